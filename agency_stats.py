@@ -0,0 +1,94 @@
+"""
+Per-agency trainee statistics for the admin agencies page.
+
+All agencies are summarised by one grouped query: certificates and module
+completions are first reduced to one row per user, then users are grouped by
+agency, so the cost does not grow with the number of agencies and there is no
+join fan-out between certificates and modules.
+
+The result is cached per process for AGENCY_STATS_TTL seconds (default 60);
+counts that are a minute old are fine for comparing agencies. Trainee
+writes do not bump the 'agency_stats' namespace of cache_bus.py: they are
+far too frequent for one shared version row, and the TTL bounds staleness.
+`flask --app app cache-bump agency_stats` drops it in every worker.
+"""
+from collections import namedtuple
+import os
+import threading
+import time
+
+from sqlalchemy import case, func, select
+
+from models import db, Certificate, User, UserModule
+import cache_bus
+
+NAMESPACE = 'agency_stats'
+
+CACHE_TTL_SECONDS = float(os.environ.get('AGENCY_STATS_TTL', '60'))
+
+AgencyStats = namedtuple('AgencyStats', 'user_count finalized_users users_with_completed_courses '
+                                        'pending_certificates approved_certificates last_activity')
+
+EMPTY = AgencyStats(0, 0, 0, 0, 0, None)
+
+
+def compute(session=None) -> dict:
+    """{agency_id: AgencyStats} for every agency with at least one user."""
+    session = session or db.session
+    per_user_certs = select(
+        Certificate.user_id,
+        func.sum(case((Certificate.status == 'pending', 1), else_=0)).label('pending'),
+        func.sum(case((Certificate.status == 'approved', 1), else_=0)).label('approved'),
+    ).group_by(Certificate.user_id).subquery()
+    per_user_activity = select(
+        UserModule.user_id,
+        func.max(UserModule.completion_date).label('last_activity'),
+    ).where(UserModule.is_completed.is_(True)).group_by(UserModule.user_id).subquery()
+
+    rows = session.execute(
+        select(
+            User.agency_id,
+            func.count(User.User_id),
+            func.sum(case((User.is_finalized.is_(True), 1), else_=0)),
+            # Completing a course issues a pending certificate; users whose
+            # certificates were all rejected have not completed one
+            func.sum(case((per_user_certs.c.pending + per_user_certs.c.approved > 0, 1), else_=0)),
+            func.coalesce(func.sum(per_user_certs.c.pending), 0),
+            func.coalesce(func.sum(per_user_certs.c.approved), 0),
+            func.max(per_user_activity.c.last_activity),
+        )
+        .outerjoin(per_user_certs, per_user_certs.c.user_id == User.User_id)
+        .outerjoin(per_user_activity, per_user_activity.c.user_id == User.User_id)
+        .where(User.agency_id.isnot(None))
+        .group_by(User.agency_id)
+    )
+    return {agency_id: AgencyStats(*(int(v or 0) for v in counts), last) for agency_id, *counts, last in rows}
+
+
+class AgencyStatsCache:
+    """The last compute() result, reused until it is `ttl` seconds old."""
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._entry = None
+        self._lock = threading.Lock()
+
+    def get(self, session=None) -> dict:
+        entry = self._entry
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        with self._lock:
+            # Another thread may have refreshed it while we waited
+            entry = self._entry
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+            stats = compute(session)
+            self._entry = (stats, time.monotonic() + self.ttl)
+            return stats
+
+    def invalidate(self) -> None:
+        self._entry = None
+
+
+cache = AgencyStatsCache()
+cache_bus.register(NAMESPACE, cache.invalidate)
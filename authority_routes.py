@@ -5,6 +5,7 @@ from datetime import datetime, UTC
 import logging
 
 from models import db, Certificate, User, Module, Course
+import search
 
 authority_bp = Blueprint('authority', __name__, url_prefix='/authority')
 
@@ -33,7 +34,7 @@ def authority_portal():
     q = (request.args.get('q') or '').strip()
 
     try:
-        from sqlalchemy import and_, or_, func
+        from sqlalchemy import and_
         query = (
             db.session.query(Certificate)
             .join(User, User.User_id == Certificate.user_id)
@@ -44,16 +45,8 @@ def authority_portal():
         if status != 'all':
             conditions.append(Certificate.status == status)
         if q:
-            like = f"%{q}%"
-            # Search by user name, course name/code, module name, module type, certificate id text
-            conditions.append(or_(
-                User.full_name.ilike(like),
-                func.coalesce(Course.name, '').ilike(like),
-                func.coalesce(Course.code, '').ilike(like),
-                Module.module_name.ilike(like),
-                Certificate.module_type.ilike(like),
-                func.cast(Certificate.certificate_id, db.String).ilike(like)
-            ))
+            # Certificate id, trainee email/number series, or text in the trainee, module or course (see search.py)
+            conditions.append(search.certificate_filter(q))
         if conditions:
             query = query.filter(and_(*conditions))
         rows = (
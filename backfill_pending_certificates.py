@@ -1,79 +1,44 @@
 import sys
-from datetime import date
-from typing import List
 
 from app import app, db
-from models import User, Module, Certificate, Course
+from models import Module
+import certificate_eligibility
 
 
-def get_course_modules(course_code: str) -> List[Module]:
-    course = Course.query.filter(Course.code.ilike(course_code)).first()
-    if not course:
-        return []
-    return list(course.modules)
+def backfill(course_code: str, dry_run: bool = False) -> int:
+    """Create a pending certificate for every eligible user of the course without one.
 
-
-def has_cert_for_course(user_id: int, modules: List[Module]) -> bool:
-    if not modules:
-        return False
-    module_ids = [m.module_id for m in modules]
-    # any certificate for any module in this course counts
-    existing = (
-        Certificate.query
-        .filter(Certificate.user_id == user_id)
-        .filter(Certificate.module_id.in_(module_ids))
-        .first()
-    )
-    return existing is not None
-
-
-def ensure_pending_cert(user: User, course_code: str, modules: List[Module]) -> bool:
-    """If user completed all modules and has no cert for this course, create a pending certificate.
-    Returns True if created, False otherwise."""
-    # EligibleForCertificate expects a course_type string that matches Module.module_type/course code
-    if not user.EligibleForCertificate(course_code):
-        return False
-    if has_cert_for_course(user.User_id, modules):
-        return False
-    # Pick a representative module for certificate association (first by series or id)
-    try:
-        modules_sorted = sorted(modules, key=lambda m: (m.series_number or '', m.module_id))
-        mod = modules_sorted[0]
-    except Exception:
-        if not modules:
-            return False
-        mod = modules[0]
-    cert = Certificate(
-        user_id=user.User_id,
-        module_type=course_code,
-        module_id=mod.module_id,
-        issue_date=date.today(),
-        status='pending'
-    )
-    db.session.add(cert)
-    return True
+    Eligibility is one grouped query and the certificates one bulk insert, see
+    certificate_eligibility. Any existing certificate for the course, including
+    a rejected one, leaves the user alone. Returns the number of (would-be)
+    certificates.
+    """
+    eligible = certificate_eligibility.eligible(course_code)
+    if dry_run:
+        return len(eligible)
+    created = certificate_eligibility.issue_pending(course_code, eligible)
+    if created:
+        db.session.commit()
+    return created
 
 
 def main(argv):
-    if len(argv) < 2:
-        print('Usage: python backfill_pending_certificates.py <COURSE_CODE>')
+    args = [a for a in argv[1:] if a != '--dry-run']
+    if not args:
+        print('Usage: python backfill_pending_certificates.py <COURSE_CODE> [--dry-run]')
         sys.exit(1)
-    course_code = argv[1].strip()
-    created = 0
+    course_code = args[0].strip()
+    dry_run = '--dry-run' in argv
     with app.app_context():
-        modules = get_course_modules(course_code)
-        if not modules:
+        if not Module.query.filter_by(module_type=course_code).first():
             print(f"No course found for code '{course_code}' or course has no modules.")
             sys.exit(2)
-        # Iterate all users to find eligible ones
-        for user in User.query.all():
-            if ensure_pending_cert(user, course_code, modules):
-                created += 1
-        if created:
-            db.session.commit()
-        print(f"Backfill complete. Created {created} pending certificate(s) for course {course_code}.")
+        created = backfill(course_code, dry_run=dry_run)
+        if dry_run:
+            print(f"Dry run: {created} user(s) eligible for a pending certificate for course {course_code}.")
+        else:
+            print(f"Backfill complete. Created {created} pending certificate(s) for course {course_code}.")
 
 
 if __name__ == '__main__':
     main(sys.argv)
-
@@ -0,0 +1,274 @@
+"""
+Invalidation of process-local caches across gunicorn workers and app nodes.
+
+Every cache registers a namespace and a callback that drops its entries:
+
+    cache_bus.register('quiz', cache.invalidate)
+
+Writers bump the namespace's row in the cache_version table (namespace,
+version) in the same transaction as the data they change. Mapper events call
+mark(session, namespace), which bumps once per flush. Bulk statements and
+scripts call bump() themselves. After commit the writing process drops its
+own entries at once.
+
+Other processes learn about the new version in one of two ways:
+
+- Polling. Before a request, at most every CACHE_BUS_POLL_SECONDS (default
+  2), one primary-key SELECT reads the versions of the registered
+  namespaces. It runs outside the request's sql_stats collector, so
+  statement budgets do not depend on when the poll falls due. Any namespace whose version moved is dropped. Stale data is
+  therefore served for at most one poll interval after the writer commits.
+- LISTEN/NOTIFY on PostgreSQL. A bump also sends NOTIFY cache_version, which
+  is delivered on commit. Each worker keeps one listening connection in a
+  daemon thread and drops the namespace as soon as the notification
+  arrives. While the listener is connected, the poll only runs every
+  CACHE_BUS_LISTEN_POLL_SECONDS (default 60) as a safety net. LISTEN needs a
+  direct server connection, so it is off by default with
+  DB_POOL_MODE=pgbouncer; set CACHE_BUS_LISTEN=0 to turn it off elsewhere.
+
+Callbacks drop a whole namespace, so namespaces should be written rarely
+compared with how often they are read (course catalog, quiz payloads, admin
+statistics), not per trainee. Caches keep their TTLs as an upper bound for
+writes that bypass the bus, e.g. manual SQL.
+
+    flask --app app cache-bump quiz agency_stats
+"""
+from datetime import datetime
+import logging
+import os
+import select as select_module
+import threading
+import time
+
+from sqlalchemy import event, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from models import db, CacheVersion
+import sql_stats
+
+POLL_SECONDS = float(os.environ.get('CACHE_BUS_POLL_SECONDS', '2'))
+LISTEN_POLL_SECONDS = float(os.environ.get('CACHE_BUS_LISTEN_POLL_SECONDS', '60'))
+CHANNEL = 'cache_version'
+# Wait before reconnecting a listener whose connection failed
+RECONNECT_SECONDS = 5.0
+
+_table = CacheVersion.__table__
+
+_callbacks = {}
+_seen = {}
+_lock = threading.Lock()
+_check_lock = threading.Lock()
+_next_check = 0.0
+
+
+def register(namespace: str, on_change):
+    """Call on_change() whenever another writer bumps `namespace`; returns on_change."""
+    with _lock:
+        _callbacks.setdefault(namespace, []).append(on_change)
+    return on_change
+
+
+def namespaces() -> list:
+    return sorted(_callbacks)
+
+
+def _observe(namespace: str, version: int) -> None:
+    """Drop the namespace's entries if `version` differs from the last one seen."""
+    with _lock:
+        # Any difference counts: a late notification only costs an extra drop,
+        # while a recreated table restarting at 1 must not be ignored
+        if _seen.get(namespace) == version:
+            return
+        _seen[namespace] = version
+        callbacks = list(_callbacks.get(namespace, ()))
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception:
+            logging.exception(f'[CACHE BUS] Invalidating {namespace} failed')
+
+
+def _dialect_insert(dialect_name):
+    if dialect_name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect_name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def _bump(connection, namespace: str) -> int:
+    now = datetime.utcnow()
+    dialect = connection.dialect.name
+    insert = _dialect_insert(dialect)
+    if insert is not None:
+        stmt = insert(_table).values(namespace=namespace, version=1, updated_at=now)
+        version = connection.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[_table.c.namespace],
+                set_={'version': _table.c.version + 1, 'updated_at': now},
+            ).returning(_table.c.version)
+        ).scalar_one()
+    else:
+        connection.execute(update(_table).where(_table.c.namespace == namespace)
+                           .values(version=_table.c.version + 1, updated_at=now))
+        version = connection.execute(select(_table.c.version).where(_table.c.namespace == namespace)).scalar()
+        if version is None:
+            connection.execute(_table.insert().values(namespace=namespace, version=1, updated_at=now))
+            version = 1
+    if dialect == 'postgresql':
+        # Delivered to listeners when the transaction commits, dropped on rollback
+        connection.exec_driver_sql('SELECT pg_notify(%(channel)s, %(payload)s)',
+                                   {'channel': CHANNEL, 'payload': f'{namespace}:{version}'})
+    return version
+
+
+def bump(*names: str, session=None) -> dict:
+    """Bump the namespaces inside the session's transaction; returns {namespace: new version}.
+
+    The caller commits. This process drops its own entries after the commit.
+    """
+    session = session or db.session
+    connection = session.connection()
+    versions = {namespace: _bump(connection, namespace) for namespace in sorted(set(names))}
+    session.info.setdefault('cache_bus_bumped', {}).update(versions)
+    return versions
+
+
+def mark(session, namespace: str) -> None:
+    """Bump `namespace` once at the end of the current flush; for mapper events."""
+    if session is not None:
+        session.info.setdefault('cache_bus_marked', set()).add(namespace)
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_marked(session, flush_context):
+    marked = session.info.pop('cache_bus_marked', None)
+    if marked:
+        bump(*marked, session=session)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for namespace, version in session.info.pop('cache_bus_bumped', {}).items():
+        _observe(namespace, version)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('cache_bus_marked', None)
+    session.info.pop('cache_bus_bumped', None)
+
+
+def check(engine=None, force: bool = False) -> None:
+    """Read the versions of the registered namespaces if the poll interval has passed."""
+    global _next_check
+    now = time.monotonic()
+    if not _callbacks or (not force and now < _next_check):
+        return
+    # One thread polls; the others keep serving from the cache meanwhile
+    if not _check_lock.acquire(blocking=force):
+        return
+    try:
+        listening = _listener is not None and _listener.connected.is_set()
+        _next_check = now + (LISTEN_POLL_SECONDS if listening else POLL_SECONDS)
+        engine = engine or db.engine
+        try:
+            with sql_stats.excluded(), engine.connect() as connection:
+                rows = connection.execute(
+                    select(_table.c.namespace, _table.c.version).where(_table.c.namespace.in_(namespaces()))
+                ).all()
+        except SQLAlchemyError:
+            logging.warning('[CACHE BUS] Version check failed; is the cache_version table missing?', exc_info=True)
+            return
+        for namespace, version in rows:
+            _observe(namespace, version)
+    finally:
+        _check_lock.release()
+
+
+def _notifications(connection, timeout: float):
+    """Payloads of the NOTIFY messages received within `timeout` seconds."""
+    if callable(getattr(connection, 'notifies', None)):
+        # psycopg 3
+        for notify in connection.notifies(timeout=timeout):
+            yield notify.payload
+        return
+    # psycopg2
+    if select_module.select([connection], [], [], timeout)[0]:
+        connection.poll()
+    while connection.notifies:
+        yield connection.notifies.pop(0).payload
+
+
+class CacheBusListener(threading.Thread):
+    """Daemon thread holding a LISTEN cache_version connection for this process."""
+
+    def __init__(self, engine):
+        super().__init__(name='cache-bus-listener', daemon=True)
+        self.engine = engine
+        self.connected = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                logging.warning('[CACHE BUS] Listener connection lost; polling every %ss until it is back',
+                                POLL_SECONDS, exc_info=True)
+            self.connected.clear()
+            time.sleep(RECONNECT_SECONDS)
+
+    def _listen(self):
+        global _next_check
+        # A dedicated connection outside the pool, closed when the thread gives up on it
+        raw = self.engine.raw_connection()
+        raw.detach()
+        connection = raw.driver_connection
+        try:
+            connection.autocommit = True
+            cursor = connection.cursor()
+            cursor.execute(f'LISTEN {CHANNEL}')
+            cursor.close()
+            self.connected.set()
+            # Bumps made while this process was not listening are found by a poll
+            _next_check = 0.0
+            while True:
+                for payload in _notifications(connection, LISTEN_POLL_SECONDS):
+                    namespace, _, version = payload.rpartition(':')
+                    if namespace in _callbacks and version.isdigit():
+                        _observe(namespace, int(version))
+        finally:
+            raw.close()
+
+
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def ensure_listener(engine) -> None:
+    """Start this process's listener thread if needed (PostgreSQL only)."""
+    global _listener, _listener_pid
+    if engine.dialect.name != 'postgresql':
+        return
+    with _listener_lock:
+        # Threads do not survive a fork, so pre-forking servers start one per worker
+        if _listener is None or _listener_pid != os.getpid() or not _listener.is_alive():
+            _listener = CacheBusListener(engine)
+            _listener_pid = os.getpid()
+            _listener.start()
+
+
+def install(app) -> None:
+    """Check the registered namespaces before requests of `app`."""
+    listen = app.config.get('CACHE_BUS_LISTEN', False)
+
+    @app.before_request
+    def _check_versions():
+        engine = db.engine
+        if listen:
+            ensure_listener(engine)
+        check(engine)
@@ -0,0 +1,128 @@
+"""
+Set-based certificate eligibility.
+
+A trainee is eligible for the certificate of a course when they have completed
+every module of it (modules whose module_type is the course code) with an
+average score of at least PASSING_AVERAGE, and hold no certificate for it yet.
+eligible() answers that for any number of users in one statement:
+
+    SELECT um.user_id, avg(um.score)
+    FROM user_module um JOIN module m ON m.module_id = um.module_id
+    WHERE m.module_type = :code AND um.is_completed
+      AND NOT EXISTS (a certificate of the user for the course)
+    GROUP BY um.user_id
+    HAVING count(DISTINCT um.module_id) = (modules of the course)
+       AND avg(um.score) >= 50
+
+issue_pending() turns its rows into pending certificates with one bulk
+INSERT. The course-completion endpoint, User.EligibleForCertificate and
+backfill_pending_certificates.py all go through here, so they agree on what
+"eligible" means.
+
+A certificate counts for the course when its module_type is the course code
+or it is attached to one of the course's modules. Rejected certificates block
+a backfill (the authority has already decided) but not a trainee's own
+resubmission; see `reissue_rejected`.
+"""
+from collections import namedtuple
+from datetime import date
+
+from sqlalchemy import and_, exists, func, insert, or_, select
+
+from models import db, Certificate, Module, UserModule
+
+PASSING_AVERAGE = 50
+
+Eligible = namedtuple('Eligible', 'user_id average_score')
+
+
+def _course_module_ids(course_code: str):
+    # Never correlated: eligible_query() joins Module itself
+    return select(Module.module_id).where(Module.module_type == course_code).correlate(None)
+
+
+def for_course(course_code: str):
+    """WHERE clause on Certificate: the certificate belongs to course `course_code`."""
+    return or_(Certificate.module_type == course_code,
+               Certificate.module_id.in_(_course_module_ids(course_code)))
+
+
+def _has_certificate(course_code: str, reissue_rejected: bool):
+    clause = and_(Certificate.user_id == UserModule.user_id, for_course(course_code))
+    if reissue_rejected:
+        clause = and_(clause, Certificate.status != 'rejected')
+    return exists().where(clause)
+
+
+def eligible_query(course_code: str, user_ids=None, min_average=PASSING_AVERAGE,
+                   exclude_certified: bool = True, reissue_rejected: bool = False):
+    """SELECT (user_id, average_score) of the users who completed all of `course_code`.
+
+    min_average=None drops the score condition; exclude_certified=False keeps
+    users who already hold a certificate for the course.
+    """
+    module_count = (select(func.count(Module.module_id))
+                    .where(Module.module_type == course_code)
+                    .correlate(None)
+                    .scalar_subquery())
+    average = func.avg(UserModule.score)
+    stmt = (
+        select(UserModule.user_id, average.label('average_score'))
+        .join(Module, Module.module_id == UserModule.module_id)
+        .where(Module.module_type == course_code, UserModule.is_completed.is_(True))
+        .group_by(UserModule.user_id)
+    )
+    if user_ids is not None:
+        stmt = stmt.where(UserModule.user_id.in_(list(user_ids)))
+    if exclude_certified:
+        stmt = stmt.where(~_has_certificate(course_code, reissue_rejected))
+    having = [func.count(UserModule.module_id.distinct()) == module_count]
+    if min_average is not None:
+        having.append(average >= min_average)
+    return stmt.having(*having)
+
+
+def eligible(course_code: str, user_ids=None, session=None, **options) -> list:
+    """[Eligible(user_id, average_score)] for `course_code`, by user id; see eligible_query()."""
+    session = session or db.session
+    if not course_code:
+        return []
+    stmt = eligible_query(course_code, user_ids, **options).order_by(UserModule.user_id)
+    return [Eligible(user_id, float(avg) if avg is not None else None)
+            for user_id, avg in session.execute(stmt)]
+
+
+def is_eligible(user_id: int, course_code: str, session=None, **options) -> bool:
+    return bool(eligible(course_code, [user_id], session=session, **options))
+
+
+def representative_module_id(course_code: str, session=None):
+    """The module a course certificate is attached to: first by series number, then id."""
+    session = session or db.session
+    return session.execute(
+        select(Module.module_id)
+        .where(Module.module_type == course_code)
+        .order_by(func.coalesce(Module.series_number, ''), Module.module_id)
+        .limit(1)
+    ).scalar()
+
+
+def issue_pending(course_code: str, rows, session=None, issue_date: date = None) -> int:
+    """Insert one pending certificate per Eligible row in a single statement; returns the count.
+
+    The caller commits.
+    """
+    session = session or db.session
+    rows = list(rows)
+    if not rows:
+        return 0
+    module_id = representative_module_id(course_code, session)
+    if module_id is None:
+        return 0
+    issue_date = issue_date or date.today()
+    session.execute(insert(Certificate), [
+        {'user_id': row.user_id, 'module_type': course_code, 'module_id': module_id,
+         'issue_date': issue_date, 'status': 'pending', 'score': row.average_score}
+        for row in rows
+    ])
+    return len(rows)
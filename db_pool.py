@@ -0,0 +1,193 @@
+"""
+Database connection pool configuration and metrics.
+
+engine_options() turns environment variables into SQLALCHEMY_ENGINE_OPTIONS so
+each deployment (threaded dev server, gunicorn workers, PgBouncer) can size
+its pool without code changes:
+
+    DB_POOL_SIZE              persistent connections per process (default 5)
+    DB_MAX_OVERFLOW           extra connections under burst load (default 10)
+    DB_POOL_TIMEOUT           seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE           replace connections older than this, seconds (default 1800)
+    DB_STATEMENT_TIMEOUT_MS   server-side statement_timeout, 0 = off (default 0)
+    DB_PRE_PING               always | idle | off (default idle)
+    DB_PRE_PING_IDLE_SECONDS  with 'idle', only ping connections unused this long (default 30)
+    DB_POOL_MODE              default | pgbouncer
+
+'always' is SQLAlchemy's pool_pre_ping (a round trip on every checkout);
+'idle' only pings connections that sat in the pool long enough to have been
+dropped by a firewall or server restart.
+
+'pgbouncer' is for PgBouncer in transaction pooling mode: PgBouncer does the
+pooling (NullPool here), psycopg 3 server-side prepared statements are turned
+off, and the statement timeout is applied per transaction with SET LOCAL
+because startup options are not forwarded.
+
+SQLite URIs get no pool tuning (file and in-memory databases use their own
+pool classes).
+
+install() attaches the listeners; pool_metrics() reports checked-out,
+overflow, checkout count and time spent waiting for a connection.
+"""
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+DEFAULTS = {
+    'DB_POOL_SIZE': '5',
+    'DB_MAX_OVERFLOW': '10',
+    'DB_POOL_TIMEOUT': '30',
+    'DB_POOL_RECYCLE': '1800',
+    'DB_STATEMENT_TIMEOUT_MS': '0',
+    'DB_PRE_PING': 'idle',
+    'DB_PRE_PING_IDLE_SECONDS': '30',
+    'DB_POOL_MODE': 'default',
+}
+PRE_PING_MODES = ('always', 'idle', 'off')
+POOL_MODES = ('default', 'pgbouncer')
+
+
+def _setting(environ, name: str) -> str:
+    return (environ.get(name) or DEFAULTS[name]).strip().lower()
+
+
+def _int_setting(environ, name: str) -> int:
+    raw = _setting(environ, name)
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError(f'{name} must be an integer, got {raw!r}')
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how often and how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+        self._depth = threading.local()
+
+    def _do_get(self):
+        # QueuePool._do_get recurses while it retries; only time the outer call
+        if getattr(self._depth, 'active', False):
+            return super()._do_get()
+        self._depth.active = True
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self._depth.active = False
+            waited = time.perf_counter() - started
+            self.checkouts += 1
+            self.wait_seconds_total += waited
+            if waited > self.wait_seconds_max:
+                self.wait_seconds_max = waited
+
+
+def engine_options(database_uri: str, environ=None) -> dict:
+    """Build SQLALCHEMY_ENGINE_OPTIONS for `database_uri` from the environment."""
+    environ = os.environ if environ is None else environ
+    url = make_url(database_uri)
+    if url.get_backend_name() == 'sqlite':
+        return {}
+
+    mode = _setting(environ, 'DB_POOL_MODE')
+    pre_ping = _setting(environ, 'DB_PRE_PING')
+    if mode not in POOL_MODES:
+        raise ValueError(f'DB_POOL_MODE must be one of {POOL_MODES}, got {mode!r}')
+    if pre_ping not in PRE_PING_MODES:
+        raise ValueError(f'DB_PRE_PING must be one of {PRE_PING_MODES}, got {pre_ping!r}')
+    statement_timeout = _int_setting(environ, 'DB_STATEMENT_TIMEOUT_MS')
+    is_postgres = url.get_backend_name() == 'postgresql'
+
+    options = {}
+    connect_args = {}
+    if mode == 'pgbouncer':
+        options['poolclass'] = NullPool
+        if is_postgres and url.get_driver_name() == 'psycopg':
+            # PgBouncer hands each transaction a different server connection
+            connect_args['prepare_threshold'] = None
+    else:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=_int_setting(environ, 'DB_POOL_SIZE'),
+            max_overflow=_int_setting(environ, 'DB_MAX_OVERFLOW'),
+            pool_timeout=_int_setting(environ, 'DB_POOL_TIMEOUT'),
+            pool_recycle=_int_setting(environ, 'DB_POOL_RECYCLE'),
+            pool_pre_ping=(pre_ping == 'always'),
+        )
+        if statement_timeout and is_postgres:
+            connect_args['options'] = f'-c statement_timeout={statement_timeout}'
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def install(engine, environ=None) -> None:
+    """Attach idle pre-ping and per-transaction statement timeout listeners to `engine`."""
+    environ = os.environ if environ is None else environ
+    if engine.dialect.name == 'sqlite':
+        return
+    mode = _setting(environ, 'DB_POOL_MODE')
+
+    if mode == 'default' and _setting(environ, 'DB_PRE_PING') == 'idle':
+        idle_seconds = _int_setting(environ, 'DB_PRE_PING_IDLE_SECONDS')
+
+        @event.listens_for(engine.pool, 'checkin')
+        def _remember_checkin(dbapi_connection, connection_record):
+            connection_record.info['checked_in_at'] = time.monotonic()
+
+        @event.listens_for(engine.pool, 'checkout')
+        def _ping_if_idle(dbapi_connection, connection_record, connection_proxy):
+            checked_in_at = connection_record.info.get('checked_in_at')
+            if checked_in_at is None or time.monotonic() - checked_in_at < idle_seconds:
+                return
+            try:
+                cursor = dbapi_connection.cursor()
+                try:
+                    cursor.execute('SELECT 1')
+                finally:
+                    cursor.close()
+            except Exception as e:
+                logging.info('[DB POOL] Dropping stale connection after %ss idle: %s', int(time.monotonic() - checked_in_at), e)
+                # The pool discards this connection and retries with a fresh one
+                raise exc.DisconnectionError() from e
+
+    statement_timeout = _int_setting(environ, 'DB_STATEMENT_TIMEOUT_MS')
+    if mode == 'pgbouncer' and statement_timeout and engine.dialect.name == 'postgresql':
+        @event.listens_for(engine, 'begin')
+        def _set_local_timeout(conn):
+            conn.exec_driver_sql(f'SET LOCAL statement_timeout = {statement_timeout}')
+
+
+def pool_metrics(engine) -> dict:
+    """Current pool state and cumulative checkout wait statistics for `engine`."""
+    pool = engine.pool
+    metrics = {'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        metrics.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+            max_overflow=pool._max_overflow,
+        )
+    if isinstance(pool, InstrumentedQueuePool):
+        metrics.update(
+            checkouts=pool.checkouts,
+            timeouts=pool.timeouts,
+            wait_seconds_total=round(pool.wait_seconds_total, 6),
+            wait_seconds_max=round(pool.wait_seconds_max, 6),
+        )
+    return metrics
@@ -0,0 +1,480 @@
+"""
+Outbound email outbox.
+
+Requests never talk to a mail provider. enqueue() adds an EmailOutbox row to
+the caller's transaction; once it commits, a background sender thread in the
+same process is woken and delivers due messages in batches:
+
+- providers are tried in order (Gmail SMTP, SMTP2GO, SendGrid, then the local
+  MAIL_SERVER, which is MailHog in development); a provider that fails is
+  skipped with exponential backoff so one slow provider does not stall the rest,
+- SMTP connections stay open between messages and batches and are re-checked
+  with NOOP after SMTP_IDLE_SECONDS; HTTP providers reuse a keep-alive session,
+- a message that no provider accepts is retried later with backoff and marked
+  failed after MAX_ATTEMPTS.
+
+Rows are claimed one at a time, right before they are sent, with SELECT ...
+FOR UPDATE SKIP LOCKED (PostgreSQL) and a lease, so several workers can
+drain the same table. A lease only has to outlast one delivery (every
+provider's timeouts), not a whole batch, so a slow batch cannot let another
+worker re-claim and resend a message. A crashed sender's message is picked
+up again when its lease expires.
+
+Secrets are not stored in the table. A body may contain a marker registered
+with register_filler(), e.g. the password reset token, which is filled in
+each time the message is handed to a provider.
+
+In the default thread mode every worker starts its sender on its first
+request (install()) and it then polls every POLL_SECONDS, so messages left
+over from a restart are delivered without a new enqueue().
+EMAIL_OUTBOX_MODE=external disables the in-process thread; run a dedicated
+sender instead:
+
+    python email_outbox.py            # drain continuously
+    python email_outbox.py --once     # drain what is due and exit
+"""
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from email.utils import formatdate, make_msgid
+import logging
+import os
+import smtplib
+import sys
+import threading
+import time
+
+from sqlalchemy import event, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import db, EmailOutbox
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 6
+LEASE_SECONDS = 300
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+PROVIDER_COOLDOWN_BASE_SECONDS = 5
+PROVIDER_COOLDOWN_MAX_SECONDS = 300
+SMTP_IDLE_SECONDS = 30
+SMTP_TIMEOUT_SECONDS = 15
+HTTP_TIMEOUT_SECONDS = 10
+POLL_SECONDS = float(os.environ.get('EMAIL_OUTBOX_POLL', '15'))
+DEFAULT_SENDER = 'noreply@shapadusecurity.com'
+
+
+class DeliveryError(Exception):
+    """A provider could not deliver a message; another provider may succeed."""
+
+
+class PermanentDeliveryError(DeliveryError):
+    """The message itself was rejected (e.g. invalid recipient); retrying will not help."""
+
+
+_fillers = {}
+
+
+def register_filler(marker: str, fill) -> None:
+    """Replace `marker` in queued bodies with fill(row) at send time."""
+    _fillers[marker] = fill
+
+
+def message_body(row: EmailOutbox) -> str:
+    body = row.body
+    for marker, fill in _fillers.items():
+        if marker in body:
+            body = body.replace(marker, fill(row))
+    return body
+
+
+def enqueue(recipient: str, subject: str, body: str) -> EmailOutbox:
+    """Queue a plain-text email in the current transaction. The caller commits."""
+    row = EmailOutbox(recipient=recipient, subject=subject, body=body,
+                      status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+    db.session.add(row)
+    db.session.info['email_outbox_wake'] = True
+    return row
+
+
+def _mime(row: EmailOutbox, sender: str) -> MIMEText:
+    msg = MIMEText(message_body(row), 'plain', 'utf-8')
+    msg['Subject'] = row.subject
+    msg['From'] = sender
+    msg['To'] = row.recipient
+    msg['Date'] = formatdate(localtime=True)
+    msg['Message-ID'] = make_msgid(idstring=f'outbox{row.id}')
+    return msg
+
+
+class SMTPProvider:
+    """SMTP delivery over one long-lived connection."""
+
+    def __init__(self, name, host, port, username=None, password=None, use_tls=False, use_ssl=False, sender=None):
+        self.name = name
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.sender = sender or username or DEFAULT_SENDER
+        self._smtp = None
+        self._last_used = 0.0
+        self.connections_opened = 0
+
+    def _connect(self):
+        cls = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        smtp = cls(self.host, self.port, timeout=SMTP_TIMEOUT_SECONDS)
+        if self.use_tls and not self.use_ssl:
+            smtp.starttls()
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        self.connections_opened += 1
+        return smtp
+
+    def _connection(self):
+        if self._smtp is not None and time.monotonic() - self._last_used > SMTP_IDLE_SECONDS:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected('NOOP failed')
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def send(self, row: EmailOutbox) -> None:
+        msg = _mime(row, self.sender).as_string()
+        for attempt in (1, 2):
+            try:
+                self._connection().sendmail(self.sender, [row.recipient], msg)
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPRecipientsRefused as e:
+                raise PermanentDeliveryError(f'{self.name}: recipient refused: {e.recipients}') from e
+            except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+                # The pooled connection went away; reconnect once
+                self.close()
+                if attempt == 2:
+                    raise DeliveryError(f'{self.name}: {e}') from e
+            except (smtplib.SMTPException, OSError) as e:
+                self.close()
+                raise DeliveryError(f'{self.name}: {e}') from e
+
+    def close(self) -> None:
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+
+class SMTP2GOProvider:
+    """SMTP2GO HTTP API over a keep-alive session."""
+
+    URL = 'https://api.smtp2go.com/v3/email/send'
+
+    def __init__(self, api_key, sender=None):
+        import requests
+        self.name = 'smtp2go'
+        self.api_key = api_key
+        self.sender = sender or DEFAULT_SENDER
+        self._session = requests.Session()
+
+    def send(self, row: EmailOutbox) -> None:
+        payload = {
+            'api_key': self.api_key,
+            'to': [row.recipient],
+            'sender': self.sender,
+            'subject': row.subject,
+            'text_body': message_body(row),
+        }
+        try:
+            response = self._session.post(self.URL, json=payload, timeout=HTTP_TIMEOUT_SECONDS)
+            data = response.json().get('data', {})
+        except Exception as e:
+            raise DeliveryError(f'smtp2go: {e}') from e
+        if response.status_code != 200 or data.get('succeeded', 0) <= 0:
+            raise DeliveryError(f"smtp2go: {data.get('error', response.status_code)}")
+
+    def close(self) -> None:
+        self._session.close()
+
+
+class SendGridProvider:
+    """SendGrid web API; the client is created once and reused."""
+
+    def __init__(self, api_key, sender=None):
+        from sendgrid import SendGridAPIClient
+        self.name = 'sendgrid'
+        self.sender = sender or DEFAULT_SENDER
+        self._client = SendGridAPIClient(api_key)
+
+    def send(self, row: EmailOutbox) -> None:
+        from sendgrid.helpers.mail import Mail as SGMail
+        message = SGMail(from_email=self.sender, to_emails=row.recipient,
+                         subject=row.subject, plain_text_content=message_body(row))
+        try:
+            response = self._client.send(message)
+        except Exception as e:
+            raise DeliveryError(f'sendgrid: {e}') from e
+        if response.status_code >= 300:
+            raise DeliveryError(f'sendgrid: HTTP {response.status_code}')
+
+    def close(self) -> None:
+        pass
+
+
+def build_providers(config) -> list:
+    """Providers in failover order, from environment credentials and the app's MAIL_* config."""
+    providers = []
+    gmail_user = os.environ.get('GMAIL_USER')
+    gmail_password = os.environ.get('GMAIL_APP_PASSWORD')
+    if gmail_user and gmail_password:
+        providers.append(SMTPProvider('gmail', 'smtp.gmail.com', 587, gmail_user, gmail_password, use_tls=True))
+    if os.environ.get('SMTP2GO_API_KEY'):
+        providers.append(SMTP2GOProvider(os.environ['SMTP2GO_API_KEY'], os.environ.get('SMTP2GO_SENDER_EMAIL')))
+    if os.environ.get('SENDGRID_API_KEY'):
+        try:
+            providers.append(SendGridProvider(os.environ['SENDGRID_API_KEY'], os.environ.get('SENDGRID_SENDER_EMAIL')))
+        except ImportError:
+            logging.warning('[EMAIL OUTBOX] SENDGRID_API_KEY set but the sendgrid package is not installed')
+    # Local relay last (MailHog in development)
+    providers.append(SMTPProvider(
+        'local',
+        config.get('MAIL_SERVER', 'localhost'),
+        config.get('MAIL_PORT', 1025),
+        config.get('MAIL_USERNAME'),
+        config.get('MAIL_PASSWORD'),
+        use_tls=bool(config.get('MAIL_USE_TLS')),
+        use_ssl=bool(config.get('MAIL_USE_SSL')),
+        sender=config.get('MAIL_DEFAULT_SENDER') or DEFAULT_SENDER,
+    ))
+    return providers
+
+
+class Dispatcher:
+    """Delivers one message through the first healthy provider, cooling down failed ones."""
+
+    def __init__(self, providers):
+        self.providers = list(providers)
+        self._failures = {p.name: 0 for p in self.providers}
+        self._available_at = {p.name: 0.0 for p in self.providers}
+
+    def _cooldown(self, name: str) -> None:
+        self._failures[name] += 1
+        delay = min(PROVIDER_COOLDOWN_BASE_SECONDS * 2 ** (self._failures[name] - 1), PROVIDER_COOLDOWN_MAX_SECONDS)
+        self._available_at[name] = time.monotonic() + delay
+
+    def deliver(self, row: EmailOutbox) -> str:
+        """Send `row` and return the provider name. Raises DeliveryError if every provider failed."""
+        now = time.monotonic()
+        candidates = [p for p in self.providers if self._available_at[p.name] <= now]
+        if not candidates:
+            # Everyone is cooling down: try the one that becomes available first
+            candidates = [min(self.providers, key=lambda p: self._available_at[p.name])]
+        errors = []
+        for provider in candidates:
+            try:
+                provider.send(row)
+            except PermanentDeliveryError:
+                raise
+            except DeliveryError as e:
+                logging.warning('[EMAIL OUTBOX] %s', e)
+                errors.append(str(e))
+                self._cooldown(provider.name)
+                continue
+            self._failures[provider.name] = 0
+            self._available_at[provider.name] = 0.0
+            return provider.name
+        raise DeliveryError('; '.join(errors) or 'no email provider configured')
+
+    def close(self) -> None:
+        for provider in self.providers:
+            provider.close()
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS))
+
+
+def _claim_next():
+    """Lease the next due message to this sender and return its id, or None."""
+    now = datetime.utcnow()
+    due = (
+        select(EmailOutbox.id)
+        .where(or_(
+            (EmailOutbox.status == 'pending') & (EmailOutbox.next_attempt_at <= now),
+            (EmailOutbox.status == 'sending') & (EmailOutbox.locked_until < now),
+        ))
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+    )
+    row_id = db.session.execute(due).scalar()
+    if row_id is not None:
+        db.session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id == row_id)
+            .values(status='sending', locked_until=now + timedelta(seconds=LEASE_SECONDS))
+        )
+    db.session.commit()
+    return row_id
+
+
+def process_batch(dispatcher: Dispatcher, limit: int = BATCH_SIZE):
+    """Deliver up to `limit` due messages, leasing each just before it is sent. Returns (claimed, sent, failed)."""
+    claimed = sent = failed = 0
+    while claimed < limit:
+        row_id = _claim_next()
+        if row_id is None:
+            break
+        claimed += 1
+        row = db.session.get(EmailOutbox, row_id)
+        row.attempts = (row.attempts or 0) + 1
+        row.locked_until = None
+        try:
+            row.provider = dispatcher.deliver(row)
+        except DeliveryError as e:
+            row.last_error = str(e)[:2000]
+            if isinstance(e, PermanentDeliveryError) or row.attempts >= MAX_ATTEMPTS:
+                row.status = 'failed'
+                failed += 1
+                logging.error('[EMAIL OUTBOX] Giving up on message %s to %s: %s', row.id, row.recipient, e)
+            else:
+                row.status = 'pending'
+                row.next_attempt_at = datetime.utcnow() + retry_delay(row.attempts)
+        else:
+            row.status = 'sent'
+            row.sent_at = datetime.utcnow()
+            row.last_error = None
+            sent += 1
+        # Record each outcome right away so a crash cannot resend delivered mail
+        db.session.commit()
+    return claimed, sent, failed
+
+
+def drain(dispatcher: Dispatcher = None, limit: int = BATCH_SIZE):
+    """Deliver every due message (within an app context). Returns (sent, failed)."""
+    from flask import current_app
+    own = dispatcher is None
+    dispatcher = dispatcher or Dispatcher(build_providers(current_app.config))
+    total_sent = total_failed = 0
+    try:
+        while True:
+            claimed, sent, failed = process_batch(dispatcher, limit)
+            total_sent += sent
+            total_failed += failed
+            if claimed < limit:
+                break
+    finally:
+        if own:
+            dispatcher.close()
+    return total_sent, total_failed
+
+
+class OutboxSender(threading.Thread):
+    """Background thread that drains the outbox when woken and every POLL_SECONDS."""
+
+    def __init__(self, app):
+        super().__init__(name='email-outbox', daemon=True)
+        self.app = app
+        self.wake = threading.Event()
+
+    def run(self):
+        with self.app.app_context():
+            dispatcher = Dispatcher(build_providers(self.app.config))
+            while True:
+                self.wake.wait(POLL_SECONDS)
+                self.wake.clear()
+                try:
+                    drain(dispatcher)
+                except Exception:
+                    db.session.rollback()
+                    logging.exception('[EMAIL OUTBOX] Sender loop failed')
+                finally:
+                    db.session.remove()
+
+
+_sender = None
+_sender_pid = None
+_sender_lock = threading.Lock()
+
+
+def _thread_mode(app) -> bool:
+    return (app.config.get('EMAIL_OUTBOX_MODE') or os.environ.get('EMAIL_OUTBOX_MODE', 'thread')) == 'thread'
+
+
+def ensure_sender(app):
+    """Start this process's sender thread if needed; returns it (None in external mode)."""
+    global _sender, _sender_pid
+    if not _thread_mode(app):
+        return None
+    sender = _sender
+    if sender is not None and _sender_pid == os.getpid() and sender.is_alive():
+        return sender
+    with _sender_lock:
+        # Threads do not survive a fork, so pre-forking servers start one per worker
+        if _sender is None or _sender_pid != os.getpid() or not _sender.is_alive():
+            _sender = OutboxSender(app)
+            _sender_pid = os.getpid()
+            _sender.start()
+        return _sender
+
+
+def wake_sender(app) -> None:
+    """Start this process's sender thread if needed and wake it (no-op in external mode)."""
+    sender = ensure_sender(app)
+    if sender is not None:
+        sender.wake.set()
+
+
+def install(app) -> None:
+    """Run the sender of each worker from its first request in thread mode.
+
+    Otherwise messages that were due for retry, whose lease expired with a
+    previous process, or that were queued just before a restart would wait for
+    this worker's next enqueue(). Started per request rather than at import so
+    pre-forking servers get one sender per worker; not in testing.
+    """
+    if not _thread_mode(app):
+        return
+
+    @app.before_request
+    def _ensure_sender():
+        if not app.testing:
+            ensure_sender(app)
+
+
+@event.listens_for(Session, 'after_commit')
+def _wake_after_commit(session):
+    if session.info.pop('email_outbox_wake', False):
+        from flask import current_app, has_app_context
+        if has_app_context():
+            wake_sender(current_app._get_current_object())
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('email_outbox_wake', None)
+
+
+def main(argv):
+    from app import app
+    with app.app_context():
+        dispatcher = Dispatcher(build_providers(app.config))
+        try:
+            if '--once' in argv[1:]:
+                sent, failed = drain(dispatcher)
+                print(f"Email outbox: {sent} sent, {failed} failed.")
+                return
+            while True:
+                drain(dispatcher)
+                db.session.remove()
+                time.sleep(POLL_SECONDS)
+        finally:
+            dispatcher.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
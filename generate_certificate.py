@@ -5,7 +5,7 @@ from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from io import BytesIO
 from models import User, Certificate, Module
-from app import db  # Assuming you use SQLAlchemy
+from models import db
 
 def generate_certificate(user_id, course_type, overall_percentage, cert_id=None, module_id=None):
     # Fetch user info from database
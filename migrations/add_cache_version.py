@@ -0,0 +1,36 @@
+"""
+Database migration script for the cache invalidation bus.
+
+Creates the cache_version table (namespace, version) that cache_bus.py uses
+to invalidate process-local caches in every worker. Run it before deploying
+the code that bumps it. Namespaces get their row on the first bump.
+
+Usage:
+    python migrations/add_cache_version.py
+"""
+
+import sys
+from pathlib import Path
+
+# Add the parent directory to the path to import app modules
+app_dir = Path(__file__).resolve().parent.parent
+if str(app_dir) not in sys.path:
+    sys.path.insert(0, str(app_dir))
+
+from app import app, db
+from models import CacheVersion
+
+
+def add_cache_version():
+    """Create the cache_version table if it does not exist."""
+    with app.app_context():
+        try:
+            CacheVersion.__table__.create(db.engine, checkfirst=True)
+            print("✓ Table 'cache_version' is present.")
+        except Exception as e:
+            print(f"✗ Error during migration: {str(e)}")
+            raise
+
+
+if __name__ == '__main__':
+    add_cache_version()
@@ -0,0 +1,34 @@
+"""
+Database migration script for the outbound email outbox.
+
+Creates the email_outbox table drained by email_outbox.py.
+
+Usage:
+    python migrations/add_email_outbox.py
+"""
+
+import sys
+from pathlib import Path
+
+# Add the parent directory to the path to import app modules
+app_dir = Path(__file__).resolve().parent.parent
+if str(app_dir) not in sys.path:
+    sys.path.insert(0, str(app_dir))
+
+from app import app, db
+from models import EmailOutbox
+
+
+def add_email_outbox():
+    """Create the email_outbox table if it does not exist."""
+    with app.app_context():
+        try:
+            EmailOutbox.__table__.create(db.engine, checkfirst=True)
+            print("✓ Table 'email_outbox' is present.")
+        except Exception as e:
+            print(f"✗ Error during migration: {str(e)}")
+            raise
+
+
+if __name__ == '__main__':
+    add_email_outbox()
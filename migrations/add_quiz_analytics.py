@@ -0,0 +1,52 @@
+"""
+Database migration script for quiz item analytics.
+
+Adds user_module.quiz_started_at / quiz_duration_seconds (attempt timing) and
+creates the quiz_module_stats summary table used by quiz_analytics.py.
+
+Usage:
+    python migrations/add_quiz_analytics.py
+"""
+
+import sys
+from pathlib import Path
+
+# Add the parent directory to the path to import app modules
+app_dir = Path(__file__).resolve().parent.parent
+if str(app_dir) not in sys.path:
+    sys.path.insert(0, str(app_dir))
+
+from app import app, db
+from models import QuizModuleStats
+from sqlalchemy import inspect, text
+
+NEW_COLUMNS = {
+    'quiz_started_at': 'TIMESTAMP',
+    'quiz_duration_seconds': 'INTEGER',
+}
+
+
+def add_quiz_analytics():
+    """Add attempt timing columns and the quiz_module_stats table."""
+    with app.app_context():
+        try:
+            existing = {c['name'] for c in inspect(db.engine).get_columns('user_module')}
+            for name, col_type in NEW_COLUMNS.items():
+                if name in existing:
+                    print(f"✓ Column '{name}' already exists in user_module table.")
+                    continue
+                db.session.execute(text(f"ALTER TABLE user_module ADD COLUMN {name} {col_type}"))
+                print(f"✓ Added column '{name}' to user_module table.")
+            db.session.commit()
+            QuizModuleStats.__table__.create(db.engine, checkfirst=True)
+            print("✓ Table 'quiz_module_stats' is present.")
+            print()
+            print("Next step: python quiz_analytics.py --all")
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error during migration: {str(e)}")
+            raise
+
+
+if __name__ == '__main__':
+    add_quiz_analytics()
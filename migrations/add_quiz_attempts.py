@@ -0,0 +1,39 @@
+"""
+Database migration script for quiz attempt history.
+
+Creates the append-only quiz_attempt table (and its indexes) written by
+api_submit_quiz through quiz_attempts.py. Attempts made before this
+migration are not reconstructed; user_module still holds their best score
+and latest answers.
+
+Usage:
+    python migrations/add_quiz_attempts.py
+"""
+
+import sys
+from pathlib import Path
+
+# Add the parent directory to the path to import app modules
+app_dir = Path(__file__).resolve().parent.parent
+if str(app_dir) not in sys.path:
+    sys.path.insert(0, str(app_dir))
+
+from app import app, db
+from models import QuizAttempt
+
+
+def add_quiz_attempts():
+    """Create the quiz_attempt table if it does not exist."""
+    with app.app_context():
+        try:
+            QuizAttempt.__table__.create(db.engine, checkfirst=True)
+            print("✓ Table 'quiz_attempt' is present.")
+            print()
+            print("Retention: python quiz_attempts.py prune [--dry-run]")
+        except Exception as e:
+            print(f"✗ Error during migration: {str(e)}")
+            raise
+
+
+if __name__ == '__main__':
+    add_quiz_attempts()
@@ -0,0 +1,39 @@
+"""
+Database migration script for indexed search.
+
+Creates the search index used by search.py: the pg_trgm extension and one
+trigram GIN index per searchable table on PostgreSQL, or the search_index FTS5
+shadow table (filled from the existing rows) on SQLite.
+Re-run it on SQLite databases whose index predates rowid-keyed documents
+(search.document_rowid); the rebuild assigns the new rowids.
+
+Usage:
+    python migrations/add_search_index.py
+"""
+
+import sys
+from pathlib import Path
+
+# Add the parent directory to the path to import app modules
+app_dir = Path(__file__).resolve().parent.parent
+if str(app_dir) not in sys.path:
+    sys.path.insert(0, str(app_dir))
+
+from app import app, db
+import search
+
+
+def add_search_index():
+    """Create (or rebuild) the search index."""
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                search.install_schema(conn, reset=True)
+            print(f"✓ Search index is present ({db.engine.dialect.name}).")
+        except Exception as e:
+            print(f"✗ Error during migration: {str(e)}")
+            raise
+
+
+if __name__ == '__main__':
+    add_search_index()
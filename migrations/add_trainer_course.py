@@ -0,0 +1,92 @@
+"""
+Database migration script for multi-course trainer assignments.
+
+Creates the trainer_course association table (see trainer_scope.py) and adds
+trainer.all_courses. Then it copies each trainer's existing Trainer.course
+assignment into the new table:
+
+- Trainers with a blank course stay unrestricted (all_courses true).
+- Every other trainer becomes restricted (all_courses false) and gets one
+  row per course code that matches. The column may hold one code or a
+  comma-separated list.
+- Codes that match no course (typos, renamed courses, different case) are
+  reported. Such a trainer stays restricted to the courses that did match,
+  possibly none, and keeps the original label so the admin can correct it.
+  The migration never grants all courses to a trainer who had a course.
+
+Usage:
+    python migrations/add_trainer_course.py [--dry-run]
+"""
+
+import sys
+from pathlib import Path
+
+# Add the parent directory to the path to import app modules
+app_dir = Path(__file__).resolve().parent.parent
+if str(app_dir) not in sys.path:
+    sys.path.insert(0, str(app_dir))
+
+from app import app, db
+from models import Course, Trainer, TrainerCourse
+from sqlalchemy import inspect, select, text
+import trainer_scope
+
+
+def _add_all_courses_column():
+    columns = {c['name'] for c in inspect(db.engine).get_columns('trainer')}
+    if 'all_courses' in columns:
+        print("✓ Column 'trainer.all_courses' already exists.")
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text('ALTER TABLE trainer ADD COLUMN all_courses BOOLEAN NOT NULL DEFAULT TRUE'))
+    print("✓ Added column 'trainer.all_courses'.")
+
+
+def add_trainer_course(dry_run=False):
+    """Create trainer_course and trainer.all_courses and backfill them from Trainer.course."""
+    with app.app_context():
+        try:
+            if not dry_run:
+                TrainerCourse.__table__.create(db.engine, checkfirst=True)
+                print("✓ Table 'trainer_course' is present.")
+                _add_all_courses_column()
+
+            course_ids = dict(db.session.execute(select(Course.code, Course.course_id)).all())
+            rows = db.session.execute(
+                select(Trainer.trainer_id, Trainer.course).where(Trainer.course.isnot(None), Trainer.course != '')
+            ).all()
+            copied = 0
+            unresolved = []
+            for trainer_id, label in rows:
+                codes = [c.strip() for c in label.split(',') if c.strip()]
+                if not codes:
+                    continue
+                known = [c for c in codes if c in course_ids]
+                unknown = [c for c in codes if c not in course_ids]
+                if unknown:
+                    unresolved.append(trainer_id)
+                    print(f"  ✗ Trainer {trainer_id}: unknown course code(s) {', '.join(unknown)}; "
+                          f"restricted to {', '.join(known) or 'no course'} until an admin reassigns them")
+                else:
+                    print(f"  Trainer {trainer_id}: {', '.join(known)}")
+                if not dry_run:
+                    trainer = db.session.get(Trainer, trainer_id)
+                    trainer_scope.assign(trainer, [course_ids[c] for c in known])
+                    if unknown:
+                        trainer.course = label
+                copied += len(known)
+
+            summary = f"{copied} assignment(s) for {len(rows)} trainer(s); {len(unresolved)} with unknown codes"
+            if dry_run:
+                print(f"Dry run: {summary} would be copied.")
+                return
+            db.session.commit()
+            print(f"✓ Copied {summary}.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error during migration: {str(e)}")
+            raise
+
+
+if __name__ == '__main__':
+    add_trainer_course(dry_run='--dry-run' in sys.argv)
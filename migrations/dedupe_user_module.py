@@ -0,0 +1,93 @@
+"""
+Database migration script: one user_module row per trainee and module.
+
+Concurrent quiz submissions used to insert duplicate (user_id, module_id)
+rows. This merges every set of duplicates into its oldest row:
+
+    score, reattempt_count, completion_date   the highest of the set
+    is_completed                              true if any row is completed
+    quiz_answers, quiz_duration_seconds       from the most recently completed row
+    quiz_started_at                           the earliest still open
+
+deletes the other rows and then adds the unique index
+uq_user_module_user_module that quiz_submission.py upserts against.
+
+Usage:
+    python migrations/dedupe_user_module.py [--dry-run]
+"""
+
+import sys
+from pathlib import Path
+
+# Add the parent directory to the path to import app modules
+app_dir = Path(__file__).resolve().parent.parent
+if str(app_dir) not in sys.path:
+    sys.path.insert(0, str(app_dir))
+
+from app import app, db
+from models import UserModule
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.orm import aliased
+
+UNIQUE_INDEX = 'uq_user_module_user_module'
+
+
+def _merge_statements():
+    table = UserModule.__table__
+    other = aliased(table)
+    same = (other.c.user_id == table.c.user_id) & (other.c.module_id == table.c.module_id)
+
+    def agg(expr):
+        return select(expr).where(same).scalar_subquery()
+
+    def latest(column):
+        return (select(column).where(same)
+                .order_by(other.c.completion_date.is_(None), other.c.completion_date.desc(), other.c.id.desc())
+                .limit(1).scalar_subquery())
+
+    keepers = (select(func.min(table.c.id))
+               .group_by(table.c.user_id, table.c.module_id)
+               .having(func.count(table.c.id) > 1))
+    merge = (update(table)
+             .where(table.c.id.in_(keepers))
+             .values(
+                 score=agg(func.max(other.c.score)),
+                 reattempt_count=agg(func.max(other.c.reattempt_count)),
+                 completion_date=agg(func.max(other.c.completion_date)),
+                 is_completed=agg(func.max(case((other.c.is_completed.is_(True), 1), else_=0))) == 1,
+                 quiz_answers=latest(other.c.quiz_answers),
+                 quiz_duration_seconds=latest(other.c.quiz_duration_seconds),
+                 quiz_started_at=agg(func.min(other.c.quiz_started_at)),
+             ))
+    all_keepers = select(func.min(table.c.id)).group_by(table.c.user_id, table.c.module_id)
+    prune = delete(table).where(table.c.id.not_in(all_keepers))
+    return keepers, merge, prune
+
+
+def dedupe_user_module(dry_run=False):
+    """Merge duplicate user_module rows and add the unique index."""
+    with app.app_context():
+        try:
+            keepers, merge, prune = _merge_statements()
+            groups = db.session.execute(select(func.count()).select_from(keepers.subquery())).scalar()
+            total = db.session.execute(select(func.count()).select_from(UserModule.__table__)).scalar()
+            print(f"Found {groups} duplicated (user_id, module_id) pair(s) in {total} user_module rows.")
+            if dry_run:
+                print("Dry run: nothing changed.")
+                return
+            if groups:
+                db.session.execute(merge)
+                removed = db.session.execute(prune).rowcount
+                print(f"✓ Merged {groups} pair(s), removed {removed} duplicate row(s).")
+            db.session.commit()
+            index = next(i for i in UserModule.__table__.indexes if i.name == UNIQUE_INDEX)
+            index.create(db.engine, checkfirst=True)
+            print(f"✓ Unique index '{UNIQUE_INDEX}' is present.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error during migration: {str(e)}")
+            raise
+
+
+if __name__ == '__main__':
+    dedupe_user_module(dry_run='--dry-run' in sys.argv)
@@ -0,0 +1,70 @@
+"""
+Database migration script to convert user_module.quiz_answers to the canonical packed format.
+
+Older rows hold free-form text (JSON arrays, double encoded JSON, bracket or comma
+separated values). This script parses each legacy value once and rewrites it using
+quiz_answers.encode_answers so the API can decode answers without fallbacks.
+Rows already in the canonical format are skipped, so the script is safe to re-run.
+
+Usage:
+    python migrations/normalize_quiz_answers.py [--dry-run]
+"""
+
+import sys
+from pathlib import Path
+
+# Add the parent directory to the path to import app modules
+app_dir = Path(__file__).resolve().parent.parent
+if str(app_dir) not in sys.path:
+    sys.path.insert(0, str(app_dir))
+
+from app import app, db
+from sqlalchemy import text
+from quiz_answers import FORMAT_PREFIX, encode_answers, parse_legacy_answers
+
+BATCH_SIZE = 1000
+
+
+def normalize_quiz_answers(dry_run=False):
+    """Rewrite every non-canonical quiz_answers value in batches."""
+    with app.app_context():
+        converted = 0
+        bytes_before = 0
+        bytes_after = 0
+        last_id = 0
+        try:
+            while True:
+                rows = db.session.execute(text("""
+                    SELECT id, quiz_answers FROM user_module
+                    WHERE id > :last_id AND quiz_answers IS NOT NULL
+                    ORDER BY id
+                    LIMIT :limit
+                """), {'last_id': last_id, 'limit': BATCH_SIZE}).fetchall()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                updates = []
+                for row_id, raw in rows:
+                    if isinstance(raw, str) and raw.startswith(FORMAT_PREFIX):
+                        continue
+                    encoded = encode_answers(parse_legacy_answers(raw))
+                    bytes_before += len(raw or '')
+                    bytes_after += len(encoded)
+                    updates.append({'id': row_id, 'value': encoded})
+                if updates and not dry_run:
+                    db.session.execute(
+                        text("UPDATE user_module SET quiz_answers = :value WHERE id = :id"),
+                        updates
+                    )
+                    db.session.commit()
+                converted += len(updates)
+            action = "Would convert" if dry_run else "✓ Converted"
+            print(f"{action} {converted} quiz_answers row(s) ({bytes_before} -> {bytes_after} bytes).")
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error during migration: {str(e)}")
+            raise
+
+
+if __name__ == '__main__':
+    normalize_quiz_answers(dry_run='--dry-run' in sys.argv)
@@ -0,0 +1,86 @@
+"""
+Database migration script: normalized user.user_category.
+
+User.user_category is now normalized on every ORM write to 'citizen' or
+'foreigner' (models.normalize_user_category), so trainee filters compare it
+with plain equality. This script cleans the existing rows the same way:
+case and surrounding spaces are dropped, and unknown or empty values become
+'foreigner' for users with a passport but no IC and 'citizen' otherwise.
+It then adds the index ix_user_user_category and, on PostgreSQL, the check
+constraint ck_user_user_category. SQLite cannot add a constraint to an
+existing table; databases created by `flask init-db` have it from the start.
+
+Usage:
+    python migrations/normalize_user_category.py [--dry-run]
+"""
+
+import sys
+from pathlib import Path
+
+# Add the parent directory to the path to import app modules
+app_dir = Path(__file__).resolve().parent.parent
+if str(app_dir) not in sys.path:
+    sys.path.insert(0, str(app_dir))
+
+from app import app, db
+from models import User, USER_CATEGORIES
+from sqlalchemy import and_, case, func, inspect, or_, select, text, update
+
+CONSTRAINT = 'ck_user_user_category'
+
+
+def _normalized():
+    cleaned = func.lower(func.trim(func.coalesce(User.user_category, '')))
+    return case(
+        (cleaned.in_(USER_CATEGORIES), cleaned),
+        (and_(func.coalesce(User.passport_number, '') != '', func.coalesce(User.ic_number, '') == ''), 'foreigner'),
+        else_='citizen',
+    )
+
+
+def normalize_user_category(dry_run=False):
+    """Rewrite non-canonical categories, then add the index and the check constraint."""
+    with app.app_context():
+        try:
+            target = _normalized()
+            dirty = or_(User.user_category.is_(None), User.user_category != target)
+            rows = db.session.execute(
+                select(User.user_category, target, func.count()).where(dirty).group_by(User.user_category, target)
+            ).all()
+            for raw, value, count in rows:
+                print(f"  {raw!r} -> {value!r}: {count} user(s)")
+            total = sum(count for _, _, count in rows)
+            if dry_run:
+                print(f"Dry run: {total} user(s) would be normalized.")
+                return
+            if total:
+                db.session.execute(update(User).where(dirty).values(user_category=target)
+                                   .execution_options(synchronize_session=False))
+            db.session.commit()
+            print(f"✓ Normalized user_category of {total} user(s).")
+
+            index = next(i for i in User.__table__.indexes if i.name == 'ix_user_user_category')
+            index.create(db.engine, checkfirst=True)
+            print("✓ Index 'ix_user_user_category' is present.")
+
+            if db.engine.dialect.name == 'postgresql':
+                existing = {c['name'] for c in inspect(db.engine).get_check_constraints('user')}
+                if CONSTRAINT in existing:
+                    print(f"✓ Constraint '{CONSTRAINT}' already exists.")
+                else:
+                    allowed = ', '.join(f"'{c}'" for c in USER_CATEGORIES)
+                    db.session.execute(text(
+                        f'ALTER TABLE "user" ADD CONSTRAINT {CONSTRAINT} CHECK (user_category IN ({allowed}))'
+                    ))
+                    db.session.commit()
+                    print(f"✓ Added constraint '{CONSTRAINT}'.")
+            else:
+                print(f"✓ Skipped constraint '{CONSTRAINT}': not supported on {db.engine.dialect.name} for existing tables.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error during migration: {str(e)}")
+            raise
+
+
+if __name__ == '__main__':
+    normalize_user_category(dry_run='--dry-run' in sys.argv)
@@ -0,0 +1,62 @@
+"""
+Migration script to run existing profile pictures through the image pipeline.
+
+Pictures uploaded before profile_images.py were stored at their original size
+(and, from the profile page, without a per-user prefix). This script builds the
+resized JPEG/WebP variants for every user whose Profile_picture is not processed
+yet and points the column at the new file. The original uploads are left on
+disk because other users may reference the same unprefixed file.
+
+Usage:
+    python migrations/process_profile_pictures.py [--dry-run]
+"""
+
+import os
+import sys
+from pathlib import Path
+
+# Add the parent directory to the path to import app modules
+app_dir = Path(__file__).resolve().parent.parent
+if str(app_dir) not in sys.path:
+    sys.path.insert(0, str(app_dir))
+
+from app import app, db
+from models import User
+from profile_images import InvalidImage, save_profile_picture, variant_name
+
+
+def process_profile_pictures(dry_run=False):
+    """Generate variants for unprocessed profile pictures."""
+    with app.app_context():
+        processed = 0
+        missing = 0
+        try:
+            users = User.query.filter(User.Profile_picture.isnot(None), User.Profile_picture != '').all()
+            for user in users:
+                stored = user.Profile_picture
+                if variant_name(stored, 'sm') != stored:
+                    continue
+                path = os.path.join(app.config['UPLOAD_FOLDER'], *stored.split('/'))
+                if not os.path.isfile(path):
+                    missing += 1
+                    continue
+                if not dry_run:
+                    try:
+                        with open(path, 'rb') as fh:
+                            user.Profile_picture = save_profile_picture(fh, f"user{user.User_id}")
+                    except InvalidImage:
+                        print(f"  skipped user {user.User_id}: {stored} is not a readable image")
+                        continue
+                processed += 1
+            if not dry_run:
+                db.session.commit()
+            action = "Would process" if dry_run else "✓ Processed"
+            print(f"{action} {processed} profile picture(s); {missing} referenced file(s) missing.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"✗ Error during migration: {str(e)}")
+            raise
+
+
+if __name__ == '__main__':
+    process_profile_pictures(dry_run='--dry-run' in sys.argv)
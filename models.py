@@ -2,7 +2,7 @@ from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date, timezone
 from flask_login import UserMixin
-from sqlalchemy import event, text
+from sqlalchemy import event
 from sqlalchemy.exc import IntegrityError  # added
 
 db = SQLAlchemy()
@@ -145,8 +145,30 @@ class AgencyAccount(UserMixin, db.Model):
     def displayed_id(self):
         return str(self.account_id)
 
+USER_CATEGORIES = ('citizen', 'foreigner')
+
+
+def normalize_user_category(raw, passport_number=None, ic_number=None) -> str:
+    """'citizen' or 'foreigner' for a submitted category.
+
+    Case and surrounding spaces are ignored; anything else falls back to the
+    identity documents held: a passport without an IC means foreigner.
+    """
+    value = (raw or '').strip().lower()
+    if value in USER_CATEGORIES:
+        return value
+    if passport_number and not ic_number:
+        return 'foreigner'
+    return 'citizen'
+
+
 class User(UserMixin, db.Model):
     __tablename__ = 'user'
+    __table_args__ = (
+        # Normalized on every ORM write (see _normalize_user_category below) so
+        # trainee filters are plain indexed equality
+        db.CheckConstraint("user_category IN ('citizen', 'foreigner')", name='ck_user_user_category'),
+    )
 
     User_id = db.Column(db.Integer, primary_key=True)
     Profile_picture = db.Column(db.String(255))
@@ -155,7 +177,7 @@ class User(UserMixin, db.Model):
     full_name = db.Column(db.String(255), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
-    user_category = db.Column(db.String(20), nullable=False, default='citizen')  # 'citizen' or 'foreigner'
+    user_category = db.Column(db.String(20), nullable=False, default='citizen', index=True)  # 'citizen' or 'foreigner'
     is_finalized = db.Column(db.Boolean, nullable=False, default=False)  # signup finalized after onboarding
     visa_expiry_date = db.Column(db.Date)
     emergency_contact_phone = db.Column(db.String(20))
@@ -194,10 +216,18 @@ class User(UserMixin, db.Model):
 
     @property
     def profile_pic_url(self):
-        from flask import url_for
+        from uploads import upload_url
         if self.Profile_picture:
-            # Serve via unified uploads route so it works in dev/prod
-            return url_for('main.serve_uploaded_slide', filename=self.Profile_picture)
+            # Serve via unified uploads route so it works in dev/prod; versioned so browsers can cache it
+            return upload_url(self.Profile_picture)
+        return None
+
+    def profile_pic_thumb_url(self, size='sm'):
+        """URL of a resized WebP variant ('sm', 'md' or 'lg'), falling back to the original upload."""
+        from uploads import upload_url
+        from profile_images import variant_name
+        if self.Profile_picture:
+            return upload_url(variant_name(self.Profile_picture, size))
         return None
 
     @property
@@ -241,22 +271,8 @@ class User(UserMixin, db.Model):
         """
         if not course_type:
             return False
-        from models import Module, UserModule  # Use absolute import to avoid ImportError
-        # Get all modules for the course_type
-        all_modules = Module.query.filter_by(module_type=course_type).all()
-        if not all_modules:
-            return False
-        all_module_ids = [m.module_id for m in all_modules]
-        # Get all completed modules for this user in this course_type
-        completed_modules = UserModule.query.filter_by(user_id=self.User_id, is_completed=True).filter(UserModule.module_id.in_(all_module_ids)).all()
-        if len(completed_modules) != len(all_modules):
-            return False
-        # Overall average (ignore None)
-        scores = [um.score for um in completed_modules if um.score is not None]
-        if not scores:
-            return False
-        average = sum(scores) / len(scores)
-        return average >= 50
+        import certificate_eligibility
+        return certificate_eligibility.is_eligible(self.User_id, course_type, exclude_certified=False)
 
     def generateUserid(self):
         last_user = User.query.filter_by(agency_id=self.agency_id).order_by(User.User_id.desc()).first()
@@ -274,16 +290,8 @@ class User(UserMixin, db.Model):
 
     def has_completed_all_modules_in_course(self, course_type):
         """Check if user has completed ALL modules in a given course type"""
-        all_modules = Module.query.filter_by(module_type=course_type).all()
-        if not all_modules:
-            return False
-
-        completed_modules = UserModule.query.filter_by(
-            user_id=self.User_id,
-            is_completed=True
-        ).filter(UserModule.module_id.in_([m.module_id for m in all_modules])).all()
-
-        return len(completed_modules) == len(all_modules)
+        import certificate_eligibility
+        return certificate_eligibility.is_eligible(self.User_id, course_type, min_average=None, exclude_certified=False)
 
     def get_overall_grade_for_course(self, course_type):
         """Return overall letter grade based ONLY on course-level reattempt_count.
@@ -479,7 +487,10 @@ class Trainer(UserMixin, db.Model):
     active_status = db.Column(db.Boolean, default=True)
     availability = db.Column(db.String(100))
     contact_number = db.Column(db.Integer)
+    # Display label of the assigned course codes; trainer_course is authoritative (see trainer_scope.py)
     course = db.Column(db.String(255))
+    # True: may manage every course. False: only the trainer_course rows, possibly none
+    all_courses = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
     module_id = db.Column(db.Integer, db.ForeignKey('module.module_id'))
     # New prefixed series for trainers: TRYYYYNNNN
     number_series = db.Column(db.String(10), unique=True)
@@ -510,13 +521,45 @@ class Trainer(UserMixin, db.Model):
     @property
     def profile_pic_url(self):
         # Mirror User.profile_pic_url behavior for consistency
-        from flask import url_for
+        from uploads import upload_url
+        if self.profile_image:
+            return upload_url(self.profile_image)
+        return None
+
+    def profile_pic_thumb_url(self, size='sm'):
+        from uploads import upload_url
+        from profile_images import variant_name
         if self.profile_image:
-            return url_for('main.serve_uploaded_slide', filename=self.profile_image)
+            return upload_url(variant_name(self.profile_image, size))
         return None
 
+class TrainerCourse(db.Model):
+    """Course a trainer is scoped to; only consulted when Trainer.all_courses is false."""
+    __tablename__ = 'trainer_course'
+    __table_args__ = (
+        db.Index('ix_trainer_course_course', 'course_id'),
+    )
+
+    # The primary key doubles as the (trainer_id, course_id) lookup index
+    trainer_id = db.Column(db.Integer, db.ForeignKey('trainer.trainer_id'), primary_key=True)
+    course_id = db.Column(db.Integer, db.ForeignKey('course.course_id'), primary_key=True)
+    assigned_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+def grade_letter(reattempts):
+    """A for no reattempts, B for one and so on; 26 or more is Z+."""
+    attempts = reattempts or 0
+    if attempts >= 26:
+        return 'Z+'
+    return chr(ord('A') + attempts)
+
+
 class UserModule(db.Model):
     __tablename__ = 'user_module'
+    __table_args__ = (
+        # One progress row per trainee and module; quiz_submission upserts against it
+        db.Index('uq_user_module_user_module', 'user_id', 'module_id', unique=True),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.User_id'), nullable=False)
@@ -526,6 +569,9 @@ class UserModule(db.Model):
     completion_date = db.Column(db.DateTime)
     quiz_answers = db.Column(db.Text)
     reattempt_count = db.Column(db.Integer, default=0)  # added
+    # Set on the first autosave of an attempt; cleared on submit once the duration is recorded
+    quiz_started_at = db.Column(db.DateTime)
+    quiz_duration_seconds = db.Column(db.Integer)
 
     def get_completion_status(self):
         return self.is_completed
@@ -543,10 +589,49 @@ class UserModule(db.Model):
 
     def get_grade_letter(self):
         """Return letter grade based on per-module reattempt count if available; fallback to A."""
-        attempts = self.reattempt_count or 0
-        if attempts >= 26:
-            return 'Z+'
-        return chr(ord('A') + attempts)
+        return grade_letter(self.reattempt_count)
+
+class QuizAttempt(db.Model):
+    """One submitted quiz attempt; append-only history kept by quiz_attempts.py."""
+    __tablename__ = 'quiz_attempt'
+    __table_args__ = (
+        db.Index('ix_quiz_attempt_user_module', 'user_id', 'module_id', 'submitted_at'),
+        db.Index('ix_quiz_attempt_module', 'module_id', 'submitted_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.User_id'), nullable=False)
+    module_id = db.Column(db.Integer, db.ForeignKey('module.module_id'), nullable=False)
+    # Hash of the module's quiz_json when the attempt was scored
+    quiz_version = db.Column(db.String(16), nullable=False)
+    # One byte per question, see quiz_answers.pack_answers
+    answers = db.Column(db.LargeBinary, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    started_at = db.Column(db.DateTime)
+    submitted_at = db.Column(db.DateTime, nullable=False)
+
+class QuizModuleStats(db.Model):
+    """Per-module quiz item analytics computed by quiz_analytics.py."""
+    __tablename__ = 'quiz_module_stats'
+
+    module_id = db.Column(db.Integer, db.ForeignKey('module.module_id'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    question_count = db.Column(db.Integer, nullable=False, default=0)
+    avg_score = db.Column(db.Float)
+    avg_duration_seconds = db.Column(db.Float)
+    # JSON list, one entry per question: correct_rate, answered, distribution, discrimination
+    item_stats = db.Column(db.Text, default='[]')
+    # Answer key edits since the last computation; > 0 means stale. New
+    # submissions are the quiz_attempt rows submitted after computed_at
+    pending_submissions = db.Column(db.Integer, nullable=False, default=0)
+    computed_at = db.Column(db.DateTime)
+
+    def get_item_stats(self):
+        import json
+        try:
+            return json.loads(self.item_stats or '[]')
+        except (json.JSONDecodeError, TypeError):
+            return []
 
 class UserCourseProgress(db.Model):
     __tablename__ = 'user_course_progress'
@@ -558,6 +643,15 @@ class UserCourseProgress(db.Model):
     completion_date = db.Column(db.Date)
     reattempt_count = db.Column(db.Integer, default=0)
 
+class NumberSeriesCounter(db.Model):
+    """Last SG/TR counter handed out per year where the database has no sequences (see number_series.py)."""
+    __tablename__ = 'number_series_counter'
+
+    series = db.Column(db.String(2), primary_key=True)
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+
 class Management:
     def getDashboard(self):
         from sqlalchemy.sql import func, case
@@ -649,35 +743,26 @@ class Registration:
 
         user.set_password(user_data['password'])
 
-        # Define these variables outside try-except so they're always available
-        year = datetime.now(UTC).strftime('%Y')
-        seq_name = f'user_number_series_{year}_seq'
-
+        from number_series import allocator
         try:
+            # SG + current year + 4-digit per-year counter, see number_series.py
+            user.number_series = allocator.allocate('SG')
             db.session.add(user)
-            db.session.flush()
-            # Set number_series with prefix SG + current year + 4-digit sequence per-year
-            db.session.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {seq_name}"))
-            seq_val = db.session.execute(text(f"SELECT nextval('{seq_name}')")).scalar()
-            user.number_series = f"SG{year}{int(seq_val):04d}"
             db.session.commit()
         except IntegrityError as e:
             db.session.rollback()
-            # Check if this is a duplicate email error (shouldn't happen due to pre-check, but just in case)
-            if 'user_email_key' in str(e.orig) or 'duplicate key value violates unique constraint' in str(e.orig):
+            # A concurrent signup with the same email got past the pre-check
+            if 'email' in str(e.orig):
                 raise ValueError(f"Email {user_data['email']} is already registered. Please use a different email.")
-
-            # If it's a different integrity error (like sequence conflicts), retry once
-            try:
-                seq_val = db.session.execute(text(f"SELECT nextval('{seq_name}')")).scalar()
-                user.number_series = f"SG{year}{int(seq_val):04d}"
-                db.session.add(user)
-                db.session.commit()
-            except IntegrityError as retry_error:
-                db.session.rollback()
-                raise RuntimeError(f"Failed to register user after retry: {str(retry_error)}")
+            raise RuntimeError(f"Failed to register user: {str(e)}")
         return user
 
+@event.listens_for(User, 'before_insert')
+@event.listens_for(User, 'before_update')
+def _normalize_user_category(mapper, connection, target):
+    target.user_category = normalize_user_category(target.user_category, target.passport_number, target.ic_number)
+
+
 class WorkHistory(db.Model):
     __tablename__ = 'work_history'
 
@@ -724,3 +809,35 @@ class ApprovalAudit(db.Model):
 
     certificate = db.relationship('Certificate', backref='approval_audits')
     approver = db.relationship('User', foreign_keys=[approved_by_id])
+
+
+class EmailOutbox(db.Model):
+    """Queued outbound email, delivered by the background sender in email_outbox.py."""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_due', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    # pending -> sending -> sent, or failed after the last attempt
+    status = db.Column(db.String(20), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # A sender owns a 'sending' row until this time; afterwards it may be reclaimed
+    locked_until = db.Column(db.DateTime)
+    provider = db.Column(db.String(40))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+
+class CacheVersion(db.Model):
+    """Version counter of a process-local cache namespace, bumped by writers; see cache_bus.py."""
+    __tablename__ = 'cache_version'
+
+    namespace = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
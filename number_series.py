@@ -0,0 +1,157 @@
+"""
+Allocation of the yearly SG (trainee) and TR (trainer) number series.
+
+A number is a two-letter prefix, the year and a four-digit counter that
+restarts every year: SG20250001, TR20250001.
+
+PostgreSQL keeps one sequence per series and year (user_number_series_2025_seq,
+the names the 20250818 migration introduced). Each process creates the year's
+sequence -- moving it past any number already stored -- once, on first use or
+via `flask init-db`, instead of issuing CREATE SEQUENCE on every signup. That
+DDL runs in its own transaction on a second pooled connection, so no lock is
+held around it: a thread waiting for a connection never blocks the threads
+that hold the others. Values
+are then reserved NUMBER_SERIES_BLOCK at a time (nextval over generate_series,
+one round trip) and handed out from memory. Sequence values are never given
+back, so a worker that exits with part of a block unused leaves a gap, exactly
+like a failed registration did before.
+
+SQLite (and anything else without sequences) uses one number_series_counter
+row per series and year, bumped inside the caller's transaction. SQLite
+serialises writers anyway, so reserving blocks would buy nothing, and a
+rolled-back registration gives its number back. The row starts from the
+highest number already stored, so seeded or imported data is respected.
+"""
+from collections import deque, namedtuple
+from datetime import datetime, timezone
+import logging
+import os
+import threading
+
+from sqlalchemy import Integer, cast, func, insert, select, text, update
+from sqlalchemy.exc import DBAPIError
+
+from models import db, NumberSeriesCounter, Trainer, User
+
+BLOCK_SIZE = int(os.environ.get('NUMBER_SERIES_BLOCK', '20'))
+# number_series columns are String(10): prefix (2) + year (4) + counter (4)
+MAX_PER_YEAR = 9999
+
+Series = namedtuple('Series', 'prefix column sequence')
+
+SERIES = {
+    'SG': Series('SG', User.number_series, 'user_number_series_{year}_seq'),
+    'TR': Series('TR', Trainer.number_series, 'trainer_number_series_{year}_seq'),
+}
+
+
+def format_number(prefix: str, year: int, value: int) -> str:
+    if value > MAX_PER_YEAR:
+        raise RuntimeError(f'{prefix} number series for {year} is exhausted ({MAX_PER_YEAR} numbers)')
+    return f'{prefix}{year}{value:04d}'
+
+
+def highest_stored(session, series: Series, year: int) -> int:
+    """Largest counter already used by `series` in `year`, 0 if none."""
+    column = series.column
+    counter = cast(func.substr(column, len(series.prefix) + 5), Integer)
+    return session.execute(
+        select(func.coalesce(func.max(counter), 0)).where(column.like(f'{series.prefix}{year}%'))
+    ).scalar() or 0
+
+
+class NumberSeriesAllocator:
+    """Hands out SG/TR numbers; one instance is shared by the whole process."""
+
+    def __init__(self, block_size: int = BLOCK_SIZE):
+        self.block_size = max(1, block_size)
+        self._blocks = {}
+        self._prepared = set()
+        self._lock = threading.Lock()
+
+    def allocate(self, prefix: str, session=None, year: int = None) -> str:
+        """Next number of series `prefix` ('SG' or 'TR') for `year` (default: this UTC year)."""
+        series = SERIES[prefix]
+        session = session or db.session
+        year = year or datetime.now(timezone.utc).year
+        if session.get_bind().dialect.name == 'postgresql':
+            value = self._next_from_block(session, series, year)
+        else:
+            value = self._next_from_counter(session, series, year)
+        return format_number(prefix, year, value)
+
+    def prepare(self, session=None, year: int = None) -> None:
+        """Create and align this year's sequences now rather than on the first signup."""
+        session = session or db.session
+        if session.get_bind().dialect.name != 'postgresql':
+            return
+        year = year or datetime.now(timezone.utc).year
+        for series in SERIES.values():
+            self._ensure_sequence(session, series, year)
+
+    # PostgreSQL: per-year sequences, reserved in blocks
+
+    def _next_from_block(self, session, series, year):
+        key = (str(session.get_bind().url), series.prefix, year)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block:
+                return block.popleft()
+        # No lock is held for the round trips. Creating the sequence takes a second
+        # pool connection, and threads queued on the lock each hold one already.
+        # Two threads refilling at once both reserve a block; both get used.
+        self._ensure_sequence(session, series, year)
+        values = self._reserve(session, series.sequence.format(year=year), self.block_size)
+        with self._lock:
+            block = self._blocks.setdefault(key, deque())
+            block.extend(values)
+            return block.popleft()
+
+    def _reserve(self, session, sequence, count):
+        return [v for (v,) in session.execute(
+            text(f"SELECT nextval('{sequence}') FROM generate_series(1, :n)"), {'n': count}
+        )]
+
+    def _ensure_sequence(self, session, series, year):
+        bind = session.get_bind()
+        key = (str(bind.url), series.sequence, year)
+        if key in self._prepared:
+            return
+        sequence = series.sequence.format(year=year)
+        for attempt in (1, 2):
+            try:
+                # Own transaction: the DDL must survive a rollback of the caller's registration
+                with bind.engine.begin() as conn:
+                    conn.execute(text(f'CREATE SEQUENCE IF NOT EXISTS {sequence}'))
+                    top = highest_stored(conn, series, year)
+                    if top:
+                        conn.execute(text(
+                            f"SELECT setval('{sequence}', :top) FROM {sequence} "
+                            f"WHERE (CASE WHEN is_called THEN last_value ELSE last_value - 1 END) < :top"
+                        ), {'top': top})
+                break
+            except DBAPIError:
+                # A concurrent CREATE SEQUENCE IF NOT EXISTS can still collide; the retry sees the sequence
+                if attempt == 2:
+                    raise
+        with self._lock:
+            # Blocks of earlier years can no longer be used
+            for stale in [k for k in self._blocks if k[0] == key[0] and k[2] != year]:
+                del self._blocks[stale]
+            self._prepared.add(key)
+        logging.info(f'[NUMBER SERIES] Sequence {sequence} ready (highest stored: {top})')
+
+    # Other databases: a counter row updated in the caller's transaction
+
+    def _next_from_counter(self, session, series, year):
+        table = NumberSeriesCounter.__table__
+        match = (table.c.series == series.prefix) & (table.c.year == year)
+        bumped = session.execute(update(table).where(match).values(last_value=table.c.last_value + 1))
+        if bumped.rowcount:
+            return session.execute(select(table.c.last_value).where(match)).scalar()
+        value = highest_stored(session, series, year) + 1
+        session.execute(insert(table).values(series=series.prefix, year=year, last_value=value))
+        return value
+
+
+allocator = NumberSeriesAllocator()
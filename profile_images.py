@@ -0,0 +1,108 @@
+"""
+Profile picture processing.
+
+Uploaded pictures are never served at their original size. On upload the image
+is decoded once (EXIF orientation applied, first frame of animations) and
+written as a set of resized variants under UPLOAD_FOLDER/profile_pics/:
+
+    user12_<hash>.jpg       1024px JPEG, the stored Profile_picture value
+    user12_<hash>_lg.webp   1024px
+    user12_<hash>_md.webp    320px  profile pages, dashboard card
+    user12_<hash>_sm.webp     96px  sidebar avatar, lists
+
+Sizes are the longest edge; aspect ratio is kept (passport photos are not
+square). <hash> is taken from the uploaded bytes, so a new picture always gets
+new URLs and the old ones can be cached as immutable (see uploads.py).
+Pictures stored before this pipeline keep working: variant_name() falls back
+to the stored file.
+"""
+import hashlib
+import io
+import os
+import re
+
+from flask import current_app
+
+SUBFOLDER = 'profile_pics'
+VARIANT_SIZES = {'sm': 96, 'md': 320, 'lg': 1024}
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+HASH_LENGTH = 16
+
+_PROCESSED_RE = re.compile(r'^(?P<base>.+_[0-9a-f]{%d})\.jpg$' % HASH_LENGTH)
+
+
+class InvalidImage(ValueError):
+    """Raised when an upload cannot be decoded as an image."""
+
+
+def _folder() -> str:
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], SUBFOLDER)
+
+
+def _resized(image, edge: int):
+    from PIL import Image
+    copy = image.copy()
+    copy.thumbnail((edge, edge), Image.LANCZOS)
+    return copy
+
+
+def _flatten(image):
+    """Return an RGB image, compositing transparency onto white."""
+    from PIL import Image
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def save_profile_picture(file_storage, owner_prefix: str) -> str:
+    """Process an uploaded profile picture and return the value to store in the model.
+
+    `owner_prefix` (e.g. 'user12') keeps users from overwriting each other's files.
+    Raises InvalidImage if the upload is not a readable image.
+    """
+    # Pillow is only needed when a picture is uploaded; keep it out of worker startup
+    from PIL import Image, ImageOps, UnidentifiedImageError
+    data = file_storage.read()
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    try:
+        with Image.open(io.BytesIO(data)) as source:
+            source.seek(0)
+            image = _flatten(ImageOps.exif_transpose(source))
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e)) from e
+
+    base = f"{owner_prefix}_{digest}"
+    folder = _folder()
+    os.makedirs(folder, exist_ok=True)
+    largest = _resized(image, VARIANT_SIZES['lg'])
+    largest.save(os.path.join(folder, f"{base}.jpg"), 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    for size, edge in VARIANT_SIZES.items():
+        variant = largest if size == 'lg' else _resized(largest, edge)
+        variant.save(os.path.join(folder, f"{base}_{size}.webp"), 'WEBP', quality=WEBP_QUALITY, method=4)
+    return f"{SUBFOLDER}/{base}.jpg"
+
+
+def variant_name(stored: str, size: str = 'sm') -> str:
+    """Return the stored path of a WebP variant, or `stored` itself for unprocessed pictures."""
+    if not stored or size not in VARIANT_SIZES:
+        return stored
+    match = _PROCESSED_RE.match(stored)
+    if not match:
+        return stored
+    return f"{match.group('base')}_{size}.webp"
+
+
+def delete_profile_picture(stored: str) -> None:
+    """Remove a processed picture and its variants (unprocessed legacy files are left alone)."""
+    if not stored or not _PROCESSED_RE.match(stored):
+        return
+    upload_root = current_app.config['UPLOAD_FOLDER']
+    for name in [stored] + [variant_name(stored, size) for size in VARIANT_SIZES]:
+        try:
+            os.remove(os.path.join(upload_root, *name.split('/')))
+        except OSError:
+            pass
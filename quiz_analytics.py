@@ -0,0 +1,285 @@
+"""
+Quiz item analytics: per-question difficulty and distractor statistics.
+
+For every module the latest submitted attempt of each trainee (quiz_attempt,
+or user_module for submissions older than that table) is loaded into an
+(attempts x questions) uint8 matrix (see quiz_answers.py for the packed format)
+and analysed with NumPy:
+
+- correct_rate: share of attempts that picked the correct answer
+- distribution: how many attempts picked each option (distractor analysis)
+- discrimination: upper 27% minus lower 27% correct rate, ranked by total correct
+- avg_duration_seconds: mean time from first autosave to submit
+
+Results are stored in QuizModuleStats. Submissions do not touch the stats row:
+a module is stale when quiz_attempt has rows submitted after its computed_at
+(an index range scan on ix_quiz_attempt_module), so concurrent submits to one
+module never queue on a shared counter. Answer key edits, which are rare admin
+writes, call mark_stale(). The stale modules are recomputed in batch by running:
+
+    python quiz_analytics.py            # modules with new submissions or edits
+    python quiz_analytics.py --all      # every module with a quiz
+    python quiz_analytics.py 12 15      # specific module ids
+"""
+from datetime import datetime
+import json
+import logging
+import sys
+from typing import TYPE_CHECKING
+
+from sqlalchemy import exists, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Module, UserModule, QuizAttempt, QuizModuleStats
+from quiz_answers import UNANSWERED, decode_packed, extract_questions, correct_index
+
+# NumPy is imported inside the numeric helpers: the web workers only call
+# mark_stale() and stats_by_module() and should not load it at startup.
+if TYPE_CHECKING:
+    import numpy as np
+
+DISCRIMINATION_GROUP = 0.27
+FETCH_BATCH = 5000
+
+
+def build_answer_matrix(packed_rows, question_count: int) -> 'np.ndarray':
+    """Stack packed answer rows into an (n, question_count) uint8 matrix.
+
+    Short rows are padded as unanswered and extra answers beyond the quiz length are dropped.
+    """
+    import numpy as np
+    matrix = np.full((len(packed_rows), question_count), UNANSWERED, dtype=np.uint8)
+    for i, packed in enumerate(packed_rows):
+        if packed:
+            row = np.frombuffer(packed[:question_count], dtype=np.uint8)
+            matrix[i, :row.size] = row
+    return matrix
+
+
+def compute_item_stats(matrix: 'np.ndarray', key, option_counts=None) -> list:
+    """Return per-question statistics for an answer matrix and answer key.
+
+    `key` holds the correct index per question (-1 when a question has no marked answer).
+    `option_counts` optionally gives the number of options per question so the
+    distribution also lists options nobody picked.
+    """
+    import numpy as np
+    n, q = matrix.shape
+    key_arr = np.asarray(key, dtype=np.int16)[:q]
+    if key_arr.size < q:
+        key_arr = np.concatenate([key_arr, np.full(q - key_arr.size, -1, dtype=np.int16)])
+    answered = matrix != UNANSWERED
+    correct = (matrix.astype(np.int16) == key_arr) & (key_arr >= 0)
+
+    answered_count = answered.sum(axis=0)
+    correct_rate = correct.mean(axis=0) if n else np.zeros(q)
+
+    # Option histogram per question with a single bincount over (question, option) cells
+    observed_max = int(matrix[answered].max()) + 1 if answered.any() else 0
+    declared_max = max(option_counts) if option_counts else 0
+    width = max(observed_max, declared_max, int(key_arr.max()) + 1 if q else 0, 1)
+    cells = (np.arange(q, dtype=np.int64) * width + matrix.astype(np.int64))[answered]
+    distribution = np.bincount(cells, minlength=q * width).reshape(q, width)
+
+    # Discrimination index: correct rate of the top group minus the bottom group
+    discrimination = None
+    if n >= 2:
+        group = max(1, int(round(n * DISCRIMINATION_GROUP)))
+        order = np.argsort(correct.sum(axis=1), kind='stable')
+        discrimination = correct[order[-group:]].mean(axis=0) - correct[order[:group]].mean(axis=0)
+
+    out = []
+    for i in range(q):
+        options = option_counts[i] if option_counts and i < len(option_counts) and option_counts[i] else width
+        out.append({
+            'question': i + 1,
+            'correct_index': int(key_arr[i]),
+            'answered': int(answered_count[i]),
+            'unanswered': int(n - answered_count[i]),
+            'correct_rate': round(float(correct_rate[i]), 4),
+            'distribution': [int(c) for c in distribution[i, :max(options, 1)]],
+            'discrimination': round(float(discrimination[i]), 4) if discrimination is not None else None,
+        })
+    return out
+
+
+def _load_module_attempts(module_id: int):
+    """Return (packed answers, scores, durations) of each trainee's latest submitted attempt.
+
+    Attempts come from quiz_attempt. Trainees with no quiz_attempt rows (their
+    submissions predate it) fall back to user_module, but only when no
+    reattempt is autosaving: until the submit, quiz_answers holds the
+    unsubmitted answers.
+    """
+    import numpy as np
+    packed_rows, scores, durations = [], [], []
+    latest = (
+        select(QuizAttempt.answers, QuizAttempt.score, QuizAttempt.started_at, QuizAttempt.submitted_at,
+               func.row_number().over(partition_by=QuizAttempt.user_id,
+                                      order_by=(QuizAttempt.submitted_at.desc(), QuizAttempt.id.desc())).label('rn'))
+        .where(QuizAttempt.module_id == module_id)
+        .subquery()
+    )
+    attempts = db.session.execute(
+        select(latest.c.answers, latest.c.score, latest.c.started_at, latest.c.submitted_at).where(latest.c.rn == 1),
+        execution_options={'yield_per': FETCH_BATCH},
+    )
+    for answers, score, started_at, submitted_at in attempts:
+        packed_rows.append(bytes(answers))
+        scores.append(float(score))
+        durations.append((submitted_at - started_at).total_seconds() if started_at else np.nan)
+
+    has_attempt = exists().where(QuizAttempt.module_id == module_id, QuizAttempt.user_id == UserModule.user_id)
+    query = (
+        db.session.query(UserModule.quiz_answers, UserModule.score, UserModule.quiz_duration_seconds)
+        .filter(UserModule.module_id == module_id, UserModule.is_completed.is_(True), UserModule.quiz_answers.isnot(None),
+                UserModule.quiz_started_at.is_(None), ~has_attempt)
+        .execution_options(yield_per=FETCH_BATCH)
+    )
+    for raw, score, duration in query:
+        try:
+            packed_rows.append(decode_packed(raw))
+        except ValueError:
+            logging.warning('[QUIZ ANALYTICS] Skipping non-canonical quiz_answers for module %s', module_id)
+            continue
+        scores.append(np.nan if score is None else float(score))
+        durations.append(np.nan if duration is None else float(duration))
+    return packed_rows, np.asarray(scores, dtype=float), np.asarray(durations, dtype=float)
+
+
+def _nanmean(values: 'np.ndarray'):
+    import numpy as np
+    values = values[~np.isnan(values)]
+    return round(float(values.mean()), 2) if values.size else None
+
+
+def refresh_module_stats(module_id: int, commit: bool = True):
+    """Recompute and store QuizModuleStats for one module. Returns the stats row (None if module missing)."""
+    module = db.session.get(Module, module_id)
+    if not module:
+        return None
+    questions = extract_questions(module.quiz_json)
+    key = [correct_index(q) for q in questions]
+    option_counts = [len(q.get('answers') or []) if isinstance(q, dict) and isinstance(q.get('answers'), list) else 0 for q in questions]
+    # Take the watermark and the edit count before loading, so submissions and
+    # edits that arrive meanwhile leave the module stale. An attempt stamped
+    # just before the watermark but committed after the load is counted by the
+    # next refresh that a later submission triggers
+    started = datetime.utcnow()
+    row = db.session.get(QuizModuleStats, module_id)
+    pending_seen = row.pending_submissions if row else 0
+
+    packed_rows, scores, durations = _load_module_attempts(module_id)
+    matrix = build_answer_matrix(packed_rows, len(key))
+    items = compute_item_stats(matrix, key, option_counts)
+    for item, q in zip(items, questions):
+        text = (q.get('text') or q.get('question') or '') if isinstance(q, dict) else ''
+        item['text'] = str(text)[:120]
+
+    if row is None:
+        row = QuizModuleStats(module_id=module_id, pending_submissions=0)
+        db.session.add(row)
+    row.attempts = int(matrix.shape[0])
+    row.question_count = len(key)
+    row.avg_score = _nanmean(scores)
+    row.avg_duration_seconds = _nanmean(durations)
+    row.item_stats = json.dumps(items)
+    if pending_seen:
+        row.pending_submissions = QuizModuleStats.pending_submissions - pending_seen
+    row.computed_at = started
+    if commit:
+        db.session.commit()
+    return row
+
+
+def mark_stale(module_id: int) -> None:
+    """Record that a module's questions or answer key changed without recomputing.
+
+    Only for quiz edits: new submissions are found through quiz_attempt.
+    Runs inside the caller's transaction; the caller commits.
+    """
+    stmt = (
+        update(QuizModuleStats)
+        .where(QuizModuleStats.module_id == module_id)
+        .values(pending_submissions=QuizModuleStats.pending_submissions + 1)
+    )
+    if db.session.execute(stmt).rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(QuizModuleStats(module_id=module_id, pending_submissions=1))
+    except IntegrityError:
+        # Another request created the row first
+        db.session.execute(stmt)
+
+
+def refresh_stale_modules(all_modules: bool = False) -> int:
+    """Recompute stats for stale modules (or every module with a quiz). Returns the count refreshed."""
+    if all_modules:
+        module_ids = [mid for (mid,) in db.session.query(Module.module_id).filter(Module.quiz_json.isnot(None))]
+    else:
+        newer_attempt = exists().where(
+            QuizAttempt.module_id == Module.module_id,
+            or_(QuizModuleStats.computed_at.is_(None), QuizAttempt.submitted_at > QuizModuleStats.computed_at),
+        )
+        module_ids = list(db.session.scalars(
+            select(Module.module_id)
+            .outerjoin(QuizModuleStats, QuizModuleStats.module_id == Module.module_id)
+            .where(or_(QuizModuleStats.pending_submissions > 0, newer_attempt))
+        ))
+    for module_id in module_ids:
+        try:
+            refresh_module_stats(module_id)
+        except Exception:
+            db.session.rollback()
+            logging.exception('[QUIZ ANALYTICS] Failed refreshing module %s', module_id)
+    return len(module_ids)
+
+
+def new_submission_counts(module_ids) -> dict:
+    """Return {module_id: attempts submitted since the stats were computed}, omitting zeros."""
+    module_ids = list(module_ids)
+    if not module_ids:
+        return {}
+    rows = db.session.execute(
+        select(QuizAttempt.module_id, func.count())
+        .join(QuizModuleStats, QuizModuleStats.module_id == QuizAttempt.module_id)
+        .where(QuizAttempt.module_id.in_(module_ids), QuizAttempt.submitted_at > QuizModuleStats.computed_at)
+        .group_by(QuizAttempt.module_id)
+    )
+    return dict(rows.all())
+
+
+def stats_by_module(module_ids) -> dict:
+    """Return {module_id: QuizModuleStats} for the given modules (for templates).
+
+    Each row also gets a `new_submissions` attribute from new_submission_counts().
+    """
+    module_ids = list(module_ids)
+    if not module_ids:
+        return {}
+    rows = QuizModuleStats.query.filter(QuizModuleStats.module_id.in_(module_ids)).all()
+    counts = new_submission_counts(row.module_id for row in rows)
+    for row in rows:
+        row.new_submissions = counts.get(row.module_id, 0)
+    return {row.module_id: row for row in rows}
+
+
+def main(argv):
+    from app import app
+    with app.app_context():
+        if '--all' in argv[1:]:
+            count = refresh_stale_modules(all_modules=True)
+        else:
+            ids = [int(a) for a in argv[1:] if a.isdigit()]
+            if ids:
+                for module_id in ids:
+                    refresh_module_stats(module_id)
+                count = len(ids)
+            else:
+                count = refresh_stale_modules()
+        print(f"Quiz analytics refreshed for {count} module(s).")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,222 @@
+"""
+Canonical storage format for UserModule.quiz_answers.
+
+Answers are stored as a short text value: a version header followed by the
+URL-safe base64 of one byte per question. Byte values 0-254 are the selected
+answer index and 255 marks an unanswered question. A 20 question quiz takes
+31 characters instead of the 60+ characters of a JSON array.
+
+Example: ``a1:AAEC_w`` -> ``[0, 1, 2, None]``
+
+Legacy rows (JSON arrays, double encoded JSON, bracket/comma separated text)
+are converted once by ``migrations/normalize_quiz_answers.py`` using
+``parse_legacy_answers``; the request path only ever calls ``decode_answers``.
+
+The module also holds the answer-key helpers shared by quiz scoring, review,
+the quiz player payload and quiz analytics, so they all agree on which option
+is correct.
+"""
+from typing import Any, List, Optional
+import base64
+import hashlib
+import json
+
+FORMAT_PREFIX = 'a1:'
+UNANSWERED = 0xFF
+MAX_ANSWER_INDEX = UNANSWERED - 1
+
+
+def normalize_answer(value: Any) -> Optional[int]:
+    """Return a stored answer index for a client supplied value, or None if unanswered/invalid."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        idx = int(value)
+    except (TypeError, ValueError):
+        try:
+            f = float(value)
+        except (TypeError, ValueError):
+            return None
+        if not f.is_integer():
+            return None
+        idx = int(f)
+    if idx < 0 or idx > MAX_ANSWER_INDEX:
+        return None
+    return idx
+
+
+def pack_answers(answers) -> bytes:
+    """Pack a list of answer indexes (None for unanswered) into one byte per question."""
+    return bytes(UNANSWERED if a is None else a for a in (normalize_answer(v) for v in (answers or [])))
+
+
+def unpack_answers(packed: bytes) -> List[Optional[int]]:
+    """Inverse of pack_answers."""
+    return [None if b == UNANSWERED else b for b in packed]
+
+
+def encode_answers(answers) -> str:
+    """Encode answers into the canonical stored text form."""
+    packed = pack_answers(answers)
+    return FORMAT_PREFIX + base64.urlsafe_b64encode(packed).decode('ascii').rstrip('=')
+
+
+def is_encoded(raw: Any) -> bool:
+    return isinstance(raw, str) and raw.startswith(FORMAT_PREFIX)
+
+
+def decode_packed(raw: Optional[str]) -> bytes:
+    """Return the packed bytes of a stored value (empty for NULL/empty).
+
+    Raises ValueError when the value is not in the canonical format.
+    """
+    if not raw:
+        return b''
+    if not is_encoded(raw):
+        raise ValueError('quiz_answers is not in canonical format; run migrations/normalize_quiz_answers.py')
+    body = raw[len(FORMAT_PREFIX):]
+    return base64.urlsafe_b64decode(body + '=' * (-len(body) % 4))
+
+
+def decode_answers(raw: Optional[str]) -> List[Optional[int]]:
+    """Decode a stored quiz_answers value into a list of answer indexes (None for unanswered)."""
+    return unpack_answers(decode_packed(raw))
+
+
+def parse_legacy_answers(raw: Any) -> List[Optional[int]]:
+    """Best-effort parsing of pre-canonical quiz_answers values.
+
+    Handles bytes, JSON arrays, double encoded JSON strings, bracketed lists that are
+    not valid JSON and bare comma separated values. Only used by the normalization migration.
+    """
+    if raw is None:
+        return []
+    if isinstance(raw, (list, tuple)):
+        return [normalize_answer(v) for v in raw]
+    if isinstance(raw, (bytes, bytearray)):
+        try:
+            raw = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            raw = raw.decode('latin-1')
+    s = str(raw).strip()
+    if not s:
+        return []
+    if is_encoded(s):
+        return decode_answers(s)
+    try:
+        parsed = json.loads(s)
+        if isinstance(parsed, str):
+            parsed = json.loads(parsed)
+        if isinstance(parsed, list):
+            return [normalize_answer(v) for v in parsed]
+        if parsed is None:
+            return []
+        return [normalize_answer(parsed)]
+    except (ValueError, TypeError):
+        pass
+    if s.startswith('[') and s.endswith(']'):
+        s = s[1:-1].strip()
+        if not s:
+            return []
+    out = []
+    for part in s.split(','):
+        p = part.strip().strip('"\'')
+        out.append(None if p.lower() in ('', 'null', 'none') else normalize_answer(p))
+    return out
+
+
+def extract_questions(quiz_json: Optional[str]) -> list:
+    """Return the list of question dicts stored in Module.quiz_json.
+
+    Accepts a plain list, a dict with 'questions'/'quiz' keys, or a single question dict.
+    """
+    try:
+        parsed = json.loads(quiz_json) if quiz_json else []
+    except (ValueError, TypeError):
+        return []
+    if isinstance(parsed, list):
+        return parsed
+    if isinstance(parsed, dict):
+        if isinstance(parsed.get('questions'), list):
+            return parsed['questions']
+        if isinstance(parsed.get('quiz'), list):
+            return parsed['quiz']
+        if 'text' in parsed and 'answers' in parsed:
+            return [parsed]
+    return []
+
+
+def correct_index(question: Any) -> int:
+    """Return the correct answer index for a question dict, or -1 if none is marked."""
+    if not isinstance(question, dict):
+        return -1
+    correct_idx = -1
+    # check question-level keys
+    if isinstance(question.get('correctIndex'), int):
+        correct_idx = question.get('correctIndex')
+    elif isinstance(question.get('correct'), int):
+        correct_idx = question.get('correct')
+    elif isinstance(question.get('correct'), str) and question.get('correct').isdigit():
+        correct_idx = int(question.get('correct'))
+    # an answer flagged as correct wins over question-level keys
+    raw_answers = question.get('answers')
+    if isinstance(raw_answers, list):
+        for i, a in enumerate(raw_answers):
+            if isinstance(a, dict):
+                if a.get('isCorrect') or a.get('is_correct') or a.get('correct') is True or a.get('isAnswer') or a.get('answer_is_correct'):
+                    return i
+    return correct_idx
+
+
+def answer_key(quiz_json: Optional[str]) -> List[int]:
+    """Compile Module.quiz_json into the list of correct answer indexes used for scoring."""
+    return [correct_index(q) for q in extract_questions(quiz_json)]
+
+
+def quiz_version(quiz_json: Optional[str]) -> str:
+    """Short hash identifying one revision of Module.quiz_json; stored with each attempt."""
+    return hashlib.sha256((quiz_json or '').encode('utf-8')).hexdigest()[:16]
+
+
+def score_answers(answers, key: List[int]) -> float:
+    """Return the percentage score (rounded to a whole number) of answers against an answer key."""
+    total = len(key)
+    if total == 0:
+        return 0
+    correct_count = 0
+    for given, expected in zip(answers, key):
+        if given is not None and expected != -1 and given == expected:
+            correct_count += 1
+    return round((correct_count / total) * 100, 0)
+
+
+def player_questions(quiz_json: Optional[str]) -> list:
+    """Normalize Module.quiz_json into the list served to the quiz player.
+
+    Each question becomes {'text', 'answers': [{'text', 'isCorrect'}], 'correctIndex'}.
+    """
+    out = []
+    for q in extract_questions(quiz_json):
+        if not isinstance(q, dict):
+            continue
+        q_text = q.get('text') or q.get('question') or ''
+        answers = []
+        raw_answers = q.get('answers') or q.get('choices') or []
+        if isinstance(raw_answers, dict):
+            # convert dict to list of {text:..., isCorrect:...}
+            for v in raw_answers.values():
+                if isinstance(v, dict):
+                    answers.append({'text': v.get('text', str(v)), 'isCorrect': bool(v.get('isCorrect', False))})
+                else:
+                    answers.append({'text': str(v), 'isCorrect': False})
+        elif isinstance(raw_answers, list):
+            for a in raw_answers:
+                if isinstance(a, dict):
+                    answers.append({'text': a.get('text', ''), 'isCorrect': bool(a.get('isCorrect', False))})
+                else:
+                    answers.append({'text': str(a), 'isCorrect': False})
+        correct_idx = correct_index(q)
+        if correct_idx != -1 and correct_idx < len(answers):
+            answers[correct_idx]['isCorrect'] = True
+        out.append({'text': q_text, 'answers': answers, 'correctIndex': correct_idx})
+    return out
@@ -0,0 +1,123 @@
+"""
+Append-only history of submitted quiz attempts.
+
+user_module keeps one row per trainee and module with the best score and the
+latest answers. Every submission is also appended to quiz_attempt, in the same
+transaction, with:
+
+- quiz_version: hash of the module's quiz_json it was scored against, so a
+  later edit of the questions or the answer key is visible
+- answers: the packed bytes of quiz_answers.pack_answers (one per question)
+- score, started_at (the attempt's first autosave) and submitted_at
+
+Rows are never updated. Indexes on (user_id, module_id, submitted_at) and
+(module_id, submitted_at) serve the per-trainee review and per-module scans.
+
+Retention: per trainee and module the newest QUIZ_ATTEMPT_KEEP attempts
+(default 20) and the best-scoring one are kept forever; older attempts are
+deleted once they are QUIZ_ATTEMPT_RETENTION_DAYS old (default 365):
+
+    python quiz_attempts.py prune [--dry-run]
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+import os
+import sys
+
+from sqlalchemy import delete, func, insert, select
+
+from models import db, QuizAttempt, UserModule
+from quiz_answers import pack_answers, quiz_version, unpack_answers
+
+KEEP_PER_MODULE = int(os.environ.get('QUIZ_ATTEMPT_KEEP', '20'))
+RETENTION_DAYS = int(os.environ.get('QUIZ_ATTEMPT_RETENTION_DAYS', '365'))
+
+AttemptSummary = namedtuple('AttemptSummary', 'id score quiz_version started_at submitted_at')
+
+
+def record(user_id: int, module_id: int, quiz_json, answers, score: float,
+           now: datetime = None, session=None) -> None:
+    """Append a submitted attempt; must run before the submission clears quiz_started_at.
+
+    Runs inside the caller's transaction; the caller commits.
+    """
+    session = session or db.session
+    started_at = (select(UserModule.quiz_started_at)
+                  .where(UserModule.user_id == user_id, UserModule.module_id == module_id)
+                  .scalar_subquery())
+    session.execute(insert(QuizAttempt.__table__).values(
+        user_id=user_id, module_id=module_id, quiz_version=quiz_version(quiz_json),
+        answers=pack_answers(answers), score=float(score),
+        started_at=started_at, submitted_at=now or datetime.utcnow(),
+    ))
+
+
+def history(user_id: int, module_id: int, session=None) -> list:
+    """[AttemptSummary] of one trainee's attempts at a module, newest first."""
+    session = session or db.session
+    rows = session.execute(
+        select(QuizAttempt.id, QuizAttempt.score, QuizAttempt.quiz_version,
+               QuizAttempt.started_at, QuizAttempt.submitted_at)
+        .where(QuizAttempt.user_id == user_id, QuizAttempt.module_id == module_id)
+        .order_by(QuizAttempt.submitted_at.desc(), QuizAttempt.id.desc())
+    )
+    return [AttemptSummary(*row) for row in rows]
+
+
+def get(user_id: int, module_id: int, attempt_id: int, session=None):
+    """The trainee's attempt `attempt_id` at the module, or None."""
+    session = session or db.session
+    return session.execute(
+        select(QuizAttempt).where(QuizAttempt.id == attempt_id, QuizAttempt.user_id == user_id,
+                                  QuizAttempt.module_id == module_id)
+    ).scalar_one_or_none()
+
+
+def answers_of(attempt: QuizAttempt) -> list:
+    return unpack_answers(attempt.answers)
+
+
+def _expired(keep: int, cutoff: datetime):
+    group = (QuizAttempt.user_id, QuizAttempt.module_id)
+    ranked = select(
+        QuizAttempt.id,
+        QuizAttempt.submitted_at,
+        func.row_number().over(partition_by=group, order_by=(QuizAttempt.submitted_at.desc(), QuizAttempt.id.desc()))
+        .label('recency'),
+        func.row_number().over(partition_by=group, order_by=(QuizAttempt.score.desc(), QuizAttempt.submitted_at, QuizAttempt.id))
+        .label('best'),
+    ).subquery()
+    return select(ranked.c.id).where(ranked.c.recency > keep, ranked.c.best > 1, ranked.c.submitted_at < cutoff)
+
+
+def prune(keep: int = KEEP_PER_MODULE, retention_days: int = RETENTION_DAYS,
+          now: datetime = None, dry_run: bool = False, session=None) -> int:
+    """Delete attempts outside the retention policy; returns how many (would be) deleted.
+
+    The caller commits.
+    """
+    session = session or db.session
+    cutoff = (now or datetime.utcnow()) - timedelta(days=retention_days)
+    expired = _expired(keep, cutoff)
+    if dry_run:
+        return session.execute(select(func.count()).select_from(expired.subquery())).scalar()
+    return session.execute(delete(QuizAttempt).where(QuizAttempt.id.in_(expired))).rowcount
+
+
+def main(argv):
+    if argv[1:2] != ['prune']:
+        print('Usage: python quiz_attempts.py prune [--dry-run]')
+        sys.exit(1)
+    from app import app
+    dry_run = '--dry-run' in argv
+    with app.app_context():
+        count = prune(dry_run=dry_run)
+        if dry_run:
+            print(f"Dry run: {count} quiz attempt(s) outside the retention policy.")
+        else:
+            db.session.commit()
+            print(f"Pruned {count} quiz attempt(s).")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
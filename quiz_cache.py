@@ -0,0 +1,113 @@
+"""
+Process-local cache of the quiz payload served by /api/load_quiz.
+
+Every trainee in a cohort receives the same normalized quiz JSON, so the
+serialized body and its strong ETag (a hash of that body) are cached per
+module. A matching If-None-Match is answered with 304 straight from the cache,
+without loading the module or the user.
+
+Entries are dropped when a Module row is updated or deleted in this process
+(SQLAlchemy mapper events, again after commit). The same events bump the
+'quiz' namespace of cache_bus.py, so other workers and nodes drop their
+payloads too. Entries still expire after QUIZ_CACHE_TTL seconds (default 600)
+for edits that bypass the ORM.
+"""
+from collections import namedtuple
+import hashlib
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from models import db, Module
+from quiz_answers import player_questions
+import cache_bus
+
+NAMESPACE = 'quiz'
+CACHE_TTL_SECONDS = float(os.environ.get('QUIZ_CACHE_TTL', '600'))
+# Browsers keep the payload but must revalidate; the ETag makes that a 304
+CACHE_CONTROL = 'private, no-cache'
+
+QuizPayload = namedtuple('QuizPayload', 'etag body')
+
+
+class QuizPayloadCache:
+    """Thread-safe {module_id: (QuizPayload, expires_at)} map."""
+
+    def __init__(self, ttl: float = CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, module_id: int):
+        entry = self._entries.get(module_id)
+        if entry is None:
+            return None
+        payload, expires_at = entry
+        if expires_at < time.monotonic():
+            with self._lock:
+                if self._entries.get(module_id) is entry:
+                    del self._entries[module_id]
+            return None
+        return payload
+
+    def put(self, module_id: int, payload: QuizPayload) -> None:
+        with self._lock:
+            self._entries[module_id] = (payload, time.monotonic() + self.ttl)
+
+    def invalidate(self, module_id: int = None) -> None:
+        with self._lock:
+            if module_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(module_id, None)
+
+
+cache = QuizPayloadCache()
+cache_bus.register(NAMESPACE, cache.invalidate)
+
+
+def build_payload(quiz_json) -> QuizPayload:
+    body = json.dumps(player_questions(quiz_json), separators=(',', ':')).encode('utf-8')
+    return QuizPayload(etag=hashlib.sha256(body).hexdigest()[:32], body=body)
+
+
+def load(module_id: int):
+    """Return the cached QuizPayload for a module, building it from the DB on a miss.
+
+    Returns None when the module does not exist.
+    """
+    payload = cache.get(module_id)
+    if payload is not None:
+        return payload
+    quiz_json = db.session.query(Module.quiz_json).filter(Module.module_id == module_id).first()
+    if quiz_json is None:
+        return None
+    payload = build_payload(quiz_json[0])
+    cache.put(module_id, payload)
+    return payload
+
+
+@event.listens_for(Module, 'after_update')
+@event.listens_for(Module, 'after_delete')
+def _invalidate_module(mapper, connection, target):
+    cache.invalidate(target.module_id)
+    # Drop it again after commit in case another request re-cached the old row meanwhile
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('quiz_cache_dirty', set()).add(target.module_id)
+        cache_bus.mark(session, NAMESPACE)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    for module_id in session.info.pop('quiz_cache_dirty', ()):
+        cache.invalidate(module_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back(session):
+    session.info.pop('quiz_cache_dirty', None)
@@ -0,0 +1,244 @@
+"""
+Bulk rescoring of a module's quiz after its answer key changes.
+
+When a trainer or admin fixes the answer key, the stored scores of that module
+are recomputed in the same transaction as the edit:
+
+1. The new quiz_json is compiled into an answer key.
+2. The module's completed user_module rows are read in chunks of
+   RESCORE_CHUNK (default 5000) by id. For each chunk the known attempts are
+   fetched too. Those are the quiz_attempt history plus the latest stored
+   answers, unless a new attempt is being autosaved.
+3. All attempts of the chunk go into one (attempts x questions) uint8 matrix,
+   the same layout quiz_analytics.py uses, and are scored with one vectorised
+   comparison against the key. Each trainee's new best is the maximum over
+   their attempts.
+4. Changed scores are written back with one executemany UPDATE per chunk.
+   The certificates of the affected trainees for the module's course are then
+   set to the new course average by a set-based UPDATE.
+
+user_module.score is the best attempt. When the previous quiz_json is known
+(the edit routes pass it), a row is only rescored if its known attempts
+reproduce the stored score under the previous key. A best attempt from
+before the attempt history existed cannot be rescored, so such rows are left
+alone and reported as skipped. The command line cannot know the previous key
+and takes the best known attempt as the score.
+
+    python quiz_rescore.py <module_id> [--dry-run]
+
+A dry run makes the same writes inside a savepoint and rolls them back, so
+its diff and certificate count are exactly what a real run would do.
+"""
+from collections import namedtuple
+import logging
+import os
+import sys
+from typing import TYPE_CHECKING
+
+from sqlalchemy import bindparam, func, select, update
+
+from models import db, Certificate, Module, QuizAttempt, UserModule
+from quiz_answers import UNANSWERED, answer_key, decode_packed
+from quiz_analytics import build_answer_matrix
+import certificate_eligibility
+
+# Imported lazily like quiz_analytics: only quiz edits and the CLI need NumPy
+if TYPE_CHECKING:
+    import numpy as np
+
+CHUNK_SIZE = int(os.environ.get('RESCORE_CHUNK', '5000'))
+# Trainees per certificate UPDATE
+CERTIFICATE_BATCH = 1000
+
+ScoreChange = namedtuple('ScoreChange', 'user_module_id user_id old_score new_score')
+
+
+class RescoreReport:
+    """What rescore_module() changed, or would change on a dry run."""
+
+    def __init__(self, module_id: int, dry_run: bool):
+        self.module_id = module_id
+        self.dry_run = dry_run
+        self.scanned = 0
+        self.skipped = 0
+        self.changes = []
+        self.certificates = 0
+
+    def as_dict(self) -> dict:
+        return {
+            'module_id': self.module_id,
+            'dry_run': self.dry_run,
+            'scanned': self.scanned,
+            'skipped': self.skipped,
+            'changed': len(self.changes),
+            'certificates': self.certificates,
+            'changes': [c._asdict() for c in self.changes],
+        }
+
+
+def score_matrix(matrix: 'np.ndarray', key) -> 'np.ndarray':
+    """Percentage score of every row of an answer matrix; score_answers() for many attempts at once."""
+    import numpy as np
+    total = len(key)
+    if total == 0:
+        return np.zeros(matrix.shape[0])
+    key_arr = np.asarray(key, dtype=np.int16)
+    correct = (matrix.astype(np.int16) == key_arr) & (key_arr >= 0) & (matrix != UNANSWERED)
+    # np.round rounds half to even, like the round() in score_answers
+    return np.round(correct.sum(axis=1) / total * 100)
+
+
+def _best_per_row(packed, owners, size, key) -> 'np.ndarray':
+    import numpy as np
+    best = np.full(size, np.nan)
+    if packed:
+        np.fmax.at(best, owners, score_matrix(build_answer_matrix(packed, len(key)), key))
+    return best
+
+
+def _known_attempts(session, module_id, rows):
+    """Packed answers of the chunk's known attempts and the chunk row each belongs to."""
+    index = {row.user_id: i for i, row in enumerate(rows)}
+    packed, owners = [], []
+    for i, row in enumerate(rows):
+        # While a reattempt is autosaving, quiz_answers holds unsubmitted answers
+        if row.quiz_answers and row.quiz_started_at is None:
+            try:
+                packed.append(decode_packed(row.quiz_answers))
+                owners.append(i)
+            except ValueError:
+                logging.warning('[RESCORE] Skipping non-canonical quiz_answers of user_module %s', row.id)
+    for user_id, answers in session.execute(
+        select(QuizAttempt.user_id, QuizAttempt.answers)
+        .where(QuizAttempt.module_id == module_id, QuizAttempt.user_id.in_(list(index)))
+    ):
+        packed.append(bytes(answers))
+        owners.append(index[user_id])
+    return packed, owners
+
+
+def _rescore_chunk(session, module_id, rows, key, old_key, report):
+    import numpy as np
+    packed, owners = _known_attempts(session, module_id, rows)
+    new_best = _best_per_row(packed, owners, len(rows), key)
+    stored = np.array([np.nan if row.score is None else row.score for row in rows], dtype=float)
+    rescorable = ~np.isnan(new_best)
+    if old_key is not None:
+        # The stored best must come from an attempt we can see
+        old_best = _best_per_row(packed, owners, len(rows), old_key)
+        rescorable &= np.isnan(stored) | (stored <= old_best + 1e-9)
+    changed = rescorable & (np.isnan(stored) | (np.abs(new_best - stored) > 1e-9))
+
+    report.scanned += len(rows)
+    report.skipped += int((~rescorable).sum())
+    params = []
+    for i in np.flatnonzero(changed):
+        row = rows[i]
+        report.changes.append(ScoreChange(row.id, row.user_id, row.score, float(new_best[i])))
+        params.append({'b_id': row.id, 'b_score': float(new_best[i])})
+    return params
+
+
+def recompute_certificate_scores(course_code: str, user_ids=None, session=None) -> int:
+    """Set certificates of `course_code` to the holder's current course average; returns how many change.
+
+    user_ids limits this to those trainees (None: all of them).
+    """
+    session = session or db.session
+    average = (select(func.avg(UserModule.score))
+               .join(Module, Module.module_id == UserModule.module_id)
+               .where(UserModule.user_id == Certificate.user_id, Module.module_type == course_code,
+                      UserModule.is_completed.is_(True))
+               .scalar_subquery())
+    target = func.coalesce(average, Certificate.score)
+    base = [certificate_eligibility.for_course(course_code), Certificate.score.is_distinct_from(target)]
+    batches = [None] if user_ids is None else [
+        user_ids[i:i + CERTIFICATE_BATCH] for i in range(0, len(user_ids), CERTIFICATE_BATCH)
+    ]
+    total = 0
+    for batch in batches:
+        where = base if batch is None else base + [Certificate.user_id.in_(batch)]
+        total += session.execute(
+            update(Certificate).where(*where).values(score=target).execution_options(synchronize_session=False)
+        ).rowcount
+    return total
+
+
+def rescore_module(module_id: int, old_quiz_json=None, dry_run: bool = False,
+                   chunk_size: int = CHUNK_SIZE, session=None) -> RescoreReport:
+    """Rescore every completed attempt of a module against its current quiz_json.
+
+    Runs inside the caller's transaction; the caller commits.
+    """
+    session = session or db.session
+    module = session.get(Module, module_id)
+    if module is None:
+        raise ValueError(f'Module {module_id} not found')
+    key = answer_key(module.quiz_json)
+    old_key = answer_key(old_quiz_json) if old_quiz_json is not None else None
+    report = RescoreReport(module_id, dry_run)
+    # A dry run performs the same writes inside a savepoint and rolls them back
+    savepoint = session.begin_nested() if dry_run else None
+    try:
+        _rescore_rows(session, module, key, old_key, report, chunk_size)
+    finally:
+        if savepoint is not None:
+            savepoint.rollback()
+    logging.info(f'[RESCORE] Module {module_id}: {report.scanned} scanned, {len(report.changes)} changed, '
+                 f'{report.skipped} skipped, {report.certificates} certificate(s){" (dry run)" if dry_run else ""}')
+    return report
+
+
+def _rescore_rows(session, module, key, old_key, report, chunk_size):
+    module_id = module.module_id
+    table = UserModule.__table__
+    write = (update(table)
+             .where(table.c.id == bindparam('b_id'))
+             .values(score=bindparam('b_score')))
+    last_id = 0
+    while True:
+        rows = session.execute(
+            select(table.c.id, table.c.user_id, table.c.score, table.c.quiz_answers, table.c.quiz_started_at)
+            .where(table.c.module_id == module_id, table.c.is_completed.is_(True), table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        params = _rescore_chunk(session, module_id, rows, key, old_key, report)
+        if params:
+            session.connection().execute(write, params)
+    if report.changes:
+        user_ids = sorted({c.user_id for c in report.changes})
+        report.certificates = recompute_certificate_scores(module.module_type, user_ids, session=session)
+
+
+def rescore_if_key_changed(module: Module, old_quiz_json, session=None):
+    """Rescore after an edit of module.quiz_json, if the edit changed the answer key; returns the report or None."""
+    if answer_key(old_quiz_json) == answer_key(module.quiz_json):
+        return None
+    session = session or db.session
+    session.flush()
+    return rescore_module(module.module_id, old_quiz_json=old_quiz_json, session=session)
+
+
+def main(argv):
+    ids = [int(a) for a in argv[1:] if a.isdigit()]
+    if len(ids) != 1:
+        print('Usage: python quiz_rescore.py <module_id> [--dry-run]')
+        sys.exit(1)
+    dry_run = '--dry-run' in argv
+    from app import app
+    with app.app_context():
+        report = rescore_module(ids[0], dry_run=dry_run)
+        for change in report.changes:
+            print(f"user {change.user_id}: {change.old_score} -> {change.new_score}")
+        if not dry_run:
+            db.session.commit()
+        print(f"{'Dry run: ' if dry_run else ''}{len(report.changes)} of {report.scanned} score(s) changed, "
+              f"{report.skipped} skipped, {report.certificates} certificate(s) updated.")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,139 @@
+"""
+Atomic writes of quiz progress to user_module.
+
+A trainee has at most one user_module row per module, enforced by the unique
+index uq_user_module_user_module (migrations/dedupe_user_module.py merges the
+duplicates older code created and adds it). Quiz submissions and autosaves
+are single INSERT ... ON CONFLICT (user_id, module_id) DO UPDATE statements,
+so a double-clicked submit or a retried request updates the same row instead
+of racing a SELECT against another worker's INSERT. Everything that depends
+on the stored row is computed by the database in that statement:
+
+    score                  the better of the stored and the new score
+    reattempt_count        incremented for a reattempt
+    quiz_duration_seconds  from the stored quiz_started_at, which is cleared
+
+PostgreSQL and SQLite (3.24+) share the statement; other databases fall back
+to the ORM read-modify-write.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import Integer, case, cast, func, literal, select
+
+from models import db, UserModule
+
+Submission = namedtuple('Submission', 'score reattempt_count')
+
+_table = UserModule.__table__
+
+
+def _dialect_insert(session):
+    name = session.get_bind().dialect.name
+    if name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def _elapsed_seconds(dialect, start, end):
+    if dialect == 'postgresql':
+        return func.greatest(0, cast(func.extract('epoch', end - start), Integer))
+    # julianday() is a float; round to milliseconds before truncating
+    return func.max(0, cast(func.round((func.julianday(end) - func.julianday(start)) * 86400, 3), Integer))
+
+
+def submit(user_id: int, module_id: int, quiz_answers: str, score: float,
+           is_reattempt: bool = False, now: datetime = None, session=None) -> Submission:
+    """Record a submitted attempt in one statement; returns the stored best score and reattempt count.
+
+    Runs inside the caller's transaction; the caller commits.
+    """
+    session = session or db.session
+    now = now or datetime.utcnow()
+    score = float(score)
+    insert = _dialect_insert(session)
+    if insert is None:
+        return _submit_orm(session, user_id, module_id, quiz_answers, score, is_reattempt, now)
+
+    c = _table.c
+    stmt = insert(_table).values(
+        user_id=user_id, module_id=module_id, quiz_answers=quiz_answers, is_completed=True,
+        score=score, completion_date=now, reattempt_count=1 if is_reattempt else 0,
+    )
+    new = stmt.excluded
+    dialect = session.get_bind().dialect.name
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[c.user_id, c.module_id],
+        set_={
+            'quiz_answers': new.quiz_answers,
+            'quiz_duration_seconds': case(
+                (c.quiz_started_at.isnot(None), _elapsed_seconds(dialect, c.quiz_started_at, new.completion_date)),
+                else_=c.quiz_duration_seconds,
+            ),
+            'quiz_started_at': None,
+            'reattempt_count': func.coalesce(c.reattempt_count, 0) + literal(1 if is_reattempt else 0),
+            'is_completed': True,
+            'score': case(
+                ((c.score.is_(None)) | (new.score > c.score), new.score),
+                else_=c.score,
+            ),
+            'completion_date': new.completion_date,
+        },
+    ).returning(c.score, c.reattempt_count)
+    stored_score, reattempt_count = session.execute(stmt).one()
+    return Submission(stored_score, reattempt_count or 0)
+
+
+def autosave(user_id: int, module_id: int, quiz_answers: str, now: datetime = None, session=None) -> None:
+    """Store in-progress answers; the first autosave of an attempt marks its start.
+
+    Runs inside the caller's transaction; the caller commits.
+    """
+    session = session or db.session
+    now = now or datetime.utcnow()
+    insert = _dialect_insert(session)
+    if insert is None:
+        um = UserModule.query.filter_by(user_id=user_id, module_id=module_id).first()
+        if not um:
+            session.add(UserModule(user_id=user_id, module_id=module_id, quiz_answers=quiz_answers, quiz_started_at=now))
+        else:
+            um.quiz_answers = quiz_answers
+            if um.quiz_started_at is None:
+                um.quiz_started_at = now
+        return
+    c = _table.c
+    stmt = insert(_table).values(user_id=user_id, module_id=module_id, quiz_answers=quiz_answers, quiz_started_at=now)
+    session.execute(stmt.on_conflict_do_update(
+        index_elements=[c.user_id, c.module_id],
+        set_={
+            'quiz_answers': stmt.excluded.quiz_answers,
+            'quiz_started_at': func.coalesce(c.quiz_started_at, stmt.excluded.quiz_started_at),
+        },
+    ))
+
+
+def _submit_orm(session, user_id, module_id, quiz_answers, score, is_reattempt, now):
+    um = session.execute(
+        select(UserModule).filter_by(user_id=user_id, module_id=module_id).with_for_update()
+    ).scalars().first()
+    if not um:
+        um = UserModule(user_id=user_id, module_id=module_id, quiz_answers=quiz_answers, is_completed=True,
+                        score=score, completion_date=now, reattempt_count=1 if is_reattempt else 0)
+        session.add(um)
+    else:
+        um.quiz_answers = quiz_answers
+        if um.quiz_started_at is not None:
+            um.quiz_duration_seconds = max(0, int((now - um.quiz_started_at).total_seconds()))
+            um.quiz_started_at = None
+        if is_reattempt:
+            um.reattempt_count = (um.reattempt_count or 0) + 1
+        um.is_completed = True
+        if um.score is None or score > float(um.score):
+            um.score = score
+        um.completion_date = now
+    session.flush()
+    return Submission(um.score, um.reattempt_count or 0)
@@ -0,0 +1,334 @@
+"""
+Per-endpoint request metrics in Prometheus text format.
+
+For every request (all blueprints, keyed by Flask endpoint and method) this
+records a latency histogram, a response size histogram, status code counts,
+5xx/unhandled error counts and the time spent in SQL (from sql_stats), plus a
+gauge of requests in flight. DB time share is
+rate(http_request_db_seconds_total) / rate(http_request_duration_seconds_sum).
+
+Each thread aggregates into its own stats object, which only that thread ever
+writes, so recording takes no locks. A scrape merges the per-thread objects;
+stats of threads that have exited are folded into a retired total.
+
+With several gunicorn workers set METRICS_MULTIPROC_DIR (or
+PROMETHEUS_MULTIPROC_DIR) to a directory shared by the workers and emptied on
+deploy: each worker writes its snapshot there at most every
+METRICS_FLUSH_SECONDS and /metrics merges all files, so whichever worker serves
+the scrape reports the whole server. Counters of exited workers are kept;
+gauges only count live workers.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+
+from db_pool import pool_metrics
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+DEFAULT_FLUSH_SECONDS = 5.0
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _EndpointStats:
+    __slots__ = ('count', 'seconds', 'latency', 'bytes', 'sizes', 'db_seconds', 'errors', 'statuses')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.latency = [0] * len(LATENCY_BUCKETS)
+        self.bytes = 0
+        self.sizes = [0] * len(SIZE_BUCKETS)
+        self.db_seconds = 0.0
+        self.errors = 0
+        self.statuses = {}
+
+
+class _ThreadStats:
+    def __init__(self):
+        self.endpoints = {}
+        self.in_flight = 0
+
+
+def _bucket_index(buckets, value):
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            return i
+    return None
+
+
+def _empty_snapshot():
+    return {'endpoints': {}, 'in_flight': 0, 'pool': {}}
+
+
+def _add_endpoint(into, key, stats):
+    """Add one endpoint's numbers (an _EndpointStats or its snapshot dict) into a snapshot."""
+    if isinstance(stats, _EndpointStats):
+        stats = {'count': stats.count, 'seconds': stats.seconds, 'latency': stats.latency, 'bytes': stats.bytes,
+                 'sizes': stats.sizes, 'db_seconds': stats.db_seconds, 'errors': stats.errors, 'statuses': stats.statuses}
+    target = into['endpoints'].get(key)
+    if target is None:
+        target = into['endpoints'][key] = {
+            'count': 0, 'seconds': 0.0, 'latency': [0] * len(LATENCY_BUCKETS), 'bytes': 0,
+            'sizes': [0] * len(SIZE_BUCKETS), 'db_seconds': 0.0, 'errors': 0, 'statuses': {},
+        }
+    for field in ('count', 'seconds', 'bytes', 'db_seconds', 'errors'):
+        target[field] += stats[field]
+    target['latency'] = [a + b for a, b in zip(target['latency'], stats['latency'])]
+    target['sizes'] = [a + b for a, b in zip(target['sizes'], stats['sizes'])]
+    for status, n in list(stats['statuses'].items()):
+        target['statuses'][str(status)] = target['statuses'].get(str(status), 0) + n
+
+
+def _merge(into, snapshot, gauges=True):
+    for key, stats in snapshot['endpoints'].items():
+        _add_endpoint(into, key, stats)
+    if gauges:
+        into['in_flight'] += snapshot['in_flight']
+        for name, value in snapshot['pool'].items():
+            if isinstance(value, (int, float)):
+                into['pool'][name] = into['pool'].get(name, 0) + value
+
+
+class RequestMetrics:
+    """Per-thread request aggregation for one process."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._threads = []  # (weakref to thread, _ThreadStats)
+        self._retired = _empty_snapshot()
+        self._registry_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def _stats(self) -> _ThreadStats:
+        stats = getattr(self._local, 'stats', None)
+        if stats is None:
+            stats = self._local.stats = _ThreadStats()
+            with self._registry_lock:
+                self._threads.append((weakref.ref(threading.current_thread()), stats))
+        return stats
+
+    def started(self) -> None:
+        self._stats().in_flight += 1
+
+    def finished(self, endpoint, method, status, seconds, size, db_seconds) -> None:
+        thread_stats = self._stats()
+        thread_stats.in_flight -= 1
+        key = f'{endpoint}\t{method}'
+        stats = thread_stats.endpoints.get(key)
+        if stats is None:
+            stats = thread_stats.endpoints[key] = _EndpointStats()
+        stats.count += 1
+        stats.seconds += seconds
+        i = _bucket_index(LATENCY_BUCKETS, seconds)
+        if i is not None:
+            stats.latency[i] += 1
+        if size is not None:
+            stats.bytes += size
+            i = _bucket_index(SIZE_BUCKETS, size)
+            if i is not None:
+                stats.sizes[i] += 1
+        stats.db_seconds += db_seconds
+        if status >= 500:
+            stats.errors += 1
+        stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def snapshot(self, engine=None) -> dict:
+        """Merged numbers of all threads of this process (bucket counts are not cumulative)."""
+        snap = _empty_snapshot()
+        with self._registry_lock:
+            live = []
+            for ref, stats in self._threads:
+                thread = ref()
+                if thread is None or not thread.is_alive():
+                    # An exited thread no longer writes its stats, so they can be folded in
+                    for key, endpoint_stats in stats.endpoints.items():
+                        _add_endpoint(self._retired, key, endpoint_stats)
+                else:
+                    live.append((ref, stats))
+            self._threads = live
+            _merge(snap, self._retired, gauges=False)
+            for _, stats in live:
+                for key, endpoint_stats in list(stats.endpoints.items()):
+                    _add_endpoint(snap, key, endpoint_stats)
+                snap['in_flight'] += stats.in_flight
+        if engine is not None:
+            snap['pool'] = pool_metrics(engine)
+        return snap
+
+
+metrics = RequestMetrics()
+
+
+def multiproc_dir():
+    return os.environ.get('METRICS_MULTIPROC_DIR') or os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def write_snapshot(directory, engine=None, pid=None) -> None:
+    """Atomically replace this process's snapshot file in `directory`."""
+    pid = pid or os.getpid()
+    path = os.path.join(directory, f'metrics_{pid}.json')
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fh:
+        json.dump(metrics.snapshot(engine), fh)
+    os.replace(tmp, path)
+
+
+def maybe_flush(engine=None, interval=DEFAULT_FLUSH_SECONDS) -> None:
+    """Write this worker's snapshot if the last write is older than `interval` (never blocks)."""
+    directory = multiproc_dir()
+    if not directory or time.monotonic() - metrics._last_flush < interval:
+        return
+    if not metrics._flush_lock.acquire(blocking=False):
+        return
+    try:
+        metrics._last_flush = time.monotonic()
+        write_snapshot(directory, engine)
+    except OSError as e:
+        logging.warning('[METRICS] Could not write snapshot to %s: %s', directory, e)
+    finally:
+        metrics._flush_lock.release()
+
+
+def collect(engine=None) -> dict:
+    """This process's live numbers merged with the other workers' snapshot files."""
+    total = _empty_snapshot()
+    _merge(total, metrics.snapshot(engine))
+    directory = multiproc_dir()
+    if directory:
+        own = os.getpid()
+        for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+            try:
+                pid = int(os.path.basename(path)[len('metrics_'):-len('.json')])
+            except ValueError:
+                continue
+            if pid == own:
+                continue
+            try:
+                with open(path, encoding='utf-8') as fh:
+                    snapshot = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            _merge(total, snapshot, gauges=_pid_alive(pid))
+    return total
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _histogram(lines, name, help_text, buckets, per_key, count_field, sum_field, counts_field):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for (endpoint, method), stats in per_key:
+        cumulative = 0
+        for bound, n in zip(buckets, stats[counts_field]):
+            cumulative += n
+            lines.append(f'{name}_bucket{_labels(endpoint=endpoint, method=method, le=bound)} {cumulative}')
+        lines.append(f'{name}_bucket{_labels(endpoint=endpoint, method=method, le="+Inf")} {stats[count_field]}')
+        lines.append(f'{name}_sum{_labels(endpoint=endpoint, method=method)} {stats[sum_field]}')
+        lines.append(f'{name}_count{_labels(endpoint=endpoint, method=method)} {stats[count_field]}')
+
+
+def render(snapshot) -> str:
+    """Prometheus text exposition of a collect() result."""
+    per_key = sorted((tuple(key.split('\t', 1)), dict(stats, sized=sum(stats['sizes'])))
+                     for key, stats in snapshot['endpoints'].items())
+    lines = []
+    _histogram(lines, 'http_request_duration_seconds', 'Request latency by endpoint.', LATENCY_BUCKETS,
+               per_key, 'count', 'seconds', 'latency')
+    # Responses without a known length (streamed) are left out of the size histogram
+    _histogram(lines, 'http_response_size_bytes', 'Response body size by endpoint.', SIZE_BUCKETS,
+               per_key, 'sized', 'bytes', 'sizes')
+
+    lines.append('# HELP http_requests_total Requests by endpoint and status code.')
+    lines.append('# TYPE http_requests_total counter')
+    for (endpoint, method), stats in per_key:
+        for status, n in sorted(stats['statuses'].items()):
+            lines.append(f'http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {n}')
+    lines.append('# HELP http_request_errors_total Requests that ended in a 5xx or an unhandled exception.')
+    lines.append('# TYPE http_request_errors_total counter')
+    for (endpoint, method), stats in per_key:
+        lines.append(f'http_request_errors_total{_labels(endpoint=endpoint, method=method)} {stats["errors"]}')
+    lines.append('# HELP http_request_db_seconds_total Time spent executing SQL by endpoint.')
+    lines.append('# TYPE http_request_db_seconds_total counter')
+    for (endpoint, method), stats in per_key:
+        lines.append(f'http_request_db_seconds_total{_labels(endpoint=endpoint, method=method)} {stats["db_seconds"]}')
+    lines.append('# HELP http_requests_in_flight Requests currently being handled.')
+    lines.append('# TYPE http_requests_in_flight gauge')
+    lines.append(f'http_requests_in_flight {snapshot["in_flight"]}')
+
+    pool = snapshot.get('pool') or {}
+    for field, name, kind, help_text in (
+        ('checked_out', 'db_pool_checked_out', 'gauge', 'Connections currently checked out of the pool.'),
+        ('overflow', 'db_pool_overflow', 'gauge', 'Connections open beyond the pool size.'),
+        ('checkouts', 'db_pool_checkouts_total', 'counter', 'Connection checkouts.'),
+        ('timeouts', 'db_pool_timeouts_total', 'counter', 'Checkouts that timed out waiting for a connection.'),
+        ('wait_seconds_total', 'db_pool_wait_seconds_total', 'counter', 'Time spent waiting for a pooled connection.'),
+    ):
+        if field in pool:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {pool[field]}')
+    return '\n'.join(lines) + '\n'
+
+
+def install(app) -> None:
+    """Time every request of `app`; call after sql_stats.install(app) so DB time is available."""
+    from flask import g, request
+    from models import db
+    interval = float(app.config.get('METRICS_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS))
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+        metrics.started()
+
+    @app.after_request
+    def _note_response(response):
+        g.metrics_status = response.status_code
+        g.metrics_size = response.calculate_content_length()
+        return response
+
+    @app.teardown_request
+    def _record(exc):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        status = 500 if exc is not None else g.pop('metrics_status', 500)
+        collector = g.get('sql_stats')
+        metrics.finished(request.endpoint or 'unmatched', request.method, status,
+                         time.perf_counter() - started, g.pop('metrics_size', None),
+                         collector.seconds if collector is not None else 0.0)
+        maybe_flush(db.engine, interval)
+
+    directory = multiproc_dir()
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+        def _final_flush():
+            try:
+                write_snapshot(directory)
+            except OSError:
+                pass
+        atexit.register(_final_flush)
@@ -0,0 +1,226 @@
+"""
+Opt-in profiling of single requests for admins.
+
+With REQUEST_PROFILING=1 an admin can add ?_profile=1 (or the header
+X-Profile: 1) to any request to capture a cProfile of it, or ?_profile=sample
+for a wall-clock sampling profile. Captures are written to PROFILE_DIR
+(default: <instance>/profiles):
+
+    <id>.prof     cProfile stats (snakeviz, `flameprof <id>.prof > out.svg`)
+    <id>.txt      top functions by cumulative time
+    <id>.folded   sampled stacks in collapsed format (flamegraph.pl, speedscope)
+    <id>.json     request, user, duration and mode, for the admin listing
+
+The response carries X-Profile-Id. At most one request is profiled at a time
+and PROFILING_RATE_LIMIT captures per minute are allowed per worker; refused
+requests run unprofiled with X-Profile-Status explaining why. Only the newest
+PROFILING_KEEP captures are kept.
+
+When REQUEST_PROFILING is off no hooks are registered at all.
+"""
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+
+DEFAULT_RATE_LIMIT = 6
+DEFAULT_KEEP = 50
+SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 40
+CAPTURE_ID = re.compile(r'^[0-9]{8}T[0-9]{6}-[a-z0-9_.]+-[0-9a-f]{8}$')
+
+_busy = threading.Lock()
+_recent_starts = deque()
+_starts_lock = threading.Lock()
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack every `interval` seconds into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name='request-profiler-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def profile_dir(app) -> str:
+    return app.config.get('PROFILE_DIR') or os.path.join(app.instance_path, 'profiles')
+
+
+def _allow(limit: int) -> bool:
+    now = time.monotonic()
+    with _starts_lock:
+        while _recent_starts and now - _recent_starts[0] > 60:
+            _recent_starts.popleft()
+        if len(_recent_starts) >= limit:
+            return False
+        _recent_starts.append(now)
+        return True
+
+
+def _requested(request):
+    value = request.args.get('_profile') or request.headers.get('X-Profile')
+    if not value:
+        return None
+    return 'sample' if value.lower() == 'sample' else 'cprofile'
+
+
+def _prune(directory: str, keep: int) -> None:
+    captures = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for capture_id in captures[:-keep] if keep else captures:
+        for ext in ('.json', '.prof', '.txt', '.folded'):
+            try:
+                os.remove(os.path.join(directory, capture_id + ext))
+            except FileNotFoundError:
+                pass
+
+
+def list_captures(app):
+    """Metadata of saved captures, newest first."""
+    directory = profile_dir(app)
+    if not os.path.isdir(directory):
+        return []
+    captures = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as fh:
+                captures.append(json.load(fh))
+        except (OSError, ValueError):
+            continue
+    return captures
+
+
+def capture_path(app, capture_id: str, ext: str):
+    """Path of one capture file, or None for unknown ids/extensions."""
+    if ext not in ('prof', 'txt', 'folded') or not CAPTURE_ID.match(capture_id):
+        return None
+    path = os.path.join(profile_dir(app), f'{capture_id}.{ext}')
+    return path if os.path.exists(path) else None
+
+
+def _save(app, profiler, sampler, meta) -> None:
+    directory = profile_dir(app)
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, meta['id'])
+    files = []
+    if profiler is not None:
+        profiler.dump_stats(base + '.prof')
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        with open(base + '.txt', 'w', encoding='utf-8') as fh:
+            fh.write(out.getvalue())
+        files += ['prof', 'txt']
+    if sampler is not None:
+        with open(base + '.folded', 'w', encoding='utf-8') as fh:
+            for stack, count in sampler.stacks.most_common():
+                fh.write(f'{stack} {count}\n')
+        meta['samples'] = sum(sampler.stacks.values())
+        files.append('folded')
+    meta['files'] = files
+    with open(base + '.json', 'w', encoding='utf-8') as fh:
+        json.dump(meta, fh)
+    _prune(directory, int(app.config.get('PROFILING_KEEP', DEFAULT_KEEP)))
+
+
+def install(app) -> None:
+    """Register the profiling hooks when REQUEST_PROFILING is enabled for `app`."""
+    if not app.config.get('REQUEST_PROFILING'):
+        return
+    from flask import g, request
+    from flask_login import current_user
+    from models import Admin
+
+    @app.before_request
+    def _start_profile():
+        mode = _requested(request)
+        if mode is None:
+            return
+        if not (current_user.is_authenticated and isinstance(current_user._get_current_object(), Admin)):
+            return
+        if not _allow(int(app.config.get('PROFILING_RATE_LIMIT', DEFAULT_RATE_LIMIT))):
+            g.profile_status = 'rate-limited'
+            return
+        if not _busy.acquire(blocking=False):
+            g.profile_status = 'busy'
+            return
+        g.profile = {'mode': mode, 'started': time.perf_counter(), 'profiler': None, 'sampler': None}
+        if mode == 'sample':
+            g.profile['sampler'] = StackSampler(threading.get_ident())
+            g.profile['sampler'].start()
+        else:
+            g.profile['profiler'] = cProfile.Profile()
+            g.profile['profiler'].enable()
+
+    @app.after_request
+    def _finish_profile(response):
+        status = g.pop('profile_status', None)
+        if status:
+            response.headers['X-Profile-Status'] = status
+        state = g.pop('profile', None)
+        if state is None:
+            return response
+        try:
+            if state['profiler'] is not None:
+                state['profiler'].disable()
+            if state['sampler'] is not None:
+                state['sampler'].stop()
+            endpoint = (request.endpoint or 'unmatched').lower()
+            meta = {
+                'id': f"{datetime.utcnow():%Y%m%dT%H%M%S}-{re.sub(r'[^a-z0-9_.]', '_', endpoint)}-{uuid.uuid4().hex[:8]}",
+                'mode': state['mode'],
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'endpoint': endpoint,
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - state['started']) * 1000, 1),
+                'admin': getattr(current_user, 'email', None),
+                'captured_at': datetime.utcnow().isoformat(timespec='seconds'),
+            }
+            _save(app, state['profiler'], state['sampler'], meta)
+            response.headers['X-Profile-Id'] = meta['id']
+            logging.info('[PROFILE] Captured %s %s as %s', request.method, request.path, meta['id'])
+        except Exception:
+            logging.exception('[PROFILE] Failed to save capture')
+        finally:
+            _busy.release()
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(exc):
+        # Reached without after_request when the view raised
+        state = g.pop('profile', None)
+        if state is None:
+            return
+        if state['profiler'] is not None:
+            state['profiler'].disable()
+        if state['sampler'] is not None:
+            state['sampler'].stop()
+        _busy.release()
@@ -2,24 +2,41 @@
 Routes for Training System app, using Flask Blueprint.
 All route functions from app.py are moved here.
 """
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory, abort, current_app, make_response, send_file
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, session, send_from_directory, abort, current_app, make_response, send_file, stream_with_context
 from flask_login import login_user, login_required, logout_user, current_user
 from werkzeug.utils import secure_filename
 from datetime import datetime
+import csv
+import io
 import os
 import logging
-from models import db, Admin, User, Agency, Module, Certificate, Trainer, UserModule, Management, Registration, Course, WorkHistory, UserCourseProgress, AgencyAccount, CertificateTemplate
+from models import db, Admin, User, Agency, Module, Certificate, Trainer, UserModule, Management, Registration, Course, WorkHistory, UserCourseProgress, AgencyAccount, CertificateTemplate, QuizAttempt, TrainerCourse, grade_letter
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import text, or_
 from utils import safe_url_for, normalized_user_category, safe_parse_date, extract_youtube_id, is_slide_file, allowed_file, allowed_slide_file, is_superadmin
+import quiz_analytics
+import quiz_cache
+import quiz_submission
+import quiz_attempts
+import quiz_rescore
+import uploads
+import slide_render
+import email_outbox
+import db_pool
+import sql_stats
+import request_metrics
+import request_profiler
+import number_series
+import table_pages
+import agency_stats as agency_stats_provider
+import search
+import trainer_scope
+import certificate_eligibility
+from profile_images import save_profile_picture, delete_profile_picture, InvalidImage
+from quiz_answers import encode_answers, decode_answers, normalize_answer, extract_questions, correct_index, answer_key, score_answers, quiz_version
 from itsdangerous import URLSafeTimedSerializer
-from flask_mail import Message
-import smtplib
-from email.mime.text import MIMEText
 import re
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail as SGMail
-import requests
+import hmac
 
 main_bp = Blueprint('main', __name__)
 
@@ -221,6 +238,7 @@ def onboarding(id, step):
     ]
     
     if request.method == 'POST':
+        replaced_picture = None
         try:
             # Process fields based on current step
             if step == 1:
@@ -237,13 +255,14 @@ def onboarding(id, step):
                 if 'profile_pic' in request.files:
                     file = request.files['profile_pic']
                     if file and file.filename and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        filename = f"user{user.User_id}_{filename}"
-                        file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'profile_pics', filename)
-                        os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                        file.save(file_path)
-                        # Set Profile_picture field (not profile_pic_url property which has no setter)
-                        user.Profile_picture = f"profile_pics/{filename}"
+                        try:
+                            new_picture = save_profile_picture(file, f"user{user.User_id}")
+                        except InvalidImage:
+                            flash('The profile picture could not be read as an image and was not saved.', 'warning')
+                        else:
+                            # Set Profile_picture field (not profile_pic_url property which has no setter)
+                            replaced_picture = user.Profile_picture
+                            user.Profile_picture = new_picture
                         
             elif step == 2:
                 # Contact Details (Step 2) - Note: emergency_contact_phone here is actually "Phone Number"
@@ -303,6 +322,8 @@ def onboarding(id, step):
             
             # Commit changes for current step
             db.session.commit()
+            if replaced_picture and replaced_picture != user.Profile_picture:
+                delete_profile_picture(replaced_picture)
             
             # Determine next action
             if step < total_steps:
@@ -496,31 +517,39 @@ def courses():
         else:
             cat = normalized_user_category(current_user)
             courses_q = Course.query.filter(or_(Course.allowed_category == cat, Course.allowed_category == 'both'))
-        all_courses = courses_q.order_by(Course.name.asc()).all()
+        all_courses = courses_q.options(db.selectinload(Course.modules)).order_by(Course.name.asc()).all()
     except Exception:
         logging.exception('[COURSES] Failed loading courses')
         all_courses = []
     visible_courses = [c for c in all_courses if getattr(c, 'is_visible_to', lambda u: True)(current_user)]
+    # One query for the user's completed modules across all courses instead of two per course
+    completed_scores = {}
+    user_id = getattr(current_user, 'User_id', None)
+    if user_id is not None and visible_courses:
+        try:
+            rows = db.session.query(UserModule.module_id, UserModule.score).join(Module, Module.module_id == UserModule.module_id).filter(
+                UserModule.user_id == user_id,
+                UserModule.is_completed.is_(True),
+                Module.course_id.in_([c.course_id for c in visible_courses])
+            ).all()
+            completed_scores = {module_id: score for module_id, score in rows}
+        except Exception:
+            logging.exception('[COURSES] Failed loading completed modules')
     course_progress = []
     for c in visible_courses:
         try:
             allowed = c.allowed_category or 'both'
             # Present modules sorted by series number
             modules = sorted(list(c.modules), key=_module_series_sort_key)
-            module_ids = [m.module_id for m in modules]
             total_modules = len(modules)
             if total_modules == 0:
                 percent = 0
                 overall_percentage = 0
             else:
-                completed_q = UserModule.query.filter(
-                    UserModule.user_id == current_user.User_id,
-                    UserModule.module_id.in_(module_ids),
-                    UserModule.is_completed.is_(True)
-                )
-                completed_count = completed_q.count()
+                completed = [m.module_id for m in modules if m.module_id in completed_scores]
+                completed_count = len(completed)
                 percent = round((completed_count / total_modules) * 100) if total_modules else 0
-                scores = [um.score for um in completed_q.all() if um.score is not None]
+                scores = [completed_scores[mid] for mid in completed if completed_scores[mid] is not None]
                 overall_percentage = round(sum(scores)/len(scores),1) if scores else 0
             course_progress.append({
                 'name': c.name,
@@ -555,22 +584,21 @@ def user_modules_page(course_id):
         modules = sorted(list(course.modules), key=_module_series_sort_key)
         # Compute progress for each module
         module_progress = []
+        try:
+            user_modules = {um.module_id: um for um in UserModule.query.filter(
+                UserModule.user_id == user.User_id,
+                UserModule.module_id.in_([m.module_id for m in modules])
+            ).all()} if modules else {}
+        except Exception:
+            logging.exception('[USER MODULES PAGE] Failed loading module progress')
+            user_modules = {}
         for m in modules:
-            try:
-                um = UserModule.query.filter_by(user_id=user.User_id, module_id=m.module_id).first()
-                completed = um.is_completed if um else False
-                score = um.score if um else None
-                module_progress.append({
-                    'module': m,
-                    'completed': completed,
-                    'score': score
-                })
-            except Exception:
-                module_progress.append({
-                    'module': m,
-                    'completed': False,
-                    'score': None
-                })
+            um = user_modules.get(m.module_id)
+            module_progress.append({
+                'module': m,
+                'completed': um.is_completed if um else False,
+                'score': um.score if um else None
+            })
     except Exception:
         logging.exception('[USER MODULES PAGE] Failed loading course')
         abort(500)
@@ -672,6 +700,7 @@ def api_agree_module_disclaimer(module_id):
 def profile():
     if request.method == 'POST':
         # Handle form submission
+        replaced_picture = None
         try:
             # Update user fields
             current_user.full_name = request.form.get('full_name', current_user.full_name)
@@ -693,13 +722,14 @@ def profile():
             if 'profile_pic' in request.files:
                 file = request.files['profile_pic']
                 if file and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'profile_pics', filename)
-                    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-                    file.save(file_path)
-                    # Store relative path (including subfolder) so serve_uploaded_slide can locate it
-                    # Use forward slashes for URL compatibility across platforms
-                    current_user.Profile_picture = f"profile_pics/{filename}"
+                    # Resized, content-hashed variants named per user so uploads never collide
+                    try:
+                        new_picture = save_profile_picture(file, f"user{current_user.User_id}")
+                    except InvalidImage:
+                        flash('The profile picture could not be read as an image and was not saved.', 'warning')
+                    else:
+                        replaced_picture = current_user.Profile_picture
+                        current_user.Profile_picture = new_picture
 
             # Handle working experiences
             # First, delete existing experiences
@@ -723,6 +753,8 @@ def profile():
                     db.session.add(work_exp)
 
             db.session.commit()
+            if replaced_picture and replaced_picture != current_user.Profile_picture:
+                delete_profile_picture(replaced_picture)
             flash('Profile updated successfully!', 'success')
             return redirect(url_for('main.profile'))
         except Exception as e:
@@ -840,6 +872,13 @@ def change_password():
 
     return render_template('change_password.html')
 
+def _quiz_saved_message(rescore):
+    """Flash text after a quiz edit, mentioning the scores a changed answer key rescored."""
+    if rescore is None:
+        return 'Quiz updated successfully'
+    return (f'Quiz updated successfully. Answer key changed: {len(rescore.changes)} score(s) and '
+            f'{rescore.certificates} certificate(s) updated')
+
 # Trainer course management
 @main_bp.route('/trainer_course_management', methods=['GET', 'POST'])
 @login_required
@@ -859,22 +898,22 @@ def trainer_course_management():
                 return redirect(url_for('main.trainer_course_management'))
             
             # SECURITY: Verify trainer has access to this module's course
-            if not module.course:
+            if module.course_id is None:
                 flash('Module is not associated with a course', 'danger')
                 logging.error(f'[DATA ERROR] Module {module_id} has no course relationship')
                 return redirect(url_for('main.trainer_course_management'))
+            if not trainer_scope.can_manage_module(current_user, module):
+                flash('You are not authorized to modify this module', 'danger')
+                logging.warning(f'[SECURITY] Trainer {current_user.trainer_id} attempted to modify module {module_id} outside their assigned course')
+                return redirect(url_for('main.trainer_course_management'))
             
-            if getattr(current_user, 'course', None):
-                # Trainer assigned to specific course(s)
-                if module.course.code != current_user.course:
-                    flash('You are not authorized to modify this module', 'danger')
-                    logging.warning(f'[SECURITY] Trainer {current_user.trainer_id} attempted to modify module {module_id} outside their assigned course')
-                    return redirect(url_for('main.trainer_course_management'))
-            # If trainer.course is None, they have access to all courses
-            
+            old_quiz_json = module.quiz_json
             module.quiz_json = quiz_json
+            quiz_analytics.mark_stale(module.module_id)
+            # A corrected answer key rescores stored attempts in the same transaction
+            rescore = quiz_rescore.rescore_if_key_changed(module, old_quiz_json)
             db.session.commit()
-            flash('Quiz updated successfully', 'success')
+            flash(_quiz_saved_message(rescore), 'success')
         except Exception as e:
             db.session.rollback()
             logging.exception('[TRAINER COURSE MANAGEMENT] Failed to update quiz')
@@ -883,8 +922,7 @@ def trainer_course_management():
     try:
         # Filter courses based on trainer assignment
         courses_query = Course.query.order_by(Course.name)
-        if getattr(current_user, 'course', None):
-            courses_query = courses_query.filter(Course.code == current_user.course)
+        courses_query = trainer_scope.restrict(courses_query, Course.course_id, current_user)
         courses = courses_query.all()
         
         # Get modules for these courses only
@@ -912,6 +950,70 @@ def trainer_course_management():
     return render_template('trainer_course_management.html', courses=courses, modules=modules, course_modules=course_modules)
 
 # Trainer portal
+def _trainer_progress_courses(args):
+    """The current trainer's courses, or only args['course'] (a course code) among them."""
+    courses_q = trainer_scope.restrict(Course.query.options(db.selectinload(Course.modules)), Course.course_id, current_user)
+    if args.get('course'):
+        courses_q = courses_q.filter(Course.code == args['course'])
+    return courses_q.order_by(Course.name).all()
+
+
+def _trainer_progress_users(args):
+    """Trainees eligible for any of the trainer's (filtered) courses (unordered)."""
+    users_q = User.query.options(db.joinedload(User.agency))
+    categories = {c.allowed_category for c in _trainer_progress_courses(args) if c.modules}
+    if not categories:
+        return users_q.filter(db.false())
+    if categories in ({'citizen'}, {'foreigner'}):
+        users_q = users_q.filter(User.user_category == next(iter(categories)))
+    q = args.get('q', '').strip().lower()
+    if q:
+        users_q = users_q.filter(search.user_filter(q))
+    return users_q
+
+
+# Paginated on trainees; each page's rows are that page's trainees in each course they may take
+TRAINER_PROGRESS_TABLE = table_pages.register(table_pages.TableSpec(
+    'trainer_progress',
+    query=_trainer_progress_users,
+    key=User.User_id,
+    sorts={'full_name': User.full_name, 'email': User.email},
+    row_template='trainer_progress_rows.html',
+    allowed=lambda user: isinstance(user, Trainer),
+    default_dir='asc',
+    prepare=lambda users: _course_progress(users, _trainer_progress_courses(request.args), match_category=True),
+))
+
+
+@main_bp.route('/trainer_progress.csv')
+@login_required
+def trainer_progress_export():
+    """Every row of the trainer's progress table as CSV, read page by page."""
+    if not isinstance(current_user, Trainer):
+        abort(403)
+    args = {k: v for k, v in request.args.items() if k not in ('cursor', 'limit')}
+
+    def generate():
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['Trainee', 'Course', 'Progress', 'Score', 'Status', 'Last Activity'])
+        cursor = None
+        while True:
+            page = table_pages.fetch(TRAINER_PROGRESS_TABLE, dict(args, limit=table_pages.MAX_LIMIT, cursor=cursor or ''))
+            for r in page['items']:
+                writer.writerow([r['user_name'], r['course_code'], f"{r['progress_pct']}%", f"{r['score']}%", r['status'],
+                                 r['last_activity'].strftime('%Y-%m-%d %H:%M') if r['last_activity'] else ''])
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='text/csv',
+                                      headers={'Content-Disposition': 'attachment; filename=trainer_progress_report.csv'})
+
+
 @main_bp.route('/trainer_portal', methods=['GET', 'POST'])
 @login_required
 def trainer_portal():
@@ -930,22 +1032,22 @@ def trainer_portal():
                 return redirect(url_for('main.trainer_portal', section='content'))
             
             # SECURITY: Verify trainer has access to this module's course
-            if not module.course:
+            if module.course_id is None:
                 flash('Module is not associated with a course', 'danger')
                 logging.error(f'[DATA ERROR] Module {module_id} has no course relationship')
                 return redirect(url_for('main.trainer_portal', section='content'))
+            if not trainer_scope.can_manage_module(current_user, module):
+                flash('You are not authorized to modify this module', 'danger')
+                logging.warning(f'[SECURITY] Trainer {current_user.trainer_id} attempted to modify module {module_id} outside their assigned course')
+                return redirect(url_for('main.trainer_portal', section='content'))
             
-            if getattr(current_user, 'course', None):
-                # Trainer assigned to specific course(s)
-                if module.course.code != current_user.course:
-                    flash('You are not authorized to modify this module', 'danger')
-                    logging.warning(f'[SECURITY] Trainer {current_user.trainer_id} attempted to modify module {module_id} outside their assigned course')
-                    return redirect(url_for('main.trainer_portal', section='content'))
-            # If trainer.course is None, they have access to all courses (handled by admin)
-            
+            old_quiz_json = module.quiz_json
             module.quiz_json = quiz_json
+            quiz_analytics.mark_stale(module.module_id)
+            # A corrected answer key rescores stored attempts in the same transaction
+            rescore = quiz_rescore.rescore_if_key_changed(module, old_quiz_json)
             db.session.commit()
-            flash('Quiz updated successfully', 'success')
+            flash(_quiz_saved_message(rescore), 'success')
         except Exception as e:
             db.session.rollback()
             logging.exception('[TRAINER PORTAL] Failed to update quiz')
@@ -953,8 +1055,7 @@ def trainer_portal():
         return redirect(url_for('main.trainer_portal', section='content'))
     try:
         courses_query = Course.query
-        if getattr(current_user, 'course', None):
-            courses_query = courses_query.filter(Course.code == current_user.course)
+        courses_query = trainer_scope.restrict(courses_query, Course.course_id, current_user)
         courses = courses_query.all()
         course_stats = []
         modules_by_course = {}
@@ -965,9 +1066,9 @@ def trainer_portal():
             modules_by_course[course.code] = [{'id': m.module_id, 'name': m.module_name} for m in modules]
             trainees_q = User.query
             if course.allowed_category == 'citizen':
-                trainees_q = trainees_q.filter(db.func.lower(db.func.trim(User.user_category)) == 'citizen')
+                trainees_q = trainees_q.filter(User.user_category == 'citizen')
             elif course.allowed_category == 'foreigner':
-                trainees_q = trainees_q.filter(db.func.lower(db.func.trim(User.user_category)) == 'foreigner')
+                trainees_q = trainees_q.filter(User.user_category == 'foreigner')
             trainees = trainees_q.all()
             trainee_ids = [u.User_id for u in trainees]
             completed_count = 0; avg_score = 0.0; last_activity = None
@@ -997,147 +1098,20 @@ def trainer_portal():
         certificates_issued = Certificate.query.count()
         avg_rating_pct = 0.0
         my_courses = len(course_stats)
-        progress_rows = []
-        for course_stat in course_stats:
-            code = course_stat['code']
-            course_obj = next((c for c in courses if c.code == code), None)
-            if not course_obj:
-                continue
-            course_module_ids = [m.module_id for m in course_obj.modules]
-            if not course_module_ids:
-                continue
-            trainees_q = User.query
-            if course_obj.allowed_category == 'citizen':
-                trainees_q = trainees_q.filter(db.func.lower(db.func.trim(User.user_category)) == 'citizen')
-            elif course_obj.allowed_category == 'foreigner':
-                trainees_q = trainees_q.filter(db.func.lower(db.func.trim(User.user_category)) == 'foreigner')
-            trainees = trainees_q.all()
-            for user in trainees:
-                user_completed_q = UserModule.query.filter(
-                    UserModule.user_id == user.User_id,
-                    UserModule.module_id.in_(course_module_ids),
-                    UserModule.is_completed.is_(True)
-                )
-                completed_for_user = user_completed_q.count()
-                total_for_course = len(course_module_ids)
-                user_progress_pct = (completed_for_user / total_for_course * 100.0) if total_for_course else 0.0
-                avg_user_score_val = user_completed_q.with_entities(db.func.avg(UserModule.score)).scalar()
-                avg_user_score = round(float(avg_user_score_val or 0.0), 1)
-                last_activity = user_completed_q.with_entities(db.func.max(UserModule.completion_date)).scalar()
-                progress_rows.append({
-                    'user_name': user.full_name,
-                    'user_number_series': user.number_series,
-                    'user_category': user.user_category,
-                    'course_name': course.name,
-                    'course_code': course.code,
-                    'agency_name': user.agency.agency_name if user.agency else '',
-                    'progress_pct': round(user_progress_pct, 1),
-                    'completed_modules': completed_for_user,
-                    'total_modules': total_for_course,
-                    'score': avg_user_score,
-                    'last_activity': last_activity,
-                    'status': 'Completed' if user_progress_pct >= 100 else 'Active'
-                })
-        active_trainees = User.query.count()
-        certificates_issued = Certificate.query.count()
-        avg_rating_pct = 0.0
-        my_courses = len(course_stats)
-        progress_rows = []
-        for course_stat in course_stats:
-            code = course_stat['code']
-            course_obj = next((c for c in courses if c.code == code), None)
-            if not course_obj:
-                continue
-            course_module_ids = [m.module_id for m in course_obj.modules]
-            if not course_module_ids:
-                continue
-            trainees_q = User.query
-            if course_obj.allowed_category == 'citizen':
-                trainees_q = trainees_q.filter(db.func.lower(db.func.trim(User.user_category)) == 'citizen')
-            elif course_obj.allowed_category == 'foreigner':
-                trainees_q = trainees_q.filter(db.func.lower(db.func.trim(User.user_category)) == 'foreigner')
-            trainees = trainees_q.all()
-            for user in trainees:
-                user_completed_q = UserModule.query.filter(
-                    UserModule.user_id == user.User_id,
-                    UserModule.module_id.in_(course_module_ids),
-                    UserModule.is_completed.is_(True)
-                )
-                completed_for_user = user_completed_q.count()
-                total_for_course = len(course_module_ids)
-                user_progress_pct = (completed_for_user / total_for_course * 100.0) if total_for_course else 0.0
-                avg_user_score_val = user_completed_q.with_entities(db.func.avg(UserModule.score)).scalar()
-                avg_user_score = round(float(avg_user_score_val or 0.0), 1)
-                last_activity = user_completed_q.with_entities(db.func.max(UserModule.completion_date)).scalar()
-                progress_rows.append({
-                    'user_name': user.full_name,
-                    'user_number_series': user.number_series,
-                    'user_category': user.user_category,
-                    'course_name': course.name,
-                    'course_code': course.code,
-                    'agency_name': user.agency.agency_name if user.agency else '',
-                    'progress_pct': round(user_progress_pct, 1),
-                    'completed_modules': completed_for_user,
-                    'total_modules': total_for_course,
-                    'score': avg_user_score,
-                    'last_activity': last_activity,
-                    'status': 'Completed' if user_progress_pct >= 100 else 'Active'
-                })
-        active_trainees = User.query.count()
-        certificates_issued = Certificate.query.count()
-        avg_rating_pct = 0.0
-        my_courses = len(course_stats)
-        progress_rows = []
-        for course_stat in course_stats:
-            code = course_stat['code']
-            course_obj = next((c for c in courses if c.code == code), None)
-            if not course_obj:
-                continue
-            course_module_ids = [m.module_id for m in course_obj.modules]
-            if not course_module_ids:
-                continue
-            trainees_q = User.query
-            if course_obj.allowed_category == 'citizen':
-                trainees_q = trainees_q.filter(db.func.lower(db.func.trim(User.user_category)) == 'citizen')
-            elif course_obj.allowed_category == 'foreigner':
-                trainees_q = trainees_q.filter(db.func.lower(db.func.trim(User.user_category)) == 'foreigner')
-            trainees = trainees_q.all()
-            for user in trainees:
-                user_completed_q = UserModule.query.filter(
-                    UserModule.user_id == user.User_id,
-                    UserModule.module_id.in_(course_module_ids),
-                    UserModule.is_completed.is_(True)
-                )
-                completed_for_user = user_completed_q.count()
-                total_for_course = len(course_module_ids)
-                user_progress_pct = (completed_for_user / total_for_course * 100.0) if total_for_course else 0.0
-                avg_user_score_val = user_completed_q.with_entities(db.func.avg(UserModule.score)).scalar()
-                avg_user_score = round(float(avg_user_score_val or 0.0), 1)
-                last_activity = user_completed_q.with_entities(db.func.max(UserModule.completion_date)).scalar()
-                progress_rows.append({
-                    'user_name': user.full_name,
-                    'user_number_series': user.number_series,
-                    'user_category': user.user_category,
-                    'course_name': course.name,
-                    'course_code': course.code,
-                    'agency_name': user.agency.agency_name if user.agency else '',
-                    'progress_pct': round(user_progress_pct, 1),
-                    'completed_modules': completed_for_user,
-                    'total_modules': total_for_course,
-                    'score': avg_user_score,
-                    'last_activity': last_activity,
-                    'status': 'Completed' if user_progress_pct >= 100 else 'Active'
-                })
+        # Only the first page of trainees is rendered; table_pagination.js fetches the rest from /api/tables/trainer_progress
+        progress_page = table_pages.fetch(TRAINER_PROGRESS_TABLE, request.args)
         # Build course_modules structure for content management UI (like admin)
         course_modules = {}
         for course in courses:
             modules = sorted(list(course.modules), key=_module_series_sort_key)
             course_modules[course.course_id] = modules
+        quiz_stats = quiz_analytics.stats_by_module(m.module_id for mods in course_modules.values() for m in mods)
     except Exception as e:
         logging.exception('[TRAINER PORTAL] Error building dynamic stats')
         courses = []
+        quiz_stats = {}
         course_stats = []
-        progress_rows = []
+        progress_page = {'items': [], 'next_cursor': None, 'total': 0, 'sort': TRAINER_PROGRESS_TABLE.default_sort, 'dir': TRAINER_PROGRESS_TABLE.default_dir}
         modules_by_course = {}
         course_modules = {}
         active_trainees = 0
@@ -1152,10 +1126,12 @@ def trainer_portal():
         certificates_issued=certificates_issued,
         avg_rating_pct=avg_rating_pct,
         course_stats=course_stats,
-        progress_rows=progress_rows,
+        progress_rows=progress_page['items'],
+        progress_page=progress_page,
         modules_by_course=modules_by_course,
         courses=courses,
-        course_modules=course_modules
+        course_modules=course_modules,
+        quiz_stats=quiz_stats
     )
 
 # Admin dashboard
@@ -1194,115 +1170,132 @@ def inject_pagination_defaults():
     return {'pagination': default}
 
 # Admin users
+def _account_filters(args):
+    return args.get('q', '').strip().lower(), args.get('role', 'all').lower()
+
+
+def _user_accounts_query(args):
+    """User rows of the admin_users listing for the filters in `args` (unordered)."""
+    q, role_filter = _account_filters(args)
+    users_q = User.query.options(db.joinedload(User.agency))
+    if args.get('agency_id'):
+        try:
+            users_q = users_q.filter(User.agency_id == int(args['agency_id']))
+        except ValueError:
+            pass
+    if q:
+        users_q = users_q.filter(search.user_filter(q))
+    # Users with the trainer role that also have a Trainer record are listed as trainers
+    users_q = users_q.filter(or_(User.role.is_(None), User.role != 'trainer',
+                                 db.func.lower(User.email).notin_(db.select(db.func.lower(Trainer.email)))))
+    # User.role 'agency' (or anything unknown) is displayed as 'user'
+    if role_filter == 'user':
+        users_q = users_q.filter(or_(User.role.is_(None), User.role.notin_(('authority', 'admin', 'trainer'))))
+    elif role_filter in ('authority', 'admin', 'trainer'):
+        users_q = users_q.filter(User.role == role_filter)
+    elif role_filter != 'all':
+        users_q = users_q.filter(db.false())
+    return users_q
+
+
+def _trainer_accounts_query(args):
+    q, role_filter = _account_filters(args)
+    trainers_q = Trainer.query
+    if role_filter not in ('all', 'trainer'):
+        return trainers_q.filter(db.false())
+    if q:
+        trainers_q = trainers_q.filter(or_(db.func.lower(Trainer.name).contains(q, autoescape=True),
+                                           db.func.lower(Trainer.email).contains(q, autoescape=True)))
+    return trainers_q
+
+
+def _admin_accounts_query(args):
+    q, role_filter = _account_filters(args)
+    admins_q = Admin.query
+    if role_filter not in ('all', 'admin'):
+        return admins_q.filter(db.false())
+    if q:
+        admins_q = admins_q.filter(or_(db.func.lower(Admin.username).contains(q, autoescape=True),
+                                       db.func.lower(Admin.email).contains(q, autoescape=True)))
+    return admins_q
+
+
+def _user_accounts(users):
+    return [{
+        'type': {'authority': 'authority', 'admin': 'admin', 'trainer': 'trainer'}.get(getattr(u, 'role', 'agency'), 'user'),
+        'id': u.User_id,
+        'number_series': u.number_series,
+        'name': u.full_name,
+        'email': u.email,
+        'agency': getattr(getattr(u, 'agency', None), 'agency_name', ''),
+        'active_status': True,
+    } for u in users]
+
+
+def _trainer_accounts(trainers):
+    return [{'type': 'trainer', 'id': t.trainer_id, 'number_series': t.number_series, 'name': t.name,
+             'email': t.email, 'agency': '', 'active_status': t.active_status} for t in trainers]
+
+
+def _admin_accounts(admins):
+    return [{'type': 'admin', 'id': a.admin_id, 'number_series': None, 'name': a.username,
+             'email': a.email, 'agency': '', 'active_status': True} for a in admins]
+
+
+# admin_users lists three tables, (title, spec); each is paginated on its own
+ACCOUNT_TABLES = [
+    ('Users', table_pages.register(table_pages.TableSpec(
+        'user_accounts', query=_user_accounts_query, key=User.User_id,
+        sorts={'id': User.User_id, 'name': User.full_name, 'email': User.email},
+        row_template='account_rows.html', allowed=lambda user: isinstance(user, Admin),
+        default_dir='asc', prepare=_user_accounts,
+    ))),
+    ('Trainers', table_pages.register(table_pages.TableSpec(
+        'trainer_accounts', query=_trainer_accounts_query, key=Trainer.trainer_id,
+        sorts={'id': Trainer.trainer_id, 'name': Trainer.name, 'email': Trainer.email},
+        row_template='account_rows.html', allowed=lambda user: isinstance(user, Admin),
+        default_dir='asc', prepare=_trainer_accounts,
+    ))),
+    # Only superadmins see admins
+    ('Admins', table_pages.register(table_pages.TableSpec(
+        'admin_accounts', query=_admin_accounts_query, key=Admin.admin_id,
+        sorts={'id': Admin.admin_id, 'name': Admin.username, 'email': Admin.email},
+        row_template='account_rows.html', allowed=lambda user: is_superadmin(user),
+        default_dir='asc', prepare=_admin_accounts,
+    ))),
+]
+
+
 @main_bp.route('/admin_users')
 @login_required
 def admin_users():
     if not (current_user.is_authenticated and (isinstance(current_user, Admin) or isinstance(current_user, AgencyAccount))):
         return redirect(url_for('main.login'))
+    if isinstance(current_user, AgencyAccount):
+        return _render_agency_portal(current_user.agency)
     try:
-        q = request.args.get('q', '').strip().lower()
-        role_filter = request.args.get('role', 'all').lower()
-        agency_id = request.args.get('agency_id')
+        q, role_filter = _account_filters(request.args)
         agencies = Agency.query.order_by(Agency.agency_name.asc()).all()
-        merged_accounts = []
-        users_q = User.query
-        if agency_id:
-            try:
-                users_q = users_q.filter(User.agency_id == int(agency_id))
-            except ValueError:
-                pass
-        users = users_q.all()
-        
-        # Track trainer emails to avoid duplicates
-        trainer_emails = set()
-        trainers = Trainer.query.all()
-        for t in trainers:
-            trainer_emails.add(t.email.lower() if t.email else '')
-        
-        for u in users:
-            if q and (q not in (u.full_name or '').lower() and q not in (u.email or '').lower()):
-                continue
-            user_role = getattr(u, 'role', 'agency')
-
-            # Map User.role to display type
-            if user_role == 'authority':
-                display_type = 'authority'
-            elif user_role == 'admin':
-                display_type = 'admin'
-            elif user_role == 'trainer':
-                # Skip users with trainer role if they have a Trainer record (avoid duplicates)
-                user_email = (u.email or '').lower()
-                if user_email in trainer_emails:
-                    continue
-                display_type = 'trainer'
-            else:  # 'agency' or default
-                display_type = 'user'
-
-            # Filter by role if specified
-            if role_filter not in ('all', display_type):
-                continue
-
-            merged_accounts.append({
-                'type': display_type,
-                'id': u.User_id,
-                'number_series': u.number_series,
-                'name': u.full_name,
-                'email': u.email,
-                'agency': getattr(getattr(u, 'agency', None), 'agency_name', ''),
-                'active_status': True,
-            })
-        
-        # Add trainers from Trainer table
-        for t in trainers:
-            if q and (q not in (t.name or '').lower() and q not in (t.email or '').lower()):
-                continue
-            if role_filter not in ('all','trainer'):
-                continue
-            merged_accounts.append({
-                'type': 'trainer',
-                'id': t.trainer_id,
-                'number_series': t.number_series,
-                'name': t.name,
-                'email': t.email,
-                'agency': '',
-                'active_status': t.active_status,
-            })
-        # Only show admins to superadmins
-        from utils import is_superadmin
-        if is_superadmin():
-            admins = Admin.query.all()
-            for a in admins:
-                if q and (q not in (a.username or '').lower() and q not in (a.email or '').lower()):
-                    continue
-                if role_filter not in ('all','admin'):
-                    continue
-                merged_accounts.append({
-                    'type': 'admin',
-                    'id': a.admin_id,
-                    'number_series': None,
-                    'name': a.username,
-                    'email': a.email,
-                    'agency': '',
-                    'active_status': True,
-                })
-        filters = SimpleNamespace(q=q, role=role_filter, agency_id=agency_id, status=request.args.get('status','all'))
+        # Only each table's first page is rendered; table_pagination.js fetches the rest from /api/tables/<name>
+        account_pages = [(title, spec, table_pages.fetch(spec, request.args))
+                         for title, spec in ACCOUNT_TABLES if spec.allowed(current_user)]
+        filters = SimpleNamespace(q=q, role=role_filter, agency_id=request.args.get('agency_id'), status=request.args.get('status','all'))
+    except ValueError:
+        abort(400)
     except Exception:
         logging.exception('[ADMIN USERS] Failed building context')
-        merged_accounts = []
+        account_pages = []
         agencies = []
         filters = SimpleNamespace(q='', role='all', agency_id=None, status='all')
-    if isinstance(current_user, AgencyAccount):
-        agency_users = User.query.filter_by(agency_id=current_user.agency_id).all()
-        return render_template('agency_portal.html', agency=current_user.agency, agency_users=agency_users)
-    
+
     # Get all courses for the course assignment dropdown
     try:
         courses = Course.query.order_by(Course.name.asc()).all()
     except Exception:
         logging.exception('[ADMIN USERS] Failed loading courses')
         courses = []
-    
-    return render_template('admin_users.html', merged_accounts=merged_accounts, agencies=agencies, filters=filters, courses=courses)
+
+    return render_template('admin_users.html', account_pages=account_pages, agencies=agencies, filters=filters, courses=courses)
 
 @main_bp.route('/create_user', methods=['POST'])
 @login_required
@@ -1355,9 +1348,6 @@ def create_user():
                 flash(f'Trainer with email {email} already exists', 'warning')
                 return redirect(url_for('main.admin_users'))
             
-            year = datetime.utcnow().strftime('%Y')
-            seq_name = f'trainer_number_series_{year}_seq'
-            
             new_trainer = Trainer(
                 name=full_name,
                 email=email,
@@ -1365,12 +1355,8 @@ def create_user():
             )
             new_trainer.set_password(password)
             
+            new_trainer.number_series = number_series.allocator.allocate('TR')
             db.session.add(new_trainer)
-            db.session.flush()
-            
-            db.session.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {seq_name}"))
-            seq_val = db.session.execute(text(f"SELECT nextval('{seq_name}')")).scalar()
-            new_trainer.number_series = f"TR{year}{int(seq_val):04d}"
             
             db.session.commit()
             flash(f'Trainer "{full_name}" created successfully', 'success')
@@ -1457,14 +1443,19 @@ def admin_course_management():
                     return jsonify({'success': False, 'message': 'Module not found'})
                 flash('Module not found', 'danger')
                 return redirect(url_for('main.admin_course_management'))
+            old_quiz_json = module.quiz_json
             module.quiz_json = quiz_json
+            quiz_analytics.mark_stale(module.module_id)
+            # A corrected answer key rescores stored attempts in the same transaction
+            rescore = quiz_rescore.rescore_if_key_changed(module, old_quiz_json)
             db.session.commit()
             
             # Check if this is an AJAX request
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return jsonify({'success': True, 'message': 'Quiz updated successfully'})
+                return jsonify({'success': True, 'message': _quiz_saved_message(rescore),
+                                'rescored': len(rescore.changes) if rescore else 0})
             
-            flash('Quiz updated successfully', 'success')
+            flash(_quiz_saved_message(rescore), 'success')
         except Exception as e:
             db.session.rollback()
             logging.exception('[ADMIN COURSE MANAGEMENT] Failed to update quiz')
@@ -1493,12 +1484,97 @@ def admin_course_management():
         # Ensure each course's module list is sorted by series (numeric-aware)
         for k in list(course_modules.keys()):
             course_modules[k] = sorted(course_modules[k], key=_module_series_sort_key)
+        quiz_stats = quiz_analytics.stats_by_module(m.module_id for m in modules)
     except Exception:
         logging.exception('[ADMIN COURSE MANAGEMENT] Failed loading data')
         courses = []
         modules = []
         course_modules = {}
-    return render_template('admin_course_management.html', courses=courses, modules=modules, course_modules=course_modules)
+        quiz_stats = {}
+    return render_template('admin_course_management.html', courses=courses, modules=modules, course_modules=course_modules, quiz_stats=quiz_stats)
+
+@main_bp.route('/api/admin/db_pool_stats')
+@login_required
+def db_pool_stats():
+    """Connection pool checkout/overflow/wait statistics for this worker process"""
+    if not isinstance(current_user, Admin):
+        return jsonify({'error': 'Not authorized'}), 403
+    stats = db_pool.pool_metrics(db.engine)
+    stats['pid'] = os.getpid()
+    return jsonify(stats)
+
+@main_bp.route('/admin/sql_stats')
+@login_required
+def admin_sql_stats():
+    """Recent requests of this worker ranked by SQL statement count (see sql_stats.py)"""
+    if not isinstance(current_user, Admin):
+        return redirect(url_for('main.login'))
+    return render_template('admin_sql_stats.html', entries=sql_stats.recent_requests()[:50], pid=os.getpid(),
+                           warn_statements=current_app.config.get('SQL_STATS_WARN_STATEMENTS'))
+
+@main_bp.route('/api/admin/search')
+@login_required
+def api_admin_search():
+    """Ranked users, modules and certificates for one search box value (see search.py)"""
+    if not isinstance(current_user, Admin):
+        return jsonify({'error': 'Not authorized'}), 403
+    q = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 10, type=int) or 10, 50)
+    parsed = search.parse(q)
+    if parsed.kind is None:
+        return jsonify({'query': None, 'users': [], 'modules': [], 'certificates': []})
+
+    if parsed.kind == 'text':
+        user_ids = search.ranked('user', parsed.value, limit)
+        users = {u.User_id: u for u in User.query.filter(User.User_id.in_(user_ids))}
+        users = [users[i] for i in user_ids if i in users]
+        module_ids = search.ranked('module', parsed.value, limit)
+        modules = {m.module_id: m for m in Module.query.filter(Module.module_id.in_(module_ids))}
+        modules = [modules[i] for i in module_ids if i in modules]
+    else:
+        users = User.query.filter(search.user_filter(q)).limit(limit).all()
+        modules = Module.query.filter(Module.module_id == parsed.value).all() if parsed.kind == 'id' else []
+    certificates = (Certificate.query.filter(search.certificate_filter(q))
+                    .order_by(Certificate.issue_date.desc(), Certificate.certificate_id.desc()).limit(limit).all())
+    return jsonify({
+        'query': {'kind': parsed.kind, 'value': parsed.value},
+        'users': [{'id': u.User_id, 'name': u.full_name, 'email': u.email, 'number_series': u.number_series} for u in users],
+        'modules': [{'id': m.module_id, 'name': m.module_name, 'series_number': m.series_number} for m in modules],
+        'certificates': [{'id': c.certificate_id, 'user_id': c.user_id, 'module_type': c.module_type,
+                          'issue_date': c.issue_date.isoformat(), 'status': c.status} for c in certificates],
+    })
+
+@main_bp.route('/admin/profiles')
+@login_required
+def admin_profiles():
+    """Recent ?_profile=1 request captures (see request_profiler.py)"""
+    if not isinstance(current_user, Admin):
+        return redirect(url_for('main.login'))
+    return render_template('admin_profiles.html', captures=request_profiler.list_captures(current_app),
+                           enabled=current_app.config.get('REQUEST_PROFILING'),
+                           rate_limit=current_app.config.get('PROFILING_RATE_LIMIT'))
+
+@main_bp.route('/admin/profiles/<capture_id>.<ext>')
+@login_required
+def admin_profile_file(capture_id, ext):
+    """Download one capture file (.prof, .txt or .folded)"""
+    if not isinstance(current_user, Admin):
+        abort(403)
+    path = request_profiler.capture_path(current_app, capture_id, ext)
+    if not path:
+        abort(404)
+    return send_file(path, mimetype='application/octet-stream' if ext == 'prof' else 'text/plain', as_attachment=(ext != 'txt'))
+
+@main_bp.route('/metrics')
+def metrics():
+    """Prometheus metrics for all workers; admin session or METRICS_TOKEN bearer token"""
+    token = current_app.config.get('METRICS_TOKEN')
+    authorized = bool(token) and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and not (current_user.is_authenticated and isinstance(current_user, Admin)):
+        abort(403)
+    body = request_metrics.render(request_metrics.collect(db.engine))
+    return current_app.response_class(body, mimetype=None, content_type=request_metrics.CONTENT_TYPE,
+                                      headers={'Cache-Control': 'no-store'})
 
 @main_bp.route('/debug/quiz_data/<int:module_id>')
 @login_required
@@ -1594,10 +1670,12 @@ def delete_course(course_id):
         for module in modules:
             # Delete certificates for this module
             Certificate.query.filter_by(module_id=module.module_id).delete()
-            # Delete user module progress
+            # Delete user module progress and attempt history
             UserModule.query.filter_by(module_id=module.module_id).delete()
+            QuizAttempt.query.filter_by(module_id=module.module_id).delete()
             db.session.delete(module)
 
+        trainer_scope.remove_course(course.course_id)
         db.session.delete(course)
         db.session.commit()
         flash('Course and all its modules have been deleted successfully!', 'success')
@@ -1693,8 +1771,9 @@ def delete_course_module(module_id):
         
         # Delete certificates for this module first
         Certificate.query.filter_by(module_id=module.module_id).delete()
-        # Delete user progress for this module
+        # Delete user progress and attempt history for this module
         UserModule.query.filter_by(module_id=module.module_id).delete()
+        QuizAttempt.query.filter_by(module_id=module.module_id).delete()
 
         db.session.delete(module)
         db.session.commit()
@@ -1722,6 +1801,7 @@ def delete_module(module_id):
         module_name = module.module_name
         
         UserModule.query.filter_by(module_id=module_id).delete()
+        QuizAttempt.query.filter_by(module_id=module_id).delete()
         Certificate.query.filter_by(module_id=module_id).delete()
         
         db.session.delete(module)
@@ -1792,6 +1872,7 @@ def delete_user():
 
         # Delete related records
         UserModule.query.filter_by(user_id=user.User_id).delete()
+        QuizAttempt.query.filter_by(user_id=user.User_id).delete()
         UserCourseProgress.query.filter_by(user_id=user.User_id).delete()
         Certificate.query.filter_by(user_id=user.User_id).delete()
         WorkHistory.query.filter_by(user_id=user.User_id).delete()
@@ -1821,6 +1902,7 @@ def delete_trainer():
         if not trainer:
             return jsonify({'success': False, 'message': 'Trainer not found'}), 404
 
+        TrainerCourse.query.filter_by(trainer_id=trainer.trainer_id).delete()
         db.session.delete(trainer)
         db.session.commit()
 
@@ -1939,7 +2021,7 @@ def assign_trainer_course():
 
     try:
         trainer_id = request.form.get('trainer_id')
-        course_code = request.form.get('course_code', '').strip()
+        course_codes = [c.strip() for c in request.form.getlist('course_code') if c.strip()]
 
         if not trainer_id:
             return jsonify({'success': False, 'message': 'Trainer ID is required'}), 400
@@ -1948,12 +2030,17 @@ def assign_trainer_course():
         if not trainer:
             return jsonify({'success': False, 'message': 'Trainer not found'}), 404
 
-        # Assign course (empty string means all courses)
-        trainer.course = course_code if course_code else None
+        # Several course_code values scope the trainer to several courses; none means all courses
+        course_ids = []
+        if course_codes:
+            course_ids = [cid for (cid,) in db.session.query(Course.course_id).filter(Course.code.in_(course_codes))]
+            if len(course_ids) != len(set(course_codes)):
+                return jsonify({'success': False, 'message': 'Unknown course code'}), 400
+        courses = trainer_scope.assign(trainer, course_ids, all_courses=not course_codes)
 
         db.session.commit()
 
-        course_name = course_code if course_code else "All Courses"
+        course_name = ', '.join(c.code for c in courses) if courses else "All Courses"
         logging.info(f'[ASSIGN COURSE] Trainer {trainer_id} assigned to course: {course_name} by {current_user}')
         
         return jsonify({
@@ -2009,9 +2096,6 @@ def change_role():
             existing_trainer = Trainer.query.filter_by(email=user.email).first()
             if not existing_trainer:
                 # Create new Trainer record
-                year = datetime.utcnow().strftime('%Y')
-                seq_name = f'trainer_number_series_{year}_seq'
-                
                 new_trainer = Trainer(
                     name=user.full_name,
                     email=user.email,
@@ -2021,13 +2105,8 @@ def change_role():
                 # Copy password from user
                 new_trainer.password_hash = user.password_hash
                 
+                new_trainer.number_series = number_series.allocator.allocate('TR')
                 db.session.add(new_trainer)
-                db.session.flush()
-                
-                # Generate trainer number series
-                db.session.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {seq_name}"))
-                seq_val = db.session.execute(text(f"SELECT nextval('{seq_name}')")).scalar()
-                new_trainer.number_series = f"TR{year}{int(seq_val):04d}"
                 
                 logging.info(f'[CHANGE ROLE] Created Trainer record for user {user_id} with series {new_trainer.number_series}')
             else:
@@ -2100,20 +2179,17 @@ def manage_module_content(module_id):
 
         # SECURITY: Verify trainer has access to this module's course
         if isinstance(current_user, Trainer):
-            if not module.course:
+            if module.course_id is None:
                 flash('Module is not associated with a course', 'danger')
                 logging.error(f'[DATA ERROR] Module {module_id} has no course relationship')
                 return redirect(url_for('main.trainer_course_management'))
-            
-            if getattr(current_user, 'course', None):
-                # Trainer assigned to specific course(s)
-                if module.course.code != current_user.course:
-                    flash('You are not authorized to modify this module', 'danger')
-                    logging.warning(f'[SECURITY] Trainer {current_user.trainer_id} attempted to modify module {module_id} outside their assigned course')
-                    return redirect(url_for('main.trainer_course_management'))
-            # If trainer.course is None, they have access to all courses
+            if not trainer_scope.can_manage_module(current_user, module):
+                flash('You are not authorized to modify this module', 'danger')
+                logging.warning(f'[SECURITY] Trainer {current_user.trainer_id} attempted to modify module {module_id} outside their assigned course')
+                return redirect(url_for('main.trainer_course_management'))
 
         content_type = request.form.get('content_type')
+        replaced_slide = rendered_slide = None
 
         if content_type == 'slide':
             slide_text = request.form.get('slide_text')
@@ -2127,7 +2203,9 @@ def manage_module_content(module_id):
                     file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], 'slides', filename)
                     os.makedirs(os.path.dirname(file_path), exist_ok=True)
                     file.save(file_path)
+                    replaced_slide = module.slide_url
                     module.slide_url = f"slides/{filename}"
+                    rendered_slide = module.slide_url
                     flash('Slide content updated successfully!', 'success')
                 else:
                     flash('Invalid file type. Only PDF and PPTX files are allowed.', 'warning')
@@ -2143,6 +2221,11 @@ def manage_module_content(module_id):
             flash('Invalid content type specified.', 'danger')
 
         db.session.commit()
+        if rendered_slide:
+            if replaced_slide and replaced_slide != rendered_slide:
+                slide_render.remove_rendered(replaced_slide)
+            # Split the deck into lazily loaded page images off the request thread
+            slide_render.render_in_background(rendered_slide)
 
     except Exception as e:
         db.session.rollback()
@@ -2165,100 +2248,105 @@ def manage_module_content(module_id):
     return redirect(url_for(redirect_route) + f'#module-{module_id}')
 
 # Admin certificates
-@main_bp.route('/admin_certificates')
-@login_required
-def admin_certificates():
-    if not isinstance(current_user, Admin):
-        return redirect(url_for('main.login'))
-    try:
-        # Get filter parameters
-        search_query = request.args.get('q', '').strip()
-        status_filter = request.args.get('status', 'all').lower()
-        agency_id = request.args.get('agency_id')
-        course_id = request.args.get('course_id')
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
-        min_score = request.args.get('min_score')
-        max_score = request.args.get('max_score')
-
-        # Get agencies and courses for filters
-        agencies = Agency.query.order_by(Agency.agency_name).all()
-        courses = Course.query.order_by(Course.name).all()
-
-        # Base query
-        certificates_query = Certificate.query.join(User, Certificate.user_id == User.User_id).join(Module).outerjoin(Course, Course.course_id == Module.course_id)
-
-        # Apply search filter
-        if search_query:
-            certificates_query = certificates_query.filter(
-                or_(
-                    User.full_name.ilike(f'%{search_query}%'),
-                    User.email.ilike(f'%{search_query}%'),
-                    Module.module_name.ilike(f'%{search_query}%'),
-                    Course.name.ilike(f'%{search_query}%') if Course else True
-                )
-            )
+def _certificates_query(args):
+    """Certificates matching the admin_certificates filters in `args` (unordered)."""
+    search_query = args.get('q', '').strip()
+    status_filter = args.get('status', 'all').lower()
+    certificates_query = Certificate.query.join(User, Certificate.user_id == User.User_id).join(Module).outerjoin(Course, Course.course_id == Module.course_id)
+    certificates_query = certificates_query.options(db.contains_eager(Certificate.user))
+
+    if search_query:
+        certificates_query = certificates_query.filter(search.certificate_filter(search_query))
+
+    # Apply agency filter
+    if args.get('agency_id'):
+        try:
+            certificates_query = certificates_query.filter(User.agency_id == int(args['agency_id']))
+        except ValueError:
+            pass
 
-        # Apply agency filter
-        if agency_id:
-            try:
-                certificates_query = certificates_query.filter(User.agency_id == int(agency_id))
-            except ValueError:
-                pass
+    # Apply course filter
+    if args.get('course_id'):
+        try:
+            certificates_query = certificates_query.filter(Course.course_id == int(args['course_id']))
+        except ValueError:
+            pass
 
-        # Apply course filter
-        if course_id:
-            try:
-                certificates_query = certificates_query.filter(Course.course_id == int(course_id))
-            except ValueError:
-                pass
+    # Apply date range
+    if args.get('date_from'):
+        try:
+            certificates_query = certificates_query.filter(Certificate.issue_date >= datetime.strptime(args['date_from'], '%Y-%m-%d').date())
+        except ValueError:
+            pass
+    if args.get('date_to'):
+        try:
+            certificates_query = certificates_query.filter(Certificate.issue_date <= datetime.strptime(args['date_to'], '%Y-%m-%d').date())
+        except ValueError:
+            pass
 
-        # Apply date range
-        if date_from:
-            try:
-                from_date = datetime.strptime(date_from, '%Y-%m-%d')
-                certificates_query = certificates_query.filter(Certificate.issue_date >= from_date)
-            except ValueError:
-                pass
-        if date_to:
-            try:
-                to_date = datetime.strptime(date_to, '%Y-%m-%d')
-                certificates_query = certificates_query.filter(Certificate.issue_date <= to_date)
-            except ValueError:
-                pass
+    # Apply score range
+    if args.get('min_score'):
+        try:
+            certificates_query = certificates_query.filter(Certificate.score >= float(args['min_score']))
+        except ValueError:
+            pass
+    if args.get('max_score'):
+        try:
+            certificates_query = certificates_query.filter(Certificate.score <= float(args['max_score']))
+        except ValueError:
+            pass
 
-        # Apply score range
-        if min_score:
-            try:
-                min_s = float(min_score)
-                certificates_query = certificates_query.filter(Certificate.score >= min_s)
-            except ValueError:
-                pass
-        if max_score:
-            try:
-                max_s = float(max_score)
-                certificates_query = certificates_query.filter(Certificate.score <= max_s)
-            except ValueError:
-                pass
+    # 'issued' predates the approval workflow and means approved
+    if status_filter in ('pending', 'approved', 'rejected', 'issued'):
+        certificates_query = certificates_query.filter(Certificate.status == ('approved' if status_filter == 'issued' else status_filter))
+    return certificates_query
 
-        # Apply status filter
-        if status_filter == 'pending':
-            certificates_query = certificates_query.filter(Certificate.certificate_path == None)
-        elif status_filter == 'issued':
-            certificates_query = certificates_query.filter(Certificate.certificate_path != None)
 
-        certificates = certificates_query.order_by(Certificate.issue_date.desc()).all()
+CERTIFICATES_TABLE = table_pages.register(table_pages.TableSpec(
+    'certificates',
+    query=_certificates_query,
+    key=Certificate.certificate_id,
+    sorts={'issue_date': Certificate.issue_date, 'certificate_id': Certificate.certificate_id, 'status': Certificate.status},
+    row_template='certificate_rows.html',
+    allowed=lambda user: isinstance(user, Admin),
+))
 
-        filters = SimpleNamespace(q=search_query, status=status_filter, agency_id=agency_id, course_id=course_id, date_from=date_from, date_to=date_to, min_score=min_score, max_score=max_score)
 
+@main_bp.route('/admin_certificates')
+@login_required
+def admin_certificates():
+    if not isinstance(current_user, Admin):
+        return redirect(url_for('main.login'))
+    filters = SimpleNamespace(**{name: request.args.get(name) for name in ('agency_id', 'course_id', 'date_from', 'date_to', 'min_score', 'max_score')},
+                              q=request.args.get('q', '').strip(), status=request.args.get('status', 'all').lower())
+    try:
+        agencies = Agency.query.order_by(Agency.agency_name).all()
+        courses = Course.query.order_by(Course.name).all()
+        # Only the first page is rendered; table_pagination.js fetches the rest from /api/tables/certificates
+        page = table_pages.fetch(CERTIFICATES_TABLE, request.args)
+    except ValueError:
+        abort(400)
     except Exception:
         logging.exception('[ADMIN CERTIFICATES] Failed loading certificates')
-        certificates = []
-        agencies = []
-        courses = []
-        filters = SimpleNamespace(q='', status='all', agency_id=None, course_id=None, date_from=None, date_to=None, min_score=None, max_score=None)
+        agencies, courses = [], []
+        page = {'items': [], 'next_cursor': None, 'total': 0, 'sort': CERTIFICATES_TABLE.default_sort, 'dir': CERTIFICATES_TABLE.default_dir}
+
+    return render_template('admin_certificates.html', certificates=page['items'], page=page, agencies=agencies, courses=courses, filters=filters)
 
-    return render_template('admin_certificates.html', certificates=certificates, agencies=agencies, courses=courses, filters=filters)
+
+@main_bp.route('/api/tables/<name>')
+@login_required
+def api_table_page(name):
+    """One page of a server-paginated listing (see table_pages.py)."""
+    spec = table_pages.TABLES.get(name)
+    if spec is None:
+        return jsonify({'error': 'Unknown table'}), 404
+    if not spec.allowed(current_user):
+        return jsonify({'error': 'Not authorized'}), 403
+    try:
+        return jsonify(table_pages.render_page(spec, request.args))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @main_bp.route('/upload_cert_template', methods=['POST'])
 @login_required
@@ -2396,82 +2484,128 @@ def generate_and_download_certificate(certificate_id):
         return redirect(url_for('main.my_certificates'))
 
 # Monitor progress
+def _course_progress(users, courses, match_category=False):
+    """Progress rows of `users` (in their order) in each of `courses` that has modules.
+
+    One grouped query covers the given users only. match_category skips
+    courses whose allowed_category excludes the user. The first row of each
+    user is marked 'first' so paginated tables can count users.
+    """
+    courses = [c for c in courses if c.modules]
+    user_ids = [u.User_id for u in users]
+    course_stats = {}
+    if user_ids and courses:
+        # Completed count, average score and last activity per (user, course)
+        stats_q = db.session.query(
+            UserModule.user_id, Module.course_id,
+            db.func.count(UserModule.id), db.func.avg(UserModule.score), db.func.max(UserModule.completion_date)
+        ).join(Module, Module.module_id == UserModule.module_id).filter(
+            UserModule.is_completed.is_(True),
+            UserModule.user_id.in_(user_ids),
+            Module.course_id.in_([c.course_id for c in courses])
+        )
+        for uid, cid, completed, avg_score, last in stats_q.group_by(UserModule.user_id, Module.course_id):
+            course_stats[(uid, cid)] = (completed, avg_score, last)
+
+    rows = []
+    for user in users:
+        first = True
+        for course in courses:
+            if match_category and course.allowed_category in ('citizen', 'foreigner') and user.user_category != course.allowed_category:
+                continue
+            total_for_course = len(course.modules)
+            completed_for_user, avg_user_score_val, last_activity = course_stats.get((user.User_id, course.course_id), (0, None, None))
+            user_progress_pct = completed_for_user / total_for_course * 100.0
+            rows.append({
+                'user_id': user.User_id,
+                'user_name': user.full_name,
+                'user_number_series': user.number_series,
+                'user_category': user.user_category,
+                'course_name': course.name,
+                'course_code': course.code,
+                'agency_name': user.agency.agency_name if user.agency else '',
+                'progress_pct': round(user_progress_pct, 1),
+                'completed_modules': completed_for_user,
+                'total_modules': total_for_course,
+                'score': round(float(avg_user_score_val or 0.0), 1),
+                'last_activity': last_activity,
+                'status': 'Completed' if user_progress_pct >= 100 else 'Active',
+                'first': first,
+            })
+            first = False
+    return rows
+
+
+def _monitor_progress_users(args):
+    """Users matching the monitor_progress filters in `args` (unordered)."""
+    users_q = User.query.options(db.joinedload(User.agency))
+    agency_id = args.get('agency_id')
+    # An agency account sees its own agency unless it picks another
+    if isinstance(current_user, AgencyAccount) and not agency_id:
+        agency_id = current_user.agency_id
+    if agency_id:
+        try:
+            users_q = users_q.filter(User.agency_id == int(agency_id))
+        except ValueError:
+            pass
+    q = args.get('q', '').strip().lower()
+    if q:
+        users_q = users_q.filter(search.user_filter(q, agencies=True))
+    return users_q
+
+
+def _monitor_progress_rows(users):
+    courses_q = Course.query.options(db.selectinload(Course.modules)).order_by(Course.name)
+    course_id = request.args.get('course_id')
+    if course_id:
+        try:
+            courses_q = courses_q.filter(Course.course_id == int(course_id))
+        except ValueError:
+            pass
+    return _course_progress(users, courses_q.all())
+
+
+# Paginated on users; each page's rows are that page's users in every course
+MONITOR_PROGRESS_TABLE = table_pages.register(table_pages.TableSpec(
+    'monitor_progress',
+    query=_monitor_progress_users,
+    key=User.User_id,
+    sorts={'full_name': User.full_name, 'email': User.email},
+    row_template='monitor_progress_rows.html',
+    allowed=lambda user: isinstance(user, (Admin, AgencyAccount)),
+    default_dir='asc',
+    prepare=_monitor_progress_rows,
+))
+
+
 @main_bp.route('/monitor_progress')
 @login_required
 def monitor_progress():
     if not (isinstance(current_user, Admin) or isinstance(current_user, AgencyAccount)):
         return redirect(url_for('main.login'))
     try:
-        # Filters
         q = request.args.get('q', '').strip().lower()
         agency_id = request.args.get('agency_id')
         course_id = request.args.get('course_id')
-        status_filter = request.args.get('status', '').lower()
-
-        # For AgencyAccount, default to their agency if no agency_id specified
         if isinstance(current_user, AgencyAccount) and not agency_id:
             agency_id = current_user.agency_id
 
         # Get agencies and courses for filters
         agencies = Agency.query.order_by(Agency.agency_name).all()
         courses = Course.query.order_by(Course.name).all()
-
-        # Get users
-        users_q = User.query.options(db.joinedload(User.agency))
-        if agency_id:
-            try:
-                users_q = users_q.filter(User.agency_id == int(agency_id))
-            except ValueError:
-                pass
-        users = users_q.all()
-
-        progress_rows = []
-        for user in users:
-            if q and (q not in (user.full_name or '').lower() and q not in (user.email or '').lower() and q not in (user.agency.agency_name if user.agency else '').lower()):
-                continue
-            for course in courses:
-                if course_id and str(course.course_id) != course_id:
-                    continue
-                course_module_ids = [m.module_id for m in course.modules]
-                if not course_module_ids:
-                    continue
-                user_completed_q = UserModule.query.filter(
-                    UserModule.user_id == user.User_id,
-                    UserModule.module_id.in_(course_module_ids),
-                    UserModule.is_completed.is_(True)
-                )
-                completed_for_user = user_completed_q.count()
-                total_for_course = len(course_module_ids)
-                user_progress_pct = (completed_for_user / total_for_course * 100.0) if total_for_course else 0.0
-                avg_user_score_val = user_completed_q.with_entities(db.func.avg(UserModule.score)).scalar()
-                avg_user_score = round(float(avg_user_score_val or 0.0), 1)
-                last_activity = user_completed_q.with_entities(db.func.max(UserModule.completion_date)).scalar()
-                progress_rows.append({
-                    'user_name': user.full_name,
-                    'course_name': course.name,
-                    'course_code': course.code,
-                    'agency_name': user.agency.agency_name if user.agency else '',
-                    'progress_pct': round(user_progress_pct, 1),
-                    'score': avg_user_score,
-                    'last_activity': last_activity,
-                    'status': 'Completed' if user_progress_pct >= 100 else 'Active'
-                })
-
-        # Sort by last_activity desc
-        progress_rows.sort(key=lambda r: (r['last_activity'] or datetime.min), reverse=True)
-        # Limit to 500
-        progress_rows = progress_rows[:500]
-
+        # Only the first page of users is rendered; table_pagination.js fetches the rest from /api/tables/monitor_progress
+        page = table_pages.fetch(MONITOR_PROGRESS_TABLE, request.args)
         filters = SimpleNamespace(q=q, agency_id=agency_id, course_id=course_id, status='')
-
+    except ValueError:
+        abort(400)
     except Exception:
         logging.exception('[MONITOR PROGRESS] Failed loading progress data')
-        progress_rows = []
         agencies = []
         courses = []
+        page = {'items': [], 'next_cursor': None, 'total': 0, 'sort': MONITOR_PROGRESS_TABLE.default_sort, 'dir': MONITOR_PROGRESS_TABLE.default_dir}
         filters = SimpleNamespace(q='', agency_id=None, course_id=None, status='')
 
-    return render_template('monitor_progress.html', course_progress_rows=progress_rows, agencies=agencies, courses=courses, filters=filters)
+    return render_template('monitor_progress.html', course_progress_rows=page['items'], page=page, agencies=agencies, courses=courses, filters=filters)
 
 # Admin agencies
 @main_bp.route('/admin_agencies')
@@ -2480,22 +2614,15 @@ def admin_agencies():
     if not isinstance(current_user, Admin):
         return redirect(url_for('main.login'))
     try:
-        agencies = Agency.query.order_by(Agency.agency_name).all()
-
-        # Get user count per agency
-        agency_stats = []
-        for agency in agencies:
-            user_count = User.query.filter_by(agency_id=agency.agency_id).count()
-            agency_stats.append({
-                'agency': agency,
-                'user_count': user_count
-            })
-
+        # Users are preloaded for the per-agency "View Users" modals
+        agencies = Agency.query.options(db.selectinload(Agency.users)).order_by(Agency.agency_name).all()
+        agency_stats = agency_stats_provider.cache.get()
     except Exception:
         logging.exception('[ADMIN AGENCIES] Failed loading agencies')
         agencies = []
+        agency_stats = {}
 
-    return render_template('admin_agencies.html', agencies=agencies)
+    return render_template('admin_agencies.html', agencies=agencies, agency_stats=agency_stats, empty_stats=agency_stats_provider.EMPTY)
 
 @main_bp.route('/add_agency', methods=['POST'])
 @login_required
@@ -2592,6 +2719,30 @@ def edit_agency(agency_id):
     return redirect(url_for('main.admin_agencies'))
 
 # --- Added: Agency account endpoints (portal + agency-specific progress monitor) ---
+AGENCY_USERS_TABLE = table_pages.register(table_pages.TableSpec(
+    'agency_users',
+    query=lambda args: User.query.filter(User.agency_id == current_user.agency_id),
+    key=User.User_id,
+    sorts={'full_name': User.full_name, 'email': User.email, 'user_category': User.user_category},
+    row_template='agency_user_rows.html',
+    allowed=lambda user: isinstance(user, AgencyAccount),
+    default_dir='asc',
+))
+
+
+def _render_agency_portal(agency):
+    """agency_portal.html with the first page of the agency's users."""
+    page = {'items': [], 'next_cursor': None, 'total': 0, 'sort': AGENCY_USERS_TABLE.default_sort, 'dir': AGENCY_USERS_TABLE.default_dir}
+    if agency:
+        try:
+            page = table_pages.fetch(AGENCY_USERS_TABLE, request.args)
+        except ValueError:
+            abort(400)
+        except Exception:
+            logging.exception('[AGENCY PORTAL] Failed loading agency users')
+    return render_template('agency_portal.html', agency=agency, agency_users=page['items'], page=page)
+
+
 @main_bp.route('/agency_portal')
 @login_required
 def agency_portal():
@@ -2605,14 +2756,10 @@ def agency_portal():
             agency = current_user.agency
         elif getattr(current_user, 'agency_id', None):
             agency = db.session.query(Agency).filter_by(agency_id=current_user.agency_id).first()
-        agency_users = []
-        if agency:
-            agency_users = User.query.filter_by(agency_id=agency.agency_id).all()
     except Exception:
-        logging.exception('[AGENCY PORTAL] Failed loading agency users')
-        agency = getattr(current_user, 'agency', None) or None
-        agency_users = []
-    return render_template('agency_portal.html', agency=agency, agency_users=agency_users)
+        logging.exception('[AGENCY PORTAL] Failed loading agency')
+        agency = None
+    return _render_agency_portal(agency)
 
 @main_bp.route('/agency_update_details', methods=['POST'])
 @login_required
@@ -2814,12 +2961,12 @@ def agency_progress_monitor():
                 users_q = users_q.filter(User.agency_id == int(agency_id))
             except Exception:
                 pass
+        if q:
+            users_q = users_q.filter(search.user_filter(q, agencies=True))
         users = users_q.all()
 
         progress_rows = []
         for user in users:
-            if q and (q not in (user.full_name or '').lower() and q not in (user.email or '').lower() and q not in (user.agency.agency_name if user.agency else '').lower()):
-                continue
             for course in courses:
                 if course_id and str(course.course_id) != course_id:
                     continue
@@ -3122,10 +3269,7 @@ def upload_content():
 @main_bp.route('/uploads/<path:filename>')
 @login_required
 def serve_uploaded_slide(filename):
-    upload_folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
-    if not os.path.isabs(upload_folder):
-        upload_folder = os.path.join(current_app.root_path, upload_folder)
-    return send_from_directory(upload_folder, filename)
+    return uploads.serve_upload(filename)
 
 # Debug database connection
 @main_bp.route('/debug_db')
@@ -3180,6 +3324,18 @@ def admin_create_agency_account(agency_id):
         flash('Failed to create agency account.', 'danger')
         return redirect(url_for('main.admin_agencies'))
 
+# The reset token is minted when the outbox sends the message, so the link never sits in email_outbox.body
+PASSWORD_RESET_TOKEN_MARKER = '__password_reset_token__'
+
+
+def _password_reset_token(email):
+    serializer = URLSafeTimedSerializer(current_app.config.get('SECRET_KEY'))
+    return serializer.dumps(email, salt='password-reset-salt')
+
+
+email_outbox.register_filler(PASSWORD_RESET_TOKEN_MARKER, lambda row: _password_reset_token(row.recipient))
+
+
 @main_bp.route('/forgot_password', methods=['GET', 'POST'])
 def forgot_password():
     """Handle 'forgot password' requests: generate a token and email a reset link.
@@ -3204,11 +3360,10 @@ def forgot_password():
             logging.exception('[FORGOT PASSWORD] DB lookup failed')
             user = None
 
-        # Create a token regardless; if no user exists token won't be useful but we don't disclose that.
+        # Send a link regardless; if no user exists the token won't be useful but we don't disclose that.
         try:
-            serializer = URLSafeTimedSerializer(current_app.config.get('SECRET_KEY'))
-            token = serializer.dumps(email, salt='password-reset-salt')
-            reset_link = url_for('main.reset_password', token=token, _external=True)
+            # The outbox fills in the token at send time (see _password_reset_token)
+            reset_link = url_for('main.reset_password', token=PASSWORD_RESET_TOKEN_MARKER, _external=True)
 
             subject = 'Password Reset - SHAPADU Security Training'
             body = f"""Hello,
@@ -3225,118 +3380,18 @@ Best regards,
 SHAPADU SECURITY SDN BHD
 Security Personnel Training System"""
 
-            # Try Gmail SMTP first (preferred method)
-            gmail_user = os.environ.get('GMAIL_USER')
-            gmail_password = os.environ.get('GMAIL_APP_PASSWORD')
-            email_sent = False
-            
-            if gmail_user and gmail_password:
-                try:
-                    with smtplib.SMTP('smtp.gmail.com', 587) as smtp:
-                        smtp.starttls()
-                        smtp.login(gmail_user, gmail_password)
-                        msg = MIMEText(body)
-                        msg['Subject'] = subject
-                        msg['From'] = gmail_user
-                        msg['To'] = email
-                        smtp.sendmail(gmail_user, [email], msg.as_string())
-                        logging.info(f'[FORGOT PASSWORD] Gmail email sent successfully to {email}')
-                        email_sent = True
-                except Exception as e:
-                    logging.error(f'[FORGOT PASSWORD] Gmail send failed: {str(e)}')
-                    logging.exception('[FORGOT PASSWORD] Gmail full error details')
-                    email_sent = False
-            
-            # Fallback: Try SMTP2GO
-            if not email_sent:
-                smtp2go_api_key = os.environ.get('SMTP2GO_API_KEY')
-                if smtp2go_api_key:
-                    try:
-                        sender_email = os.environ.get('SMTP2GO_SENDER_EMAIL', 'noreply@shapadusecurity.com')
-                        smtp2go_url = 'https://api.smtp2go.com/v3/email/send'
-                        payload = {
-                            'api_key': smtp2go_api_key,
-                            'to': [email],
-                            'sender': sender_email,
-                            'subject': subject,
-                            'text_body': body
-                        }
-                        response = requests.post(smtp2go_url, json=payload, timeout=10)
-                        response_data = response.json()
-                        
-                        if response.status_code == 200 and response_data.get('data', {}).get('succeeded', 0) > 0:
-                            logging.info(f'[FORGOT PASSWORD] SMTP2GO email sent successfully to {email}')
-                            email_sent = True
-                        else:
-                            error_msg = response_data.get('data', {}).get('error', 'Unknown error')
-                            logging.error(f'[FORGOT PASSWORD] SMTP2GO send failed: {error_msg}')
-                            email_sent = False
-                    except Exception as e:
-                        logging.error(f'[FORGOT PASSWORD] SMTP2GO send failed: {str(e)}')
-                        logging.exception('[FORGOT PASSWORD] SMTP2GO full error details')
-                        email_sent = False
-            
-            # Fallback: Try SendGrid
-            if not email_sent:
-                sendgrid_api_key = os.environ.get('SENDGRID_API_KEY')
-                if sendgrid_api_key:
-                    try:
-                        sender_email = os.environ.get('SENDGRID_SENDER_EMAIL', 'noreply@shapadusecurity.com')
-                        message = SGMail(
-                            from_email=sender_email,
-                            to_emails=email,
-                            subject=subject,
-                            plain_text_content=body
-                        )
-                        sg = SendGridAPIClient(sendgrid_api_key)
-                        response = sg.send(message)
-                        logging.info(f'[FORGOT PASSWORD] SendGrid email sent successfully to {email}. Status: {response.status_code}')
-                        email_sent = True
-                    except Exception as e:
-                        logging.error(f'[FORGOT PASSWORD] SendGrid send failed: {str(e)}')
-                        logging.exception('[FORGOT PASSWORD] SendGrid full error details')
-                        email_sent = False
-            
-            # Fallback: Try Flask-Mail if available
-            if not email_sent:
-                mail_ext = current_app.extensions.get('mail') if hasattr(current_app, 'extensions') else None
-                if mail_ext:
-                    try:
-                        msg = Message(subject=subject, recipients=[email], body=body)
-                        mail_ext.send(msg)
-                        email_sent = True
-                    except Exception:
-                        logging.exception('[FORGOT PASSWORD] Flask-Mail send failed')
-                        email_sent = False
-
-            # Final fallback: localhost SMTP or log link in development
-            if not email_sent:
-                try:
-                    smtp_host = current_app.config.get('MAIL_SERVER', 'localhost')
-                    smtp_port = current_app.config.get('MAIL_PORT', 1025)
-                    from_addr = current_app.config.get('MAIL_DEFAULT_SENDER', 'noreply@shapadusecurity.com')
-                    with smtplib.SMTP(smtp_host, smtp_port) as smtp:
-                        msg = MIMEText(body)
-                        msg['Subject'] = subject
-                        msg['From'] = from_addr
-                        msg['To'] = email
-                        smtp.sendmail(from_addr, [email], msg.as_string())
-                        email_sent = True
-                except Exception:
-                    logging.exception('[FORGOT PASSWORD] All email methods failed')
-                    # In development/debug mode, surface the reset link in the server logs
-                    if current_app.debug or str(current_app.config.get('ENV','')).lower() == 'development':
-                        logging.info('[FORGOT PASSWORD] Reset link (dev): %s', reset_link)
-                        flash('Development mode: Password reset link has been logged to the server console.', 'info')
-                        return redirect(url_for('main.login'))
-                    # Production: show error
-                    flash('Unable to send reset email. Please contact support.', 'danger')
-                    return redirect(url_for('main.login'))
+            # Delivered by the outbox sender; the request only records the message
+            email_outbox.enqueue(email, subject, body)
+            db.session.commit()
+            if current_app.debug:
+                dev_link = url_for('main.reset_password', token=_password_reset_token(email), _external=True)
+                logging.info('[FORGOT PASSWORD] Reset link (dev): %s', dev_link)
 
             # Always show a neutral message so attackers cannot confirm account existence
             flash('If an account with that email exists, a password reset link has been sent.', 'info')
         except Exception:
-            logging.exception('[FORGOT PASSWORD] Error generating or sending reset link')
+            db.session.rollback()
+            logging.exception('[FORGOT PASSWORD] Error generating or queueing reset link')
             flash('An error occurred. Please try again later.', 'danger')
         return redirect(url_for('main.login'))
 
@@ -3435,86 +3490,30 @@ def module_quiz(module_id):
 
 # Quiz APIs
 @main_bp.route('/api/load_quiz/<int:module_id>')
-@login_required
 def api_load_quiz(module_id):
     """Return quiz data for a module as JSON (list of questions).
-    Supports multiple storage shapes for Module.quiz_json.
+    Supports multiple storage shapes for Module.quiz_json (see quiz_answers.player_questions).
+    Responses carry a strong ETag; a matching If-None-Match gets a 304 from the
+    process cache (quiz_cache.py) without loading the user or the module.
     """
+    # A signed session with a login is enough to revalidate; the full user load only happens on a 200
+    if session.get('_user_id') is None:
+        return current_app.login_manager.unauthorized()
     try:
-        mod = db.session.get(Module, module_id)
-        if not mod:
-            return jsonify([]), 404
-        raw = mod.quiz_json
-        if not raw:
-            return jsonify([])
-        import json
-        try:
-            parsed = json.loads(raw)
-        except Exception:
-            # If it's not valid JSON, return empty
-            return jsonify([])
-        # Normalize to a list of questions: support list, or dict with 'questions'/'quiz' keys
-        questions = []
-        if isinstance(parsed, list):
-            questions = parsed
-        elif isinstance(parsed, dict):
-            # Try common keys
-            if 'questions' in parsed and isinstance(parsed['questions'], list):
-                questions = parsed['questions']
-            elif 'quiz' in parsed and isinstance(parsed['quiz'], list):
-                questions = parsed['quiz']
-            else:
-                # If dict looks like a single question, wrap it
-                # Accept keys 'text' and 'answers'
-                if 'text' in parsed and 'answers' in parsed:
-                    questions = [parsed]
-                else:
-                    # Unknown structure -> return empty
-                    questions = []
+        cached = quiz_cache.cache.get(module_id)
+        if cached is not None and request.if_none_match.contains_weak(cached.etag):
+            resp = current_app.response_class(status=304)
         else:
-            questions = []
-        # Ensure each question has answers array with 'text' and optional 'isCorrect'
-        out = []
-        for q in questions:
-            if not isinstance(q, dict):
-                continue
-            q_text = q.get('text') or q.get('question') or ''
-            answers = []
-            raw_answers = q.get('answers') or q.get('choices') or []
-            if isinstance(raw_answers, dict):
-                # convert dict to list of {text:..., isCorrect:...}
-                for k, v in raw_answers.items():
-                    if isinstance(v, dict):
-                        answers.append({'text': v.get('text', str(v)), 'isCorrect': bool(v.get('isCorrect', False))})
-                    else:
-                        answers.append({'text': str(v), 'isCorrect': False})
-            elif isinstance(raw_answers, list):
-                for a in raw_answers:
-                    if isinstance(a, dict):
-                        answers.append({'text': a.get('text', ''), 'isCorrect': bool(a.get('isCorrect', False))})
-                    else:
-                        answers.append({'text': str(a), 'isCorrect': False})
-            # Find correct index
-            correct_idx = -1
-            if isinstance(q, dict):
-                if isinstance(q.get('correctIndex'), int):
-                    correct_idx = q.get('correctIndex')
-                elif isinstance(q.get('correct'), int):
-                    correct_idx = q.get('correct')
-                elif isinstance(q.get('correct'), str) and q.get('correct').isdigit():
-                    correct_idx = int(q.get('correct'))
-            # Inspect answers for isCorrect
-            if isinstance(raw_answers, list):
-                for i, a in enumerate(raw_answers):
-                    if isinstance(a, dict):
-                        if a.get('isCorrect') or a.get('is_correct') or a.get('correct') is True or a.get('isAnswer') or a.get('answer_is_correct'):
-                            correct_idx = i
-                            break
-            # Set isCorrect on the correct answer
-            if correct_idx != -1 and correct_idx < len(answers):
-                answers[correct_idx]['isCorrect'] = True
-            out.append({'text': q_text, 'answers': answers, 'correctIndex': correct_idx})
-        return jsonify(out)
+            if not current_user.is_authenticated:
+                return current_app.login_manager.unauthorized()
+            payload = quiz_cache.load(module_id)
+            if payload is None:
+                return jsonify([]), 404
+            resp = current_app.response_class(payload.body, mimetype='application/json')
+            cached = payload
+        resp.set_etag(cached.etag)
+        resp.headers['Cache-Control'] = quiz_cache.CACHE_CONTROL
+        return resp
     except Exception:
         logging.exception('[API] load_quiz')
         return jsonify([]), 500
@@ -3524,10 +3523,8 @@ def api_load_quiz(module_id):
 @login_required
 def api_get_user_quiz_answers(module_id):
     """Return saved answers array for the current user and module.
-    Simpler, robust behavior:
     - Resolve the current user id.
-    - Return parsed JSON array when possible.
-    - If stored value is a non-JSON string or otherwise unparsable, attempt a safe fallback parsing (comma/bracket split) and return an array of values or nulls.
+    - Decode the canonical UserModule.quiz_answers value (see quiz_answers.py) into a list of indexes/nulls.
     """
     try:
         # Resolve user id
@@ -3548,88 +3545,7 @@ def api_get_user_quiz_answers(module_id):
         um = UserModule.query.filter_by(user_id=uid, module_id=module_id).first()
         if not um or not getattr(um, 'quiz_answers', None):
             return jsonify([])
-
-        raw = um.quiz_answers
-        # If already a Python list, return it
-        if isinstance(raw, (list, tuple)):
-            return jsonify(list(raw))
-
-        # If it's bytes, decode
-        if isinstance(raw, (bytes, bytearray)):
-            try:
-                raw = raw.decode('utf-8')
-            except Exception:
-                try:
-                    raw = raw.decode('latin-1')
-                except Exception:
-                    raw = str(raw)
-
-        # If it's a string, try JSON first
-        if isinstance(raw, str):
-            s = raw.strip()
-            try:
-                import json
-                parsed = json.loads(s)
-                if isinstance(parsed, list):
-                    return jsonify(parsed)
-                # Some systems may have stored a quoted JSON string, try again
-                if isinstance(parsed, str):
-                    try:
-                        parsed2 = json.loads(parsed)
-                        if isinstance(parsed2, list):
-                            return jsonify(parsed2)
-                    except Exception:
-                        pass
-            except Exception:
-                pass
-
-            # Fallback: simple bracket or comma-split parsing
-            if s.startswith('[') and s.endswith(']'):
-                inner = s[1:-1].strip()
-                if inner == '':
-                    return jsonify([])
-                parts = [p.strip() for p in inner.split(',')]
-                out = []
-                for p in parts:
-                    if p.lower() in ('null', 'none'):
-                        out.append(None)
-                    elif (p.startswith('"') and p.endswith('"')) or (p.startswith("'") and p.endswith("'")):
-                        out.append(p[1:-1])
-                    else:
-                        # try numeric
-                        try:
-                            if '.' in p:
-                                f = float(p)
-                                if f.is_integer():
-                                    out.append(int(f))
-                                else:
-                                    out.append(f)
-                            else:
-                                out.append(int(p))
-                        except Exception:
-                            out.append(p)
-                return jsonify(out)
-
-            # Comma-separated without brackets
-            if ',' in s:
-                parts = [p.trim() if hasattr(p, 'trim') else p.strip() for p in s.split(',')]
-                out = []
-                for p in parts:
-                    if p.lower() in ('null', 'none'):
-                        out.append(None)
-                    else:
-                        try:
-                            out.append(int(p))
-                        except Exception:
-                            try:
-                                f = float(p)
-                                out.append(int(f) if f.is_integer() else f)
-                            except Exception:
-                                out.append(p)
-                return jsonify(out)
-
-        # As a last resort, return the raw string as single-element array
-        return jsonify([raw])
+        return jsonify(decode_answers(um.quiz_answers))
     except Exception:
         logging.exception('[API] user_quiz_answers')
         return jsonify([]), 500
@@ -3639,7 +3555,7 @@ def api_get_user_quiz_answers(module_id):
 @login_required
 def api_save_quiz_answers(module_id):
     """Save partial answers for the logged-in user for a module.
-    This implementation accepts JSON bodies and will persist whatever array is provided (including arrays containing nulls).
+    Accepts a JSON array of answer indexes (nulls for unanswered questions) and stores it in the canonical packed form.
     """
     try:
         # Accept JSON body or raw data; prefer JSON
@@ -3674,6 +3590,8 @@ def api_save_quiz_answers(module_id):
         if answers is None:
             # Nothing usable provided
             return jsonify({'success': False, 'message': 'No answers provided'}), 400
+        if not isinstance(answers, list):
+            return jsonify({'success': False, 'message': 'Answers must be an array'}), 400
 
         # Resolve numeric user id robustly
         uid = None
@@ -3689,13 +3607,8 @@ def api_save_quiz_answers(module_id):
         if not uid:
             return jsonify({'success': False, 'message': 'User not identified'}), 400
 
-        import json
-        um = UserModule.query.filter_by(user_id=uid, module_id=module_id).first()
-        if not um:
-            um = UserModule(user_id=uid, module_id=module_id, quiz_answers=json.dumps(answers))
-            db.session.add(um)
-        else:
-            um.quiz_answers = json.dumps(answers)
+        # First autosave of a new attempt marks its start for time-to-completion stats
+        quiz_submission.autosave(uid, module_id, encode_answers(answers))
         db.session.commit()
         return jsonify({'success': True})
     except Exception:
@@ -3708,7 +3621,7 @@ def api_save_quiz_answers(module_id):
 @login_required
 def api_debug_quiz_raw(module_id):
     """Return raw UserModule.quiz_answers for debugging (only for logged-in user).
-    Simpler debug output: raw stored value and a best-effort parsed JSON.
+    Simpler debug output: raw stored value and its decoded answers (None if not in canonical format).
     """
     try:
         # Resolve numeric user id robustly
@@ -3728,14 +3641,9 @@ def api_debug_quiz_raw(module_id):
         if not um:
             return jsonify({'success': False, 'message': 'No UserModule found', 'raw': None})
         raw = um.quiz_answers
-        parsed = None
         try:
-            import json
-            if isinstance(raw, str):
-                parsed = json.loads(raw)
-            elif isinstance(raw, (list, tuple)):
-                parsed = list(raw)
-        except Exception:
+            parsed = decode_answers(raw)
+        except ValueError:
             parsed = None
         return jsonify({
             'success': True,
@@ -3774,54 +3682,51 @@ def api_review_quiz(module_id):
         if not um or not um.is_completed:
             return jsonify({'success': False, 'message': 'Quiz not completed yet'}), 400
 
-        import json
         # Load quiz questions
-        try:
-            parsed = json.loads(mod.quiz_json) if mod.quiz_json else []
-        except Exception:
-            parsed = []
-
-        questions = []
-        if isinstance(parsed, list):
-            questions = parsed
-        elif isinstance(parsed, dict):
-            if 'questions' in parsed and isinstance(parsed['questions'], list):
-                questions = parsed['questions']
-            elif 'quiz' in parsed and isinstance(parsed['quiz'], list):
-                questions = parsed['quiz']
-
-        # Load user's answers
-        user_answers = []
-        try:
-            user_answers = json.loads(um.quiz_answers) if um.quiz_answers else []
-        except Exception:
-            user_answers = []
+        questions = extract_questions(mod.quiz_json)
+        current_version = quiz_version(mod.quiz_json)
+        attempts = quiz_attempts.history(uid, module_id)
+
+        attempt_id = request.args.get('attempt', type=int)
+        if attempt_id is not None:
+            # A past attempt from the history instead of the latest stored answers
+            attempt = quiz_attempts.get(uid, module_id, attempt_id)
+            if attempt is None:
+                return jsonify({'success': False, 'message': 'Attempt not found'}), 404
+            user_answers = quiz_attempts.answers_of(attempt)
+            score = attempt.score
+            completed_at = attempt.submitted_at
+            version = attempt.quiz_version
+        else:
+            # Load user's answers
+            try:
+                user_answers = decode_answers(um.quiz_answers)
+            except ValueError:
+                user_answers = []
+            score = um.score
+            completed_at = um.completion_date
+            version = attempts[0].quiz_version if attempts else current_version
 
         # Extract correct indices
-        correct_indices = []
-        for q in questions:
-            raw_answers = q.get('answers') if isinstance(q, dict) else []
-            correct_idx = -1
-            if isinstance(q, dict):
-                if isinstance(q.get('correctIndex'), int):
-                    correct_idx = q.get('correctIndex')
-                elif isinstance(q.get('correct'), int):
-                    correct_idx = q.get('correct')
-            if isinstance(raw_answers, list):
-                for i, a in enumerate(raw_answers):
-                    if isinstance(a, dict):
-                        if a.get('isCorrect') or a.get('is_correct') or a.get('correct') is True:
-                            correct_idx = i
-                            break
-            correct_indices.append(correct_idx)
+        correct_indices = [correct_index(q) for q in questions]
 
         return jsonify({
             'success': True,
             'questions': questions,
             'userAnswers': user_answers,
             'correctAnswers': correct_indices,
-            'score': um.score,
-            'completionDate': um.completion_date.isoformat() if um.completion_date else None
+            'score': score,
+            'completionDate': completed_at.isoformat() if completed_at else None,
+            'attemptId': attempt_id,
+            # The quiz was edited after these answers were scored
+            'quizChanged': version != current_version,
+            'attempts': [{
+                'id': a.id,
+                'score': a.score,
+                'startedAt': a.started_at.isoformat() if a.started_at else None,
+                'submittedAt': a.submitted_at.isoformat(),
+                'quizChanged': a.quiz_version != current_version,
+            } for a in attempts],
         })
     except Exception:
         logging.exception('[API] review_quiz')
@@ -3838,69 +3743,17 @@ def api_submit_quiz(module_id):
         is_reattempt = bool(payload.get('is_reattempt')) if isinstance(payload, dict) else False
         if answers is None:
             return jsonify({'success': False, 'message': 'No answers provided'}), 400
+        if not isinstance(answers, list):
+            return jsonify({'success': False, 'message': 'Answers must be an array'}), 400
+        answers = [normalize_answer(a) for a in answers]
 
         mod = db.session.get(Module, module_id)
         if not mod:
             return jsonify({'success': False, 'message': 'Module not found'}), 404
 
-        # Load quiz canonical data
-        import json
-        try:
-            parsed = json.loads(mod.quiz_json) if mod.quiz_json else []
-        except Exception:
-            parsed = []
-
-        # Normalize to questions list (reuse same shape as api_load_quiz)
-        questions = []
-        if isinstance(parsed, list):
-            questions = parsed
-        elif isinstance(parsed, dict):
-            if 'questions' in parsed and isinstance(parsed['questions'], list):
-                questions = parsed['questions']
-            elif 'quiz' in parsed and isinstance(parsed['quiz'], list):
-                questions = parsed['quiz']
-            elif 'text' in parsed and 'answers' in parsed:
-                questions = [parsed]
-            else:
-                questions = []
-
-        # Extract correct indices using the robust detection rules
-        correct_indices = []
-        for q in questions:
-            raw_answers = q.get('answers') if isinstance(q, dict) else []
-            correct_idx = -1
-            # check question-level keys
-            if isinstance(q, dict):
-                if isinstance(q.get('correctIndex'), int):
-                    correct_idx = q.get('correctIndex')
-                elif isinstance(q.get('correct'), int):
-                    correct_idx = q.get('correct')
-                elif isinstance(q.get('correct'), str) and q.get('correct').isdigit():
-                    correct_idx = int(q.get('correct'))
-            # inspect answers
-            if isinstance(raw_answers, list):
-                for i, a in enumerate(raw_answers):
-                    if isinstance(a, dict):
-                        if a.get('isCorrect') or a.get('is_correct') or a.get('correct') is True or a.get('isAnswer') or a.get('answer_is_correct'):
-                            correct_idx = i
-                            break
-                        # if 'correct' is numeric index stored on an answer dict, handled above
-            correct_indices.append(correct_idx)
-
-        # Score calculation
-        total = len(correct_indices)
-        if total == 0:
-            score = 0
-        else:
-            correct_count = 0
-            for i in range(min(len(answers), total)):
-                try:
-                    user_ans = int(answers[i])
-                except Exception:
-                    user_ans = None
-                if user_ans is not None and user_ans == correct_indices[i] and correct_indices[i] != -1:
-                    correct_count += 1
-            score = round((correct_count / total) * 100, 0)
+        # Compile the answer key and score using the shared rules in quiz_answers.py
+        correct_indices = answer_key(mod.quiz_json)
+        score = score_answers(answers, correct_indices)
 
         # Persist to UserModule
         # Resolve numeric user id robustly
@@ -3917,24 +3770,13 @@ def api_submit_quiz(module_id):
         if not uid:
             return jsonify({'success': False, 'message': 'User not identified'}), 400
 
-        um = UserModule.query.filter_by(user_id=uid, module_id=module_id).first()
-        if not um:
-            um = UserModule(user_id=uid, module_id=module_id, quiz_answers=json.dumps(answers), is_completed=True, score=float(score), completion_date=datetime.utcnow(), reattempt_count=1 if is_reattempt else 0)
-            db.session.add(um)
-        else:
-            # Update answers
-            um.quiz_answers = json.dumps(answers)
-            # Increase reattempt count when reattempt
-            if is_reattempt:
-                um.reattempt_count = (um.reattempt_count or 0) + 1
-            # Mark completed and update score only if it's better
-            um.is_completed = True
-            if um.score is None or float(score) > float(um.score):
-                um.score = float(score)
-            um.completion_date = datetime.utcnow()
+        now = datetime.utcnow()
+        # History first: it reads the attempt's start time that the submission clears
+        quiz_attempts.record(uid, module_id, mod.quiz_json, answers, score, now=now)
+        # One INSERT ... ON CONFLICT: best score and reattempt count are kept by the database
+        stored = quiz_submission.submit(uid, module_id, encode_answers(answers), score, is_reattempt=is_reattempt, now=now)
         db.session.commit()
-        grade_letter = um.get_grade_letter() if um else 'A'
-        return jsonify({'success': True, 'score': int(score), 'grade_letter': grade_letter, 'reattempt_count': um.reattempt_count if um else 0, 'answers': answers, 'correct_indices': correct_indices})
+        return jsonify({'success': True, 'score': int(score), 'grade_letter': grade_letter(stored.reattempt_count), 'reattempt_count': stored.reattempt_count, 'answers': answers, 'correct_indices': correct_indices})
     except Exception:
         logging.exception('[API] submit_quiz')
         db.session.rollback()
@@ -3960,55 +3802,23 @@ def api_complete_course():
         if not user:
             return jsonify({'success': False, 'message': 'User not found'}), 404
         
-        # Check if user is eligible for certificate
-        if not user.EligibleForCertificate(course_code):
-            return jsonify({'success': False, 'message': 'Not eligible. Complete all modules with 50% average score.'}), 400
-        
-        # Check if certificate already exists for this course
-        existing_cert = Certificate.query.filter_by(user_id=uid, module_type=course_code).first()
-        if existing_cert:
+        # One grouped query: all modules completed, average >= 50, no live certificate
+        eligible = certificate_eligibility.eligible(course_code, [uid], reissue_rejected=True)
+        if not eligible:
+            existing_cert = Certificate.query.filter(
+                Certificate.user_id == uid,
+                certificate_eligibility.for_course(course_code),
+                Certificate.status.in_(('pending', 'approved')),
+            ).order_by(Certificate.status == 'pending').first()
+            if existing_cert is None:
+                return jsonify({'success': False, 'message': 'Not eligible. Complete all modules with 50% average score.'}), 400
             if existing_cert.status == 'pending':
                 return jsonify({'success': True, 'already_submitted': True, 'message': 'Already submitted for approval'}), 200
-            elif existing_cert.status == 'approved':
-                return jsonify({'success': True, 'already_approved': True, 'message': 'Certificate already approved'}), 200
-        
-        # Get all modules for this course to associate certificate with one
-        modules = Module.query.filter_by(module_type=course_code).all()
-        if not modules:
+            return jsonify({'success': True, 'already_approved': True, 'message': 'Certificate already approved'}), 200
+
+        # Pending certificate on the course's first module, scored with the course average
+        if not certificate_eligibility.issue_pending(course_code, eligible):
             return jsonify({'success': False, 'message': 'No modules found for this course'}), 404
-        
-        # Sort modules to pick a representative one (first by series or id)
-        try:
-            modules_sorted = sorted(modules, key=lambda m: (m.series_number or '', m.module_id))
-            representative_module = modules_sorted[0]
-        except Exception:
-            representative_module = modules[0]
-        
-        # Calculate average score for the course
-        module_ids = [m.module_id for m in modules]
-        user_modules = UserModule.query.filter(
-            UserModule.user_id == uid,
-            UserModule.module_id.in_(module_ids),
-            UserModule.is_completed == True
-        ).all()
-        
-        if user_modules:
-            total_score = sum(um.score for um in user_modules if um.score is not None)
-            average_score = total_score / len(user_modules) if len(user_modules) > 0 else 0
-        else:
-            average_score = 0
-        
-        # Create pending certificate with score
-        from datetime import date
-        new_cert = Certificate(
-            user_id=uid,
-            module_type=course_code,
-            module_id=representative_module.module_id,
-            issue_date=date.today(),
-            status='pending',
-            score=average_score
-        )
-        db.session.add(new_cert)
         db.session.commit()
         
         logging.info(f'[COURSE_COMPLETE] User {uid} completed course {course_code}, pending certificate created')
@@ -4037,6 +3847,31 @@ def api_save_theme_preference():
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@main_bp.route('/api/quiz_stats/<int:module_id>/refresh', methods=['POST'])
+@login_required
+def api_refresh_quiz_stats(module_id):
+    """Recompute quiz item analytics for one module on demand (admins and the module's trainers)."""
+    if not isinstance(current_user, (Admin, Trainer)):
+        return jsonify({'success': False, 'message': 'Not authorized'}), 403
+    try:
+        mod = db.session.get(Module, module_id)
+        if not mod:
+            return jsonify({'success': False, 'message': 'Module not found'}), 404
+        if isinstance(current_user, Trainer) and not trainer_scope.can_manage_module(current_user, mod):
+            return jsonify({'success': False, 'message': 'Not authorized'}), 403
+        stats = quiz_analytics.refresh_module_stats(module_id)
+        return jsonify({
+            'success': True,
+            'attempts': stats.attempts,
+            'avg_score': stats.avg_score,
+            'avg_duration_seconds': stats.avg_duration_seconds,
+            'items': stats.get_item_stats()
+        })
+    except Exception:
+        logging.exception('[API] refresh_quiz_stats')
+        db.session.rollback()
+        return jsonify({'success': False, 'message': 'Server error'}), 500
+
 @main_bp.route('/admin_debug_quiz/<int:module_id>')
 @login_required
 def admin_debug_quiz(module_id):
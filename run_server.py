@@ -82,6 +82,8 @@ def main():
         sys.exit(1)
 
     try:
+        # The development runner keeps creating missing tables on startup (see create_app)
+        os.environ.setdefault('AUTO_CREATE_SCHEMA', '1')
         # Import the Flask app explicitly from app.py to avoid name collision with app/ directory
         app = _load_flask_app_from_file()
 
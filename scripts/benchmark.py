@@ -0,0 +1,273 @@
+"""
+Request benchmark: scripted user journeys against a seeded dataset.
+
+Seeds a throwaway database with seed_data.py, then replays three journeys
+through the Flask test client (no network, so numbers reflect app + database
+time only):
+
+    trainee    login -> dashboard -> course modules -> for each module:
+               load quiz, save answers, submit -> complete course
+    admin      login -> monitor_progress
+    authority  login -> portal -> approve one trainee's pending certificates
+
+Every request is timed per step. The report lists p50/p95 per step and the
+overall requests/second. Results are compared with the baseline file for the
+database backend; a step whose p50 (or p95, with twice the slack) or the
+overall throughput is worse than the baseline by more than --tolerance makes
+the run exit with status 1.
+
+Usage:
+    python scripts/benchmark.py [--users 10000] [--iterations 20] [--concurrency 1]
+    python scripts/benchmark.py --database-url postgresql://bench@localhost/bench_db --reset-database
+    python scripts/benchmark.py --update-baseline      # record this machine's numbers
+
+DATABASE_URL is not read: the default is a temporary SQLite file, and a
+PostgreSQL URL is only used with --reset-database because all its tables are
+dropped and reseeded.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, 'scripts', 'benchmark_baseline.json')
+JOURNEY_COURSE = 'CSG'
+# Latency regressions smaller than this are noise, whatever the percentage
+MIN_REGRESSION_MS = 2.0
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class Timings:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def timed(self, step, call, *args, **kwargs):
+        started = time.perf_counter()
+        response = call(*args, **kwargs)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.samples[step].append(elapsed_ms)
+            if response.status_code >= 400:
+                self.errors[step] += 1
+        return response
+
+
+def _login(timings, client, journey, email, password):
+    timings.timed(f'{journey}.login', client.post, '/login', data={'email': email, 'password': password})
+
+
+def trainee_journey(app, timings, user_email, modules, password):
+    client = app.test_client()
+    _login(timings, client, 'trainee', user_email, password)
+    timings.timed('trainee.dashboard', client.get, '/user_dashboard')
+    timings.timed('trainee.course_modules', client.get, f'/modules/{JOURNEY_COURSE}')
+    for module_id, key in modules:
+        timings.timed('trainee.load_quiz', client.get, f'/api/load_quiz/{module_id}')
+        answers = list(key)
+        timings.timed('trainee.save_answers', client.post, f'/api/save_quiz_answers/{module_id}', json={'answers': answers[:len(answers) // 2]})
+        timings.timed('trainee.submit_quiz', client.post, f'/api/submit_quiz/{module_id}', json={'answers': answers})
+    timings.timed('trainee.complete_course', client.post, '/api/complete_course', json={'course_code': JOURNEY_COURSE})
+
+
+def admin_journey(app, timings, email, password):
+    client = app.test_client()
+    _login(timings, client, 'admin', email, password)
+    timings.timed('admin.monitor_progress', client.get, '/monitor_progress')
+
+
+def authority_journey(app, timings, email, password, trainee_id):
+    client = app.test_client()
+    _login(timings, client, 'authority', email, password)
+    timings.timed('authority.portal', client.get, '/authority')
+    with client.session_transaction() as sess:
+        token = sess.get('csrf_token', '')
+    timings.timed('authority.approve', client.post, '/authority/bulk_approve',
+                  json={'scope': 'user', 'user_id': trainee_id}, headers={'X-CSRFToken': token})
+
+
+def plan(iterations):
+    """Journey ids to run: trainees dominate, as in production traffic."""
+    journeys = []
+    for i in range(iterations):
+        journeys.extend(['trainee', 'trainee', 'trainee', 'admin' if i % 2 == 0 else 'authority'])
+    return journeys
+
+
+def run(args):
+    os.environ['DISABLE_SCHEMA_GUARD'] = '1'
+    os.environ['EMAIL_OUTBOX_MODE'] = 'external'
+    sys.path.insert(0, ROOT)
+    import logging
+    logging.disable(logging.WARNING)
+    import app as app_module
+    import seed_data
+    from models import db, Certificate, Module, User, UserModule
+    from quiz_answers import answer_key
+
+    app = app_module.create_app({'SQLALCHEMY_DATABASE_URI': args.database_url, 'TESTING': True})
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        counts = seed_data.generate(users=args.users, seed=args.seed)
+        print(f'Seeded {sum(counts.values())} rows ({args.users} trainees) in {time.perf_counter() - started:.1f}s on {db.engine.dialect.name}')
+        backend = db.engine.dialect.name
+        modules = [(m.module_id, answer_key(m.quiz_json)) for m in Module.query.filter_by(module_type=JOURNEY_COURSE).order_by(Module.series_number)]
+        started_ids = {uid for (uid,) in db.session.query(UserModule.user_id).filter(UserModule.module_id.in_([m for m, _ in modules])).distinct()}
+        fresh = [email for uid, email in db.session.query(User.User_id, User.email).filter(User.role == 'agency').order_by(User.User_id) if uid not in started_ids]
+        pending = [uid for (uid,) in db.session.query(Certificate.user_id).filter(Certificate.status == 'pending').distinct().order_by(Certificate.user_id)]
+
+    journeys = plan(args.iterations)
+    needed_trainees = journeys.count('trainee') + 1  # plus the warm-up journey
+    if len(fresh) < needed_trainees:
+        raise SystemExit(f'Only {len(fresh)} trainees without {JOURNEY_COURSE} history; raise --users or lower --iterations')
+    fresh_iter, pending_iter = iter(fresh), iter(pending)
+    password = seed_data.DEFAULT_PASSWORD
+    tasks = []
+    for journey in journeys:
+        if journey == 'trainee':
+            tasks.append((trainee_journey, (next(fresh_iter), modules, password)))
+        elif journey == 'admin':
+            tasks.append((admin_journey, (seed_data.ADMIN_EMAIL, password)))
+        else:
+            tasks.append((authority_journey, (seed_data.AUTHORITY_EMAIL, password, next(pending_iter, 0))))
+
+    timings = Timings()
+    # Warm-up journeys so template compilation and first connections are not measured
+    warmup = Timings()
+    trainee_journey(app, warmup, next(fresh_iter), modules, password)
+    admin_journey(app, warmup, seed_data.ADMIN_EMAIL, password)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(fn, app, timings, *fn_args) for fn, fn_args in tasks]
+        for f in futures:
+            f.result()
+    wall = time.perf_counter() - started
+
+    total = sum(len(v) for v in timings.samples.values())
+    result = {
+        'backend': backend,
+        'users': args.users,
+        'concurrency': args.concurrency,
+        'requests': total,
+        'requests_per_second': round(total / wall, 1),
+        'steps': {
+            step: {
+                'count': len(samples),
+                'errors': timings.errors.get(step, 0),
+                'p50_ms': round(statistics.median(samples), 2),
+                'p95_ms': round(percentile(samples, 95), 2),
+            } for step, samples in sorted(timings.samples.items())
+        },
+    }
+    return result
+
+
+def report(result):
+    print(f"\n{'step':<28}{'n':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}")
+    for step, s in result['steps'].items():
+        print(f"{step:<28}{s['count']:>6}{s['errors']:>5}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}")
+    print(f"\n{result['requests']} requests, {result['requests_per_second']} req/s "
+          f"({result['backend']}, {result['users']} trainees, concurrency {result['concurrency']})")
+
+
+def compare(result, baseline, tolerance):
+    """Return a list of regressions of `result` against one backend's baseline."""
+    problems = []
+    for step, base in baseline.get('steps', {}).items():
+        current = result['steps'].get(step)
+        if current is None:
+            problems.append(f'{step}: missing from this run')
+            continue
+        # p95 rests on few samples per step, so it gets twice the slack of the median
+        for field, slack in (('p50_ms', tolerance), ('p95_ms', 2 * tolerance)):
+            limit = max(base[field] * (1 + slack), base[field] + MIN_REGRESSION_MS)
+            if current[field] > limit:
+                problems.append(f"{step}: {field[:3]} {current[field]:.1f} ms > {limit:.1f} ms (baseline {base[field]:.1f})")
+    for step, current in result['steps'].items():
+        if current['errors']:
+            problems.append(f"{step}: {current['errors']} error responses")
+    base_rps = baseline.get('requests_per_second')
+    if base_rps and result['requests_per_second'] < base_rps * (1 - tolerance):
+        problems.append(f"throughput {result['requests_per_second']} req/s < {base_rps * (1 - tolerance):.1f} (baseline {base_rps})")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='default: a temporary SQLite file')
+    parser.add_argument('--reset-database', action='store_true', help='allow dropping all tables of a non-SQLite --database-url')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=1, help='journeys run in parallel threads (adds GIL contention)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.3, help='allowed slowdown before failing (0.3 = 30%%)')
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--json', help='also write the result to this file')
+    args = parser.parse_args(argv)
+
+    tmpdir = None
+    if not args.database_url:
+        tmpdir = tempfile.TemporaryDirectory()
+        args.database_url = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+    elif not args.database_url.startswith('sqlite') and not args.reset_database:
+        parser.error('--reset-database is required: all tables of --database-url are dropped and reseeded')
+
+    try:
+        result = run(args)
+    finally:
+        if tmpdir is not None:
+            tmpdir.cleanup()
+    report(result)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fh:
+            json.dump(result, fh, indent=2)
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as fh:
+            baselines = json.load(fh)
+    if args.update_baseline:
+        baselines[result['backend']] = {k: result[k] for k in ('users', 'concurrency', 'requests_per_second', 'steps')}
+        with open(args.baseline, 'w', encoding='utf-8') as fh:
+            json.dump(baselines, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        print(f"Baseline for {result['backend']} written to {args.baseline}")
+        return 0
+    baseline = baselines.get(result['backend'])
+    if not baseline:
+        print(f"No {result['backend']} baseline in {args.baseline}; run with --update-baseline to record one")
+        return 0
+    if (baseline.get('users'), baseline.get('concurrency')) != (result['users'], result['concurrency']):
+        print('Note: baseline was recorded with different --users/--concurrency; comparison is approximate')
+    problems = compare(result, baseline, args.tolerance)
+    if problems:
+        print('\nRegressions against baseline:')
+        for p in problems:
+            print(f'  ✗ {p}')
+        return 1
+    print('✓ Within baseline')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
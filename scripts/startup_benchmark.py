@@ -0,0 +1,107 @@
+"""
+Startup benchmark: how long a fresh worker takes to import, build the app and
+answer its first request.
+
+Each run happens in a new Python process so module caches do not hide import
+cost. Reports the median and worst of:
+
+    import     `import app` (models, Flask, SQLAlchemy; no blueprints)
+    create     create_app() (blueprints, routes.py and its imports)
+    first      first GET of --path through the test client (template compile, DB connect)
+    second     the same request again
+
+Usage:
+    python scripts/startup_benchmark.py [--runs 5] [--path /login] [--importtime 15]
+
+DATABASE_URL defaults to a throwaway SQLite file so no server is needed.
+--importtime N also lists the N slowest modules imported while building the app.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app as app_module
+t1 = time.perf_counter()
+application = app_module.create_app()
+t2 = time.perf_counter()
+client = application.test_client()
+r = client.get(sys.argv[1])
+t3 = time.perf_counter()
+client.get(sys.argv[1])
+t4 = time.perf_counter()
+heavy = sorted(m for m in ('numpy', 'PIL', 'PyPDF2', 'reportlab', 'openpyxl', 'sendgrid', 'requests') if m in sys.modules)
+print(json.dumps({'import': t1 - t0, 'create': t2 - t1, 'first': t3 - t2, 'second': t4 - t3,
+                  'status': r.status_code, 'heavy_modules': heavy}))
+"""
+
+
+def _env(db_path):
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', f'sqlite:///{db_path}')
+    env.setdefault('EMAIL_OUTBOX_MODE', 'external')
+    env['PYTHONPATH'] = ROOT + os.pathsep + env.get('PYTHONPATH', '')
+    return env
+
+
+def run_once(path, env):
+    out = subprocess.run([sys.executable, '-c', PROBE, path], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(count, env):
+    """Return [(cumulative microseconds, module)] for the slowest imports while building the app."""
+    out = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app; app.create_app()'],
+                         cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        parts = line.split('|')
+        try:
+            rows.append((int(parts[1]), parts[2].strip()))
+        except ValueError:
+            continue
+    return sorted(rows, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default='/login')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = _env(os.path.join(tmp, 'bench.db'))
+        # Tables must exist for the first request; schema creation is not part of startup
+        subprocess.run([sys.executable, '-c', 'import app; a = app.create_app()\nwith a.app_context(): app.db.create_all()'],
+                       cwd=ROOT, env=env, check=True, capture_output=True)
+        results = [run_once(args.path, env) for _ in range(args.runs)]
+
+        print(f"Startup over {args.runs} run(s), GET {args.path} -> {results[-1]['status']}")
+        print(f"{'phase':<8} {'median ms':>10} {'max ms':>10}")
+        for phase in ('import', 'create', 'first', 'second'):
+            values = [r[phase] * 1000 for r in results]
+            print(f"{phase:<8} {statistics.median(values):>10.1f} {max(values):>10.1f}")
+        total = [(r['import'] + r['create'] + r['first']) * 1000 for r in results]
+        print(f"{'total':<8} {statistics.median(total):>10.1f} {max(total):>10.1f}  (import + create + first request)")
+        print(f"Heavy modules loaded: {', '.join(results[-1]['heavy_modules']) or 'none'}")
+
+        if args.importtime:
+            print("\nSlowest imports (import app + create_app()):")
+            for micros, module in slowest_imports(args.importtime, env):
+                print(f"  {micros / 1000:>8.1f} ms  {module}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+"""
+Indexed search over users, agencies, courses and modules.
+
+Every searchable entity has one "document": its text columns, lower-cased and
+joined by spaces (see DOCUMENTS). Free text is matched as a substring of that
+document through an index:
+
+    PostgreSQL  a pg_trgm GIN index on the document expression of each table;
+                `doc LIKE '%text%'` uses it and similarity() ranks results.
+                Being an expression index it is always current.
+    SQLite      an FTS5 shadow table `search_index(kind, ref_id, body)` with
+                the trigram tokenizer, kept in sync by ORM flush events and
+                ranked by bm25. Each document's rowid is derived from its
+                kind and id (document_rowid), so a flush replaces it by rowid
+                instead of scanning the UNINDEXED kind/ref_id columns. Core
+                bulk writes bypass those events; run
+                `flask --app app search-reindex` afterwards (seed_data does).
+
+Both need at least three characters; shorter text falls back to a plain LIKE.
+
+parse() routes queries that name one record to equality lookups instead:
+digits are an id, anything shaped like an email is an email and SG/TR
+followed by eight digits is a number series. user_filter() and
+certificate_filter() turn a query into a WHERE clause for the existing
+listings; ranked() returns the best matches of one kind for the admin search.
+
+The index is created together with the tables (db.create_all, `flask init-db`)
+when it is missing, or for an existing database with
+`python migrations/add_search_index.py`, which like search-reindex drops and
+refills it.
+"""
+from collections import namedtuple
+import logging
+import re
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, Text, event, func, literal_column, or_, select, text
+from sqlalchemy.engine import Engine
+
+from models import db, Agency, Certificate, Course, Module, User
+
+MIN_INDEXED_LENGTH = 3
+
+ParsedQuery = namedtuple('ParsedQuery', 'kind value')
+Document = namedtuple('Document', 'kind model key columns')
+
+DOCUMENTS = {
+    'user': Document('user', User, 'User_id', ('full_name', 'email', 'number_series')),
+    'agency': Document('agency', Agency, 'agency_id', ('agency_name',)),
+    'course': Document('course', Course, 'course_id', ('name', 'code')),
+    'module': Document('module', Module, 'module_id', ('module_name', 'module_type', 'series_number')),
+}
+
+# rowid = ref_id * ROWID_STRIDE + the kind's slot; room for a few more kinds
+ROWID_STRIDE = 8
+_KIND_SLOTS = {kind: slot for slot, kind in enumerate(DOCUMENTS)}
+
+EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+NUMBER_SERIES = re.compile(r'^(SG|TR)\d{8}$', re.IGNORECASE)
+
+# Not part of db.metadata: create_all cannot create virtual tables
+search_index = Table(
+    'search_index', MetaData(),
+    Column('rowid', Integer),
+    Column('kind', String),
+    Column('ref_id', Integer),
+    Column('body', Text),
+)
+
+_fts_ready = {}
+
+
+def parse(q) -> ParsedQuery:
+    """Classify a search box value; ParsedQuery(None, None) when empty."""
+    q = (q or '').strip()
+    if not q:
+        return ParsedQuery(None, None)
+    if q.isdigit():
+        return ParsedQuery('id', int(q))
+    if EMAIL.match(q):
+        return ParsedQuery('email', q)
+    if NUMBER_SERIES.match(q):
+        return ParsedQuery('series', q.upper())
+    return ParsedQuery('text', q.lower())
+
+
+def document_sql(doc: Document) -> str:
+    """The lower-cased document expression; identical in index DDL and queries."""
+    return 'lower(' + " || ' ' || ".join(f"coalesce({c}, '')" for c in doc.columns) + ')'
+
+
+def document_rowid(kind: str, ref_id: int) -> int:
+    return ref_id * ROWID_STRIDE + _KIND_SLOTS[kind]
+
+
+def document_text(doc: Document, obj) -> str:
+    return ' '.join(str(getattr(obj, c) or '') for c in doc.columns).lower()
+
+
+def _like_pattern(value: str) -> str:
+    return '%' + value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def _fts_phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _uses_fts(bind) -> bool:
+    if bind.dialect.name != 'sqlite':
+        return False
+    key = str(bind.engine.url)
+    if key not in _fts_ready:
+        probe = text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'")
+        if isinstance(bind, Engine):
+            with bind.connect() as conn:
+                _fts_ready[key] = conn.execute(probe).first() is not None
+        else:
+            _fts_ready[key] = bind.execute(probe).first() is not None
+    return _fts_ready[key]
+
+
+def match_ids(kind: str, value: str, session=None):
+    """SELECT of the ids of `kind` documents containing `value`, for use with in_()."""
+    doc = DOCUMENTS[kind]
+    bind = (session or db.session).get_bind()
+    if len(value) >= MIN_INDEXED_LENGTH and _uses_fts(bind):
+        return select(search_index.c.ref_id).where(
+            search_index.c.body.match(_fts_phrase(value)), search_index.c.kind == kind
+        )
+    table = doc.model.__table__
+    return select(table.c[doc.key]).where(literal_column(document_sql(doc)).like(_like_pattern(value), escape='\\'))
+
+
+def ranked(kind: str, q: str, limit: int = 20, session=None) -> list:
+    """Ids of the `kind` documents best matching free text `q`, best first."""
+    session = session or db.session
+    value = (q or '').strip().lower()
+    if not value:
+        return []
+    doc = DOCUMENTS[kind]
+    bind = session.get_bind()
+    if len(value) >= MIN_INDEXED_LENGTH and _uses_fts(bind):
+        stmt = (select(search_index.c.ref_id)
+                .where(search_index.c.body.match(_fts_phrase(value)), search_index.c.kind == kind)
+                .order_by(literal_column('rank')))
+    else:
+        table = doc.model.__table__
+        body = literal_column(document_sql(doc))
+        stmt = select(table.c[doc.key]).where(body.like(_like_pattern(value), escape='\\'))
+        if bind.dialect.name == 'postgresql':
+            stmt = stmt.order_by(func.similarity(body, value).desc())
+        else:
+            stmt = stmt.order_by(table.c[doc.key])
+    return [ref_id for (ref_id,) in session.execute(stmt.limit(limit))]
+
+
+def user_filter(q, agencies: bool = False, session=None):
+    """WHERE clause on User for search box value `q`, or None when `q` is empty.
+
+    With agencies=True free text also matches the user's agency name.
+    """
+    parsed = parse(q)
+    if parsed.kind is None:
+        return None
+    if parsed.kind == 'email':
+        return User.email.in_({parsed.value, parsed.value.lower()})
+    if parsed.kind == 'series':
+        return User.number_series == parsed.value
+    text_value = str(parsed.value).lower()
+    clauses = [User.User_id.in_(match_ids('user', text_value, session))]
+    if parsed.kind == 'id':
+        clauses.insert(0, User.User_id == parsed.value)
+    if agencies:
+        clauses.append(User.agency_id.in_(match_ids('agency', text_value, session)))
+    return or_(*clauses)
+
+
+def certificate_filter(q, session=None):
+    """WHERE clause on Certificate for search box value `q`, or None when `q` is empty.
+
+    An id is a certificate id; email and number series select the trainee;
+    free text matches the trainee, the module or the module's course.
+    """
+    parsed = parse(q)
+    if parsed.kind is None:
+        return None
+    if parsed.kind == 'id':
+        return Certificate.certificate_id == parsed.value
+    if parsed.kind in ('email', 'series'):
+        return Certificate.user_id.in_(select(User.User_id).where(user_filter(q, session=session)))
+    return or_(
+        Certificate.user_id.in_(match_ids('user', parsed.value, session)),
+        Certificate.module_id.in_(match_ids('module', parsed.value, session)),
+        Certificate.module_id.in_(
+            select(Module.module_id).where(Module.course_id.in_(match_ids('course', parsed.value, session)))
+        ),
+    )
+
+
+# --- Index maintenance ---
+
+def install_schema(conn, reset: bool = False) -> None:
+    """Create the search index for `conn`'s database if it is missing.
+
+    On SQLite a newly created index is filled from the tables; reset=True
+    drops and refills an existing one (search-reindex, the migration).
+    """
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        if reset:
+            conn.execute(text('DROP TABLE IF EXISTS search_index'))
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        )).first() is not None
+        if not exists:
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE search_index USING fts5(kind UNINDEXED, ref_id UNINDEXED, body, tokenize='trigram')"
+            ))
+        _fts_ready[str(conn.engine.url)] = True
+        if not exists:
+            rebuild(conn)
+    elif dialect == 'postgresql':
+        try:
+            with conn.begin_nested():
+                conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        except Exception:
+            logging.warning('[SEARCH] Could not create extension pg_trgm; searches will scan', exc_info=True)
+            return
+        quote = conn.dialect.identifier_preparer.quote
+        for doc in DOCUMENTS.values():
+            conn.execute(text(
+                f'CREATE INDEX IF NOT EXISTS ix_{doc.kind}_search_trgm ON {quote(doc.model.__tablename__)} '
+                f'USING gin (({document_sql(doc)}) gin_trgm_ops)'
+            ))
+
+
+def rebuild(conn) -> int:
+    """Refill the SQLite shadow table from the base tables; returns the document count."""
+    if conn.dialect.name != 'sqlite':
+        return 0
+    conn.execute(search_index.delete())
+    total = 0
+    for doc in DOCUMENTS.values():
+        table = doc.model.__table__
+        total += conn.execute(search_index.insert().from_select(
+            ['rowid', 'kind', 'ref_id', 'body'],
+            select(table.c[doc.key] * ROWID_STRIDE + _KIND_SLOTS[doc.kind], literal_column(f"'{doc.kind}'"),
+                   table.c[doc.key], literal_column(document_sql(doc))),
+        )).rowcount
+    return total
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_index(target, connection, **kw):
+    # Fires on every create_all, also when every table already existed
+    install_schema(connection)
+
+
+@event.listens_for(db.metadata, 'after_drop')
+def _drop_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text('DROP TABLE IF EXISTS search_index'))
+        _fts_ready[str(connection.engine.url)] = False
+
+
+def _sync(kind, event_name):
+    doc = DOCUMENTS[kind]
+
+    def listener(mapper, connection, target):
+        if not _uses_fts(connection):
+            return
+        if event_name == 'after_update':
+            state = db.inspect(target)
+            if not any(state.attrs[c].history.has_changes() for c in doc.columns):
+                return
+        ref_id = getattr(target, doc.key)
+        rowid = document_rowid(kind, ref_id)
+        # kind and ref_id are UNINDEXED: only a rowid lookup avoids scanning the index
+        connection.execute(search_index.delete().where(search_index.c.rowid == rowid))
+        if event_name != 'after_delete':
+            connection.execute(search_index.insert().values(rowid=rowid, kind=kind, ref_id=ref_id,
+                                                            body=document_text(doc, target)))
+    return listener
+
+
+for _doc in DOCUMENTS.values():
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_doc.model, _event_name, _sync(_doc.kind, _event_name))
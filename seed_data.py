@@ -0,0 +1,352 @@
+"""
+Seeded synthetic dataset for benchmarks, profiling and scaling work.
+
+Creates agencies, trainees (citizens and foreigners with SG number series),
+courses with modules and quizzes, UserModule history, certificates in pending
+and approved states with their approval audit rows, an admin
+(admin@bench.local) and an authority user (authority@bench.local). The same
+--seed always produces the same rows, so runs are comparable.
+
+All rows are generated in memory first, because history and certificates are
+derived in the same pass as their trainee; peak memory therefore grows with
+--users. They are then written straight to the driver instead of through the
+ORM, in --chunk-size batches except for psycopg 3's row-by-row COPY:
+
+    postgresql  COPY ... FROM STDIN (psycopg 3 write_row, or psycopg2 copy_expert)
+    sqlite      executemany in one transaction with synchronous=OFF
+    others      SQLAlchemy Core executemany
+
+Every account shares one password hash (DEFAULT_PASSWORD); hashing 100k
+passwords would take longer than the rest of the run.
+
+Trainee progress per course follows PROGRESS_MIX (not started / part way /
+finished); quiz answers are drawn from a per-trainee skill level, so scores,
+answer distributions and certificate eligibility stay consistent with the
+stored quizzes.
+
+Usage:
+    DATABASE_URL=sqlite:///bench.db python seed_data.py --users 160000 --reset
+    python seed_data.py --agencies 500 --users 50000 --courses 6 --modules-per-course 8
+
+160k trainees is about 1M rows. --reset drops and recreates all tables first;
+without it the database must not contain users yet.
+"""
+import argparse
+import base64
+import io
+import json
+import logging
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+from werkzeug.security import generate_password_hash
+
+DEFAULT_PASSWORD = 'bench-pass'
+ADMIN_EMAIL = 'admin@bench.local'
+AUTHORITY_EMAIL = 'authority@bench.local'
+USERS_PER_AGENCY = 200
+QUESTIONS_PER_QUIZ = 10
+ANSWERS_PER_QUESTION = 4
+COURSES = (
+    # code, name, allowed_category, module count
+    ('CSG', 'CERTIFIED SECURITY GUARD (CSG)', 'both', 6),
+    ('TNG', 'NEPAL SECURITY GUARD TRAINING (TNG)', 'foreigner', 5),
+    ('SSG', 'SENIOR SECURITY GUARD (SSG)', 'citizen', 4),
+)
+FOREIGNER_SHARE = 0.3
+# Share of trainees per course that never started, are part way through, or finished it
+PROGRESS_MIX = (('none', 0.35), ('partial', 0.35), ('complete', 0.30))
+APPROVED_SHARE = 0.6
+SERIES_PER_YEAR = 9999
+CHUNK_SIZE = 10000
+
+
+def quiz_for(rng, code, n):
+    """A quiz in the editor's format: answers flagged with isCorrect."""
+    questions = []
+    for q in range(QUESTIONS_PER_QUIZ):
+        correct = rng.randrange(ANSWERS_PER_QUESTION)
+        questions.append({
+            'text': f'{code} module {n} question {q + 1}',
+            'answers': [{'text': f'Option {chr(65 + a)}', 'isCorrect': a == correct} for a in range(ANSWERS_PER_QUESTION)],
+        })
+    return questions
+
+
+def course_catalog(count, modules_per_course=None):
+    """COURSES, extended with generated courses when more are requested."""
+    catalog = []
+    for i in range(count):
+        if i < len(COURSES):
+            code, name, allowed, modules = COURSES[i]
+        else:
+            code = f'GEN{i + 1:02d}'
+            name, allowed, modules = f'GENERATED COURSE {i + 1} ({code})', ('both', 'citizen', 'foreigner')[i % 3], 5
+        catalog.append((code, name, allowed, modules_per_course or modules))
+    return catalog
+
+
+def number_series(index, first_year):
+    """SGYYYYNNNN, rolling over to an earlier year every 9999 trainees."""
+    year = first_year - index // SERIES_PER_YEAR
+    return f'SG{year}{index % SERIES_PER_YEAR + 1:04d}'
+
+
+def _pick(rng, mix):
+    r = rng.random()
+    for name, share in mix:
+        if r < share:
+            return name
+        r -= share
+    return mix[-1][0]
+
+
+class BulkWriter:
+    """Writes row tuples in chunks into one table at a time over a single SQLAlchemy connection."""
+
+    def __init__(self, connection, chunk_size=CHUNK_SIZE):
+        self.conn = connection
+        self.dialect = connection.dialect.name
+        self.driver = connection.dialect.driver
+        self.chunk_size = chunk_size
+        self.counts = {}
+
+    def write(self, table, columns, rows) -> int:
+        columns, rows = self._with_defaults(table, columns, rows)
+        if self.dialect == 'postgresql' and self.driver in ('psycopg', 'psycopg2'):
+            n = self._copy(table, columns, rows)
+        else:
+            n = self._executemany(table, columns, rows)
+        self.counts[table.name] = self.counts.get(table.name, 0) + n
+        return n
+
+    @staticmethod
+    def _with_defaults(table, columns, rows):
+        # Raw inserts bypass Python-side column defaults; fill the constant ones
+        extra = [c for c in table.columns if c.name not in columns and c.default is not None and c.default.is_scalar]
+        if not extra:
+            return columns, rows
+        values = tuple(c.default.arg for c in extra)
+        return list(columns) + [c.name for c in extra], (tuple(row) + values for row in rows)
+
+    def _chunks(self, rows):
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _executemany(self, table, columns, rows) -> int:
+        n = 0
+        if self.dialect == 'sqlite':
+            column_list = ', '.join(f'"{c}"' for c in columns)
+            sql = f'INSERT INTO "{table.name}" ({column_list}) VALUES ({", ".join("?" * len(columns))})'
+            for chunk in self._chunks(rows):
+                # Same text form SQLAlchemy's SQLite DateTime/Date types store
+                self.conn.exec_driver_sql(sql, [tuple(str(v) if isinstance(v, date) else v for v in row) for row in chunk])
+                n += len(chunk)
+        else:
+            for chunk in self._chunks(rows):
+                self.conn.execute(table.insert(), [dict(zip(columns, row)) for row in chunk])
+                n += len(chunk)
+        return n
+
+    def _copy(self, table, columns, rows) -> int:
+        column_list = ', '.join(f'"{c}"' for c in columns)
+        raw = self.conn.connection.driver_connection
+        n = 0
+        if self.driver == 'psycopg':
+            with raw.cursor() as cursor:
+                with cursor.copy(f'COPY "{table.name}" ({column_list}) FROM STDIN') as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                        n += 1
+            return n
+        with raw.cursor() as cursor:
+            for chunk in self._chunks(rows):
+                buf = io.StringIO()
+                for row in chunk:
+                    buf.write('\t'.join(_copy_text(v) for v in row))
+                    buf.write('\n')
+                buf.seek(0)
+                cursor.copy_expert(f'COPY "{table.name}" ({column_list}) FROM STDIN', buf)
+                n += len(chunk)
+        return n
+
+
+def _copy_text(value) -> str:
+    """One value in COPY text format."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def generate(users=10000, seed=42, agencies=None, courses=len(COURSES), modules_per_course=None, chunk_size=CHUNK_SIZE):
+    """Insert the dataset into the current app's database; returns row counts per table."""
+    from models import db, Admin, Agency, ApprovalAudit, Certificate, Course, Module, User, UserModule
+    import search
+    from quiz_answers import answer_key
+
+    rng = random.Random(seed)
+    password_hash = generate_password_hash(DEFAULT_PASSWORD)
+    today = date(2025, 1, 1) + timedelta(days=seed % 365)
+    year_start = datetime(today.year, today.month, today.day) - timedelta(days=365)
+    agency_count = agencies or max(1, users // USERS_PER_AGENCY)
+    catalog = course_catalog(courses, modules_per_course)
+    authority_id = users + 1
+    approved_at = datetime(today.year, today.month, today.day)
+
+    modules_by_course = {}
+    course_rows, module_rows = [], []
+    module_id = 0
+    for course_id, (code, name, allowed, module_count) in enumerate(catalog, start=1):
+        course_rows.append((course_id, name, code, allowed))
+        modules_by_course[code] = []
+        for n in range(1, module_count + 1):
+            module_id += 1
+            quiz = json.dumps(quiz_for(rng, code, n))
+            module_rows.append((module_id, f'{code} Module {n}', code, f'{code}{n:03d}', f'Content for {code} module {n}', quiz, course_id))
+            modules_by_course[code].append((module_id, answer_key(quiz)))
+
+    # Trainee rows are generated first; history and certificates are derived from them in the same pass
+    user_rows, history_rows, certificate_rows, audit_rows = [], [], [], []
+    unanswered_share = 0.02
+    for uid in range(1, users + 1):
+        category = 'foreigner' if rng.random() < FOREIGNER_SHARE else 'citizen'
+        user_rows.append((
+            uid, number_series(uid - 1, today.year), f'Trainee {uid}', f'trainee{uid}@bench.local', password_hash,
+            category, True, rng.randint(1, agency_count), 'agency',
+            f'{uid:012d}' if category == 'citizen' else None, f'P{uid:08d}' if category == 'foreigner' else None,
+        ))
+        # Skill skews high: most trainees pass, a tail struggles
+        skill = min(0.98, max(0.25, rng.betavariate(5, 2)))
+        for code, _, allowed, _ in catalog:
+            if allowed not in ('both', category):
+                continue
+            progress = _pick(rng, PROGRESS_MIX)
+            if progress == 'none':
+                continue
+            modules = modules_by_course[code]
+            done = len(modules) if progress == 'complete' else rng.randrange(1, len(modules))
+            finished = year_start + timedelta(minutes=rng.randrange(300 * 24 * 60))
+            total = 0.0
+            for mid, key in modules[:done]:
+                packed = bytearray()
+                correct = 0
+                for k in key:
+                    r = rng.random()
+                    if r < unanswered_share:
+                        packed.append(0xFF)
+                    elif r < skill:
+                        packed.append(k)
+                        correct += 1
+                    else:
+                        packed.append((k + 1 + int(r * 1000) % (ANSWERS_PER_QUESTION - 1)) % ANSWERS_PER_QUESTION)
+                score = round(100.0 * correct / len(key), 1)
+                total += score
+                finished += timedelta(minutes=rng.randrange(20, 3 * 24 * 60))
+                history_rows.append((
+                    uid, mid, True, score, finished, 'a1:' + base64.urlsafe_b64encode(bytes(packed)).decode('ascii').rstrip('='),
+                    rng.choice((0, 0, 0, 1, 2)), rng.randint(120, 1500),
+                ))
+            if progress == 'complete' and total / len(modules) >= 50:
+                certificate_id = len(certificate_rows) + 1
+                approved = rng.random() < APPROVED_SHARE
+                certificate_rows.append((
+                    certificate_id, uid, code, modules[0][0], finished.date(), round(total / len(modules), 1),
+                    'approved' if approved else 'pending', authority_id if approved else None, approved_at if approved else None,
+                ))
+                if approved:
+                    audit_rows.append((certificate_id, authority_id, approved_at, 'pending', 'approved', 'seeded'))
+    user_rows.append((authority_id, None, 'Bench Authority', AUTHORITY_EMAIL, password_hash, 'citizen', True, 1, 'authority', None, None))
+
+    with db.engine.connect() as conn:
+        writer = BulkWriter(conn, chunk_size)
+        sqlite_sync = None
+        if writer.dialect == 'sqlite':
+            # Per connection and only outside a transaction; restored before the connection goes back to the pool
+            sqlite_sync = conn.exec_driver_sql('PRAGMA synchronous').scalar()
+            conn.exec_driver_sql('PRAGMA synchronous = OFF')
+            conn.commit()
+        try:
+            with conn.begin():
+                writer.write(Agency.__table__, ['agency_id', 'agency_name', 'contact_number', 'address', 'Reg_of_Company', 'PIC', 'email'], (
+                    (a, f'Agency {a}', f'03{a:08d}', f'{a} Jalan Bench', f'REG{a:06d}', f'PIC {a}', f'agency{a}@bench.local')
+                    for a in range(1, agency_count + 1)))
+                writer.write(Course.__table__, ['course_id', 'name', 'code', 'allowed_category'], course_rows)
+                writer.write(Module.__table__, ['module_id', 'module_name', 'module_type', 'series_number', 'content', 'quiz_json', 'course_id'], module_rows)
+                writer.write(User.__table__, ['User_id', 'number_series', 'full_name', 'email', 'password_hash', 'user_category',
+                                              'is_finalized', 'agency_id', 'role', 'ic_number', 'passport_number'], user_rows)
+                writer.write(UserModule.__table__, ['user_id', 'module_id', 'is_completed', 'score', 'completion_date', 'quiz_answers',
+                                                    'reattempt_count', 'quiz_duration_seconds'], history_rows)
+                writer.write(Certificate.__table__, ['certificate_id', 'user_id', 'module_type', 'module_id', 'issue_date', 'score',
+                                                     'status', 'approved_by_id', 'approved_at'], certificate_rows)
+                writer.write(ApprovalAudit.__table__, ['certificate_id', 'approved_by_id', 'approved_at', 'status_before', 'status_after', 'note'], audit_rows)
+                writer.write(Admin.__table__, ['username', 'email', 'password_hash', 'role', 'is_superadmin'],
+                             [('bench-admin', ADMIN_EMAIL, password_hash, 'admin', True)])
+                _sync_sequences(conn)
+                # Core inserts bypass the ORM events that maintain the SQLite search index
+                search.rebuild(conn)
+        finally:
+            if sqlite_sync is not None:
+                conn.exec_driver_sql(f'PRAGMA synchronous = {int(sqlite_sync)}')
+                conn.commit()
+    return writer.counts
+
+
+def _sync_sequences(conn):
+    """Move PostgreSQL serial sequences past the explicit ids inserted above."""
+    if conn.dialect.name != 'postgresql':
+        return
+    for table, column in (('agency', 'agency_id'), ('course', 'course_id'), ('module', 'module_id'),
+                          ('user', 'User_id'), ('certificate', 'certificate_id')):
+        conn.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', '{column}'), (SELECT COALESCE(MAX(\"{column}\"), 1) FROM \"{table}\"))"
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--agencies', type=int, help=f'default: one per {USERS_PER_AGENCY} trainees')
+    parser.add_argument('--courses', type=int, default=len(COURSES))
+    parser.add_argument('--modules-per-course', type=int, help='default: 4-6 for the standard courses, 5 for generated ones')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--reset', action='store_true', help='drop and recreate all tables first')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    from app import app
+    from models import db, User
+    with app.app_context():
+        if args.reset:
+            db.drop_all()
+        db.create_all()
+        if db.session.query(User.User_id).first() is not None:
+            print('✗ Database already has users; use --reset to replace them')
+            return 1
+        db.session.rollback()
+        started = time.perf_counter()
+        counts = generate(users=args.users, seed=args.seed, agencies=args.agencies, courses=args.courses,
+                          modules_per_course=args.modules_per_course, chunk_size=args.chunk_size)
+        elapsed = time.perf_counter() - started
+    total = sum(counts.values())
+    for table, n in counts.items():
+        print(f'  {table:<16} {n:>9}')
+    print(f'✓ Seeded {total} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
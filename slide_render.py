@@ -0,0 +1,257 @@
+"""
+Slide pre-rendering: uploaded PDF/PPTX decks split into per-page images.
+
+Trainees on mobile data should not download a 50 MB deck before seeing page 1.
+When manage_module_content stores a slide, render_in_background() converts it
+into compressed WebP pages plus a small manifest:
+
+    UPLOAD_FOLDER/slides/rendered/<deck stem>-<content hash>/
+        manifest.json    {"source", "source_hash", "pages": [{"file", "width", "height", "bytes"}], ...}
+        page-001.webp
+        page-002.webp
+        ...
+
+The directory name carries the deck's content hash (uploads.content_hash), so
+a replaced deck is never shown with stale pages; the templates simply fall
+back to the original file until its pages exist.
+
+External tools, both optional:
+
+    SLIDE_PDF_RENDERER   pdftoppm binary (poppler-utils), default: found on PATH
+    SLIDE_OFFICE_BINARY  soffice/libreoffice used to turn PPTX into PDF first
+
+Without them the deck is still served as before. Existing decks can be
+rendered from the command line:
+
+    python slide_render.py              # every module with a slide
+    python slide_render.py 12 15        # specific module ids
+"""
+from datetime import datetime
+import glob
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+
+from flask import current_app
+
+from uploads import HASH_LENGTH, content_hash, resolve, upload_url
+
+RENDERED_SUBFOLDER = 'slides/rendered'
+MANIFEST_NAME = 'manifest.json'
+RENDER_DPI = 110
+MAX_PAGE_WIDTH = 1600
+WEBP_QUALITY = 72
+MAX_PAGES = 400
+CONVERT_TIMEOUT_SECONDS = 300
+
+
+class SlideRenderError(RuntimeError):
+    """Raised when a deck cannot be converted to page images."""
+
+
+def _tool(config_key: str, candidates):
+    configured = current_app.config.get(config_key) or os.environ.get(config_key)
+    if configured:
+        return configured
+    for name in candidates:
+        found = shutil.which(name)
+        if found:
+            return found
+    return None
+
+
+def rendered_dir_name(slide_url: str, source_hash: str) -> str:
+    stem = os.path.splitext(os.path.basename(slide_url))[0]
+    return f"{RENDERED_SUBFOLDER}/{stem}-{source_hash}"
+
+
+def _rendered_dir(slide_url: str):
+    """Return (relative dir, absolute dir) for the current version of a deck, or None if it is missing."""
+    source = resolve(slide_url)
+    if source is None:
+        return None
+    rel = rendered_dir_name(slide_url, content_hash(source))
+    return rel, os.path.join(current_app.config['UPLOAD_FOLDER'], *rel.split('/'))
+
+
+def load_manifest(slide_url: str):
+    """Return the manifest dict for the deck's current content, or None if it has not been rendered."""
+    if not slide_url:
+        return None
+    target = _rendered_dir(slide_url)
+    if target is None:
+        return None
+    try:
+        with open(os.path.join(target[1], MANIFEST_NAME), encoding='utf-8') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def slide_pages(slide_url: str):
+    """Template helper: [{'url', 'width', 'height'}] for a rendered deck, or [] to fall back to the file."""
+    manifest = load_manifest(slide_url)
+    if not manifest:
+        return []
+    rel = rendered_dir_name(slide_url, manifest['source_hash'])
+    return [
+        {'url': upload_url(f"{rel}/{page['file']}"), 'width': page['width'], 'height': page['height']}
+        for page in manifest.get('pages', [])
+    ]
+
+
+def _pptx_to_pdf(source: str, workdir: str) -> str:
+    office = _tool('SLIDE_OFFICE_BINARY', ('soffice', 'libreoffice'))
+    if not office:
+        raise SlideRenderError('No office converter available for PPTX (set SLIDE_OFFICE_BINARY)')
+    subprocess.run(
+        [office, '--headless', '--convert-to', 'pdf', '--outdir', workdir, source],
+        check=True, capture_output=True, timeout=CONVERT_TIMEOUT_SECONDS,
+    )
+    pdf = os.path.join(workdir, os.path.splitext(os.path.basename(source))[0] + '.pdf')
+    if not os.path.isfile(pdf):
+        raise SlideRenderError(f'Office converter produced no PDF for {source}')
+    return pdf
+
+
+def _pdf_to_pngs(pdf: str, workdir: str):
+    renderer = _tool('SLIDE_PDF_RENDERER', ('pdftoppm',))
+    if not renderer:
+        raise SlideRenderError('No PDF renderer available (install poppler-utils or set SLIDE_PDF_RENDERER)')
+    prefix = os.path.join(workdir, 'raw')
+    subprocess.run(
+        [renderer, '-png', '-r', str(RENDER_DPI), '-l', str(MAX_PAGES), pdf, prefix],
+        check=True, capture_output=True, timeout=CONVERT_TIMEOUT_SECONDS,
+    )
+    # pdftoppm zero-pads page numbers to the width of the page count
+    pngs = glob.glob(prefix + '-*.png')
+    return sorted(pngs, key=lambda p: int(p.rsplit('-', 1)[1].split('.')[0]))
+
+
+def render_slides(slide_url: str, force: bool = False):
+    """Render the deck stored at `slide_url` (relative to UPLOAD_FOLDER). Returns its manifest.
+
+    Already rendered versions are reused unless `force` is set.
+    """
+    source = resolve(slide_url)
+    if source is None:
+        raise SlideRenderError(f'Slide file not found: {slide_url}')
+    existing = load_manifest(slide_url)
+    if existing and not force:
+        return existing
+
+    source_hash = content_hash(source)
+    out_dir = _rendered_dir(slide_url)[1]
+    parent = os.path.dirname(out_dir)
+    os.makedirs(parent, exist_ok=True)
+    workdir = tempfile.mkdtemp(prefix='render-', dir=parent)
+    try:
+        pdf = source
+        if source.lower().endswith('.pptx'):
+            pdf = _pptx_to_pdf(source, workdir)
+        pngs = _pdf_to_pngs(pdf, workdir)
+        if not pngs:
+            raise SlideRenderError(f'No pages rendered for {slide_url}')
+
+        from PIL import Image
+        staging = os.path.join(workdir, 'pages')
+        os.makedirs(staging)
+        pages = []
+        for number, png in enumerate(pngs, start=1):
+            name = f'page-{number:03d}.webp'
+            with Image.open(png) as img:
+                img = img.convert('RGB')
+                if img.width > MAX_PAGE_WIDTH:
+                    img = img.resize((MAX_PAGE_WIDTH, round(img.height * MAX_PAGE_WIDTH / img.width)), Image.LANCZOS)
+                path = os.path.join(staging, name)
+                img.save(path, 'WEBP', quality=WEBP_QUALITY, method=4)
+                pages.append({'file': name, 'width': img.width, 'height': img.height, 'bytes': os.path.getsize(path)})
+
+        manifest = {
+            'source': slide_url,
+            'source_hash': source_hash,
+            'source_bytes': os.path.getsize(source),
+            'pages': pages,
+            'rendered_at': datetime.utcnow().isoformat(timespec='seconds'),
+        }
+        with open(os.path.join(staging, MANIFEST_NAME), 'w', encoding='utf-8') as fh:
+            json.dump(manifest, fh, separators=(',', ':'))
+        # Publish atomically; a concurrent render of the same version may have won the race
+        if os.path.isdir(out_dir):
+            shutil.rmtree(out_dir, ignore_errors=True)
+        try:
+            os.replace(staging, out_dir)
+        except OSError:
+            if not os.path.isdir(out_dir):
+                raise
+        remove_rendered(slide_url, keep=os.path.basename(out_dir))
+        return manifest
+    except (subprocess.SubprocessError, OSError) as e:
+        raise SlideRenderError(f'Rendering {slide_url} failed: {e}') from e
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def remove_rendered(slide_url: str, keep: str = None) -> None:
+    """Delete rendered versions of a deck, except the directory named `keep`."""
+    if not slide_url:
+        return
+    stem = os.path.splitext(os.path.basename(slide_url))[0]
+    version_re = re.compile(re.escape(stem) + r'-[0-9a-f]{%d}$' % HASH_LENGTH)
+    root = os.path.join(current_app.config['UPLOAD_FOLDER'], *RENDERED_SUBFOLDER.split('/'))
+    try:
+        names = os.listdir(root)
+    except OSError:
+        return
+    for name in names:
+        if name != keep and version_re.match(name):
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def _render_logged(app, slide_url: str) -> None:
+    with app.app_context():
+        try:
+            manifest = render_slides(slide_url)
+            logging.info('[SLIDES] Rendered %s into %d page(s)', slide_url, len(manifest['pages']))
+        except SlideRenderError as e:
+            logging.warning('[SLIDES] %s', e)
+        except Exception:
+            logging.exception('[SLIDES] Unexpected error rendering %s', slide_url)
+
+
+def render_in_background(slide_url: str) -> None:
+    """Render a deck off the request thread (inline when SLIDE_RENDER_SYNC is set, e.g. tests)."""
+    app = current_app._get_current_object()
+    if app.config.get('SLIDE_RENDER_SYNC'):
+        _render_logged(app, slide_url)
+        return
+    threading.Thread(target=_render_logged, args=(app, slide_url), daemon=True, name='slide-render').start()
+
+
+def main(argv):
+    from app import app
+    from models import Module
+    with app.app_context():
+        ids = [int(a) for a in argv[1:] if a.isdigit()]
+        query = Module.query.filter(Module.slide_url.isnot(None), Module.slide_url != '')
+        if ids:
+            query = query.filter(Module.module_id.in_(ids))
+        rendered = failed = 0
+        for module in query.all():
+            try:
+                render_slides(module.slide_url)
+                rendered += 1
+            except SlideRenderError as e:
+                failed += 1
+                print(f"  module {module.module_id}: {e}")
+        print(f"Slides rendered for {rendered} module(s), {failed} failed.")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
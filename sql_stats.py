@@ -0,0 +1,197 @@
+"""
+Per-request SQL statement accounting.
+
+Engine cursor events feed every active collector: the one opened for the
+current request by install(app), and any opened by count_statements() (used by
+the test suite to pin query budgets per route). Each collector keeps the
+statement count, total DB time and a count per statement shape (the SQL text
+with literals and IN-lists collapsed), so N+1 loops show up as one shape
+repeated once per row.
+
+Per request:
+  * a warning is logged when SQL_STATS_WARN_STATEMENTS statements or
+    SQL_STATS_WARN_REPEATS repeats of one shape are exceeded;
+  * an X-SQL-Stats header is added when SQL_STATS_HEADER is on (default: debug);
+  * the noisiest recent requests are kept per worker for /admin/sql_stats.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DEFAULT_WARN_STATEMENTS = 40
+DEFAULT_WARN_REPEATS = 10
+RECENT_LIMIT = 200
+SHAPE_LENGTH = 240
+
+_active = contextvars.ContextVar('sql_stats_collectors', default=())
+_recent = deque(maxlen=RECENT_LIMIT)
+_recent_lock = threading.Lock()
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement: str) -> str:
+    """Collapse literals, IN-lists and whitespace so repeats of one query compare equal."""
+    shape = _STRING_LITERAL.sub('?', statement)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PLACEHOLDER_LIST.sub('(?)', shape)
+    shape = _WHITESPACE.sub(' ', shape).strip()
+    return shape[:SHAPE_LENGTH]
+
+
+class StatementCollector:
+    """Statement count, DB time and repeated shapes for one request or block."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def top_shapes(self, limit: int = 3):
+        return [(shape, n) for shape, n in self.shapes.most_common(limit) if n > 1]
+
+    def summary(self) -> str:
+        text = f'statements={self.count}; db_ms={self.seconds * 1000:.1f}'
+        top = self.top_shapes(1)
+        if top:
+            shape, n = top[0]
+            text += f'; top={n}x {shape[:80]}'
+        return text
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _active.get():
+        conn.info.setdefault('sql_stats_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    collectors = _active.get()
+    started = conn.info.get('sql_stats_started')
+    if not collectors or not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    for collector in collectors:
+        collector.record(statement, elapsed)
+
+
+def _handle_error(context):
+    # after_cursor_execute does not run for a failing statement: pop its start time
+    # here, or every later statement on this connection would be timed from it
+    conn = context.connection
+    if conn is None:
+        return
+    collectors = _active.get()
+    started = conn.info.get('sql_stats_started')
+    if not collectors or not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    for collector in collectors:
+        collector.record(context.statement or '', elapsed)
+
+
+def _listen() -> None:
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+
+def _push(collector: StatementCollector):
+    return _active.set(_active.get() + (collector,))
+
+
+@contextmanager
+def count_statements():
+    """Collect the statements run inside the block (including by test-client requests)."""
+    _listen()
+    collector = StatementCollector()
+    token = _push(collector)
+    try:
+        yield collector
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def excluded():
+    """Run the block without recording its statements, e.g. housekeeping that is not the request's own work."""
+    token = _active.set(())
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+@contextmanager
+def statement_budget(max_statements: int):
+    """Fail with the repeated shapes listed when the block runs more than `max_statements`."""
+    with count_statements() as collector:
+        yield collector
+    if collector.count > max_statements:
+        repeated = '\n'.join(f'  {n}x {shape}' for shape, n in collector.top_shapes(5))
+        raise AssertionError(f'{collector.count} SQL statements, budget is {max_statements}\n{repeated}')
+
+
+def recent_requests():
+    """Most recently finished requests of this worker, noisiest first."""
+    with _recent_lock:
+        entries = list(_recent)
+    return sorted(entries, key=lambda e: (e['statements'], e['db_ms']), reverse=True)
+
+
+def install(app) -> None:
+    """Open a collector for every request of `app` and report it when the request ends."""
+    from flask import g, request
+    _listen()
+
+    @app.before_request
+    def _start_collecting():
+        g.sql_stats = StatementCollector()
+        g.sql_stats_token = _push(g.sql_stats)
+
+    @app.after_request
+    def _report(response):
+        collector = g.get('sql_stats')
+        if collector is None:
+            return response
+        warn_statements = app.config.get('SQL_STATS_WARN_STATEMENTS', DEFAULT_WARN_STATEMENTS)
+        warn_repeats = app.config.get('SQL_STATS_WARN_REPEATS', DEFAULT_WARN_REPEATS)
+        top = collector.top_shapes()
+        if collector.count > warn_statements or (top and top[0][1] > warn_repeats):
+            logging.warning('[SQL STATS] %s %s ran %s', request.method, request.path, collector.summary())
+        if app.config.get('SQL_STATS_HEADER', app.debug):
+            response.headers['X-SQL-Stats'] = collector.summary()
+        if collector.count:
+            with _recent_lock:
+                _recent.append({
+                    'at': time.time(),
+                    'method': request.method,
+                    'path': request.path,
+                    'endpoint': request.endpoint,
+                    'status': response.status_code,
+                    'statements': collector.count,
+                    'db_ms': round(collector.seconds * 1000, 1),
+                    'top_shapes': top,
+                })
+        return response
+
+    @app.teardown_request
+    def _stop_collecting(exc):
+        token = g.pop('sql_stats_token', None)
+        if token is not None:
+            _active.reset(token)
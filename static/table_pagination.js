@@ -1,6 +1,7 @@
 /**
  * Table Pagination Script - Google-style pagination
- * Automatically paginates tables with 50 items per page
+ * Automatically paginates tables with 50 items per page. Tables that carry a
+ * data-source URL are paginated on the server instead (ServerTablePagination).
  */
 
 class TablePagination {
@@ -349,12 +350,202 @@ class TablePagination {
     }
 }
 
+/**
+ * Server-driven pagination for tables with a data-source attribute.
+ *
+ * The page renders only the first page of rows. Further pages are fetched
+ * from data-source (GET /api/tables/<name>, see table_pages.py) with the
+ * cursor the previous page returned, and the next page is prefetched while
+ * the current one is shown. Cursors only move forward, so the controls list
+ * the pages loaded so far plus "next". Headers with data-sort-key re-sort on
+ * the server. When one item spans several rows (a user's per-course rows),
+ * data-item-selector selects one row per item for the "Showing x-y" count.
+ */
+class ServerTablePagination {
+    constructor(tableId, itemsPerPage = 50) {
+        this.tableId = tableId;
+        this.itemsPerPage = itemsPerPage;
+        this.table = document.getElementById(tableId);
+        if (!this.table) return;
+        this.tbody = this.table.querySelector('tbody');
+        if (!this.tbody) return;
+
+        this.source = this.table.dataset.source;
+        this.sort = this.table.dataset.sort || '';
+        this.dir = this.table.dataset.dir || 'desc';
+        this.reset(this.tbody.innerHTML, this.table.dataset.cursor || null, parseInt(this.table.dataset.total) || 0);
+
+        TablePagination.prototype.injectStyles.call(this);
+        this.createPaginationControls();
+        this.bindSortHeaders();
+        this.render(false);
+    }
+
+    reset(html, cursor, total) {
+        this.pages = [{ html: html, cursor: cursor }];
+        this.currentPage = 1;
+        this.total = total;
+        this.pending = null;
+    }
+
+    get totalPages() {
+        return Math.max(1, Math.ceil(this.total / this.itemsPerPage));
+    }
+
+    pageUrl(cursor) {
+        const url = new URL(this.source, window.location.origin);
+        ['cursor', 'sort', 'dir', 'limit'].forEach(k => url.searchParams.delete(k));
+        if (this.sort) url.searchParams.set('sort', this.sort);
+        url.searchParams.set('dir', this.dir);
+        url.searchParams.set('limit', this.itemsPerPage);
+        if (cursor) url.searchParams.set('cursor', cursor);
+        return url;
+    }
+
+    fetchPage(cursor) {
+        return fetch(this.pageUrl(cursor), { headers: { 'Accept': 'application/json' }, credentials: 'same-origin' })
+            .then(r => {
+                if (!r.ok) throw new Error(`HTTP ${r.status}`);
+                return r.json();
+            });
+    }
+
+    // Load the page after the last loaded one, once
+    loadNext() {
+        const last = this.pages[this.pages.length - 1];
+        if (!last.cursor) return Promise.resolve(false);
+        if (!this.pending) {
+            const generation = this.pages;
+            this.pending = this.fetchPage(last.cursor)
+                .then(data => {
+                    // Ignore pages of a sort order that was replaced meanwhile
+                    if (generation !== this.pages) return false;
+                    this.pages.push({ html: data.html, cursor: data.next_cursor });
+                    this.updatePaginationButtons();
+                    return true;
+                })
+                .catch(err => {
+                    console.warn(`Could not load the next page of "${this.tableId}":`, err);
+                    return false;
+                })
+                .finally(() => { if (generation === this.pages) this.pending = null; });
+        }
+        return this.pending;
+    }
+
+    showPage(pageNum) {
+        if (pageNum < 1) return;
+        if (pageNum <= this.pages.length) {
+            this.currentPage = pageNum;
+            this.render(true);
+        } else if (pageNum === this.pages.length + 1) {
+            this.loadNext().then(loaded => { if (loaded) this.showPage(pageNum); });
+        }
+    }
+
+    render(scroll) {
+        this.tbody.innerHTML = this.pages[this.currentPage - 1].html;
+        const rowCount = this.tbody.querySelectorAll(this.table.dataset.itemSelector || 'tr').length;
+        const start = this.total === 0 ? 0 : (this.currentPage - 1) * this.itemsPerPage + 1;
+        const end = this.total === 0 ? 0 : start + rowCount - 1;
+        const startEl = document.getElementById(`start-${this.tableId}`);
+        const endEl = document.getElementById(`end-${this.tableId}`);
+        const totalEl = document.getElementById(`total-${this.tableId}`);
+        if (startEl) startEl.textContent = start;
+        if (endEl) endEl.textContent = end;
+        if (totalEl) totalEl.textContent = this.total;
+        this.updatePaginationButtons();
+        this.updateSortIndicators();
+        if (scroll) this.table.scrollIntoView({ behavior: 'smooth', block: 'start' });
+        // Prefetch so "next" is instant
+        if (this.currentPage === this.pages.length) this.loadNext();
+    }
+
+    createPaginationControls() {
+        const paginationDiv = document.createElement('div');
+        paginationDiv.id = `pagination-${this.tableId}`;
+        paginationDiv.className = 'table-pagination-controls';
+        paginationDiv.innerHTML = `
+            <div class="pagination-info">
+                Showing <span class="fw-bold" id="start-${this.tableId}">0</span>–<span class="fw-bold" id="end-${this.tableId}">0</span> of <span class="fw-bold" id="total-${this.tableId}">${this.total}</span>
+            </div>
+            <nav aria-label="Table pagination">
+                <ul class="pagination-nav" id="pagination-list-${this.tableId}"></ul>
+            </nav>
+        `;
+        const tableParent = this.table.closest('.table-responsive') || this.table.parentElement;
+        tableParent.insertAdjacentElement('beforebegin', paginationDiv);
+        this.paginationList = document.getElementById(`pagination-list-${this.tableId}`);
+    }
+
+    updatePaginationButtons() {
+        if (!this.paginationList) return;
+        this.paginationList.innerHTML = '';
+        const hasNext = this.currentPage < this.pages.length || !!this.pages[this.pages.length - 1].cursor;
+        const link = (label, pageNum, { active = false, disabled = false, html = false } = {}) => {
+            const li = document.createElement('li');
+            const a = document.createElement('a');
+            a.className = `pagination-link ${active ? 'active' : ''} ${disabled ? 'disabled' : ''}`;
+            a.href = '#';
+            if (html) a.innerHTML = label; else a.textContent = label;
+            if (active) a.setAttribute('aria-current', 'page');
+            a.addEventListener('click', (e) => {
+                e.preventDefault();
+                if (!disabled && !active) this.showPage(pageNum);
+            });
+            li.appendChild(a);
+            this.paginationList.appendChild(li);
+        };
+        link('<i class="fas fa-chevron-left"></i>', this.currentPage - 1, { disabled: this.currentPage === 1, html: true });
+        TablePagination.prototype.getPageNumbers.call({ totalPages: this.pages.length, currentPage: this.currentPage }).forEach(pageNum => {
+            if (pageNum === '...') link('...', 0, { disabled: true });
+            else link(String(pageNum), pageNum, { active: pageNum === this.currentPage });
+        });
+        if (this.pages.length < this.totalPages) link(`of ${this.totalPages}`, 0, { disabled: true });
+        link('<i class="fas fa-chevron-right"></i>', this.currentPage + 1, { disabled: !hasNext, html: true });
+    }
+
+    bindSortHeaders() {
+        this.table.querySelectorAll('th[data-sort-key]').forEach(th => {
+            th.style.cursor = 'pointer';
+            th.addEventListener('click', (e) => {
+                if (e.target.closest('input, a, button')) return;
+                const key = th.dataset.sortKey;
+                this.dir = key === this.sort && this.dir === 'asc' ? 'desc' : 'asc';
+                this.sort = key;
+                this.fetchPage(null)
+                    .then(data => {
+                        this.reset(data.html, data.next_cursor, data.total || 0);
+                        this.render(false);
+                    })
+                    .catch(err => console.warn(`Could not sort "${this.tableId}":`, err));
+            });
+        });
+    }
+
+    updateSortIndicators() {
+        this.table.querySelectorAll('th[data-sort-key]').forEach(th => {
+            let icon = th.querySelector('.sort-indicator');
+            if (!icon) {
+                icon = document.createElement('i');
+                th.appendChild(icon);
+            }
+            const active = th.dataset.sortKey === this.sort;
+            icon.className = `sort-indicator fas ms-1 ${active ? (this.dir === 'asc' ? 'fa-sort-up' : 'fa-sort-down') : 'fa-sort text-muted'}`;
+        });
+    }
+}
+
 // Auto-initialize pagination for tables with data-paginate attribute
 document.addEventListener('DOMContentLoaded', function() {
     const paginateTables = document.querySelectorAll('[data-paginate="true"]');
 
     paginateTables.forEach(table => {
         const itemsPerPage = parseInt(table.getAttribute('data-items-per-page')) || 50;
-        new TablePagination(table.id, itemsPerPage);
+        if (table.dataset.source) {
+            new ServerTablePagination(table.id, itemsPerPage);
+        } else {
+            new TablePagination(table.id, itemsPerPage);
+        }
     });
 });
@@ -0,0 +1,140 @@
+"""
+Server-driven pagination for listing tables.
+
+A listing registers a TableSpec: who may see it, the filtered base query for
+the current request, the columns it may be sorted by and the Jinja partial
+that renders its <tr> rows. GET /api/tables/<name> then serves one page:
+
+    ?sort=issue_date&dir=desc&limit=50&cursor=<opaque>&<the page's own filters>
+
+    {"html": "<tr>...</tr>", "count": 50, "next_cursor": "..." or null,
+     "sort": "issue_date", "dir": "desc", "total": 1234}
+
+Pages are keyset-paginated on (sort column, primary key), so the 200th page
+costs the same as the first; "total" is only counted for the first page. The
+HTML view renders that first page itself with the same partial and marks the
+table with data-source/data-cursor, and static/table_pagination.js fetches
+(and prefetches) the following pages on demand.
+
+A listing whose rows need more than the paged entities (e.g. per-course
+progress of each user) passes prepare(items) -> rows; it runs once per page,
+so its lookups only cover that page's entities.
+
+Sort columns must be NOT NULL: keyset comparisons skip NULLs.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from flask import render_template
+from sqlalchemy import and_, or_
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+TABLES = {}
+
+
+class TableSpec:
+    """One server-paginated listing."""
+
+    def __init__(self, name, query, key, sorts, row_template, allowed,
+                 default_sort=None, default_dir='desc', prepare=None):
+        self.name = name
+        # query(args) -> filtered Query for the current user, without ordering
+        self.query = query
+        self.key = key
+        self.sorts = sorts
+        self.row_template = row_template
+        self.allowed = allowed
+        self.default_sort = default_sort or next(iter(sorts))
+        self.default_dir = default_dir
+        # prepare(items) -> rows for row_template; items by default
+        self.prepare = prepare
+
+
+def register(spec: TableSpec) -> TableSpec:
+    TABLES[spec.name] = spec
+    return spec
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _decode_value(column, value):
+    python_type = column.type.python_type
+    if value is not None and python_type in (datetime, date) and isinstance(value, str):
+        return python_type.fromisoformat(value)
+    return value
+
+
+def encode_cursor(sort: str, direction: str, value, key) -> str:
+    raw = json.dumps([sort, direction, _encode_value(value), key], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        sort, direction, value, key = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Malformed cursor')
+    return sort, direction, value, key
+
+
+def page_args(spec: TableSpec, args):
+    """(sort, direction, limit, cursor position or None) from request args; ValueError if invalid."""
+    sort = args.get('sort') or spec.default_sort
+    if sort not in spec.sorts:
+        raise ValueError(f'Cannot sort by {sort!r}')
+    direction = (args.get('dir') or spec.default_dir).lower()
+    if direction not in ('asc', 'desc'):
+        raise ValueError("dir must be 'asc' or 'desc'")
+    try:
+        limit = min(max(int(args.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        raise ValueError('limit must be a number')
+    after = None
+    if args.get('cursor'):
+        c_sort, c_dir, value, key = decode_cursor(args['cursor'])
+        if (c_sort, c_dir) != (sort, direction):
+            raise ValueError('Cursor belongs to a different sort order')
+        after = (_decode_value(spec.sorts[sort], value), key)
+    return sort, direction, limit, after
+
+
+def fetch(spec: TableSpec, args) -> dict:
+    """One page of `spec` as {'items', 'next_cursor', 'total', 'sort', 'dir', 'count'}."""
+    sort, direction, limit, after = page_args(spec, args)
+    column, key = spec.sorts[sort], spec.key
+    base = spec.query(args)
+    total = base.order_by(None).count() if after is None else None
+
+    query = base
+    if after is not None:
+        value, last_key = after
+        beyond = column > value if direction == 'asc' else column < value
+        tie = key > last_key if direction == 'asc' else key < last_key
+        query = query.filter(or_(beyond, and_(column == value, tie)))
+    order = (column.asc(), key.asc()) if direction == 'asc' else (column.desc(), key.desc())
+    rows = query.order_by(*order).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, direction, getattr(last, column.key), getattr(last, key.key))
+    if spec.prepare is not None:
+        rows = spec.prepare(rows)
+    return {'items': rows, 'next_cursor': next_cursor, 'total': total,
+            'sort': sort, 'dir': direction, 'count': len(rows)}
+
+
+def render_page(spec: TableSpec, args) -> dict:
+    """fetch() with the rows rendered through the listing's partial, ready for jsonify."""
+    page = fetch(spec, args)
+    page['html'] = render_template(spec.row_template, rows=page.pop('items'))
+    return page
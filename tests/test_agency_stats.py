@@ -0,0 +1,100 @@
+from datetime import date, datetime
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    import agency_stats
+    agency_stats.cache.invalidate()
+    flask_app_module = importlib.import_module('app')
+    from models import db, Admin, Course, Module
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = Admin(username='admin', email='admin@example.com')
+        admin.set_password('pass123')
+        course = Course(name='Course', code='CSG', allowed_category='both')
+        db.session.add_all([admin, course])
+        db.session.flush()
+        db.session.add(Module(module_name='M1', module_type='CSG', series_number='CSG001', course_id=course.course_id))
+        db.session.commit()
+    yield app, app.test_client()
+
+
+def _add_agency(name, users):
+    """users: list of (finalized, certificate statuses, completion datetime or None)."""
+    from models import db, Agency, User, UserModule, Certificate
+    agency = Agency(agency_name=name, contact_number='0', address='', Reg_of_Company='', PIC='', email=f'{name}@example.com')
+    db.session.add(agency)
+    db.session.flush()
+    for i, (finalized, statuses, completed_at) in enumerate(users):
+        u = User(full_name=f'{name} {i}', email=f'{name}{i}@example.com', user_category='citizen',
+                 agency_id=agency.agency_id, password_hash='x', is_finalized=finalized)
+        db.session.add(u)
+        db.session.flush()
+        if completed_at:
+            db.session.add(UserModule(user_id=u.User_id, module_id=1, is_completed=True, score=80.0, completion_date=completed_at))
+        for status in statuses:
+            db.session.add(Certificate(user_id=u.User_id, module_id=1, issue_date=date(2025, 1, 1), status=status))
+    db.session.commit()
+    return agency.agency_id
+
+
+def test_grouped_stats(app_client):
+    app, _ = app_client
+    import agency_stats
+    with app.app_context():
+        a = _add_agency('a', [
+            (True, ['approved', 'pending'], datetime(2025, 3, 1, 9)),
+            (True, [], datetime(2025, 4, 2, 10)),
+            (False, ['pending'], None),
+            (False, ['rejected'], None),
+        ])
+        b = _add_agency('b', [(False, [], None)])
+        stats = agency_stats.compute()
+    assert stats[a] == agency_stats.AgencyStats(4, 2, 2, 2, 1, datetime(2025, 4, 2, 10))
+    assert stats[b] == agency_stats.AgencyStats(1, 0, 0, 0, 0, None)
+
+
+def test_page_shows_stats_with_constant_queries(app_client):
+    app, client = app_client
+    import agency_stats
+    import sql_stats
+    with app.app_context():
+        _add_agency('a', [(True, ['approved'], datetime(2025, 5, 6))])
+    _login(client, 'admin@example.com', 'pass123')
+    with sql_stats.count_statements() as small:
+        page = client.get('/admin_agencies')
+    assert page.status_code == 200 and b'2025-05-06' in page.data
+
+    with app.app_context():
+        for n in range(20):
+            _add_agency(f'x{n}', [(False, ['pending'], None)] * 3)
+    agency_stats.cache.invalidate()
+    with sql_stats.statement_budget(small.count):
+        assert b'x19' in client.get('/admin_agencies').data
+
+
+def test_cache_reused_until_ttl(app_client):
+    app, _ = app_client
+    import agency_stats
+    cache = agency_stats.AgencyStatsCache(ttl=60)
+    with app.app_context():
+        a = _add_agency('a', [(False, [], None)])
+        assert cache.get()[a].user_count == 1
+        _add_agency('b', [(False, [], None)])
+        assert len(cache.get()) == 1
+        cache.invalidate()
+        assert len(cache.get()) == 2
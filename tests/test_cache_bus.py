@@ -0,0 +1,109 @@
+import json
+import pytest
+from sqlalchemy import update
+
+
+QUIZ = [{'text': 'Q1', 'answers': [{'text': 'a'}, {'text': 'b', 'isCorrect': True}]}]
+
+
+@pytest.fixture()
+def app_ctx(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    import cache_bus
+    from models import db, Agency, Module
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        cache_bus._seen.clear()
+        db.session.add_all([
+            Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com'),
+            Module(module_name='M1', module_type='CSG', series_number='CSG001', quiz_json=json.dumps(QUIZ)),
+        ])
+        db.session.commit()
+        yield app
+
+
+@pytest.fixture()
+def dropped(monkeypatch):
+    import cache_bus
+    calls = []
+    monkeypatch.setitem(cache_bus._callbacks, 'test', [lambda: calls.append('test')])
+    return calls
+
+
+def _version(namespace):
+    from models import db, CacheVersion
+    row = db.session.get(CacheVersion, namespace)
+    return row.version if row else None
+
+
+def test_bump_drops_local_entries_after_commit(app_ctx, dropped):
+    import cache_bus
+    from models import db
+    cache_bus.bump('test')
+    db.session.rollback()
+    assert dropped == [] and _version('test') is None
+
+    assert cache_bus.bump('test', 'test') == {'test': 1}
+    assert dropped == []
+    db.session.commit()
+    assert dropped == ['test']
+    cache_bus.bump('test')
+    db.session.commit()
+    assert _version('test') == 2 and dropped == ['test', 'test']
+
+
+def test_poll_picks_up_other_writers(app_ctx, dropped, monkeypatch):
+    import cache_bus
+    from models import db, CacheVersion
+    cache_bus.check(force=True)
+    assert dropped == []
+    # Another process bumps the version; this one has not committed anything
+    cache_bus.bump('test')
+    db.session.commit()
+    db.session.execute(update(CacheVersion).where(CacheVersion.namespace == 'test')
+                       .values(version=CacheVersion.version + 1))
+    db.session.commit()
+    dropped.clear()
+
+    monkeypatch.setattr(cache_bus, '_next_check', float('inf'))
+    cache_bus.check()
+    assert dropped == []
+    monkeypatch.setattr(cache_bus, '_next_check', 0.0)
+    cache_bus.check()
+    cache_bus.check()
+    assert dropped == ['test']
+
+
+def test_module_edits_bump_quiz_but_trainee_writes_do_not(app_ctx):
+    import quiz_cache
+    import agency_stats
+    from datetime import date
+    from models import db, Certificate, Module, User
+    db.session.get(Module, 1).quiz_json = json.dumps(QUIZ * 2)
+    db.session.commit()
+    assert _version(quiz_cache.NAMESPACE) == 1
+
+    u = User(full_name='U', email='u@example.com', user_category='citizen', agency_id=1, password_hash='x')
+    db.session.add(u)
+    db.session.commit()
+    db.session.add(Certificate(user_id=u.User_id, module_id=1, module_type='CSG', issue_date=date(2025, 1, 1),
+                               status='pending', score=80.0))
+    db.session.commit()
+    assert _version(agency_stats.NAMESPACE) is None
+    assert _version(quiz_cache.NAMESPACE) == 1
+
+
+def test_poll_is_not_counted_as_request_statements(app_ctx, dropped, monkeypatch):
+    import cache_bus
+    import sql_stats
+    monkeypatch.setattr(cache_bus, '_next_check', 0.0)
+    with sql_stats.count_statements() as stats:
+        cache_bus.check()
+    assert stats.count == 0
+    assert cache_bus._next_check > 0
@@ -0,0 +1,128 @@
+import json
+from datetime import date, datetime
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Agency, Course, Module
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        agency = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        course = Course(name='Course', code='CSG', allowed_category='both')
+        db.session.add_all([agency, course])
+        db.session.flush()
+        db.session.add_all([
+            Module(module_name='M2', module_type='CSG', series_number='CSG002', course_id=course.course_id),
+            Module(module_name='M1', module_type='CSG', series_number='CSG001', course_id=course.course_id),
+            Module(module_name='Other', module_type='TFS', series_number='TFS001'),
+        ])
+        db.session.commit()
+    yield app, app.test_client()
+
+
+def _add_user(name, scores, certificate=None):
+    """scores: {module_id: score or None}; a module missing from it is not completed."""
+    from models import db, User, UserModule, Certificate
+    u = User(full_name=name, email=f'{name}@example.com', user_category='citizen', agency_id=1)
+    u.set_password('pass123')
+    db.session.add(u)
+    db.session.flush()
+    for module_id, score in scores.items():
+        db.session.add(UserModule(user_id=u.User_id, module_id=module_id, is_completed=True,
+                                  score=score, completion_date=datetime(2025, 1, 1)))
+    if certificate:
+        db.session.add(Certificate(user_id=u.User_id, module_id=2, module_type='CSG',
+                                   issue_date=date(2025, 1, 1), status=certificate))
+    db.session.commit()
+    return u.User_id
+
+
+def test_eligible_in_one_statement(app_client):
+    app, _ = app_client
+    import certificate_eligibility
+    import sql_stats
+    with app.app_context():
+        passed = _add_user('passed', {1: 60.0, 2: 80.0})
+        _add_user('low', {1: 40.0, 2: 50.0})
+        _add_user('partial', {1: 90.0})
+        _add_user('certified', {1: 90.0, 2: 90.0}, certificate='approved')
+        rejected = _add_user('rejected', {1: 90.0, 2: 70.0}, certificate='rejected')
+        _add_user('unscored', {1: None, 2: None})
+
+        with sql_stats.count_statements() as stats:
+            rows = certificate_eligibility.eligible('CSG')
+        assert stats.count == 1
+        assert rows == [certificate_eligibility.Eligible(passed, 70.0)]
+
+        # A trainee may resubmit after a rejection; the backfill may not
+        resubmit = certificate_eligibility.eligible('CSG', reissue_rejected=True)
+        assert [r.user_id for r in resubmit] == [passed, rejected]
+
+        from models import db, User
+        assert db.session.get(User, passed).EligibleForCertificate('CSG')
+        assert not User.query.filter_by(full_name='low').first().EligibleForCertificate('CSG')
+        assert User.query.filter_by(full_name='low').first().has_completed_all_modules_in_course('CSG')
+        assert not User.query.filter_by(full_name='partial').first().has_completed_all_modules_in_course('CSG')
+
+
+def test_backfill_inserts_in_bulk(app_client):
+    app, _ = app_client
+    import backfill_pending_certificates
+    from models import Certificate
+    with app.app_context():
+        ids = [_add_user(f'u{i}', {1: 50.0 + i, 2: 90.0}) for i in range(5)]
+        _add_user('certified', {1: 90.0, 2: 90.0}, certificate='rejected')
+
+        assert backfill_pending_certificates.backfill('CSG', dry_run=True) == 5
+        assert Certificate.query.filter_by(status='pending').count() == 0
+
+        assert backfill_pending_certificates.backfill('CSG') == 5
+        certs = Certificate.query.filter_by(status='pending').order_by(Certificate.user_id).all()
+        assert [c.user_id for c in certs] == ids
+        # Attached to the first module by series number, scored with the average
+        assert {c.module_id for c in certs} == {2}
+        assert certs[0].score == pytest.approx(70.0)
+        assert all(c.module_type == 'CSG' and c.issue_date == date.today() for c in certs)
+
+        assert backfill_pending_certificates.backfill('CSG') == 0
+
+
+def test_complete_course_endpoint(app_client):
+    app, client = app_client
+    with app.app_context():
+        _add_user('trainee', {1: 40.0})
+    _login(client, 'trainee@example.com', 'pass123')
+    post = lambda: client.post('/api/complete_course', data=json.dumps({'course_code': 'CSG'}),
+                               headers={'Content-Type': 'application/json'})
+
+    r = post()
+    assert r.status_code == 400 and r.get_json()['success'] is False
+
+    with app.app_context():
+        from models import db, UserModule
+        db.session.add(UserModule(user_id=1, module_id=2, is_completed=True, score=70.0))
+        db.session.commit()
+
+    r = post()
+    assert r.get_json()['submitted'] is True
+    r = post()
+    assert r.get_json()['already_submitted'] is True
+    with app.app_context():
+        from models import Certificate
+        cert = Certificate.query.one()
+        assert cert.status == 'pending' and cert.score == pytest.approx(55.0)
@@ -0,0 +1,240 @@
+import socketserver
+import threading
+import pytest
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib, in the spirit of MailHog."""
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.wfile.write(b'220 stand-in ESMTP\r\n')
+        rcpts, data_mode, lines = [], False, []
+        for raw in self.rfile:
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            if data_mode:
+                if line == '.':
+                    server.messages.append({'to': rcpts, 'data': '\n'.join(lines)})
+                    rcpts, data_mode, lines = [], False, []
+                    self.wfile.write(b'250 OK queued\r\n')
+                else:
+                    lines.append(line)
+                continue
+            cmd = line[:4].upper()
+            if cmd in ('EHLO', 'HELO'):
+                self.wfile.write(b'250 stand-in\r\n')
+            elif cmd == 'RCPT':
+                addr = line.split(':', 1)[1].strip('<> ')
+                if addr in server.refuse:
+                    self.wfile.write(b'550 no such user\r\n')
+                else:
+                    rcpts.append(addr)
+                    self.wfile.write(b'250 OK\r\n')
+            elif cmd == 'DATA':
+                data_mode = True
+                self.wfile.write(b'354 go ahead\r\n')
+            elif cmd == 'QUIT':
+                self.wfile.write(b'221 bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 OK\r\n')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _SMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.refuse = set()
+
+
+@pytest.fixture()
+def smtp_server():
+    server = SMTPStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture()
+def app_ctx(monkeypatch, smtp_server):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    for var in ('GMAIL_USER', 'SMTP2GO_API_KEY', 'SENDGRID_API_KEY'):
+        monkeypatch.delenv(var, raising=False)
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Agency, User
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    monkeypatch.setitem(app.config, 'EMAIL_OUTBOX_MODE', 'external')
+    monkeypatch.setitem(app.config, 'MAIL_SERVER', '127.0.0.1')
+    monkeypatch.setitem(app.config, 'MAIL_PORT', smtp_server.server_address[1])
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        db.session.add(a)
+        db.session.flush()
+        u = User(full_name='U1', email='u1@example.com', user_category='citizen', agency_id=a.agency_id)
+        u.set_password('pass123')
+        db.session.add(u)
+        db.session.commit()
+    yield app
+
+
+def test_forgot_password_only_enqueues(app_ctx, smtp_server):
+    from models import EmailOutbox
+    r = app_ctx.test_client().post('/forgot_password', data={'email': 'u1@example.com'})
+    assert r.status_code == 302
+    assert smtp_server.messages == []
+    with app_ctx.app_context():
+        row = EmailOutbox.query.one()
+        assert row.status == 'pending'
+        assert row.recipient == 'u1@example.com'
+        assert '/reset_password/__password_reset_token__' in row.body
+
+
+def test_reset_token_is_minted_at_send_time(app_ctx, smtp_server):
+    import re
+    import email_outbox
+    from itsdangerous import URLSafeTimedSerializer
+    app_ctx.test_client().post('/forgot_password', data={'email': 'u1@example.com'})
+    with app_ctx.app_context():
+        assert email_outbox.drain() == (1, 0)
+    from email import message_from_string
+    body = message_from_string(smtp_server.messages[0]['data']).get_payload(decode=True).decode()
+    token = re.search(r'/reset_password/(\S+)', body).group(1)
+    serializer = URLSafeTimedSerializer(app_ctx.config['SECRET_KEY'])
+    assert serializer.loads(token, salt='password-reset-salt', max_age=3600) == 'u1@example.com'
+
+
+def test_drain_reuses_one_connection(app_ctx, smtp_server):
+    import email_outbox
+    from models import db, EmailOutbox
+    with app_ctx.app_context():
+        for i in range(5):
+            email_outbox.enqueue(f'user{i}@example.com', 'Hello', f'Body {i}')
+        db.session.commit()
+        sent, failed = email_outbox.drain(limit=2)
+        assert (sent, failed) == (5, 0)
+        assert {r.status for r in EmailOutbox.query.all()} == {'sent'}
+        assert EmailOutbox.query.first().provider == 'local'
+    assert len(smtp_server.messages) == 5
+    assert smtp_server.connections == 1
+
+
+class _DownProvider:
+    name = 'down'
+
+    def __init__(self):
+        self.calls = 0
+
+    def send(self, row):
+        import email_outbox
+        self.calls += 1
+        raise email_outbox.DeliveryError('down: connection refused')
+
+    def close(self):
+        pass
+
+
+def test_failover_and_backoff(app_ctx, smtp_server):
+    import email_outbox
+    from models import db, EmailOutbox
+    down = _DownProvider()
+    with app_ctx.app_context():
+        local = email_outbox.build_providers(app_ctx.config)[-1]
+        dispatcher = email_outbox.Dispatcher([down, local])
+        for i in range(3):
+            email_outbox.enqueue(f'user{i}@example.com', 'Hello', 'Body')
+        db.session.commit()
+        assert email_outbox.drain(dispatcher) == (3, 0)
+        # the failed provider is cooled down instead of being retried for every message
+        assert down.calls == 1
+        dispatcher.close()
+
+        # nothing accepts the message: it is rescheduled, then given up on after MAX_ATTEMPTS
+        stuck = email_outbox.Dispatcher([down])
+        row = email_outbox.enqueue('late@example.com', 'Hello', 'Body')
+        db.session.commit()
+        email_outbox.drain(stuck)
+        db.session.refresh(row)
+        assert row.status == 'pending' and row.attempts == 1
+        assert row.next_attempt_at > row.created_at
+        row.attempts = email_outbox.MAX_ATTEMPTS - 1
+        row.next_attempt_at = row.created_at
+        db.session.commit()
+        email_outbox.drain(stuck)
+        db.session.refresh(row)
+        assert row.status == 'failed'
+        assert 'connection refused' in row.last_error
+
+
+def test_refused_recipient_fails_without_retry(app_ctx, smtp_server):
+    import email_outbox
+    from models import db, EmailOutbox
+    smtp_server.refuse.add('nobody@example.com')
+    with app_ctx.app_context():
+        email_outbox.enqueue('nobody@example.com', 'Hello', 'Body')
+        db.session.commit()
+        assert email_outbox.drain() == (0, 1)
+        assert EmailOutbox.query.one().status == 'failed'
+
+
+def test_messages_are_leased_one_at_a_time(app_ctx, smtp_server):
+    import email_outbox
+    from models import db, EmailOutbox
+
+    class _Watching:
+        name = 'watching'
+
+        def __init__(self):
+            self.seen = []
+
+        def send(self, row):
+            self.seen.append(sorted(r.status for r in EmailOutbox.query.filter(EmailOutbox.id != row.id)))
+
+        def close(self):
+            pass
+
+    with app_ctx.app_context():
+        for i in range(3):
+            email_outbox.enqueue(f'user{i}@example.com', 'Hello', 'Body')
+        db.session.commit()
+        provider = _Watching()
+        assert email_outbox.drain(email_outbox.Dispatcher([provider])) == (3, 0)
+    # While one message is being sent, the others are not leased to this sender
+    assert provider.seen == [['pending', 'pending'], ['pending', 'sent'], ['sent', 'sent']]
+
+
+def test_thread_mode_starts_sender_on_first_request(app_ctx, monkeypatch):
+    import email_outbox
+    started = []
+
+    class FakeSender:
+        def __init__(self, app):
+            self.wake = threading.Event()
+
+        def start(self):
+            started.append(self)
+
+        def is_alive(self):
+            return True
+
+    monkeypatch.setattr(email_outbox, 'OutboxSender', FakeSender)
+    monkeypatch.setattr(email_outbox, '_sender', None)
+    monkeypatch.setenv('EMAIL_OUTBOX_MODE', 'thread')
+    import importlib
+    # A non-testing app, as a worker would build it
+    app = importlib.import_module('app').create_app()
+    client = app.test_client()
+    client.get('/login')
+    client.get('/login')
+    assert len(started) == 1 and not started[0].wake.is_set()
@@ -0,0 +1,91 @@
+import json
+import pytest
+from sqlalchemy import event
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+QUIZ = [{'text': 'Q1', 'answers': [{'text': 'a'}, {'text': 'b', 'isCorrect': True}]}]
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    import quiz_cache
+    from models import db, Agency, User, Module
+    quiz_cache.cache.invalidate()
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        db.session.add(a)
+        db.session.flush()
+        u = User(full_name='U1', email='u1@example.com', user_category='citizen', agency_id=a.agency_id)
+        u.set_password('pass123')
+        db.session.add_all([u, Module(module_name='M1', module_type='CSG', series_number='CSG001', quiz_json=json.dumps(QUIZ))])
+        db.session.commit()
+    yield app.test_client()
+
+
+def test_requires_login(app_client):
+    r = app_client.get('/api/load_quiz/1')
+    assert r.status_code in (302, 401)
+
+
+def test_etag_and_304_without_queries(app_client, monkeypatch):
+    import cache_bus
+    # Keep the cache_bus version poll from falling due during the 304 request
+    monkeypatch.setattr(cache_bus, '_next_check', float('inf'))
+    _login(app_client, 'u1@example.com', 'pass123')
+    r = app_client.get('/api/load_quiz/1')
+    assert r.status_code == 200
+    assert r.get_json()[0]['correctIndex'] == 1
+    etag = r.headers['ETag']
+    assert etag and not etag.startswith('W/')
+    assert 'no-cache' in r.headers['Cache-Control']
+
+    from models import db
+    flask_app = app_client.application
+    statements = []
+    with flask_app.app_context():
+        engine = db.engine
+        listener = lambda *args, **kwargs: statements.append(args[2])
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            r2 = app_client.get('/api/load_quiz/1', headers={'If-None-Match': etag})
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+    assert r2.status_code == 304
+    assert r2.headers['ETag'] == etag
+    assert statements == []
+
+
+def test_quiz_edit_changes_etag(app_client):
+    _login(app_client, 'u1@example.com', 'pass123')
+    etag = app_client.get('/api/load_quiz/1').headers['ETag']
+    from models import db
+    flask_app = app_client.application
+    from models import Module
+    with flask_app.app_context():
+        m = db.session.get(Module, 1)
+        m.quiz_json = json.dumps(QUIZ + QUIZ)
+        db.session.commit()
+    r = app_client.get('/api/load_quiz/1', headers={'If-None-Match': etag})
+    assert r.status_code == 200
+    assert r.headers['ETag'] != etag
+    assert len(r.get_json()) == 2
+
+
+def test_missing_module(app_client):
+    _login(app_client, 'u1@example.com', 'pass123')
+    assert app_client.get('/api/load_quiz/99').status_code == 404
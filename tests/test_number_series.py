@@ -0,0 +1,124 @@
+from datetime import datetime, timezone
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+YEAR = datetime.now(timezone.utc).year
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Admin, Agency
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = Admin(username='admin', email='admin@example.com')
+        admin.set_password('pass123')
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        db.session.add_all([admin, a])
+        db.session.commit()
+    yield app, app.test_client()
+
+
+def _register(email):
+    from models import Registration
+    return Registration.registerUser({'full_name': email, 'email': email, 'password': 'pass123',
+                                      'user_category': 'citizen', 'agency_id': 1})
+
+
+def test_registration_numbers_follow_stored_ones(app_client):
+    app, _ = app_client
+    from models import db, User
+    import sql_stats
+    with app.app_context():
+        db.session.add(User(full_name='Imported', email='old@example.com', user_category='citizen',
+                            agency_id=1, password_hash='x', number_series=f'SG{YEAR}0041'))
+        db.session.commit()
+        with sql_stats.count_statements() as collector:
+            first = _register('a@example.com')
+        second = _register('b@example.com')
+        assert (first.number_series, second.number_series) == (f'SG{YEAR}0042', f'SG{YEAR}0043')
+        assert collector.count and not any('SEQUENCE' in shape for shape in collector.shapes)
+
+
+def test_rolled_back_number_is_reused(app_client):
+    app, _ = app_client
+    from models import db, User
+    from number_series import allocator
+    with app.app_context():
+        assert allocator.allocate('SG') == f'SG{YEAR}0001'
+        db.session.rollback()
+        assert _register('a@example.com').number_series == f'SG{YEAR}0001'
+        with pytest.raises(ValueError, match='already registered'):
+            _register('a@example.com')
+        assert User.query.count() == 1
+
+
+def test_trainer_series_shared_by_create_and_change_role(app_client):
+    app, client = app_client
+    _login(client, 'admin@example.com', 'pass123')
+    client.post('/create_user', data={'role': 'trainer', 'full_name': 'T1', 'email': 't1@example.com', 'password': 'pass123'})
+    with app.app_context():
+        user_id = _register('u@example.com').User_id
+    r = client.post('/change_role', data={'user_id': user_id, 'new_role': 'trainer', 'orig_type': 'user'})
+    assert r.get_json()['success']
+    from models import db, Trainer, User
+    with app.app_context():
+        assert sorted(t.number_series for t in Trainer.query) == [f'TR{YEAR}0001', f'TR{YEAR}0002']
+        assert db.session.get(User, user_id).number_series == f'SG{YEAR}0001'
+
+
+def test_block_reservation_round_trips(app_client):
+    app, _ = app_client
+    from number_series import NumberSeriesAllocator, SERIES, format_number
+
+    class CountingAllocator(NumberSeriesAllocator):
+        calls = []
+
+        def _ensure_sequence(self, session, series, year):
+            pass
+
+        def _reserve(self, session, sequence, count):
+            start = sum(n for _, n in self.calls)
+            self.calls.append((sequence, count))
+            return list(range(start + 1, start + count + 1))
+
+    a = CountingAllocator(block_size=5)
+    from models import db
+    with app.app_context():
+        values = [a._next_from_block(db.session, SERIES['TR'], YEAR) for _ in range(12)]
+    assert values == list(range(1, 13))
+    assert a.calls == [(f'trainer_number_series_{YEAR}_seq', 5)] * 3
+    with pytest.raises(RuntimeError, match='exhausted'):
+        format_number('SG', YEAR, 10000)
+
+
+def test_sequence_ddl_runs_without_the_allocator_lock(app_client):
+    app, _ = app_client
+    from number_series import NumberSeriesAllocator, SERIES
+
+    class Checking(NumberSeriesAllocator):
+        def _ensure_sequence(self, session, series, year):
+            # Another thread holding the lock may be waiting for a pool connection
+            assert not self._lock.locked()
+
+        def _reserve(self, session, sequence, count):
+            assert not self._lock.locked()
+            return list(range(1, count + 1))
+
+    a = Checking(block_size=2)
+    from models import db
+    with app.app_context():
+        assert [a._next_from_block(db.session, SERIES['SG'], YEAR) for _ in range(3)] == [1, 2, 1]
@@ -0,0 +1,86 @@
+import io
+import os
+import pytest
+from PIL import Image
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+def _png(width, height, color):
+    buf = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buf, 'PNG')
+    buf.seek(0)
+    return buf
+
+
+@pytest.fixture()
+def app_client(monkeypatch, tmp_path):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Agency, User
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        db.session.add(a)
+        db.session.flush()
+        u = User(full_name='U1', email='u1@example.com', user_category='citizen', agency_id=a.agency_id)
+        u.set_password('pass123')
+        db.session.add(u)
+        db.session.commit()
+    client = app.test_client()
+    _login(client, 'u1@example.com', 'pass123')
+    yield app, client
+
+
+def _stored_picture(app):
+    from models import db, User
+    with app.app_context():
+        return db.session.get(User, 1).Profile_picture
+
+
+def test_upload_builds_variants_and_replaces_old(app_client, tmp_path):
+    app, client = app_client
+    r = client.post('/profile', data={'profile_pic': (_png(2000, 1500, 'red'), 'me.png')}, content_type='multipart/form-data')
+    assert r.status_code == 302
+    stored = _stored_picture(app)
+    assert stored.startswith('profile_pics/user1_') and stored.endswith('.jpg')
+
+    from profile_images import variant_name
+    with Image.open(tmp_path / stored) as img:
+        assert max(img.size) == 1024
+    with Image.open(tmp_path / variant_name(stored, 'sm')) as img:
+        assert img.format == 'WEBP'
+        assert img.size == (96, 72)
+
+    page = client.get('/user_dashboard')
+    assert variant_name(stored, 'md').encode() in page.data
+
+    client.post('/profile', data={'profile_pic': (_png(300, 300, 'blue'), 'me.png')}, content_type='multipart/form-data')
+    replaced = _stored_picture(app)
+    assert replaced != stored
+    assert not os.path.exists(tmp_path / stored)
+    assert not os.path.exists(tmp_path / variant_name(stored, 'sm'))
+
+
+def test_invalid_image_is_rejected(app_client, tmp_path):
+    app, client = app_client
+    client.post('/profile', data={'profile_pic': (io.BytesIO(b'not an image'), 'me.png')}, content_type='multipart/form-data')
+    assert _stored_picture(app) is None
+    assert not os.path.exists(tmp_path / 'profile_pics') or not os.listdir(tmp_path / 'profile_pics')
+
+
+def test_legacy_picture_falls_back_to_original():
+    from profile_images import variant_name
+    assert variant_name('profile_pics/user3_me.png', 'sm') == 'profile_pics/user3_me.png'
+    assert variant_name('profile_pics/user3_0123456789abcdef.jpg', 'md') == 'profile_pics/user3_0123456789abcdef_md.webp'
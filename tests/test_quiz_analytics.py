@@ -0,0 +1,128 @@
+from datetime import datetime
+import json
+import pytest
+
+from quiz_answers import encode_answers, decode_packed
+from quiz_analytics import build_answer_matrix, compute_item_stats
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+QUIZ = [
+    {'text': 'Q1', 'answers': [{'text': 'a', 'isCorrect': True}, {'text': 'b'}, {'text': 'c'}]},
+    {'text': 'Q2', 'answers': [{'text': 'a'}, {'text': 'b', 'isCorrect': True}]},
+]
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Agency, User, Module, Admin, Course
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        db.session.add(a)
+        db.session.flush()
+        for i in range(3):
+            u = User(full_name=f'U{i}', email=f'u{i}@example.com', user_category='citizen', agency_id=a.agency_id)
+            u.set_password('pass123')
+            db.session.add(u)
+        admin = Admin(username='admin', email='admin@example.com')
+        admin.set_password('pass123')
+        c = Course(name='CERTIFIED SECURITY GUARD (CSG)', code='CSG', allowed_category='both')
+        db.session.add_all([admin, c])
+        db.session.flush()
+        db.session.add(Module(module_name='M1', module_type='CSG', series_number='CSG001', course_id=c.course_id, quiz_json=json.dumps(QUIZ)))
+        db.session.commit()
+    yield app.test_client()
+
+
+def test_compute_item_stats():
+    rows = [decode_packed(encode_answers(a)) for a in ([0, 1], [0, 0], [2, None], [1])]
+    matrix = build_answer_matrix(rows, 2)
+    assert matrix.shape == (4, 2)
+    items = compute_item_stats(matrix, [0, 1], [3, 2])
+    assert items[0]['correct_rate'] == 0.5
+    assert items[0]['distribution'] == [2, 1, 1]
+    assert items[1]['distribution'] == [1, 1]
+    assert items[1]['unanswered'] == 2
+    # the strongest attempt answered both correctly, the weakest neither
+    assert items[0]['discrimination'] == 1.0
+
+
+def test_compute_item_stats_without_attempts():
+    items = compute_item_stats(build_answer_matrix([], 2), [0, -1])
+    assert [i['correct_rate'] for i in items] == [0.0, 0.0]
+    assert items[0]['discrimination'] is None
+
+
+def test_submissions_mark_stale_and_refresh(app_client):
+    from models import QuizModuleStats
+    for i, answers in enumerate(([0, 1], [0, 0], [1, 0])):
+        _login(app_client, f'u{i}@example.com', 'pass123')
+        app_client.post('/api/save_quiz_answers/1', json={'answers': [answers[0], None]})
+        r = app_client.post('/api/submit_quiz/1', json={'answers': answers})
+        assert r.get_json()['success'] is True
+        app_client.get('/logout')
+    import quiz_analytics
+    from models import db
+    flask_app = app_client.application
+    with flask_app.app_context():
+        # Submissions do not write the stats row; the module is stale through quiz_attempt
+        assert db.session.get(QuizModuleStats, 1) is None
+        assert quiz_analytics.refresh_stale_modules() == 1
+        db.session.get(QuizModuleStats, 1).computed_at = datetime(2000, 1, 1)
+        db.session.commit()
+        assert quiz_analytics.stats_by_module([1])[1].new_submissions == 3
+
+    _login(app_client, 'admin@example.com', 'pass123')
+    r = app_client.post('/api/quiz_stats/1/refresh')
+    data = r.get_json()
+    assert data['success'] is True
+    assert data['attempts'] == 3
+    assert data['avg_duration_seconds'] is not None
+    assert data['items'][0]['distribution'] == [2, 1, 0]
+    with flask_app.app_context():
+        assert quiz_analytics.new_submission_counts([1]) == {}
+        assert quiz_analytics.refresh_stale_modules() == 0
+        quiz_analytics.mark_stale(1)
+        db.session.commit()
+        assert quiz_analytics.refresh_stale_modules() == 1
+        assert db.session.get(QuizModuleStats, 1).pending_submissions == 0
+    page = app_client.get('/admin_course_management')
+    assert page.status_code == 200
+    assert b'stats-pane-1' in page.data
+
+
+def test_reattempt_counts_only_latest_submitted_answers(app_client):
+    import quiz_analytics
+    from models import db
+    _login(app_client, 'u0@example.com', 'pass123')
+    app_client.post('/api/submit_quiz/1', json={'answers': [1, 0]})
+    app_client.post('/api/submit_quiz/1', json={'answers': [0, 1]})
+    # An unsubmitted reattempt must not replace the submitted answers
+    app_client.post('/api/save_quiz_answers/1', json={'answers': [2, None]})
+    with app_client.application.app_context():
+        stats = quiz_analytics.refresh_module_stats(1)
+        items = stats.get_item_stats()
+        assert stats.attempts == 1
+        assert items[0]['distribution'] == [1, 0, 0]
+        assert items[1]['unanswered'] == 0
+        # Submissions older than quiz_attempt are read from user_module
+        db.session.execute(db.text('DELETE FROM quiz_attempt'))
+        assert quiz_analytics.refresh_module_stats(1).attempts == 0
+        db.session.execute(db.text('UPDATE user_module SET quiz_started_at = NULL, quiz_answers = :a'),
+                           {'a': encode_answers([0, 1])})
+        items = quiz_analytics.refresh_module_stats(1).get_item_stats()
+        assert items[0]['distribution'] == [1, 0, 0]
@@ -0,0 +1,89 @@
+import json
+import pytest
+
+from quiz_answers import encode_answers, decode_answers, parse_legacy_answers
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Agency, User, Module
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        db.session.add(a)
+        db.session.flush()
+        u = User(full_name='U1', email='u1@example.com', user_category='citizen', agency_id=a.agency_id)
+        u.set_password('pass123')
+        quiz = [
+            {'text': 'Q1', 'answers': [{'text': 'a', 'isCorrect': True}, {'text': 'b'}]},
+            {'text': 'Q2', 'answers': [{'text': 'a'}, {'text': 'b', 'isCorrect': True}]},
+        ]
+        m = Module(module_name='M1', module_type='CSG', series_number='CSG001', quiz_json=json.dumps(quiz))
+        db.session.add_all([u, m])
+        db.session.commit()
+    yield app.test_client()
+
+
+def test_roundtrip_with_unanswered():
+    encoded = encode_answers([0, 1, None, 3])
+    assert encoded.startswith('a1:')
+    assert decode_answers(encoded) == [0, 1, None, 3]
+    assert decode_answers(None) == []
+    assert decode_answers('') == []
+
+
+def test_encoding_is_smaller_than_json():
+    answers = [i % 4 for i in range(40)]
+    assert len(encode_answers(answers)) < len(json.dumps(answers))
+
+
+def test_invalid_values_become_unanswered():
+    assert decode_answers(encode_answers(['2', 1.0, 'x', -1, 999, True])) == [2, 1, None, None, None, None]
+
+
+def test_decode_rejects_legacy_text():
+    with pytest.raises(ValueError):
+        decode_answers('[0, 1]')
+
+
+@pytest.mark.parametrize('raw,expected', [
+    ('[0, 1, null]', [0, 1, None]),
+    ('"[2, 3]"', [2, 3]),
+    (b'[1]', [1]),
+    ("['1', None, 2]", [1, None, 2]),
+    ('1, 2,null', [1, 2, None]),
+    ('[]', []),
+])
+def test_parse_legacy_answers(raw, expected):
+    assert parse_legacy_answers(raw) == expected
+
+
+def test_save_and_load_roundtrip(app_client):
+    _login(app_client, 'u1@example.com', 'pass123')
+    r = app_client.post('/api/save_quiz_answers/1', json={'answers': [1, None]})
+    assert r.status_code == 200
+    assert app_client.get('/api/user_quiz_answers/1').get_json() == [1, None]
+    r = app_client.post('/api/submit_quiz/1', json={'answers': [0, 1]})
+    data = r.get_json()
+    assert data['score'] == 100
+    assert app_client.get('/api/user_quiz_answers/1').get_json() == [0, 1]
+
+
+def test_save_rejects_non_array(app_client):
+    _login(app_client, 'u1@example.com', 'pass123')
+    r = app_client.post('/api/save_quiz_answers/1', json={'answers': 'nope'})
+    assert r.status_code == 400
@@ -0,0 +1,101 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+QUIZ = [
+    {'text': 'Q1', 'answers': [{'text': 'a', 'isCorrect': True}, {'text': 'b'}]},
+    {'text': 'Q2', 'answers': [{'text': 'a'}, {'text': 'b', 'isCorrect': True}]},
+]
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Agency, User, Module, Course
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        c = Course(name='Course', code='CSG', allowed_category='both')
+        db.session.add_all([a, c])
+        db.session.flush()
+        u = User(full_name='U1', email='u1@example.com', user_category='citizen', agency_id=a.agency_id)
+        u.set_password('pass123')
+        db.session.add(u)
+        db.session.add(Module(module_name='M1', module_type='CSG', series_number='CSG001', course_id=c.course_id, quiz_json=json.dumps(QUIZ)))
+        db.session.commit()
+    yield app, app.test_client()
+
+
+def _post(client, url, payload):
+    return client.post(url, data=json.dumps(payload), headers={'Content-Type': 'application/json'})
+
+
+def test_submissions_are_kept_and_reviewable(app_client):
+    app, client = app_client
+    _login(client, 'u1@example.com', 'pass123')
+    _post(client, '/api/save_quiz_answers/1', {'answers': [1, None]})
+    _post(client, '/api/submit_quiz/1', {'answers': [1, 1]})
+    _post(client, '/api/submit_quiz/1', {'answers': [0, 1], 'is_reattempt': True})
+
+    from models import QuizAttempt
+    with app.app_context():
+        attempts = QuizAttempt.query.order_by(QuizAttempt.id).all()
+        assert [a.score for a in attempts] == [50.0, 100.0]
+        assert attempts[0].answers == bytes([1, 1])
+        # Only the first attempt had an autosave to mark its start
+        assert attempts[0].started_at is not None and attempts[1].started_at is None
+        first_id = attempts[0].id
+
+    data = client.get('/api/review_quiz/1').get_json()
+    assert data['userAnswers'] == [0, 1] and data['score'] == 100.0
+    assert [a['score'] for a in data['attempts']] == [100.0, 50.0]
+    assert data['quizChanged'] is False
+
+    data = client.get(f'/api/review_quiz/1?attempt={first_id}').get_json()
+    assert data['userAnswers'] == [1, 1] and data['score'] == 50.0
+
+    assert client.get('/api/review_quiz/1?attempt=999').status_code == 404
+
+    with app.app_context():
+        from models import db, Module
+        module = db.session.get(Module, 1)
+        module.quiz_json = json.dumps(QUIZ[:1])
+        db.session.commit()
+    data = client.get('/api/review_quiz/1').get_json()
+    assert data['quizChanged'] is True
+    assert all(a['quizChanged'] for a in data['attempts'])
+
+
+def test_prune_keeps_newest_and_best(app_client):
+    app, _ = app_client
+    import quiz_attempts
+    from models import db, QuizAttempt
+    with app.app_context():
+        old = datetime(2024, 1, 1)
+        scores = [90.0, 10.0, 20.0, 30.0, 40.0]
+        for i, score in enumerate(scores):
+            quiz_attempts.record(1, 1, '[]', [0], score, now=old + timedelta(days=i))
+        quiz_attempts.record(1, 1, '[]', [0], 5.0, now=datetime(2025, 6, 1))
+        db.session.commit()
+
+        now = datetime(2025, 6, 2)
+        assert quiz_attempts.prune(keep=2, retention_days=30, now=now, dry_run=True) == 3
+        assert quiz_attempts.prune(keep=2, retention_days=30, now=now) == 3
+        db.session.commit()
+        assert sorted(a.score for a in QuizAttempt.query.all()) == [5.0, 40.0, 90.0]
+        # Recent attempts are kept whatever their rank
+        assert quiz_attempts.prune(keep=0, retention_days=30, now=now) == 1
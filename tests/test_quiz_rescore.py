@@ -0,0 +1,133 @@
+import json
+from datetime import date, datetime
+import pytest
+
+from quiz_answers import encode_answers
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+def _quiz(*correct):
+    return json.dumps([
+        {'text': f'Q{i}', 'answers': [{'text': 'a', 'isCorrect': c == 0}, {'text': 'b', 'isCorrect': c == 1}]}
+        for i, c in enumerate(correct)
+    ])
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Admin, Agency, User, Module, Course
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        c = Course(name='Course', code='CSG', allowed_category='both')
+        admin = Admin(username='admin', email='admin@example.com')
+        admin.set_password('pass123')
+        db.session.add_all([a, c, admin])
+        db.session.flush()
+        for i in range(4):
+            db.session.add(User(full_name=f'U{i}', email=f'u{i}@example.com', user_category='citizen',
+                                agency_id=a.agency_id, password_hash='x'))
+        db.session.add_all([
+            # Key: Q0 -> a, Q1 -> a; the second answer is wrong and will be fixed to b
+            Module(module_name='M1', module_type='CSG', series_number='CSG001', course_id=c.course_id, quiz_json=_quiz(0, 0)),
+            Module(module_name='M2', module_type='CSG', series_number='CSG002', course_id=c.course_id, quiz_json=_quiz(0)),
+        ])
+        db.session.commit()
+    yield app, app.test_client()
+
+
+def _progress(user_id, module_id, answers, score, **extra):
+    from models import db, UserModule
+    db.session.add(UserModule(user_id=user_id, module_id=module_id, is_completed=True, score=score,
+                              quiz_answers=encode_answers(answers), completion_date=datetime(2025, 1, 1), **extra))
+
+
+def _seed():
+    from models import db, Certificate
+    import quiz_attempts
+    _progress(1, 1, [0, 1], 50.0)            # 50 -> 100
+    _progress(2, 1, [0, 0], 100.0)           # 100 -> 50
+    # Latest answers scored 0; the best (100) is in the history and becomes 50
+    _progress(3, 1, [1, 0], 100.0)
+    quiz_attempts.record(3, 1, _quiz(0, 0), [0, 0], 100.0, now=datetime(2024, 12, 1))
+    # Best attempt predates the history: cannot be rescored
+    _progress(4, 1, [1, 1], 100.0)
+    for uid in (1, 2, 3):
+        _progress(uid, 2, [0], 100.0)
+    db.session.add_all([
+        Certificate(user_id=1, module_id=1, module_type='CSG', issue_date=date(2025, 1, 1), status='approved', score=75.0),
+        Certificate(user_id=2, module_id=1, module_type='CSG', issue_date=date(2025, 1, 1), status='pending', score=100.0),
+    ])
+    db.session.commit()
+
+
+def test_score_matrix_matches_score_answers():
+    import numpy as np
+    import quiz_rescore
+    from quiz_answers import score_answers, pack_answers
+    from quiz_analytics import build_answer_matrix
+    rng = np.random.default_rng(7)
+    key = [0, 2, 1, -1, 3, 0, 1]
+    answers = [[None if v == 4 else int(v) for v in row] for row in rng.integers(0, 5, size=(300, 9))]
+    matrix = build_answer_matrix([pack_answers(a) for a in answers], len(key))
+    assert quiz_rescore.score_matrix(matrix, key).tolist() == [score_answers(a, key) for a in answers]
+
+
+def test_dry_run_then_rescore(app_client):
+    app, _ = app_client
+    import quiz_rescore
+    from models import db, Certificate, Module, UserModule
+    with app.app_context():
+        _seed()
+        module = db.session.get(Module, 1)
+        old_quiz_json = module.quiz_json
+        module.quiz_json = _quiz(0, 1)
+        db.session.flush()
+
+        report = quiz_rescore.rescore_module(1, old_quiz_json=old_quiz_json, dry_run=True, chunk_size=2)
+        assert report.scanned == 4 and report.skipped == 1
+        assert sorted((c.user_id, c.old_score, c.new_score) for c in report.changes) == [
+            (1, 50.0, 100.0), (2, 100.0, 50.0), (3, 100.0, 50.0)]
+        assert report.certificates == 2
+        assert db.session.get(UserModule, 1).score == 50.0
+
+        report = quiz_rescore.rescore_module(1, old_quiz_json=old_quiz_json, chunk_size=2)
+        db.session.commit()
+        scores = {um.user_id: um.score for um in UserModule.query.filter_by(module_id=1)}
+        assert scores == {1: 100.0, 2: 50.0, 3: 50.0, 4: 100.0}
+        # Certificates follow the course average over both modules
+        certs = {c.user_id: c.score for c in Certificate.query.all()}
+        assert certs == {1: 100.0, 2: 75.0}
+
+
+def test_quiz_edit_triggers_rescore(app_client):
+    app, client = app_client
+    from models import UserModule
+    with app.app_context():
+        _seed()
+    _login(client, 'admin@example.com', 'pass123')
+    # Rewording a question keeps the key: nothing is rescored
+    reworded = json.loads(_quiz(0, 0))
+    reworded[0]['text'] = 'Reworded'
+    r = client.post('/admin_course_management', data={'module_id': 1, 'quiz_data': json.dumps(reworded)},
+                    headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert r.get_json()['rescored'] == 0
+
+    r = client.post('/admin_course_management', data={'module_id': 1, 'quiz_data': _quiz(0, 1)},
+                    headers={'X-Requested-With': 'XMLHttpRequest'})
+    assert r.get_json()['success'] is True and r.get_json()['rescored'] == 3
+    with app.app_context():
+        assert UserModule.query.filter_by(user_id=1, module_id=1).one().score == 100.0
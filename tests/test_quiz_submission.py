@@ -0,0 +1,103 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+QUIZ = [
+    {'text': 'Q1', 'answers': [{'text': 'a', 'isCorrect': True}, {'text': 'b'}]},
+    {'text': 'Q2', 'answers': [{'text': 'a'}, {'text': 'b', 'isCorrect': True}]},
+]
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Agency, User, Module, Course
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        c = Course(name='Course', code='CSG', allowed_category='both')
+        db.session.add_all([a, c])
+        db.session.flush()
+        u = User(full_name='U1', email='u1@example.com', user_category='citizen', agency_id=a.agency_id)
+        u.set_password('pass123')
+        db.session.add(u)
+        db.session.add(Module(module_name='M1', module_type='CSG', series_number='CSG001', course_id=c.course_id, quiz_json=json.dumps(QUIZ)))
+        db.session.commit()
+    yield app, app.test_client()
+
+
+def _submit(client, answers, reattempt=False):
+    return client.post('/api/submit_quiz/1', data=json.dumps({'answers': answers, 'is_reattempt': reattempt}),
+                       headers={'Content-Type': 'application/json'})
+
+
+def test_submissions_upsert_one_row(app_client):
+    app, client = app_client
+    _login(client, 'u1@example.com', 'pass123')
+    r = _submit(client, [0, 1])
+    assert r.get_json()['score'] == 100 and r.get_json()['grade_letter'] == 'A'
+
+    r = _submit(client, [1, 1], reattempt=True)
+    data = r.get_json()
+    assert data['score'] == 50 and data['reattempt_count'] == 1 and data['grade_letter'] == 'B'
+
+    from models import UserModule
+    from quiz_answers import decode_answers
+    with app.app_context():
+        rows = UserModule.query.all()
+        assert len(rows) == 1
+        # Best score is kept, the answers are the latest attempt's
+        assert rows[0].score == 100.0 and rows[0].is_completed
+        assert decode_answers(rows[0].quiz_answers) == [1, 1]
+
+
+def test_upsert_records_duration_and_statement_count(app_client):
+    app, _ = app_client
+    import quiz_submission
+    import sql_stats
+    from models import db, UserModule
+    with app.app_context():
+        start = datetime(2025, 5, 1, 10, 0, 0)
+        quiz_submission.autosave(1, 1, 'a1:AA', now=start)
+        quiz_submission.autosave(1, 1, 'a1:AAE', now=start + timedelta(seconds=5))
+        with sql_stats.count_statements() as stats:
+            stored = quiz_submission.submit(1, 1, 'a1:AAE', 40.0, now=start + timedelta(seconds=90))
+        db.session.commit()
+        assert stats.count == 1
+        assert stored == quiz_submission.Submission(40.0, 0)
+
+        um = UserModule.query.one()
+        assert um.quiz_duration_seconds == 90
+        assert um.quiz_started_at is None
+
+        stored = quiz_submission.submit(1, 1, 'a1:AAE', 30.0, is_reattempt=True, now=start + timedelta(seconds=95))
+        db.session.commit()
+        assert stored == quiz_submission.Submission(40.0, 1)
+        db.session.expire_all()
+        # No autosave since the last submit: the previous duration stands
+        assert UserModule.query.one().quiz_duration_seconds == 90
+
+
+def test_unique_progress_row(app_client):
+    app, _ = app_client
+    from sqlalchemy.exc import IntegrityError
+    from models import db, UserModule
+    with app.app_context():
+        db.session.add_all([UserModule(user_id=1, module_id=1), UserModule(user_id=1, module_id=1)])
+        with pytest.raises(IntegrityError):
+            db.session.commit()
+        db.session.rollback()
@@ -0,0 +1,123 @@
+import json
+import re
+import threading
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+@pytest.fixture()
+def app_client(monkeypatch, tmp_path):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    monkeypatch.setenv('METRICS_MULTIPROC_DIR', str(tmp_path / 'metrics'))
+    monkeypatch.setenv('METRICS_TOKEN', 'scrape-secret')
+    import importlib
+    import request_metrics
+    monkeypatch.setattr(request_metrics, 'metrics', request_metrics.RequestMetrics())
+    flask_app_module = importlib.import_module('app')
+    from models import db, Admin, Agency, User
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = Admin(username='admin', email='admin@example.com')
+        admin.set_password('pass123')
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        db.session.add_all([admin, a])
+        db.session.flush()
+        u = User(full_name='U1', email='u1@example.com', user_category='citizen', agency_id=a.agency_id)
+        u.set_password('pass123')
+        db.session.add(u)
+        db.session.commit()
+    yield app, app.test_client(), tmp_path / 'metrics'
+
+
+def _value(text, pattern):
+    match = re.search(r'^' + re.escape(pattern) + r' (\S+)$', text, re.M)
+    return float(match.group(1)) if match else None
+
+
+def test_threads_aggregate_without_sharing():
+    import request_metrics
+    m = request_metrics.RequestMetrics()
+
+    def worker():
+        for _ in range(100):
+            m.started()
+            m.finished('main.courses', 'GET', 200, 0.02, 2000, 0.005)
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    m.started()
+    for t in threads:
+        t.join()
+
+    snap = m.snapshot()
+    stats = snap['endpoints']['main.courses\tGET']
+    assert stats['count'] == 400
+    assert stats['db_seconds'] == pytest.approx(2.0)
+    assert snap['in_flight'] == 1
+    # the exited threads were folded into the retired totals
+    assert len(m._threads) == 1
+    assert m.snapshot()['endpoints']['main.courses\tGET']['count'] == 400
+
+
+def test_metrics_endpoint(app_client):
+    app, client, _ = app_client
+    assert client.get('/metrics').status_code == 403
+    _login(client, 'u1@example.com', 'pass123')
+    client.get('/courses')
+    client.get('/courses')
+    assert client.get('/metrics').status_code == 403
+
+    r = client.get('/metrics', headers={'Authorization': 'Bearer scrape-secret'})
+    assert r.status_code == 200
+    assert r.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = r.get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in text
+    assert _value(text, 'http_request_duration_seconds_count{endpoint="main.courses",method="GET"}') == 2
+    assert _value(text, 'http_request_duration_seconds_bucket{endpoint="main.courses",method="GET",le="+Inf"}') == 2
+    assert _value(text, 'http_requests_total{endpoint="main.courses",method="GET",status="200"}') == 2
+    assert _value(text, 'http_request_db_seconds_total{endpoint="main.courses",method="GET"}') > 0
+    assert _value(text, 'http_response_size_bytes_sum{endpoint="main.courses",method="GET"}') > 0
+    # the scrape itself is in flight
+    assert _value(text, 'http_requests_in_flight') == 1
+
+    client.get('/logout')
+    _login(client, 'admin@example.com', 'pass123')
+    assert client.get('/metrics').status_code == 200
+
+
+def test_other_workers_are_merged(app_client):
+    app, client, directory = app_client
+    import request_metrics
+    worker = request_metrics.RequestMetrics()
+    worker.started()
+    worker.finished('authority.authority_portal', 'GET', 500, 0.3, 120, 0.1)
+    worker.started()
+    # a worker that has exited: its counters stay, its in-flight gauge does not
+    snapshot = worker.snapshot()
+    (directory / 'metrics_999999999.json').write_text(json.dumps(snapshot))
+
+    _login(client, 'admin@example.com', 'pass123')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert _value(text, 'http_request_errors_total{endpoint="authority.authority_portal",method="GET"}') == 1
+    assert _value(text, 'http_requests_total{endpoint="authority.authority_portal",method="GET",status="500"}') == 1
+    assert _value(text, 'http_requests_in_flight') == 1
+
+
+def test_worker_snapshot_is_flushed(app_client):
+    app, client, directory = app_client
+    import request_metrics
+    request_metrics.metrics._last_flush = 0.0
+    client.get('/login')
+    files = list(directory.glob('metrics_*.json'))
+    assert len(files) == 1
+    assert 'main.login\tGET' in json.loads(files[0].read_text())['endpoints']
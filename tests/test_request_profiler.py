@@ -0,0 +1,94 @@
+import os
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+@pytest.fixture()
+def app_client(monkeypatch, tmp_path):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    monkeypatch.setenv('REQUEST_PROFILING', '1')
+    monkeypatch.setenv('PROFILE_DIR', str(tmp_path / 'profiles'))
+    import importlib
+    import request_profiler
+    request_profiler._recent_starts.clear()
+    flask_app_module = importlib.import_module('app')
+    from models import db, Admin, Agency, User
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = Admin(username='admin', email='admin@example.com')
+        admin.set_password('pass123')
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        db.session.add_all([admin, a])
+        db.session.flush()
+        u = User(full_name='U1', email='u1@example.com', user_category='citizen', agency_id=a.agency_id)
+        u.set_password('pass123')
+        db.session.add(u)
+        db.session.commit()
+    yield app, app.test_client()
+
+
+def test_admin_capture_written_and_listed(app_client):
+    app, client = app_client
+    _login(client, 'admin@example.com', 'pass123')
+    r = client.get('/monitor_progress?_profile=1')
+    assert r.status_code == 200
+    capture_id = r.headers['X-Profile-Id']
+    directory = app.config['PROFILE_DIR']
+    assert {f'{capture_id}.{ext}' for ext in ('prof', 'txt', 'json')} <= set(os.listdir(directory))
+
+    page = client.get('/admin/profiles')
+    assert page.status_code == 200 and capture_id.encode() in page.data
+    txt = client.get(f'/admin/profiles/{capture_id}.txt')
+    assert txt.status_code == 200 and b'cumulative' in txt.data
+    assert client.get('/admin/profiles/../../etc/passwd.txt').status_code == 404
+    assert client.get(f'/admin/profiles/{capture_id}.json').status_code == 404
+
+
+def test_sample_mode_writes_folded_stacks(app_client):
+    app, client = app_client
+    _login(client, 'admin@example.com', 'pass123')
+    r = client.get('/monitor_progress', headers={'X-Profile': 'sample'})
+    capture_id = r.headers['X-Profile-Id']
+    assert os.path.exists(os.path.join(app.config['PROFILE_DIR'], f'{capture_id}.folded'))
+
+
+def test_non_admin_requests_are_never_profiled(app_client):
+    app, client = app_client
+    _login(client, 'u1@example.com', 'pass123')
+    r = client.get('/user_dashboard?_profile=1')
+    assert 'X-Profile-Id' not in r.headers
+    assert not os.path.exists(app.config['PROFILE_DIR'])
+    assert client.get('/admin/profiles').status_code == 302
+
+
+def test_rate_limit_and_pruning(app_client):
+    app, client = app_client
+    app.config.update(PROFILING_RATE_LIMIT=3, PROFILING_KEEP=2)
+    _login(client, 'admin@example.com', 'pass123')
+    ids = [client.get('/admin/sql_stats?_profile=1').headers.get('X-Profile-Id') for _ in range(3)]
+    assert all(ids)
+    r = client.get('/admin/sql_stats?_profile=1')
+    assert r.headers['X-Profile-Status'] == 'rate-limited' and 'X-Profile-Id' not in r.headers
+    import request_profiler
+    assert [c['id'] for c in request_profiler.list_captures(app)] == sorted(ids, reverse=True)[:2]
+
+
+def test_disabled_registers_no_hooks(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    monkeypatch.delenv('REQUEST_PROFILING', raising=False)
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    app = flask_app_module.create_app()
+    hooks = [f.__name__ for f in app.before_request_funcs.get(None, [])]
+    assert '_start_profile' not in hooks
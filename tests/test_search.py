@@ -0,0 +1,189 @@
+from datetime import date
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Admin, Agency, User, Course, Module, Certificate
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = Admin(username='admin', email='admin@example.com')
+        admin.set_password('pass123')
+        a = Agency(agency_name='Harbour Staffing', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        course = Course(name='Safety Induction', code='CSG', allowed_category='both')
+        db.session.add_all([admin, a, course])
+        db.session.flush()
+        m = Module(module_name='Working at Height', module_type='CSG', series_number='CSG001', course_id=course.course_id)
+        db.session.add(m)
+        db.session.flush()
+        people = [('Aisyah Rahman', 'aisyah@example.com', 'SG20250001'), ('Rahmat Ali', 'rahmat@example.com', 'SG20250002'),
+                  ('John Tan', 'john.tan@example.com', 'SG20250003')]
+        for name, email, series in people:
+            u = User(full_name=name, email=email, number_series=series, user_category='citizen', agency_id=a.agency_id, password_hash='x')
+            db.session.add(u)
+            db.session.flush()
+            db.session.add(Certificate(user_id=u.User_id, module_id=m.module_id, module_type='CSG', issue_date=date(2025, 1, 1), status='pending'))
+        db.session.commit()
+    yield app, app.test_client()
+
+
+def _user_names(app, q, **kw):
+    import search
+    from models import User
+    with app.app_context():
+        return sorted(u.full_name for u in User.query.filter(search.user_filter(q, **kw)))
+
+
+def test_parse_routes_exact_lookups():
+    from search import parse
+    assert parse('  ') == (None, None)
+    assert parse('42') == ('id', 42)
+    assert parse('John.Tan@Example.com') == ('email', 'John.Tan@Example.com')
+    assert parse('sg20250001') == ('series', 'SG20250001')
+    assert parse('TR2025000') == ('text', 'tr2025000')
+    assert parse('Rahman') == ('text', 'rahman')
+
+
+def test_user_filter(app_client):
+    app, _ = app_client
+    assert _user_names(app, 'rahm') == ['Aisyah Rahman', 'Rahmat Ali']
+    assert _user_names(app, 'john.tan@example.com') == ['John Tan']
+    assert _user_names(app, 'SG20250002') == ['Rahmat Ali']
+    assert _user_names(app, '1') == ['Aisyah Rahman']
+    assert _user_names(app, 'Ta') == ['John Tan']  # below trigram length: plain LIKE
+    assert _user_names(app, '100%') == []
+    assert _user_names(app, 'harbour') == []
+    assert len(_user_names(app, 'harbour', agencies=True)) == 3
+
+
+def test_text_search_uses_shadow_table(app_client):
+    app, _ = app_client
+    import search
+    from models import db
+    with app.app_context():
+        sql = str(search.user_filter('aisyah').compile(db.engine))
+        assert 'search_index' in sql and 'MATCH' in sql
+        assert 'search_index' not in str(search.user_filter('ai').compile(db.engine))
+
+
+def test_index_follows_orm_writes(app_client):
+    app, _ = app_client
+    import search
+    from models import db, User
+    with app.app_context():
+        john = User.query.filter_by(email='john.tan@example.com').one()
+        john.full_name = 'Johnathan Lim'
+        db.session.commit()
+        assert search.ranked('user', 'lim') == [john.User_id]
+        assert search.ranked('user', 'john tan') == []
+        limah = User(full_name='Limah Osman', email='limah@example.com', user_category='citizen', agency_id=1, password_hash='x')
+        db.session.add(limah)
+        db.session.commit()
+        assert len(search.ranked('user', 'lim')) == 2
+        db.session.delete(limah)
+        db.session.commit()
+        assert search.ranked('user', 'lim') == [john.User_id]
+
+
+def test_certificate_search_in_listings(app_client):
+    app, client = app_client
+    _login(client, 'admin@example.com', 'pass123')
+
+    def cert_count(q):
+        page = client.get('/api/tables/certificates', query_string={'q': q}).get_json()
+        return page['total']
+
+    assert cert_count('safety induction') == 3
+    assert cert_count('at height') == 3
+    assert cert_count('rahman') == 1
+    assert cert_count('rahmat@example.com') == 1
+    assert cert_count('2') == 1
+    assert cert_count('nothing like this') == 0
+
+    r = client.get('/api/admin/search', query_string={'q': 'rahma'}).get_json()
+    assert {u['name'] for u in r['users']} == {'Aisyah Rahman', 'Rahmat Ali'}
+    assert len(r['certificates']) == 2
+    r = client.get('/api/admin/search', query_string={'q': 'sg20250003'}).get_json()
+    assert r['query']['kind'] == 'series' and [u['name'] for u in r['users']] == ['John Tan']
+
+
+def test_user_listings_search_in_sql(app_client):
+    app, client = app_client
+    _login(client, 'admin@example.com', 'pass123')
+    page = client.get('/admin_users', query_string={'q': 'aisyah'})
+    assert b'Aisyah Rahman' in page.data and b'John Tan' not in page.data
+    page = client.get('/monitor_progress', query_string={'q': 'harbour'})
+    assert all(name in page.data for name in (b'Aisyah Rahman', b'Rahmat Ali', b'John Tan'))
+    page = client.get('/monitor_progress', query_string={'q': 'john'})
+    assert b'John Tan' in page.data and b'Rahmat Ali' not in page.data
+
+
+def test_seed_data_rebuilds_index(app_client):
+    app, _ = app_client
+    import search
+    import seed_data
+    from models import db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_data.generate(users=30, seed=1)
+        assert len(search.ranked('user', 'trainee 1', limit=50)) == 11
+
+
+def test_flush_sync_replaces_documents_by_rowid(app_client):
+    app, _ = app_client
+    import search
+    from sqlalchemy import text
+    from models import db, Certificate, User
+    with app.app_context():
+        u = db.session.get(User, 1)
+        u.full_name = 'Aisyah Binti Rahman'
+        db.session.commit()
+        rowid = search.document_rowid('user', 1)
+        assert db.session.execute(text('SELECT rowid, body FROM search_index WHERE body MATCH \'"binti"\'')).all() == [
+            (rowid, 'aisyah binti rahman aisyah@example.com sg20250001')]
+        # The rebuilt index uses the same rowids as the flush events
+        with db.engine.begin() as conn:
+            search.rebuild(conn)
+        assert search.ranked('user', 'binti') == [1]
+        assert db.session.execute(text('SELECT count(*) FROM search_index WHERE rowid = :r'), {'r': rowid}).scalar() == 1
+        plan = db.session.execute(text('EXPLAIN QUERY PLAN DELETE FROM search_index WHERE rowid = :r'), {'r': rowid}).all()
+        # FTS5 reports a rowid lookup as 'INDEX 0:=' and a full scan as 'INDEX 0:'
+        assert plan[0][-1].endswith(':=')
+        Certificate.query.filter_by(user_id=1).delete()
+        db.session.delete(u)
+        db.session.commit()
+        assert search.ranked('user', 'binti') == []
+
+
+def test_create_all_on_existing_schema_keeps_index(app_client, monkeypatch):
+    app, _ = app_client
+    import search
+    from sqlalchemy import text
+    from models import db
+    with app.app_context():
+        with db.engine.begin() as conn:
+            conn.execute(text("INSERT INTO search_index (rowid, kind, ref_id, body) VALUES (1, 'user', 99, 'marker')"))
+        rebuilds = []
+        with monkeypatch.context() as patch:
+            patch.setattr(search, 'rebuild', lambda conn: rebuilds.append(conn))
+            db.create_all()
+        assert rebuilds == []
+        assert search.ranked('user', 'marker') == [99]
+        with db.engine.begin() as conn:
+            search.install_schema(conn, reset=True)
+        assert search.ranked('user', 'marker') == []
@@ -0,0 +1,81 @@
+import re
+from datetime import datetime
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+@pytest.fixture()
+def app_ctx(monkeypatch, tmp_path):
+    monkeypatch.setenv('DATABASE_URL', f'sqlite:///{tmp_path / "seed.db"}')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    yield app
+
+
+def test_generated_rows_are_consistent(app_ctx):
+    import seed_data
+    from models import db, User, UserModule, Certificate, ApprovalAudit, Module
+    from quiz_answers import decode_answers, answer_key, score_answers
+    with app_ctx.app_context():
+        counts = seed_data.generate(users=500, seed=7, agencies=5)
+        assert counts['user'] == 501
+        assert counts['agency'] == 5
+        assert User.query.count() == 501
+
+        series = [s for (s,) in db.session.query(User.number_series).filter(User.number_series.isnot(None))]
+        assert len(series) == 500 and all(re.fullmatch(r'SG\d{8}', s) for s in series)
+        # Python-side defaults are filled in by the raw insert path
+        assert db.session.query(User.module_disclaimer_agreements).first()[0] == '{}'
+
+        um = UserModule.query.first()
+        assert isinstance(um.completion_date, datetime)
+        module = db.session.get(Module, um.module_id)
+        assert score_answers(decode_answers(um.quiz_answers), answer_key(module.quiz_json)) == pytest.approx(um.score, abs=0.1)
+
+        statuses = {s for (s,) in db.session.query(Certificate.status).distinct()}
+        assert statuses == {'pending', 'approved'}
+        assert ApprovalAudit.query.count() == Certificate.query.filter_by(status='approved').count()
+
+
+def test_same_seed_same_data(app_ctx):
+    import seed_data
+    from models import db, UserModule
+    with app_ctx.app_context():
+        seed_data.generate(users=200, seed=3)
+        first = db.session.query(UserModule.user_id, UserModule.module_id, UserModule.score, UserModule.quiz_answers).order_by(UserModule.id).all()
+        db.drop_all()
+        db.create_all()
+        seed_data.generate(users=200, seed=3)
+        second = db.session.query(UserModule.user_id, UserModule.module_id, UserModule.score, UserModule.quiz_answers).order_by(UserModule.id).all()
+    assert first == second
+
+
+def test_seeded_accounts_can_log_in(app_ctx):
+    import seed_data
+    with app_ctx.app_context():
+        seed_data.generate(users=50, seed=1)
+    client = app_ctx.test_client()
+    r = _login(client, 'trainee1@bench.local', seed_data.DEFAULT_PASSWORD)
+    assert r.status_code == 302 and '/user_dashboard' in r.headers['Location']
+    assert client.get('/courses').status_code == 200
+
+
+def test_copy_text_escaping():
+    from seed_data import _copy_text
+    assert _copy_text(None) == '\\N'
+    assert _copy_text(True) == 't'
+    assert _copy_text('a\tb\nc\\d') == 'a\\tb\\nc\\\\d'
+    assert _copy_text(datetime(2025, 1, 2, 3, 4, 5)) == '2025-01-02T03:04:05'
@@ -0,0 +1,110 @@
+import io
+import os
+import stat
+import sys
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+# Stand-in for poppler's pdftoppm: writes three pages as <prefix>-N.png
+RENDERER = """#!{python}
+import sys
+from PIL import Image
+prefix = sys.argv[-1]
+for n in (1, 2, 3):
+    Image.new('RGB', (2000, 1500), (n * 60, 10, 10)).save(f'{{prefix}}-{{n}}.png')
+"""
+
+
+@pytest.fixture()
+def app_client(monkeypatch, tmp_path):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Admin, Course, Module, Agency, User
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    renderer = tmp_path / 'pdftoppm'
+    renderer.write_text(RENDERER.format(python=sys.executable))
+    renderer.chmod(renderer.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(uploads))
+    monkeypatch.setitem(app.config, 'SLIDE_PDF_RENDERER', str(renderer))
+    monkeypatch.setitem(app.config, 'SLIDE_RENDER_SYNC', True)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = Admin(username='admin', email='admin@example.com')
+        admin.set_password('pass123')
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        c = Course(name='CERTIFIED SECURITY GUARD (CSG)', code='CSG', allowed_category='both')
+        db.session.add_all([admin, a, c])
+        db.session.flush()
+        u = User(full_name='U1', email='u1@example.com', user_category='citizen', agency_id=a.agency_id)
+        u.set_password('pass123')
+        db.session.add_all([u, Module(module_name='M1', module_type='CSG', series_number='CSG001', course_id=c.course_id)])
+        db.session.commit()
+    yield app, app.test_client(), uploads
+
+
+def _upload(client, content=b'%PDF-1.4 deck'):
+    return client.post('/manage_module_content/1', data={
+        'content_type': 'slide',
+        'slide_file': (io.BytesIO(content), 'deck.pdf'),
+    }, content_type='multipart/form-data')
+
+
+def test_upload_renders_pages_and_manifest(app_client):
+    app, client, uploads = app_client
+    _login(client, 'admin@example.com', 'pass123')
+    _upload(client)
+
+    import slide_render
+    with app.test_request_context():
+        manifest = slide_render.load_manifest('slides/mod1_deck.pdf')
+        pages = slide_render.slide_pages('slides/mod1_deck.pdf')
+    assert [p['file'] for p in manifest['pages']] == ['page-001.webp', 'page-002.webp', 'page-003.webp']
+    assert manifest['pages'][0]['width'] == slide_render.MAX_PAGE_WIDTH
+    assert len(pages) == 3
+
+    client.get('/logout')
+    _login(client, 'u1@example.com', 'pass123')
+    page = client.get('/modules/CSG')
+    assert page.status_code == 200
+    assert b'page-001.webp' in page.data
+    assert page.data.count(b'loading="lazy"') >= 2
+    r = client.get(pages[1]['url'])
+    assert r.status_code == 200
+    assert r.headers['Content-Type'] == 'image/webp'
+
+
+def test_replaced_deck_drops_old_pages(app_client):
+    app, client, uploads = app_client
+    _login(client, 'admin@example.com', 'pass123')
+    _upload(client)
+    first = os.listdir(uploads / 'slides' / 'rendered')
+    _upload(client, b'%PDF-1.4 other deck')
+    second = os.listdir(uploads / 'slides' / 'rendered')
+    assert len(first) == len(second) == 1
+    assert first != second
+
+
+def test_missing_renderer_falls_back_to_file(app_client, monkeypatch):
+    app, client, uploads = app_client
+    monkeypatch.setitem(app.config, 'SLIDE_PDF_RENDERER', str(uploads / 'missing-binary'))
+    _login(client, 'admin@example.com', 'pass123')
+    _upload(client)
+    import slide_render
+    with app.test_request_context():
+        assert slide_render.slide_pages('slides/mod1_deck.pdf') == []
+    client.get('/logout')
+    _login(client, 'u1@example.com', 'pass123')
+    assert b'deferred-iframe' in client.get('/modules/CSG').data
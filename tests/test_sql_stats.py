@@ -0,0 +1,143 @@
+import logging
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Admin, Agency, User, Course, Module, UserModule
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = Admin(username='admin', email='admin@example.com')
+        admin.set_password('pass123')
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        db.session.add_all([admin, a])
+        db.session.flush()
+        u = User(full_name='U1', email='u1@example.com', user_category='citizen', agency_id=a.agency_id)
+        u.set_password('pass123')
+        db.session.add(u)
+        db.session.commit()
+    yield app, app.test_client()
+
+
+def _add_courses(app, courses, modules_per_course):
+    from models import db, Course, Module, UserModule, User
+    with app.app_context():
+        user = User.query.first()
+        start = Course.query.count()
+        for c in range(start, start + courses):
+            course = Course(name=f'Course {c}', code=f'C{c}', allowed_category='both')
+            db.session.add(course)
+            db.session.flush()
+            for n in range(modules_per_course):
+                m = Module(module_name=f'M{c}-{n}', module_type=f'C{c}', series_number=f'C{c}{n:03d}', course_id=course.course_id)
+                db.session.add(m)
+                db.session.flush()
+                db.session.add(UserModule(user_id=user.User_id, module_id=m.module_id, is_completed=True, score=80.0))
+        db.session.commit()
+        return course.course_id
+
+
+def _statements(client, url):
+    import sql_stats
+    with sql_stats.count_statements() as collector:
+        assert client.get(url).status_code == 200
+    return collector.count
+
+
+def test_statement_shape_collapses_literals():
+    from sql_stats import statement_shape
+    assert statement_shape("SELECT * FROM user_module WHERE user_id = 7 AND note = 'x''y'") == \
+        statement_shape("SELECT *\n  FROM user_module WHERE user_id = 12 AND note = 'z'")
+    assert statement_shape('SELECT id FROM module WHERE id IN (?, ?, ?)') == statement_shape('SELECT id FROM module WHERE id IN (?)')
+
+
+@pytest.mark.parametrize('path', ['/courses', '/course/{course_id}'])
+def test_query_budget_does_not_grow_with_data(app_client, path):
+    app, client = app_client
+    course_id = _add_courses(app, courses=1, modules_per_course=2)
+    _login(client, 'u1@example.com', 'pass123')
+    small = _statements(client, path.format(course_id=course_id))
+
+    course_id = _add_courses(app, courses=4, modules_per_course=8)
+    import sql_stats
+    with sql_stats.statement_budget(small):
+        client.get(path.format(course_id=course_id))
+
+
+def test_monitor_progress_budget(app_client):
+    app, client = app_client
+    _add_courses(app, courses=1, modules_per_course=2)
+    _login(client, 'admin@example.com', 'pass123')
+    small = _statements(client, '/monitor_progress')
+
+    from models import db, User
+    with app.app_context():
+        for i in range(2, 30):
+            db.session.add(User(full_name=f'U{i}', email=f'u{i}@example.com', user_category='citizen', agency_id=1, password_hash='x'))
+        db.session.commit()
+    _add_courses(app, courses=3, modules_per_course=4)
+    import sql_stats
+    with sql_stats.statement_budget(small):
+        assert b'U29' in client.get('/monitor_progress').data
+
+
+def test_budget_failure_lists_repeated_shapes(app_client):
+    app, _ = app_client
+    import sql_stats
+    from models import db, User
+    with app.app_context():
+        with pytest.raises(AssertionError, match=r'3 SQL statements, budget is 2\n  3x SELECT'):
+            with sql_stats.statement_budget(2):
+                for user_id in (1, 2, 3):
+                    db.session.get(User, user_id)
+                    db.session.expunge_all()
+
+
+def test_warning_header_and_admin_page(app_client, caplog):
+    app, client = app_client
+    _add_courses(app, courses=3, modules_per_course=1)
+    app.config.update(SQL_STATS_WARN_STATEMENTS=1, SQL_STATS_HEADER=True)
+    _login(client, 'u1@example.com', 'pass123')
+    with caplog.at_level(logging.WARNING):
+        r = client.get('/courses')
+    assert r.headers['X-SQL-Stats'].startswith('statements=')
+    assert any('[SQL STATS] GET /courses' in rec.getMessage() for rec in caplog.records)
+
+    assert client.get('/admin/sql_stats').status_code == 302
+    client.get('/logout')
+    _login(client, 'admin@example.com', 'pass123')
+    page = client.get('/admin/sql_stats')
+    assert page.status_code == 200
+    assert b'GET /courses' in page.data
+
+
+def test_failed_statement_does_not_skew_later_timings(app_client):
+    app, _ = app_client
+    import sql_stats
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+    from models import db
+    with app.app_context():
+        with sql_stats.count_statements() as collector:
+            conn = db.session.connection()
+            with pytest.raises(OperationalError):
+                conn.execute(text('SELECT * FROM no_such_table'))
+            db.session.rollback()
+            conn = db.session.connection()
+            conn.execute(text('SELECT 1'))
+            assert not conn.info.get('sql_stats_started')
+        assert collector.count == 2
@@ -0,0 +1,190 @@
+import re
+from datetime import date, timedelta
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Admin, Agency, AgencyAccount, User, Course, Module, Certificate
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = Admin(username='admin', email='admin@example.com')
+        admin.set_password('pass123')
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        db.session.add_all([admin, a])
+        db.session.flush()
+        account = AgencyAccount(agency_id=a.agency_id, email='agency@example.com')
+        account.set_password('pass123')
+        course = Course(name='Course', code='CSG', allowed_category='both')
+        db.session.add_all([account, course])
+        db.session.flush()
+        m = Module(module_name='M1', module_type='CSG', series_number='CSG001', course_id=course.course_id)
+        db.session.add(m)
+        db.session.flush()
+        for i in range(120):
+            u = User(full_name=f'User {i:03d}', email=f'u{i}@example.com', user_category='citizen', agency_id=a.agency_id, password_hash='x')
+            db.session.add(u)
+            db.session.flush()
+            # Pairs of certificates share a date so the id tiebreak is exercised
+            db.session.add(Certificate(user_id=u.User_id, module_id=m.module_id, module_type='CSG',
+                                       issue_date=date(2025, 1, 1) + timedelta(days=i // 2), score=float(i % 100), status='pending'))
+        db.session.commit()
+    yield app, app.test_client()
+
+
+def _walk(client, url):
+    ids, total, cursor = [], None, None
+    while True:
+        page = client.get(url + (f'&cursor={cursor}' if cursor else '')).get_json()
+        total = page['total'] if total is None else total
+        ids += [int(v) for v in re.findall(r'name="cert_ids" value="(\d+)"', page['html'])]
+        cursor = page['next_cursor']
+        if not cursor:
+            return ids, total
+
+
+def test_first_page_only_in_html(app_client):
+    app, client = app_client
+    _login(client, 'admin@example.com', 'pass123')
+    r = client.get('/admin_certificates')
+    assert r.status_code == 200
+    assert len(re.findall(rb'name="cert_ids"', r.data)) == 50
+    assert b'data-source="/api/tables/certificates' in r.data
+    assert re.search(rb'data-cursor="[A-Za-z0-9_-]+"', r.data)
+    assert b'120 results' in r.data
+
+
+def test_cursor_walk_covers_every_row_in_order(app_client):
+    app, client = app_client
+    _login(client, 'admin@example.com', 'pass123')
+    ids, total = _walk(client, '/api/tables/certificates?limit=17')
+    assert total == 120
+    assert ids == list(range(120, 0, -1))
+
+    ids, _ = _walk(client, '/api/tables/certificates?sort=certificate_id&dir=asc&limit=50')
+    assert ids == list(range(1, 121))
+
+    ids, total = _walk(client, '/api/tables/certificates?min_score=90&limit=4')
+    assert total == 10 and len(ids) == 10
+
+
+def test_bad_requests_and_authorization(app_client):
+    app, client = app_client
+    assert client.get('/api/tables/certificates').status_code == 302
+    _login(client, 'agency@example.com', 'pass123')
+    assert client.get('/api/tables/certificates').status_code == 403
+    client.get('/logout')
+    _login(client, 'admin@example.com', 'pass123')
+    assert client.get('/api/tables/nope').status_code == 404
+    assert client.get('/api/tables/certificates?sort=password_hash').status_code == 400
+    cursor = client.get('/api/tables/certificates?limit=5').get_json()['next_cursor']
+    assert client.get(f'/api/tables/certificates?sort=status&cursor={cursor}').status_code == 400
+    assert client.get('/api/tables/certificates?cursor=%%%').status_code == 400
+
+
+def test_agency_users_are_scoped_and_paged(app_client):
+    app, client = app_client
+    from models import db, Agency, User
+    with app.app_context():
+        other = Agency(agency_name='B', contact_number='0', address='', Reg_of_Company='', PIC='', email='b@example.com')
+        db.session.add(other)
+        db.session.flush()
+        db.session.add(User(full_name='Outsider', email='out@example.com', user_category='citizen', agency_id=other.agency_id, password_hash='x'))
+        db.session.commit()
+    _login(client, 'agency@example.com', 'pass123')
+    r = client.get('/agency_portal')
+    assert r.status_code == 200
+    assert r.data.count(b'@example.com</td>') == 50 and b'User 000' in r.data
+    page = client.get('/api/tables/agency_users?sort=full_name&dir=desc&limit=200').get_json()
+    assert page['total'] == 120 and page['next_cursor'] is None
+    assert b'Outsider' not in page['html'].encode()
+
+
+def _walk_users(client, url):
+    """(user ids in page order, first-page total) of a table with one data-first row per user."""
+    ids, total, cursor = [], None, None
+    while True:
+        page = client.get(url + (f'&cursor={cursor}' if cursor else '')).get_json()
+        total = page['total'] if total is None else total
+        ids += [int(v) for v in re.findall(r'<tr data-user-id="(\d+)" data-first', page['html'])]
+        cursor = page['next_cursor']
+        if not cursor:
+            return ids, total
+
+
+def test_monitor_progress_pages_users(app_client):
+    app, client = app_client
+    import sql_stats
+    _login(client, 'admin@example.com', 'pass123')
+    r = client.get('/monitor_progress')
+    assert r.status_code == 200
+    assert len(re.findall(rb'<tr data-user-id="\d+" data-first', r.data)) == 50 and b'120 users' in r.data
+    assert b'data-source="/api/tables/monitor_progress' in r.data
+
+    ids, total = _walk_users(client, '/api/tables/monitor_progress?limit=30')
+    assert total == 120 and sorted(ids) == list(range(1, 121)) and len(ids) == 120
+    # Per-course rows are only built for the page's users
+    with sql_stats.count_statements() as small:
+        client.get('/api/tables/monitor_progress?limit=5')
+    with sql_stats.statement_budget(small.count):
+        client.get('/api/tables/monitor_progress?limit=200')
+
+    page = client.get('/api/tables/monitor_progress?q=user 007&limit=50').get_json()
+    assert page['total'] == 1 and 'User 007' in page['html']
+
+
+def test_trainer_progress_pages_and_exports(app_client):
+    app, client = app_client
+    from models import db, Trainer
+    with app.app_context():
+        trainer = Trainer(name='T', email='t@example.com')
+        trainer.set_password('pass123')
+        db.session.add(trainer)
+        db.session.commit()
+    _login(client, 't@example.com', 'pass123')
+    r = client.get('/trainer_portal')
+    assert r.status_code == 200
+    assert r.data.count(b'<tr data-first>') == 50
+    page = client.get('/api/tables/trainer_progress?course=CSG&limit=200').get_json()
+    assert page['total'] == 120 and page['html'].count('<tr data-first>') == 120
+    assert client.get('/api/tables/trainer_progress?course=NOPE').get_json()['total'] == 0
+
+    csv_lines = client.get('/trainer_progress.csv').get_data(as_text=True).splitlines()
+    assert csv_lines[0] == 'Trainee,Course,Progress,Score,Status,Last Activity' and len(csv_lines) == 121
+
+
+def test_admin_users_pages_each_account_table(app_client):
+    app, client = app_client
+    from models import db, Trainer, User
+    with app.app_context():
+        db.session.add(Trainer(name='Trainer One', email='trainer@example.com', password_hash='x'))
+        # Listed once, as the trainer
+        db.session.add(User(full_name='Trainer One', email='Trainer@example.com', user_category='citizen', agency_id=1, role='trainer', password_hash='x'))
+        db.session.add(User(full_name='Auth', email='auth@example.com', user_category='citizen', agency_id=1, role='authority', password_hash='x'))
+        db.session.commit()
+    _login(client, 'admin@example.com', 'pass123')
+    r = client.get('/admin_users')
+    assert r.status_code == 200
+    assert b'122 results' in r.data
+    assert r.data.count(b'id="user-row-') == 50 and b'id="trainer-row-1"' in r.data
+    assert b'admin_accountsTable' not in r.data
+
+    page = client.get('/api/tables/user_accounts?limit=200').get_json()
+    assert page['total'] == 121 and 'Trainer@example.com' not in page['html']
+    assert client.get('/api/tables/user_accounts?role=authority').get_json()['total'] == 1
+    assert client.get('/api/tables/trainer_accounts?role=user').get_json()['total'] == 0
+    assert client.get('/api/tables/admin_accounts').status_code == 403
@@ -0,0 +1,117 @@
+import json
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+@pytest.fixture()
+def app_client(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Admin, Trainer, Module, Course
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = Admin(username='admin', email='admin@example.com')
+        admin.set_password('pass123')
+        trainer = Trainer(name='T', email='t@example.com')
+        trainer.set_password('pass123')
+        courses = [Course(name=code, code=code, allowed_category='both') for code in ('CSG', 'TFS', 'NEW')]
+        db.session.add_all([admin, trainer] + courses)
+        db.session.flush()
+        for c in courses:
+            db.session.add(Module(module_name=f'{c.code} 1', module_type=c.code, series_number=f'{c.code}001',
+                                  course_id=c.course_id, quiz_json='[]'))
+        db.session.commit()
+    yield app, app.test_client()
+
+
+def _quiz():
+    return json.dumps([{'text': 'Q', 'answers': [{'text': 'a', 'isCorrect': True}]}])
+
+
+def test_assign_several_courses_and_reset(app_client):
+    app, client = app_client
+    import trainer_scope
+    from models import db, Trainer, TrainerCourse
+    _login(client, 'admin@example.com', 'pass123')
+    r = client.post('/assign_trainer_course', data={'trainer_id': 1, 'course_code': ['TFS', 'CSG']})
+    assert r.status_code == 200 and r.get_json()['success'] is True
+    with app.app_context():
+        trainer = db.session.get(Trainer, 1)
+        assert trainer.course == 'CSG, TFS'
+        assert trainer_scope.permitted_course_ids(trainer) == frozenset({1, 2})
+
+    r = client.post('/assign_trainer_course', data={'trainer_id': 1, 'course_code': ['CSG', 'NOPE']})
+    assert r.status_code == 400
+
+    # No course_code at all: unrestricted again
+    r = client.post('/assign_trainer_course', data={'trainer_id': 1})
+    assert r.status_code == 200
+    with app.app_context():
+        assert TrainerCourse.query.count() == 0
+        trainer = db.session.get(Trainer, 1)
+        assert trainer.course is None
+        assert trainer_scope.permitted_course_ids(trainer) is None
+
+
+def test_quiz_edit_allowed_only_in_assigned_courses(app_client):
+    app, client = app_client
+    import trainer_scope
+    from models import db, Module, Trainer
+    with app.app_context():
+        trainer_scope.assign(db.session.get(Trainer, 1), [1, 2])
+        db.session.commit()
+    _login(client, 't@example.com', 'pass123')
+    for module_id, allowed in ((1, True), (2, True), (3, False)):
+        client.post('/trainer_course_management', data={'module_id': module_id, 'quiz_data': _quiz()})
+        with app.app_context():
+            assert (db.session.get(Module, module_id).quiz_json == _quiz()) is allowed
+
+    page = client.get('/trainer_course_management')
+    assert page.status_code == 200
+    assert b'TFS 1' in page.data and b'NEW 1' not in page.data
+
+
+def test_permitted_ids_read_once_per_request(app_client):
+    app, _ = app_client
+    import trainer_scope
+    from models import db, Trainer
+    from sql_stats import count_statements
+    with app.app_context():
+        trainer = db.session.get(Trainer, 1)
+        trainer_scope.assign(trainer, [3])
+        db.session.commit()
+    with app.test_request_context():
+        trainer = db.session.get(Trainer, 1)
+        with count_statements() as stats:
+            for course_id in (1, 2, 3):
+                trainer_scope.can_manage_course(trainer, course_id)
+        assert stats.count == 1
+        assert trainer_scope.can_manage_course(trainer, 3)
+        assert not trainer_scope.can_manage_course(trainer, 1)
+
+
+def test_deleting_last_course_leaves_trainer_without_access(app_client):
+    app, client = app_client
+    import trainer_scope
+    from models import db, Trainer
+    with app.app_context():
+        trainer_scope.assign(db.session.get(Trainer, 1), [1])
+        db.session.commit()
+    _login(client, 'admin@example.com', 'pass123')
+    client.post('/delete_course/1')
+    with app.app_context():
+        trainer = db.session.get(Trainer, 1)
+        assert trainer.all_courses is False and trainer.course is None
+        assert trainer_scope.permitted_course_ids(trainer) == frozenset()
+        assert not trainer_scope.can_manage_course(trainer, 2)
@@ -0,0 +1,116 @@
+import os
+import pytest
+
+
+def _login(client, email, password):
+    return client.post('/login', data={
+        'email': email,
+        'password': password
+    }, follow_redirects=False)
+
+
+CONTENT = bytes(range(256)) * 40
+
+
+@pytest.fixture()
+def app_client(monkeypatch, tmp_path):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Agency, User
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    monkeypatch.setitem(app.config, 'UPLOAD_OFFLOAD', '')
+    (tmp_path / 'slides').mkdir()
+    (tmp_path / 'slides' / 'mod1_deck.pdf').write_bytes(CONTENT)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        a = Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com')
+        db.session.add(a)
+        db.session.flush()
+        u = User(full_name='U1', email='u1@example.com', user_category='citizen', agency_id=a.agency_id)
+        u.set_password('pass123')
+        db.session.add(u)
+        db.session.commit()
+    client = app.test_client()
+    _login(client, 'u1@example.com', 'pass123')
+    yield app, client
+
+
+def _versioned_url(app, filename):
+    from uploads import upload_url
+    with app.test_request_context():
+        return upload_url(filename)
+
+
+def test_range_and_cache_headers(app_client):
+    app, client = app_client
+    r = client.get('/uploads/slides/mod1_deck.pdf')
+    assert r.status_code == 200
+    assert r.data == CONTENT
+    assert r.headers['Accept-Ranges'] == 'bytes'
+    assert r.headers['Cache-Control'] == 'private, no-cache'
+    etag = r.headers['ETag']
+
+    assert client.get('/uploads/slides/mod1_deck.pdf', headers={'If-None-Match': etag}).status_code == 304
+
+    partial = client.get('/uploads/slides/mod1_deck.pdf', headers={'Range': 'bytes=100-199'})
+    assert partial.status_code == 206
+    assert partial.data == CONTENT[100:200]
+    assert partial.headers['Content-Range'] == f'bytes 100-199/{len(CONTENT)}'
+
+    url = _versioned_url(app, 'slides/mod1_deck.pdf')
+    assert '?v=' + etag.strip('"') in url
+    assert 'immutable' in client.get(url).headers['Cache-Control']
+
+
+def test_replaced_file_gets_new_url(app_client):
+    app, client = app_client
+    before = _versioned_url(app, 'slides/mod1_deck.pdf')
+    path = os.path.join(app.config['UPLOAD_FOLDER'], 'slides', 'mod1_deck.pdf')
+    with open(path, 'wb') as fh:
+        fh.write(CONTENT[::-1] + b'x')
+    after = _versioned_url(app, 'slides/mod1_deck.pdf')
+    assert before != after
+    # the old version is no longer cacheable for a year
+    assert client.get(before).headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_missing_and_traversal(app_client):
+    _, client = app_client
+    assert client.get('/uploads/slides/nope.pdf').status_code == 404
+    assert client.get('/uploads/../app.py').status_code == 404
+
+
+def test_requires_login(app_client):
+    _, client = app_client
+    client.get('/logout')
+    assert client.get('/uploads/slides/mod1_deck.pdf').status_code in (302, 401)
+
+
+def test_accel_redirect_with_stand_in(app_client, monkeypatch):
+    app, client = app_client
+    monkeypatch.setitem(app.config, 'UPLOAD_OFFLOAD', 'nginx')
+    r = client.get('/uploads/slides/mod1_deck.pdf')
+    assert r.headers['X-Accel-Redirect'] == '/protected_uploads/slides/mod1_deck.pdf'
+    assert r.data == b'' and r.mimetype == 'application/pdf'
+    r = client.get('/uploads/slides/mod1_deck.pdf', headers={'If-None-Match': r.headers['ETag']})
+    assert r.status_code == 304 and 'X-Accel-Redirect' not in r.headers
+
+    from uploads import AccelRedirectStandIn
+    monkeypatch.setattr(app, 'wsgi_app', AccelRedirectStandIn(app.wsgi_app, {'/protected_uploads/': app.config['UPLOAD_FOLDER']}))
+    r = client.get('/uploads/slides/mod1_deck.pdf', headers={'Range': 'bytes=0-9'})
+    assert r.status_code == 206
+    assert r.data == CONTENT[:10]
+    assert 'X-Accel-Redirect' not in r.headers
+    assert r.headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_x_sendfile(app_client, monkeypatch):
+    app, client = app_client
+    monkeypatch.setitem(app.config, 'UPLOAD_OFFLOAD', 'sendfile')
+    r = client.get('/uploads/slides/mod1_deck.pdf')
+    assert r.headers['X-Sendfile'] == os.path.join(app.config['UPLOAD_FOLDER'], 'slides', 'mod1_deck.pdf')
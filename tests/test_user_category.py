@@ -0,0 +1,59 @@
+import pytest
+
+
+@pytest.fixture()
+def app_ctx(monkeypatch):
+    monkeypatch.setenv('DATABASE_URL', 'sqlite:///:memory:')
+    monkeypatch.setenv('DISABLE_SCHEMA_GUARD', '1')
+    import importlib
+    flask_app_module = importlib.import_module('app')
+    from models import db, Agency
+    app = flask_app_module.create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(Agency(agency_name='A', contact_number='0', address='', Reg_of_Company='', PIC='', email='a@example.com'))
+        db.session.commit()
+        yield app
+
+
+def _user(email, category, **extra):
+    from models import db, User
+    u = User(full_name='U', email=email, user_category=category, agency_id=1, password_hash='x', **extra)
+    db.session.add(u)
+    db.session.commit()
+    return u
+
+
+def test_category_normalized_on_write(app_ctx):
+    from models import db
+    assert _user('a@example.com', ' Citizen ').user_category == 'citizen'
+    assert _user('b@example.com', 'FOREIGNER').user_category == 'foreigner'
+    assert _user('c@example.com', '', passport_number='P1').user_category == 'foreigner'
+    u = _user('d@example.com', 'unknown', ic_number='900101')
+    assert u.user_category == 'citizen'
+    u.user_category = 'Foreigner'
+    db.session.commit()
+    assert u.user_category == 'foreigner'
+
+
+def test_check_constraint_rejects_other_values(app_ctx):
+    from sqlalchemy import insert
+    from sqlalchemy.exc import IntegrityError
+    from models import db, User
+    # Core writes bypass the ORM normalization; the constraint still holds
+    with pytest.raises(IntegrityError):
+        db.session.execute(insert(User).values(full_name='U', email='x@example.com', password_hash='x',
+                                               user_category='Citizen', agency_id=1))
+    db.session.rollback()
+
+
+def test_equality_filter_and_unflushed_users(app_ctx):
+    from models import User
+    from utils import normalized_user_category
+    _user('a@example.com', 'citizen')
+    _user('b@example.com', 'foreigner')
+    assert [u.email for u in User.query.filter(User.user_category == 'foreigner')] == ['b@example.com']
+    # Objects not flushed yet are still classified
+    assert normalized_user_category(User(user_category=None, passport_number='P')) == 'foreigner'
@@ -0,0 +1,121 @@
+"""
+Which courses a trainer may manage.
+
+Assignments live in the trainer_course table, one row per (trainer, course),
+so a trainer can be scoped to several courses. Trainer.all_courses marks an
+unrestricted trainer explicitly. A restricted trainer without rows (for
+example after their only course was deleted) may manage nothing; access is
+never inferred from an empty set. Trainer.course is kept as a display label
+("CSG, TFS") for the admin listings.
+
+The permitted course ids are read once per request (one indexed query on
+the trainer_course primary key) and cached on flask.g. Both authorization and
+the trainer's listing queries use them, and module checks compare
+Module.course_id without loading the course:
+
+    ids = trainer_scope.permitted_course_ids(current_user)   # None: all courses
+    if not trainer_scope.can_manage_module(current_user, module): ...
+    query = trainer_scope.restrict(Course.query, Course.course_id, current_user)
+
+`python migrations/add_trainer_course.py` creates the table and copies the
+existing Trainer.course codes into it.
+"""
+from flask import g, has_request_context
+from sqlalchemy import delete, insert, select
+
+from models import db, Course, Trainer, TrainerCourse
+
+
+def _load(trainer_id: int, session=None):
+    session = session or db.session
+    ids = frozenset(session.execute(
+        select(TrainerCourse.course_id).where(TrainerCourse.trainer_id == trainer_id)
+    ).scalars())
+    return ids
+
+
+def permitted_course_ids(trainer, session=None):
+    """frozenset of the course ids `trainer` is scoped to, or None when unrestricted."""
+    if trainer.all_courses:
+        return None
+    trainer_id = trainer.trainer_id
+    if not has_request_context():
+        return _load(trainer_id, session)
+    cache = g.setdefault('trainer_course_ids', {})
+    if trainer_id not in cache:
+        cache[trainer_id] = _load(trainer_id, session)
+    return cache[trainer_id]
+
+
+def can_manage_course(trainer, course_id) -> bool:
+    ids = permitted_course_ids(trainer)
+    return ids is None or course_id in ids
+
+
+def can_manage_module(trainer, module) -> bool:
+    """Modules outside any course are refused; callers report those separately."""
+    return module.course_id is not None and can_manage_course(trainer, module.course_id)
+
+
+def restrict(query, course_id_column, trainer):
+    """`query` limited to the trainer's courses through `course_id_column`."""
+    ids = permitted_course_ids(trainer)
+    if ids is None:
+        return query
+    return query.filter(course_id_column.in_(sorted(ids)))
+
+
+def assign(trainer, course_ids, all_courses=False, session=None) -> list:
+    """Replace the trainer's assignments, or make them unrestricted with all_courses=True.
+
+    Returns the assigned courses. Runs inside the caller's transaction; the
+    caller commits.
+    """
+    session = session or db.session
+    courses = []
+    if course_ids and not all_courses:
+        courses = session.execute(
+            select(Course).where(Course.course_id.in_(set(course_ids))).order_by(Course.code)
+        ).scalars().all()
+    session.execute(delete(TrainerCourse).where(TrainerCourse.trainer_id == trainer.trainer_id))
+    if courses:
+        session.execute(insert(TrainerCourse), [
+            {'trainer_id': trainer.trainer_id, 'course_id': c.course_id} for c in courses
+        ])
+    trainer.all_courses = all_courses
+    trainer.course = ', '.join(c.code for c in courses) or None
+    _forget_cached(trainer.trainer_id)
+    return courses
+
+
+def remove_course(course_id, session=None) -> int:
+    """Drop a course from every trainer's assignments; returns how many trainers lost it.
+
+    Those trainers stay restricted: losing their last course leaves them
+    with no course, not with every course.
+    """
+    session = session or db.session
+    trainers = session.execute(
+        select(Trainer).join(TrainerCourse, TrainerCourse.trainer_id == Trainer.trainer_id)
+        .where(TrainerCourse.course_id == course_id)
+    ).scalars().all()
+    if not trainers:
+        return 0
+    session.execute(delete(TrainerCourse).where(TrainerCourse.course_id == course_id))
+    labels = {}
+    for trainer_id, code in session.execute(
+        select(TrainerCourse.trainer_id, Course.code)
+        .join(Course, Course.course_id == TrainerCourse.course_id)
+        .where(TrainerCourse.trainer_id.in_([t.trainer_id for t in trainers]))
+        .order_by(Course.code)
+    ):
+        labels.setdefault(trainer_id, []).append(code)
+    for trainer in trainers:
+        trainer.course = ', '.join(labels.get(trainer.trainer_id, ())) or None
+        _forget_cached(trainer.trainer_id)
+    return len(trainers)
+
+
+def _forget_cached(trainer_id) -> None:
+    if has_request_context():
+        g.setdefault('trainer_course_ids', {}).pop(trainer_id, None)
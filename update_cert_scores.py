@@ -1,17 +1,13 @@
 from app import app
-from models import db, Certificate, UserModule
+from models import db, Module
+import quiz_rescore
 
 def update_cert_scores():
+    """Set every certificate's score to the holder's current course average, one UPDATE per course."""
     with app.app_context():
-        certs = Certificate.query.all()
         updated = 0
-        for cert in certs:
-            user_module = UserModule.query.filter_by(user_id=cert.user_id, module_id=cert.module_id).first()
-            if user_module and user_module.score is not None:
-                # Keep certificate.score in sync with user's module score
-                if cert.score != user_module.score:
-                    cert.score = user_module.score
-                    updated += 1
+        for (course_code,) in db.session.query(Module.module_type).distinct():
+            updated += quiz_rescore.recompute_certificate_scores(course_code)
         if updated:
             db.session.commit()
         print(f"Updated {updated} certificates with correct score.")
@@ -0,0 +1,182 @@
+"""
+Serving of files stored under UPLOAD_FOLDER (module slides, profile pictures).
+
+serve_uploaded_slide only performs the login check and then hands the file to
+serve_upload(), which:
+
+- answers Range requests (206) so PDF viewers can fetch pages on demand,
+- sends a strong ETag derived from the file contents,
+- lets browsers cache the file for a year when the URL carries the content
+  hash (?v=..., see upload_url()); a replaced file gets a new URL,
+- optionally hands the byte streaming to the front proxy instead of the worker.
+
+The handoff is selected with UPLOAD_OFFLOAD (config or environment):
+
+    ''          Flask streams the file (default, development)
+    'nginx'     X-Accel-Redirect: UPLOAD_ACCEL_PREFIX + filename
+    'sendfile'  X-Sendfile: absolute path (Apache mod_xsendfile, lighttpd)
+
+Matching nginx configuration for the 'nginx' mode:
+
+    location /protected_uploads/ {
+        internal;
+        alias /srv/app/static/uploads/;
+    }
+
+AccelRedirectStandIn emulates that internal location as WSGI middleware so the
+'nginx' mode can be exercised locally and in tests without running nginx
+(set UPLOAD_ACCEL_STANDIN=1).
+"""
+from functools import lru_cache
+import hashlib
+import mimetypes
+import os
+
+from flask import abort, current_app, request, url_for
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+HASH_LENGTH = 16
+HASH_CHUNK = 1024 * 1024
+# Versioned URLs never change content, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'private, no-cache'
+DEFAULT_ACCEL_PREFIX = '/protected_uploads/'
+# Response headers nginx keeps from the upstream response on an internal redirect
+PASSTHROUGH_HEADERS = ('Cache-Control', 'ETag', 'Expires', 'Set-Cookie', 'Content-Disposition')
+
+
+def upload_folder() -> str:
+    folder = current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
+    if not os.path.isabs(folder):
+        folder = os.path.join(current_app.root_path, folder)
+    return folder
+
+
+def resolve(filename: str):
+    """Return the absolute path of an uploaded file, or None if it is missing or outside the folder."""
+    if not filename:
+        return None
+    path = safe_join(upload_folder(), filename)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
+
+@lru_cache(maxsize=4096)
+def _hash_file(path: str, mtime_ns: int, size: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def content_hash(path: str) -> str:
+    """Content hash of a file, recomputed only when its mtime or size changes."""
+    st = os.stat(path)
+    return _hash_file(path, st.st_mtime_ns, st.st_size)
+
+
+def upload_url(filename: str, **values):
+    """URL of an uploaded file, versioned with its content hash when the file exists."""
+    if not filename:
+        return None
+    path = resolve(filename)
+    if path is not None:
+        values['v'] = content_hash(path)
+    return url_for('main.serve_uploaded_slide', filename=filename, **values)
+
+
+def offload_mode() -> str:
+    mode = current_app.config.get('UPLOAD_OFFLOAD')
+    if mode is None:
+        mode = os.environ.get('UPLOAD_OFFLOAD', '')
+    return (mode or '').strip().lower()
+
+
+def serve_upload(filename: str):
+    """Build the response for an uploaded file (caller has already authorized the request)."""
+    path = resolve(filename)
+    if path is None:
+        abort(404)
+    etag = content_hash(path)
+    mode = offload_mode()
+
+    if mode == 'nginx':
+        # nginx serves the bytes (and any Range) from its internal location, so the file is never opened here
+        prefix = current_app.config.get('UPLOAD_ACCEL_PREFIX', DEFAULT_ACCEL_PREFIX)
+        rel = os.path.relpath(path, upload_folder()).replace(os.sep, '/')
+        resp = current_app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        resp.set_etag(etag)
+        resp.last_modified = int(os.stat(path).st_mtime)
+        resp.make_conditional(request)
+        if resp.status_code != 304:
+            resp.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + rel
+    else:
+        resp = send_file(
+            path,
+            request.environ,
+            conditional=True,
+            etag=etag,
+            use_x_sendfile=(mode == 'sendfile'),
+            response_class=current_app.response_class,
+        )
+
+    resp.headers['Accept-Ranges'] = 'bytes'
+    if request.args.get('v') == etag:
+        resp.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        resp.headers['Cache-Control'] = REVALIDATE_CACHE_CONTROL
+    return resp
+
+
+class AccelRedirectStandIn:
+    """WSGI middleware standing in for nginx's X-Accel-Redirect handling.
+
+    `locations` maps internal URL prefixes to directories, like nginx's
+    `location <prefix> { internal; alias <dir>; }`. Responses carrying
+    X-Accel-Redirect are replaced by the referenced file, served with Range
+    support; other responses pass through untouched.
+    """
+
+    def __init__(self, wsgi_app, locations):
+        self.wsgi_app = wsgi_app
+        self.locations = {prefix.rstrip('/') + '/': folder for prefix, folder in locations.items()}
+
+    def __call__(self, environ, start_response):
+        captured = {}
+
+        def capture(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+            return lambda data: None
+
+        app_iter = self.wsgi_app(environ, capture)
+        headers = dict(captured.get('headers') or ())
+        target = headers.get('X-Accel-Redirect')
+        if not target:
+            return self._replay(app_iter, captured, start_response)
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+        path = self._map(target)
+        if path is None or not os.path.isfile(path):
+            start_response('404 NOT FOUND', [('Content-Type', 'text/plain')])
+            return [b'Not Found']
+        resp = send_file(path, environ, conditional=True, etag=headers.get('ETag', '').strip('"') or True)
+        for name in PASSTHROUGH_HEADERS:
+            if name in headers:
+                resp.headers[name] = headers[name]
+        return resp(environ, start_response)
+
+    def _map(self, target: str):
+        for prefix, folder in self.locations.items():
+            if target.startswith(prefix):
+                return safe_join(folder, target[len(prefix):])
+        return None
+
+    @staticmethod
+    def _replay(app_iter, captured, start_response):
+        start_response(captured['status'], captured['headers'])
+        return app_iter
@@ -10,6 +10,8 @@ from flask import url_for, redirect, flash
 from flask_login import current_user
 from werkzeug.routing import BuildError
 from functools import wraps
+from uploads import upload_url
+from slide_render import slide_pages
 
 
 def safe_url_for(endpoint: str, **values) -> str:
@@ -23,19 +25,12 @@ def safe_url_for(endpoint: str, **values) -> str:
 def normalized_user_category(user: Any) -> str:
     """Return 'citizen' or 'foreigner' robustly.
 
-    Falls back to inspecting passport/ic when user.user_category is missing or invalid.
+    Stored users are normalized on write (models.normalize_user_category); this
+    also covers objects that have not been flushed yet.
     """
-    try:
-        raw = (getattr(user, 'user_category', None) or '').strip().lower()
-    except Exception:
-        raw = ''
-    if raw in ('citizen', 'foreigner'):
-        return raw
-    passport = getattr(user, 'passport_number', None)
-    ic = getattr(user, 'ic_number', None)
-    if passport and not ic:
-        return 'foreigner'
-    return 'citizen'
+    from models import normalize_user_category
+    return normalize_user_category(getattr(user, 'user_category', None),
+                                   getattr(user, 'passport_number', None), getattr(user, 'ic_number', None))
 
 
 def safe_parse_date(value, fmt: str = '%Y-%m-%d'):
@@ -164,7 +159,7 @@ def admin_or_superadmin_required(f):
 def register_jinja_filters(app) -> None:
     """Register common Jinja filters and globals on the provided Flask app.
 
-    Adds: 'youtube_id', 'is_slide', 'url_encode' filters and `safe_url_for` global.
+    Adds: 'youtube_id', 'is_slide', 'url_encode' filters and `safe_url_for`, `upload_url`, `slide_pages` globals.
     Also injects a `USE_TAILWIND_CDN` context variable similar to the previous implementation.
     """
     app.jinja_env.filters['youtube_id'] = extract_youtube_id
@@ -172,6 +167,8 @@ def register_jinja_filters(app) -> None:
     app.jinja_env.filters['url_encode'] = lambda s: urllib.parse.quote(str(s), safe='')
     app.jinja_env.globals['safe_url_for'] = safe_url_for
     app.jinja_env.globals['is_superadmin'] = is_superadmin
+    app.jinja_env.globals['upload_url'] = upload_url
+    app.jinja_env.globals['slide_pages'] = slide_pages
 
     @app.context_processor
     def _inject_tailwind_flag():